@@ -1,59 +1,244 @@
 import logging
 logging.getLogger("arxiv").setLevel(logging.ERROR)   
 import arxiv
+import json
+import os
 import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import metrics
 
 def get_ID(month, year, number):
     """Return arXiv ID in YYMM.NNNNN format."""
     return f"{year % 100:02d}{month:02d}.{number:05d}"
 
+PROBE_BATCH_SIZE = 100     # IDs per export-API request (id_list batch)
+PROBE_DELAY_SECONDS = 0.2
+PROBE_RETRIES = 3          # attempts of a bound-search round before the search gives up
+MAX_ID_NUMBER = 99999
+ID_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "id_cache.json")
+
+# One client shared by every probe so consecutive requests reuse its rate-limit bookkeeping
+_client = arxiv.Client(page_size=PROBE_BATCH_SIZE, delay_seconds=PROBE_DELAY_SECONDS)
+_client_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_cache = None
+
+# ---------------------------
+# Persistent probe cache
+# ---------------------------
+
+def _load_cache():
+    """Load the on-disk probe cache once: {yymm: {"probes": {number: bool}, "first": n, "last": n}}."""
+    global _cache
+    if _cache is None:
+        try:
+            with open(ID_CACHE_PATH, "r", encoding="utf-8") as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+def _save_cache():
+    """Write the probe cache atomically so an interrupted run never corrupts it."""
+    tmp_path = ID_CACHE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_cache, f)
+    os.replace(tmp_path, ID_CACHE_PATH)
+
+def _month_entry(yymm):
+    return _load_cache().setdefault(yymm, {"probes": {}})
+
+def is_closed_month(year, month):
+    """A month strictly before the current one can no longer receive new IDs."""
+    today = datetime.now(timezone.utc)
+    return (year, month) < (today.year, today.month)
+
+# ---------------------------
+# Batched existence probes
+# ---------------------------
+
+class ProbeError(RuntimeError):
+    """Some probe batches failed; `found` holds the numbers the successful ones confirmed."""
+
+    def __init__(self, message, found):
+        super().__init__(message)
+        self.found = found
+
+def _query_existing(paper_ids):
+    """Issue one id_list request and return the subset of paper_ids that exist."""
+    search = arxiv.Search(id_list=paper_ids, max_results=len(paper_ids))
+    wanted = set(paper_ids)
+    found = set()
+    with _client_lock, metrics.API_SECONDS.time(api="export"):
+        for result in _client.results(search):
+            base_id = result.get_short_id().split('v')[0]
+            if base_id in wanted:
+                found.add(base_id)
+    metrics.API_RESPONSES.inc(api="export", status="200")
+    metrics.ID_PROBES.inc(len(found), result="found")
+    metrics.ID_PROBES.inc(len(wanted) - len(found), result="missing")
+    return found
+
+def probe_ids(year, month, numbers):
+    """
+    Check which ID numbers of a month exist, PROBE_BATCH_SIZE IDs per request.
+    Answers are memoized in ID_CACHE_PATH; misses are only memoized for closed months,
+    since IDs of the running month may still appear later.
+    Returns:
+        set of numbers that exist
+    Raises:
+        ProbeError if a batch failed (after the other batches were probed and memoized)
+    """
+    yymm = f"{year % 100:02d}{month:02d}"
+    closed = is_closed_month(year, month)
+    existing = set()
+    failed = 0
+    with _cache_lock:
+        probes = _month_entry(yymm)["probes"]
+        unknown = []
+        for n in numbers:
+            known = probes.get(str(n))
+            if known is None:
+                unknown.append(n)
+            elif known:
+                existing.add(n)
+    metrics.ID_PROBES.inc(len(numbers) - len(unknown), result="cached")
+
+    for i in range(0, len(unknown), PROBE_BATCH_SIZE):
+        batch = unknown[i:i + PROBE_BATCH_SIZE]
+        try:
+            found = _query_existing([get_ID(month, year, n) for n in batch])
+        except Exception as e:
+            # Network or parsing error — unknown, so neither memoized nor reported as missing
+            failed += len(batch)
+            print(f"[IDs] Probe failed for {yymm} ({len(batch)} IDs): {e}")
+            metrics.ID_PROBES.inc(len(batch), result="error")
+            if "HTTP 429" in str(e) or "HTTP 503" in str(e):
+                metrics.RATE_LIMITED.inc(api="export")
+            continue
+        found_numbers = {int(paper_id.split('.')[1]) for paper_id in found}
+        existing |= found_numbers
+        with _cache_lock:
+            probes = _month_entry(yymm)["probes"]
+            for n in batch:
+                if n in found_numbers or closed:
+                    probes[str(n)] = n in found_numbers
+            _save_cache()
+    if failed:
+        raise ProbeError(f"{failed} of {len(unknown)} probes failed for {yymm}", existing)
+    return existing
+
 def id_exists(paper_id):
-    """Check if a specific arXiv ID exists."""
-    search = arxiv.Search(id_list=[paper_id])
-    client = arxiv.Client(page_size=1, delay_seconds=0.2)
+    """Check if a specific arXiv ID exists (a failed probe counts as not found)."""
+    yymm, number = paper_id.split('.')
+    year, month = 2000 + int(yymm[:2]), int(yymm[2:])
     try:
-        next(client.results(search))
-        return True
-    except StopIteration:
-        return False
-    except Exception:
-        # Network or parsing error — assume not found for safety
-        return False
+        return int(number) in probe_ids(year, month, [int(number)])
+    except ProbeError as e:
+        return int(number) in e.found
+
+def _probe_round(year, month, numbers):
+    """
+    One round of a bound search: every number must get an answer, since a failed batch read
+    as "missing" would steer the search (and the memoized bound) wrong. Failed batches are
+    retried; after PROBE_RETRIES attempts the ProbeError propagates and nothing is memoized.
+    """
+    for attempt in range(PROBE_RETRIES):
+        try:
+            return probe_ids(year, month, numbers)
+        except ProbeError:
+            if attempt == PROBE_RETRIES - 1:
+                raise
+            time.sleep(PROBE_DELAY_SECONDS * 2 ** (attempt + 1))
+
+def _spread(low, high, count):
+    """Up to `count` distinct integers spread evenly over the open interval (low, high)."""
+    span = high - low - 1
+    if span <= count:
+        return list(range(low + 1, high))
+    return sorted({low + 1 + (span - 1) * i // max(count - 1, 1) for i in range(count)})
+
+def _cached_bound(year, month, key):
+    """Return a memoized first/last ID for a closed month, if any."""
+    if not is_closed_month(year, month):
+        return False, None
+    with _cache_lock:
+        entry = _month_entry(f"{year % 100:02d}{month:02d}")
+        if key in entry:
+            return True, entry[key]
+    return False, None
+
+def _store_bound(year, month, key, value):
+    if not is_closed_month(year, month):
+        return
+    with _cache_lock:
+        _month_entry(f"{year % 100:02d}{month:02d}")[key] = value
+        _save_cache()
 
 def find_first_id(year, month):
-    """Find the first valid arXiv ID of a given month using exponential + binary search."""
-    low, high = 1, 1
-    # Exponential search upward until we find a valid ID
-    while not id_exists(get_ID(month, year, high)):
-        high *= 2
-        if high > 99999:
-            return None  # No valid papers this month
-
-    # Now binary search between low and high to find the *first* valid ID
+    """
+    Find the first valid arXiv ID of a given month.
+    Probes a dense window first, then a geometric ladder and a k-ary narrowing,
+    each round being a single batched request.
+    """
+    hit, cached = _cached_bound(year, month, "first")
+    if hit:
+        return cached
+
+    found = _probe_round(year, month, range(1, PROBE_BATCH_SIZE + 1))
+    if found:
+        first = min(found)
+        _store_bound(year, month, "first", first)
+        return first
+
+    # Geometric ladder above the dense window, all in one request
+    ladder = []
+    n = PROBE_BATCH_SIZE * 2
+    while n <= MAX_ID_NUMBER:
+        ladder.append(n)
+        n *= 2
+    ladder.append(MAX_ID_NUMBER)
+    found = _probe_round(year, month, ladder)
+    if not found:
+        _store_bound(year, month, "first", None)
+        return None  # No valid papers this month
+
+    # k-ary search between the last missing rung and the first existing one
+    high = min(found)
+    low = max([PROBE_BATCH_SIZE] + [r for r in ladder if r < high])
     while low + 1 < high:
-        mid = (low + high) // 2
-        if id_exists(get_ID(month, year, mid)):
-            high = mid
+        points = _spread(low, high, PROBE_BATCH_SIZE)
+        found = _probe_round(year, month, points)
+        if found:
+            high = min(found)
+            low = max([low] + [p for p in points if p < high])
         else:
-            low = mid
+            low = points[-1]
+    _store_bound(year, month, "first", high)
     return high
 
 def find_last_id(year, month):
-    """Find the last valid arXiv ID of a given month."""
-    low, high = 1, 1
-    # Exponential search upward until we find a missing ID
-    while id_exists(get_ID(month, year, high)):
-        high *= 2
-        if high > 99999:
-            return 99999
-    low = high // 2
-    # Binary search for the last existing ID
+    """
+    Find the last valid arXiv ID of a given month.
+    k-ary search: every round probes PROBE_BATCH_SIZE evenly spread IDs in one request,
+    so the full 1..99999 range is resolved in about three requests.
+    """
+    hit, cached = _cached_bound(year, month, "last")
+    if hit:
+        return cached
+
+    low, high = 0, MAX_ID_NUMBER + 1  # invariant: low exists (or 0), high is missing
     while low + 1 < high:
-        mid = (low + high) // 2
-        if id_exists(get_ID(month, year, mid)):
-            low = mid
-        else:
-            high = mid
+        points = _spread(low, high, PROBE_BATCH_SIZE)
+        found = _probe_round(year, month, points)
+        if found:
+            low = max(found)
+        next_missing = [p for p in points if p > low and p not in found]
+        high = min(next_missing) if next_missing else high
+    _store_bound(year, month, "last", low)
     return low
 
 def get_IDs_month(month, year, start_number, end_number):
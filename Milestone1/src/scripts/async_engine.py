@@ -0,0 +1,358 @@
+import asyncio
+import contextlib
+import json
+import os
+import random
+import re
+import shutil
+import tarfile
+import time
+import zlib
+
+import aiohttp
+import arxiv
+import feedparser
+
+import downloader
+import metrics
+import reference_extractor
+from blob_store import get_blob_store, version_complete
+from downloader import extract_source, format_yymm_id
+from journal import EXTRACTED, FETCHED, REFS_DONE
+from metadata_collector import save_metadata, METADATA_BATCH_SIZE
+from reference_extractor import convert_to_references_dict, write_references
+
+EXPORT_API_URL = "http://export.arxiv.org/api/query"
+USER_AGENT = "arxiv-downloader/1.0 (+https://github.com/your-handle)"
+
+# Requests per second and burst size for every upstream we talk to
+HOST_RATES = {
+    "export": (1.0, 1),   # export.arxiv.org API (metadata)
+    "src": (4.0, 8),      # arxiv.org/src tarballs
+    "s2": (1.0, 1),       # Semantic Scholar Graph API
+}
+
+MAX_IN_FLIGHT = 200       # papers processed concurrently
+MAX_SOURCES_IN_FLIGHT = 8 # /src bodies streamed at once, each through one default-executor thread
+MAX_CONNECTIONS = 64      # pooled keep-alive connections shared by all hosts
+MAX_RETRIES = 5
+STOP_POLL_SECONDS = 0.5   # how often run_async_pipeline checks its stop callable
+
+# ---------------------------
+# Rate limiting
+# ---------------------------
+
+class TokenBucket:
+    """
+    Asyncio token bucket: `rate` tokens per second, at most `capacity` stored.
+    Every request to a host takes one token, so bursts are allowed up to capacity
+    and the sustained rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate, capacity, name=None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def make_buckets(rates=None):
+    return {host: TokenBucket(rate, burst, host) for host, (rate, burst) in (rates or HOST_RATES).items()}
+
+# ---------------------------
+# HTTP helpers
+# ---------------------------
+
+def _retry_after(response, attempt):
+    """Seconds to wait before retrying: honor Retry-After, otherwise exponential backoff."""
+    header = response.headers.get("Retry-After")
+    if header and header.isdigit():
+        return float(header)
+    return min(2 ** attempt, 60) + random.uniform(0, 1)
+
+
+async def request(session, bucket, method, url, consume=None, **kwargs):
+    """
+    Perform one rate-limited request, retrying on 429/503 and connection errors.
+    Returns (status, body bytes); status is None when every attempt failed.
+    With `consume`, a 200 body is not read into memory: `await consume(response)` streams it,
+    and its result is returned instead of the bytes.
+    """
+    api = bucket.name or "other"
+    for attempt in range(MAX_RETRIES):
+        await bucket.acquire()
+        t0 = time.perf_counter()
+        try:
+            async with session.request(method, url, **kwargs) as r:
+                metrics.API_RESPONSES.inc(api=api, status=str(r.status))
+                if r.status in (429, 503):
+                    metrics.RATE_LIMITED.inc(api=api)
+                    metrics.API_SECONDS.observe(time.perf_counter() - t0, api=api)
+                    wait = _retry_after(r, attempt)
+                    print(f"[Async] HTTP {r.status} for {url}. Retry in {wait:.1f}s")
+                    await asyncio.sleep(wait)
+                    continue
+                body = await consume(r) if consume is not None and r.status == 200 else await r.read()
+                metrics.API_SECONDS.observe(time.perf_counter() - t0, api=api)
+                return r.status, body
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.API_RESPONSES.inc(api=api, status="error")
+            wait = min(2 ** attempt, 60)
+            print(f"[Async] Request failed for {url}: {e}. Retry in {wait}s")
+            await asyncio.sleep(wait)
+    return None, b""
+
+
+class _BodyReader:
+    """
+    Blocking file-like view of an aiohttp response body, for the extraction thread.
+    Each read() awaits at most `size` bytes of the body on the event loop, so only the chunk
+    being extracted is in memory (aiohttp stops reading the socket while its buffer is full).
+    """
+
+    def __init__(self, content, loop):
+        self.content = content
+        self.loop = loop
+        self.bytes_read = 0
+        self.eof = False
+
+    def read(self, size=-1):
+        if self.eof:
+            return b""      # aiohttp warns about reads past the end of a body
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(downloader.CHUNK_SIZE)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        data = asyncio.run_coroutine_threadsafe(self.content.read(size), self.loop).result()
+        self.eof = not data
+        self.bytes_read += len(data)
+        return data
+
+# ---------------------------
+# Stages
+# ---------------------------
+
+async def fetch_metadata(session, buckets, arxiv_ids):
+    """Resolve a chunk of papers with one export-API request: {base_id: latest arxiv.Result}."""
+    status, body = await request(session, buckets["export"], "GET", EXPORT_API_URL,
+                                 params={"id_list": ",".join(arxiv_ids),
+                                         "max_results": str(len(arxiv_ids))})
+    if status != 200:
+        raise RuntimeError(f"export API returned {status} for {len(arxiv_ids)} IDs")
+    wanted = set(arxiv_ids)
+    papers = {}
+    for entry in feedparser.parse(body).entries:
+        try:
+            result = arxiv.Result._from_feed_entry(entry)
+        except Exception:
+            continue
+        base_id = result.get_short_id().split('v')[0]
+        if base_id in wanted:
+            papers[base_id] = result
+    return papers
+
+
+async def fetch_source(session, buckets, full_id, folder_version, store=None, sources=None):
+    """
+    Stream one version's /src archive into extract_source, which runs off the event loop.
+    `sources` (a semaphore) caps how many bodies are streamed at once across all papers.
+    """
+    if store is not None and version_complete(folder_version):
+        metrics.ARCHIVES_REUSED.inc(reason="extracted")
+        return True
+    src_url = f"{downloader.ARXIV_HOST}/src/{full_id}"
+
+    async def extract(response):
+        reader = _BodyReader(response.content, asyncio.get_running_loop())
+        os.makedirs(folder_version, exist_ok=True)
+        try:
+            with metrics.EXTRACT_SECONDS.time():
+                return await asyncio.to_thread(extract_source, reader, folder_version, full_id, store)
+        except BaseException:
+            # A failed or retried transfer leaves no partial version behind
+            shutil.rmtree(folder_version, ignore_errors=True)
+            raise
+        finally:
+            metrics.BYTES_DOWNLOADED.inc(reader.bytes_read)
+
+    try:
+        async with sources or contextlib.nullcontext():
+            status, written = await request(session, buckets["src"], "GET", src_url, consume=extract)
+    except (OSError, EOFError, tarfile.TarError, zlib.error) as e:
+        # A corrupt version only fails itself, as in downloader._download_once
+        print(f"Extraction failed for {full_id}: {e}")
+        return False
+    if status != 200:
+        print(f"Source unavailable for {full_id} (HTTP {status})")
+        return False
+    metrics.FILES_EXTRACTED.inc(written)
+    return written > 0
+
+
+async def fetch_references(session, buckets, arxiv_id, paper_folder):
+    """Fetch Semantic Scholar references for a paper and write references.json."""
+    cache_key = reference_extractor.references_cache_key(arxiv_id)
+    t0 = time.perf_counter()
+    references = await asyncio.to_thread(reference_extractor.cache_get, cache_key)
+    metrics.S2_CACHE.inc(result="hit" if references is not None else "miss")
+    if references is None:
+        url = f"{reference_extractor.S2_API_HOST}/paper/arXiv:{arxiv_id}/references"
+        headers = {"x-api-key": reference_extractor.API_KEY, "Accept": "application/json"}
+        references = []
+        offset = 0
+        while offset is not None:
+            status, body = await request(session, buckets["s2"], "GET", url,
+                                         params={"fields": reference_extractor.REFERENCE_FIELDS,
+                                                 "offset": str(offset),
+                                                 "limit": str(reference_extractor.REFERENCE_PAGE_SIZE)},
+                                         headers=headers)
+            if status == 200:
+                page = json.loads(body)
+                references.extend(page.get("data", []) or [])
+                offset = page.get("next")
+            elif status == 404:
+                print(f"  Paper {arxiv_id} not found in Semantic Scholar")
+                offset = None
+            else:
+                raise RuntimeError(f"Semantic Scholar returned {status} for {arxiv_id}")
+        await asyncio.to_thread(reference_extractor.cache_put, cache_key, references)
+    metrics.REFERENCE_FETCH_SECONDS.observe(time.perf_counter() - t0)
+    await asyncio.to_thread(write_references, paper_folder, convert_to_references_dict(references))
+
+
+async def process_paper(session, buckets, result, base_dir, sources=None):
+    """
+    Every version's source → metadata → references, for one resolved paper.
+    References are skipped when no version has a source.
+    Versions are fetched concurrently, at most `sources` (a semaphore) bodies at a time.
+    Returns {version: True if its source was extracted}, as downloader.download does.
+    """
+    arxiv_id, latest = result.get_short_id().split('v')
+    latest = int(latest)
+
+    folder_arxiv = os.path.join(base_dir, format_yymm_id(arxiv_id))
+    tex_root = os.path.join(folder_arxiv, "tex")
+    store = get_blob_store(base_dir) if downloader.BLOB_STORE else None
+    versions = range(1, latest + 1)
+    extracted = dict(zip(versions, await asyncio.gather(*[
+        fetch_source(session, buckets, f"{arxiv_id}v{v}", os.path.join(tex_root, f"{arxiv_id}v{v}"),
+                     store, sources)
+        for v in versions
+    ])))
+    await asyncio.to_thread(save_metadata, result, folder_arxiv)
+    if any(extracted.values()):
+        await fetch_references(session, buckets, arxiv_id, folder_arxiv)
+    return extracted
+
+# ---------------------------
+# Engine
+# ---------------------------
+
+async def run_async_pipeline(arxiv_ids, base_dir, max_in_flight=MAX_IN_FLIGHT, rates=None, journal=None,
+                             stop=None):
+    """
+    Process every ID with up to `max_in_flight` papers in flight over one pooled session.
+    When a JobJournal is given, every paper's state transitions are recorded in it.
+    stop: a callable polled every STOP_POLL_SECONDS; once it returns True the papers in flight
+    are cancelled and stats["cancelled"] is set.
+    Returns a stats dict with processed/failed counts and sustained papers per minute.
+    """
+    buckets = make_buckets(rates)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    sources = asyncio.Semaphore(MAX_SOURCES_IN_FLIGHT)
+    stats = {"processed": 0, "failed": 0}
+    t0 = time.time()
+
+    connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     headers={"User-Agent": USER_AGENT}) as session:
+
+        async def worker(arxiv_id, result):
+            async with semaphore:
+                try:
+                    print(f"[Async] Start {arxiv_id}")
+                    with metrics.busy("async_paper"):
+                        extracted = await process_paper(session, buckets, result, base_dir, sources)
+                    if journal:
+                        for version, ok in extracted.items():
+                            journal.mark_version(arxiv_id, version, EXTRACTED if ok else "failed",
+                                                 None if ok else "no source")
+                    if not any(extracted.values()):
+                        # Same as the threads engine: a paper without any source is quarantined
+                        stats["failed"] += 1
+                        metrics.STAGE_ITEMS.inc(stage="async_paper", outcome="no_source")
+                        print(f"[Async] No LaTeX source for {arxiv_id}")
+                        if journal:
+                            journal.fail(arxiv_id, "no LaTeX source for any version", permanent=True)
+                        return
+                    if journal:
+                        journal.mark(arxiv_id, REFS_DONE)
+                    stats["processed"] += 1
+                    metrics.STAGE_ITEMS.inc(stage="async_paper", outcome="ok")
+                    print(f"[Async] Done {arxiv_id} (Total {stats['processed']})")
+                except Exception as e:
+                    stats["failed"] += 1
+                    metrics.STAGE_ITEMS.inc(stage="async_paper", outcome="failed")
+                    print(f"[Async] Error {arxiv_id}: {e}")
+                    if journal:
+                        journal.fail(arxiv_id, f"async: {e}")
+
+        async def run_chunk(chunk):
+            try:
+                papers = await fetch_metadata(session, buckets, chunk)
+            except Exception as e:
+                stats["failed"] += len(chunk)
+                print(f"[Async] Metadata error for {chunk[0]}..{chunk[-1]}: {e}")
+                if journal:
+                    for aid in chunk:
+                        journal.fail(aid, f"metadata: {e}")
+                return
+            for aid in chunk:
+                if aid not in papers:
+                    stats["failed"] += 1
+                    print(f"[Async] Not found: {aid}")
+                    if journal:
+                        journal.fail(aid, "not found in arXiv export API", permanent=True)
+                elif journal:
+                    journal.mark(aid, FETCHED)
+            await asyncio.gather(*[worker(aid, papers[aid]) for aid in chunk if aid in papers])
+
+        ids = [aid for aid in arxiv_ids if re.match(r"^\d{4}\.\d{4,5}$", aid)]
+        crawl = asyncio.ensure_future(asyncio.gather(*[run_chunk(ids[i:i + METADATA_BATCH_SIZE])
+                                                       for i in range(0, len(ids), METADATA_BATCH_SIZE)]))
+        while stop is not None and not crawl.done():
+            await asyncio.wait([crawl], timeout=STOP_POLL_SECONDS)
+            if not crawl.done() and stop():
+                # Papers in flight keep their journal state and stay pending
+                print("[Async] Stop requested: cancelling the papers in flight")
+                crawl.cancel()
+                stats["cancelled"] = True
+        try:
+            await crawl
+        except asyncio.CancelledError:
+            if not stats.get("cancelled"):
+                raise
+
+    elapsed = time.time() - t0
+    stats["seconds"] = elapsed
+    stats["papers_per_minute"] = stats["processed"] / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"[Async] {stats['processed']} papers in {elapsed:.2f} sec "
+          f"→ {stats['papers_per_minute']:.1f} papers/minute ({stats['failed']} failed)")
+    return stats
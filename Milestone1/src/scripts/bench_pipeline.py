@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_upstream import MONTHS, FakeCorpus, FakeUpstream, redirect_pipeline
+
+SIZES = (100, 1000, 10000)
+RESULTS_PATH = "bench_results.json"
+MILESTONE2_SCRIPTS = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                                                  "Milestone2", "src", "scripts"))
+REGRESSION_TOLERANCE = 0.20     # a throughput drop above this share fails --baseline
+
+# ---------------------------
+# One size (child process)
+# ---------------------------
+
+def id_range(size, papers_per_month):
+    """fetch_ids_worker arguments selecting `size` IDs across the two MONTHS (ends of both are probed)."""
+    first_half = size // 2
+    (m1, y1), (m2, y2) = [(int(m[2:]), 2000 + int(m[:2])) for m in MONTHS]
+    return dict(start_month=m1, start_year=y1, start_ID=papers_per_month - first_half + 1,
+                end_month=m2, end_year=y2, end_ID=size - first_half,
+                start_index=0, num_papers=size, download_all=True)
+
+
+def point_pipeline_at(upstream_url, workdir, args):
+    """Redirect every upstream of the pipeline to the fake server and its caches to workdir."""
+    import concurrency
+
+    redirect_pipeline(upstream_url, workdir, args.keep_delays)
+    if args.download_limit:
+        concurrency.CONTROLLERS["download"].maximum = args.download_limit
+    if args.reference_limit:
+        concurrency.CONTROLLERS["reference"].maximum = args.reference_limit
+
+
+def train_model():
+    """The notebook's Logistic Regression, trained on bench_scoring's synthetic labeled corpus."""
+    from sklearn.linear_model import LogisticRegression
+    from bench_scoring import synthetic_corpus
+    from scoring import create_dataset_batched
+
+    all_data, all_labels, partitions = synthetic_corpus()
+    train_ids = [p for p, part in partitions.items() if part == "train"]
+    X, y = create_dataset_batched(train_ids, all_data, all_labels)[:2]
+    model = LogisticRegression(class_weight='balanced', max_iter=1000, random_state=42, solver='lbfgs')
+    return model.fit(X, y)
+
+
+def run_size(size, upstream_url, papers_per_month, workdir, args):
+    """Crawl `size` papers from the fake upstream, then build hierarchies and match references
+    (with --streamed, as further stages of the crawl pipeline)."""
+    sys.path.insert(0, MILESTONE2_SCRIPTS)
+    point_pipeline_at(upstream_url, workdir, args)
+    import main
+    import metrics
+    from journal import JobJournal, REFS_DONE
+    import corpus_reader
+    import incremental
+    from scoring import generate_predictions_batched
+    from downloader import format_yymm_id
+
+    data_dir = os.path.join(workdir, "data")
+    output_dir = Path(workdir) / "output"
+    os.makedirs(data_dir, exist_ok=True)
+    seconds = {}
+
+    extra_stages = ()
+    if args.streamed:
+        # One staged pipeline: every paper is built and matched as soon as its references land
+        extra_stages = main.paper_stages(data_dir, output_dir, train_model())
+
+    # Crawl: ID discovery -> metadata -> download -> references, exactly as main.py runs it
+    t0 = time.perf_counter()
+    selected_ids, _ = main.fetch_ids_worker(**id_range(size, papers_per_month))
+    journal = JobJournal(os.path.join(workdir, "journal.sqlite3"))
+    journal.add_papers(selected_ids)
+    main.resume_pending_papers(journal, data_dir, args.engine, extra_stages=extra_stages)
+    crawled = journal.counts()
+    done = [aid for aid in selected_ids if journal.state_of(aid) == REFS_DONE]
+    journal.close()
+    seconds["crawl"] = time.perf_counter() - t0
+
+    if args.streamed:
+        matched = sum((output_dir / format_yymm_id(aid) / main.PREDICTIONS_FILE).exists() for aid in done)
+        seconds = {"total": seconds["crawl"]}
+        return run_result(size, done, crawled, seconds, matched)
+
+    # Hierarchy: incremental build of every crawled paper
+    t0 = time.perf_counter()
+    for aid in done:
+        with metrics.STAGE_SECONDS.time(stage="hierarchy"):
+            status = incremental.build_paper(Path(data_dir) / format_yymm_id(aid), output_dir, verbose=False)
+        metrics.STAGE_ITEMS.inc(stage="hierarchy", outcome=status)
+    seconds["hierarchy"] = time.perf_counter() - t0
+
+    # Matching: rank the candidates of every paper's BibTeX entries (training is not timed)
+    model = train_model()
+    t0 = time.perf_counter()
+    matched = 0
+    papers = corpus_reader.iter_papers(output_dir, paper_ids=[format_yymm_id(aid) for aid in done
+                                                              if (output_dir / format_yymm_id(aid)).is_dir()])
+    for record in papers:
+        with metrics.STAGE_SECONDS.time(stage="matching"):
+            generate_predictions_batched(record.paper_id, record, model)
+        record.release()
+        metrics.STAGE_ITEMS.inc(stage="matching", outcome="ok")
+        matched += 1
+    seconds["matching"] = time.perf_counter() - t0
+    seconds["total"] = sum(seconds.values())
+    return run_result(size, done, crawled, seconds, matched)
+
+
+def run_result(size, done, crawled, seconds, matched):
+    """Result record of one size: phase throughput, then latency and upstream figures from metrics."""
+    import metrics
+
+    summary = metrics.summary()
+    histograms = summary["histograms"]
+    stage_latency = histograms.get(metrics.STAGE_SECONDS.name, {})
+    api_latency = histograms.get(metrics.API_SECONDS.name, {})
+    phase_items = {"crawl": len(done), "hierarchy": len(done), "matching": matched, "total": len(done)}
+    return {
+        "size": size,
+        "papers_done": len(done),
+        "journal": crawled,
+        "seconds": {k: round(v, 3) for k, v in seconds.items()},
+        "throughput_papers_per_sec": {k: round(phase_items[k] / v, 3) if v > 0 else None
+                                      for k, v in seconds.items()},
+        "stages": {label.split("=", 1)[1]: {k: s[k] for k in ("count", "mean", "p50", "p99")}
+                   for label, s in stage_latency.items()},
+        "api": {label.split("=", 1)[1]: {k: s[k] for k in ("count", "mean", "p50", "p99")}
+                for label, s in api_latency.items()},
+        "responses": summary["counters"].get(metrics.API_RESPONSES.name, {}),
+        "rate_limited": summary["counters"].get(metrics.RATE_LIMITED.name, {}),
+        "bytes_downloaded": summary["counters"].get(metrics.BYTES_DOWNLOADED.name, {}).get("total", 0),
+        "bottleneck": summary["bottleneck"],
+        "concurrency_limits": summary["gauges"].get(metrics.CONCURRENCY_LIMIT.name, {}),
+        "backoffs": summary["counters"].get(metrics.BACKOFFS.name, {}),
+        # ru_maxrss is in KiB on Linux: the true peak, not a sampled one
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+# ---------------------------
+# Driver
+# ---------------------------
+
+def run_child(size, upstream, papers_per_month, root, args):
+    """Run one size in a fresh interpreter, so metrics and peak RSS start from zero."""
+    workdir = os.path.join(root, f"size_{size}")
+    os.makedirs(workdir, exist_ok=True)
+    result_path = os.path.join(workdir, "result.json")
+    log_path = os.path.join(workdir, "pipeline.log")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(size), "--upstream", upstream.url,
+           "--papers-per-month", str(papers_per_month), "--workdir", workdir, "--result", result_path,
+           "--engine", args.engine, "--download-limit", str(args.download_limit or 0),
+           "--reference-limit", str(args.reference_limit or 0)] + \
+          (["--keep-delays"] if args.keep_delays else []) + (["--streamed"] if args.streamed else [])
+    with open(log_path, "w", encoding="utf-8") as log:
+        code = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=os.path.dirname(__file__))
+    if code != 0:
+        print(f"❌ Size {size} failed (exit {code}), see {log_path}")
+        return None
+    with open(result_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_run(run):
+    print(f"\n[Bench] {run['size']} papers → {run['papers_done']} done in {run['seconds']['total']:.1f}s "
+          f"({run['throughput_papers_per_sec']['total']} papers/s), peak RSS {run['peak_rss_mb']} MB")
+    print(f"[Bench]   {'stage':<12}{'count':>8}{'p50(s)':>10}{'p99(s)':>10}")
+    for name, s in list(run["stages"].items()) + [(f"api:{k}", v) for k, v in run["api"].items()]:
+        p50 = f"{s['p50']:.4f}" if s["p50"] is not None else "-"
+        p99 = f"{s['p99']:.4f}" if s["p99"] is not None else "-"
+        print(f"[Bench]   {name:<12}{s['count']:>8}{p50:>10}{p99:>10}")
+    if run["rate_limited"]:
+        print(f"[Bench]   429/503 responses: {run['rate_limited']}")
+    if run["concurrency_limits"]:
+        print(f"[Bench]   final concurrency limits: {run['concurrency_limits']}, backoffs: {run['backoffs']}")
+
+
+def compare(runs, baseline_path, tolerance):
+    """Throughput of each size and phase against a previous results file; True if nothing regressed."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["size"]: r for r in json.load(f)["runs"]}
+    ok = True
+    print(f"\n[Bench] Against {baseline_path} (tolerance {tolerance:.0%})")
+    for run in runs:
+        old = baseline.get(run["size"])
+        if old is None:
+            continue
+        for phase, value in run["throughput_papers_per_sec"].items():
+            before = old["throughput_papers_per_sec"].get(phase)
+            if not before or value is None:
+                continue
+            ratio = value / before
+            regressed = ratio < 1 - tolerance
+            ok &= not regressed
+            print(f"[Bench]   {run['size']:>6} {phase:<10}{before:>10.2f} → {value:<10.2f}"
+                  f"{ratio:6.2f}x {'❌' if regressed else '✅'}")
+        print(f"[Bench]   {run['size']:>6} {'peak RSS':<10}{old['peak_rss_mb']:>10.1f} → {run['peak_rss_mb']:<10.1f}MB")
+    return ok
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="End-to-end benchmark of the crawler and the hierarchy/matching stages against "
+                    "a local fake arXiv / Semantic Scholar.")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated paper counts")
+    parser.add_argument("--output", default=RESULTS_PATH, help="results JSON file")
+    parser.add_argument("--baseline", help="previous results JSON to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads")
+    parser.add_argument("--download-limit", type=int, help="maximum concurrent downloads (default: STAGE_LIMITS)")
+    parser.add_argument("--reference-limit", type=int, help="maximum concurrent reference batches")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds added to every fake request")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="probability of a 429 answer")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--keep-delays", action="store_true",
+                        help="keep the pipeline's politeness delays (default: zero them)")
+    parser.add_argument("--streamed", action="store_true",
+                        help="run hierarchy and matching as stages of the crawl pipeline (one total timing)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="keep data here (default: a temporary folder)")
+    # internal: one size in a child process
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--upstream", help=argparse.SUPPRESS)
+    parser.add_argument("--papers-per-month", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.streamed and args.engine == "async":
+        parser.error("--streamed needs the threads engine")
+
+    if args.child:
+        result = run_size(args.child, args.upstream, args.papers_per_month, args.workdir, args)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        sys.exit(0)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    papers_per_month = max(sizes)
+    upstream = FakeUpstream(FakeCorpus(papers_per_month, args.seed), args.latency, args.rate_limit,
+                            args.retry_after, args.seed).start()
+    print(f"🧪 Fake upstream on {upstream.url}: latency {args.latency}s, 429 rate {args.rate_limit:.0%}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.workdir or tmp
+        runs = []
+        for size in sizes:
+            print(f"\n[Bench] Running {size} papers ({args.engine} engine)...")
+            run = run_child(size, upstream, papers_per_month, root, args)
+            if run:
+                runs.append(run)
+                print_run(run)
+    upstream.stop()
+
+    results = {
+        "config": {k: getattr(args, k) for k in ("engine", "streamed", "download_limit", "reference_limit",
+                                                 "latency", "rate_limit", "retry_after", "keep_delays", "seed")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "upstream_requests": upstream.stats(),
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n[Bench] Results written to {args.output}")
+
+    ok = len(runs) == len(sizes)
+    if args.baseline:
+        ok &= compare(runs, args.baseline, args.tolerance)
+    sys.exit(0 if ok else 1)
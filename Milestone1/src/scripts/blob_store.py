@@ -0,0 +1,286 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import metrics
+
+BLOBS_DIRNAME = "blobs"              # <base_data_dir>/blobs/<2 hex>/<sha256>
+SOURCES_MANIFEST = ".sources.json"   # per version folder: archive hash, ETag and {path: sha256}
+HASH_CHUNK = 64 * 1024
+GC_GRACE_SECONDS = 3600              # gc spares younger blobs: their manifest may not be written yet
+
+# ---------------------------
+# Store
+# ---------------------------
+
+class BlobStore:
+    """
+    Content-addressed store of extracted .tex/.bib files. Every distinct file is kept once,
+    read-only, at <root>/<aa>/<sha256>, and version folders get hard links to it (a copy where
+    hard links are unsupported, e.g. across filesystems), so a file shared by v1 and v2 or by
+    several papers takes the space of one. Archives are indexed by the sha256 of their bytes
+    (archives/<sha256>.json, the files they extract to), and each resource (e.g. 2303.07856v2)
+    records the strong ETag it was last served with (etags/). An ETag only identifies one
+    representation of one URL, so it is sent back as If-None-Match for that same resource only,
+    and a 304 rebuilds the version from links without transferring it.
+    Every write is a rename of a finished temporary file: threads and processes share a store
+    without locks.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        for sub in ("tmp", "archives", "etags"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def _tmp_path(self):
+        return os.path.join(self.root, "tmp", uuid.uuid4().hex)
+
+    def put(self, src):
+        """Store the bytes of a file-like object (hashed while copied); returns their sha256."""
+        tmp_path = self._tmp_path()
+        h = hashlib.sha256()
+        size = 0
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = src.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        digest = h.hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            outcome = "duplicate"
+        else:
+            # Read-only: an in-place write through one hard link would change every copy
+            os.chmod(tmp_path, 0o444)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            outcome = "new"
+        metrics.BLOBS.inc(outcome=outcome)
+        metrics.BLOB_BYTES.inc(size, outcome=outcome)
+        return digest
+
+    def link(self, digest, target_path):
+        """Make target_path the blob: a hard link, or a copy when linking fails."""
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+        try:
+            os.link(self.blob_path(digest), target_path)
+        except OSError:
+            shutil.copyfile(self.blob_path(digest), target_path)
+
+    def materialize(self, files, folder):
+        """Link every {relative path: sha256} of a manifest into folder."""
+        for name, digest in files.items():
+            self.link(digest, os.path.join(folder, name))
+
+    # ---------------------------
+    # Archive index
+    # ---------------------------
+
+    def _write_json(self, path, obj):
+        tmp_path = self._tmp_path()
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+
+    def _archive_path(self, archive):
+        return os.path.join(self.root, "archives", f"{archive}.json")
+
+    def _etag_path(self, resource):
+        return os.path.join(self.root, "etags", hashlib.sha1(resource.encode("utf-8")).hexdigest())
+
+    def _etag_record(self, resource):
+        try:
+            with open(self._etag_path(resource), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def has_archive(self, archive):
+        return os.path.exists(self._archive_path(archive))
+
+    def remember_archive(self, archive, files, resource=None, etag=None):
+        """Record what an archive extracts to, and the ETag `resource` (e.g. 2303.07856v2) was served with."""
+        self._write_json(self._archive_path(archive), files)
+        if resource and usable_etag(etag):
+            self._write_json(self._etag_path(resource), {"etag": etag, "archive": archive})
+
+    def archive_files(self, archive):
+        """{path: sha256} an archive extracts to; None if unknown or a blob is missing."""
+        try:
+            with open(self._archive_path(archive), "r", encoding="utf-8") as f:
+                files = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return files if all(self.has(digest) for digest in files.values()) else None
+
+    def archive_for_etag(self, resource, etag):
+        """The archive `resource` was last served as under this ETag, if any."""
+        record = self._etag_record(resource) if usable_etag(etag) else None
+        if not isinstance(record, dict) or record.get("etag") != etag:
+            return None
+        return record.get("archive")
+
+    def known_etag(self, resource):
+        """The ETag to send as If-None-Match for `resource`: None unless every blob of its archive is kept."""
+        record = self._etag_record(resource)
+        if not isinstance(record, dict) or not usable_etag(record.get("etag")):
+            return None
+        return record["etag"] if self.archive_files(record.get("archive")) else None
+
+    # ---------------------------
+    # Maintenance
+    # ---------------------------
+
+    def stats(self):
+        """Blob count and bytes, plus the number of links to them (files of version folders)."""
+        blobs = size = links = 0
+        for sub in os.listdir(self.root):
+            if len(sub) != 2:
+                continue
+            for name in os.listdir(os.path.join(self.root, sub)):
+                st = os.stat(os.path.join(self.root, sub, name))
+                blobs += 1
+                size += st.st_size
+                links += st.st_nlink - 1
+        archives = len(os.listdir(os.path.join(self.root, "archives")))
+        return {"blobs": blobs, "bytes": size, "links": links, "archives": archives}
+
+    def live_digests(self):
+        """Every sha256 listed by the archive index or by a .sources.json of the data directory."""
+        live = set()
+        archives = os.path.join(self.root, "archives")
+        for name in os.listdir(archives):
+            try:
+                with open(os.path.join(archives, name), "r", encoding="utf-8") as f:
+                    live.update(json.load(f).values())
+            except (OSError, ValueError, AttributeError):
+                continue
+        data_dir = os.path.dirname(os.path.abspath(self.root))
+        for folder, dirs, filenames in os.walk(data_dir):
+            if os.path.abspath(folder) == os.path.abspath(self.root):
+                dirs[:] = []
+                continue
+            if SOURCES_MANIFEST in filenames:
+                manifest = read_manifest(folder)
+                if manifest:
+                    live.update((manifest.get("files") or {}).values())
+        return live
+
+    def collect_garbage(self):
+        """
+        Remove blobs that neither the archive index nor any .sources.json refers to (e.g. left by
+        an extraction that failed midway); returns how many were removed. A blob's link count says
+        nothing here: version folders may hold copies of it.
+        """
+        live = self.live_digests()
+        cutoff = time.time() - GC_GRACE_SECONDS
+        removed = 0
+        for sub in os.listdir(self.root):
+            if len(sub) != 2:
+                continue
+            for name in os.listdir(os.path.join(self.root, sub)):
+                path = os.path.join(self.root, sub, name)
+                if name not in live and os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+# ---------------------------
+# Hashing reader and manifests
+# ---------------------------
+
+def usable_etag(etag):
+    """Only strong ETags promise identical bytes; weak ones (W/"...") are never indexed."""
+    return bool(etag) and not etag.startswith("W/")
+
+
+class HashingReader:
+    """File-like wrapper hashing every byte read through it (the /src archive as downloaded)."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self._hash.update(data)
+        return data
+
+    def finish(self):
+        """Read what the extractor left (tar padding, gzip trailer) and return the archive's sha256."""
+        while self.read(HASH_CHUNK):
+            pass
+        return self._hash.hexdigest()
+
+
+def write_manifest(folder, archive, files, etag=None):
+    """Write a version folder's .sources.json: its archive hash, ETag and {path: sha256}."""
+    tmp_path = os.path.join(folder, SOURCES_MANIFEST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"archive": archive, "etag": etag, "files": files}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(folder, SOURCES_MANIFEST))
+
+
+def read_manifest(folder):
+    try:
+        with open(os.path.join(folder, SOURCES_MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def version_complete(folder):
+    """Whether a version folder holds every file of its manifest (a finished extraction)."""
+    manifest = read_manifest(folder)
+    return bool(manifest and manifest.get("files")) and \
+        all(os.path.exists(os.path.join(folder, name)) for name in manifest["files"])
+
+# ---------------------------
+# Shared stores
+# ---------------------------
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_blob_store(base_data_dir):
+    """The blob store of a data directory (one instance per directory, shared by all threads)."""
+    root = os.path.join(os.path.abspath(base_data_dir), BLOBS_DIRNAME)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = BlobStore(root)
+        return _stores[root]
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clean the .tex/.bib blob store of a data directory.")
+    parser.add_argument("command", choices=["stats", "gc"])
+    parser.add_argument("base_data_dir")
+    args = parser.parse_args()
+
+    store = get_blob_store(args.base_data_dir)
+    if args.command == "stats":
+        s = store.stats()
+        print(f"📦 {s['blobs']} blobs ({s['bytes'] / 1024 ** 2:.1f} MB) linked {s['links']} times, "
+              f"{s['archives']} archives indexed")
+    else:
+        print(f"🧹 Removed {store.collect_garbage()} unreferenced blobs")
@@ -0,0 +1,316 @@
+import argparse
+import atexit
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+import corpus_store
+from downloader import format_yymm_id
+
+GRAPH_DIRNAME = "citation_graph"   # <base_data_dir>/citation_graph/
+COMPACT_EVERY = 5000               # papers in the delta log before it is merged into the CSR arrays
+NODE_FIELDS = ("title", "authors", "year", "doi", "arxiv_id", "venue")
+CSR_FILES = ("out_indptr", "out_indices", "in_indptr", "in_indices")
+
+# ---------------------------
+# Graph
+# ---------------------------
+
+class CitationGraph:
+    """
+    Corpus-level citation graph. Every work (citing paper or cited reference) is one integer
+    node, stored once in nodes.jsonl and found by its format_yymm_id key or by "doi:<doi>".
+    Edges live in two CSR array pairs (citing -> cited and cited -> citing), memory-mapped
+    from .npy files. Papers added since the last compaction are appended to delta.jsonl and
+    kept in memory; a paper's delta row replaces its CSR row (re-fetched references).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self.keys = []         # node id -> key
+        self.attrs = []        # node id -> {field: value} (first non-empty value wins)
+        self.index = {}        # key / "doi:<doi>" -> node id
+        self.delta = {}        # citing node id -> np.int32 array of cited node ids
+        self.delta_in = {}     # cited node id -> set of citing node ids (delta rows only)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _load(self):
+        if os.path.exists(self._path("nodes.jsonl")):
+            with open(self._path("nodes.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._replay_node(record)
+        if os.path.exists(self._path("out_indptr.npy")):
+            for name in CSR_FILES:
+                setattr(self, name, np.load(self._path(f"{name}.npy"), mmap_mode="r"))
+        else:
+            self.out_indptr = self.in_indptr = np.zeros(1, dtype=np.int64)
+            self.out_indices = self.in_indices = np.zeros(0, dtype=np.int32)
+        if os.path.exists(self._path("delta.jsonl")):
+            with open(self._path("delta.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._set_row(record["src"], record["dst"])
+        self._nodes_file = open(self._path("nodes.jsonl"), "a", encoding="utf-8")
+        self._delta_file = open(self._path("delta.jsonl"), "a", encoding="utf-8")
+
+    def _replay_node(self, record):
+        node, key = record["id"], record["key"]
+        if node == len(self.keys):
+            self.keys.append(key)
+            self.attrs.append({})
+        self.index.setdefault(key, node)
+        for k, v in record["attrs"].items():
+            self.attrs[node].setdefault(k, v)
+        if record["attrs"].get("doi"):
+            self.index.setdefault(f"doi:{record['attrs']['doi'].lower()}", node)
+
+    # ---------------------------
+    # Writes
+    # ---------------------------
+
+    def _register(self, key, attrs, persist=True):
+        """Node id of key (or of its DOI alias), creating or enriching the node."""
+        doi = (attrs.get("doi") or "").lower()
+        node = self.index.get(key)
+        if node is None and doi:
+            node = self.index.get(f"doi:{doi}")
+        attrs = {k: v for k, v in attrs.items() if k in NODE_FIELDS and v not in (None, "", [])}
+        new_key = key not in self.index
+        if node is None:
+            node = len(self.keys)
+            self.keys.append(key)
+            self.attrs.append({})
+        attrs = {k: v for k, v in attrs.items() if k not in self.attrs[node]}
+        self.attrs[node].update(attrs)
+        self.index.setdefault(key, node)
+        if doi:
+            self.index.setdefault(f"doi:{doi}", node)
+        if persist and (new_key or attrs):
+            self._nodes_file.write(json.dumps({"id": node, "key": key, "attrs": attrs}, ensure_ascii=False) + "\n")
+        return node
+
+    def _base_row(self, indptr, indices, node):
+        if node + 1 >= len(indptr):
+            return indices[:0]
+        return indices[indptr[node]:indptr[node + 1]]
+
+    def _set_row(self, src, dst):
+        for old in self.delta.get(src, ()):
+            self.delta_in.get(int(old), set()).discard(src)
+        self.delta[src] = np.asarray(dst, dtype=np.int32)
+        for d in dst:
+            self.delta_in.setdefault(int(d), set()).add(src)
+
+    def add_papers(self, references_by_paper):
+        """
+        Add (or replace) the outgoing edges of citing papers.
+        references_by_paper: {arxiv_id: references_dict} as produced by convert_to_references_dict.
+        """
+        with self._lock:
+            for arxiv_id, references_dict in references_by_paper.items():
+                src = self._register(paper_key(arxiv_id), {})
+                dst = []
+                for key, ref in (references_dict or {}).items():
+                    node = self._register(key, ref)
+                    if node != src:
+                        dst.append(node)
+                dst = list(dict.fromkeys(dst))
+                self._set_row(src, dst)
+                self._delta_file.write(json.dumps({"src": src, "dst": dst}) + "\n")
+            self._nodes_file.flush()
+            self._delta_file.flush()
+            if len(self.delta) >= COMPACT_EVERY:
+                self.compact()
+
+    def compact(self):
+        """Merge the delta rows into fresh CSR arrays and empty the delta log."""
+        with self._lock:
+            if not self.delta:
+                return
+            n = len(self.keys)
+            base_src = np.repeat(np.arange(len(self.out_indptr) - 1, dtype=np.int32), np.diff(self.out_indptr))
+            keep = ~np.isin(base_src, np.fromiter(self.delta, dtype=np.int32))
+            delta_src = np.concatenate([np.full(len(d), s, dtype=np.int32) for s, d in self.delta.items()])
+            src = np.concatenate([base_src[keep], delta_src])
+            dst = np.concatenate([np.asarray(self.out_indices)[keep], *self.delta.values()]).astype(np.int32)
+
+            arrays = {}
+            arrays["out_indptr"], arrays["out_indices"] = _to_csr(src, dst, n)
+            arrays["in_indptr"], arrays["in_indices"] = _to_csr(dst, src, n)
+            for name, array in arrays.items():
+                tmp_path = self._path(f".{name}.tmp.npy")
+                np.save(tmp_path, array)
+                os.replace(tmp_path, self._path(f"{name}.npy"))
+            for name in CSR_FILES:
+                setattr(self, name, np.load(self._path(f"{name}.npy"), mmap_mode="r"))
+
+            # Replaying a delta line twice is harmless, so truncating after the swap is safe
+            self._delta_file.close()
+            self._delta_file = open(self._path("delta.jsonl"), "w", encoding="utf-8")
+            self.delta.clear()
+            self.delta_in.clear()
+
+    def close(self):
+        with self._lock:
+            self._nodes_file.close()
+            self._delta_file.close()
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+
+    def node(self, key):
+        """Node id of an arXiv ID (any format), a references.json key or "doi:<doi>"; None if unknown."""
+        for candidate in (key, paper_key(key), f"doi:{key.lower()}"):
+            if candidate in self.index:
+                return self.index[candidate]
+        return None
+
+    def cited_by(self, node):
+        """Works cited by node (its outgoing edges)."""
+        if node in self.delta:
+            return self.delta[node]
+        return self._base_row(self.out_indptr, self.out_indices, node)
+
+    def citing(self, node):
+        """Papers citing node (its incoming edges)."""
+        base = np.asarray(self._base_row(self.in_indptr, self.in_indices, node))
+        if self.delta:
+            base = base[~np.isin(base, np.fromiter(self.delta, dtype=np.int32))]
+        extra = self.delta_in.get(node)
+        if extra:
+            base = np.concatenate([base, np.fromiter(extra, dtype=np.int32)])
+        return base
+
+    def in_degree(self, node):
+        return len(self.citing(node))
+
+    def in_degrees(self):
+        """In-degree of every node as one array."""
+        n = len(self.keys)
+        degrees = np.zeros(n, dtype=np.int64)
+        base = np.diff(self.in_indptr)
+        degrees[:len(base)] = base
+        for src, dst in self.delta.items():
+            old = self._base_row(self.out_indptr, self.out_indices, src)
+            np.subtract.at(degrees, np.asarray(old), 1)
+            np.add.at(degrees, dst, 1)
+        return degrees
+
+    def top_cited(self, n=10):
+        degrees = self.in_degrees()
+        top = np.argsort(-degrees, kind="stable")[:n]
+        return [(self.keys[i], int(degrees[i])) for i in top if degrees[i] > 0]
+
+    def co_cited(self, node, n=10):
+        """Works most often cited together with node: [(key, number of papers citing both)]."""
+        citing = self.citing(node)
+        if len(citing) == 0:
+            return []
+        together = np.concatenate([self.cited_by(int(p)) for p in citing])
+        together = together[together != node]
+        if len(together) == 0:
+            return []
+        ids, counts = np.unique(together, return_counts=True)
+        top = np.argsort(-counts, kind="stable")[:n]
+        return [(self.keys[ids[i]], int(counts[i])) for i in top]
+
+    def stats(self):
+        replaced = sum(len(self._base_row(self.out_indptr, self.out_indices, src)) for src in self.delta)
+        edges = len(self.out_indices) - replaced + sum(len(d) for d in self.delta.values())
+        return {"nodes": len(self.keys), "edges": edges, "delta_papers": len(self.delta)}
+
+    def rebuild_from_store(self, store):
+        """Re-add every paper of a CorpusStore (e.g. after enabling the graph on an existing corpus)."""
+        for month in store.months("references"):
+            by_paper = {}
+            for row in store.read_table("references", month).to_pylist():
+                refs = by_paper.setdefault(row["src_arxiv_id"], {})
+                if row["ref_key"] is not None:
+                    refs[row["ref_key"]] = corpus_store.row_to_reference(row)
+            self.add_papers(by_paper)
+            print(f"  {month}: {len(by_paper)} papers added")
+        self.compact()
+
+
+def _to_csr(rows, cols, n):
+    """(indptr, indices) of an n-row CSR matrix with the given coordinates (sorted rows and columns)."""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32)
+
+
+def paper_key(arxiv_id):
+    """'2303.07856v2' -> '2303-07856', the key format of references.json."""
+    return format_yymm_id(re.sub(r'v\d+$', '', arxiv_id))
+
+# ---------------------------
+# Shared graphs
+# ---------------------------
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+def get_graph(base_data_dir):
+    """The citation graph of a data directory (one instance per directory, shared by all threads)."""
+    root = os.path.join(os.path.abspath(base_data_dir), GRAPH_DIRNAME)
+    with _graphs_lock:
+        if root not in _graphs:
+            _graphs[root] = CitationGraph(root)
+        return _graphs[root]
+
+@atexit.register
+def compact_all():
+    """Compact every graph used by this process, so the next reader only maps CSR arrays."""
+    for graph in list(_graphs.values()):
+        graph.compact()
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Query or rebuild the citation graph of a data directory.")
+    parser.add_argument("command", choices=["build", "stats", "citing", "co-cited", "top"])
+    parser.add_argument("base_data_dir")
+    parser.add_argument("key", nargs="?", help="arXiv ID, references.json key or DOI")
+    parser.add_argument("-n", type=int, default=10)
+    args = parser.parse_args()
+
+    graph = get_graph(args.base_data_dir)
+    t0 = time.perf_counter()
+    if args.command == "build":
+        graph.rebuild_from_store(corpus_store.get_store(args.base_data_dir))
+        print(f"✅ Built citation graph: {graph.stats()}")
+    elif args.command == "stats":
+        print(graph.stats())
+    elif args.command == "top":
+        for key, degree in graph.top_cited(args.n):
+            print(f"{degree:6d}  {key}  {graph.attrs[graph.index[key]].get('title', '')}")
+    else:
+        node = graph.node(args.key or "")
+        if node is None:
+            raise SystemExit(f"Unknown work: {args.key}")
+        if args.command == "citing":
+            citing = graph.citing(node)
+            print(f"{graph.keys[node]} is cited by {len(citing)} papers")
+            for p in citing[:args.n]:
+                print(f"  {graph.keys[p]}")
+        else:
+            for key, count in graph.co_cited(node, args.n):
+                print(f"{count:6d}  {key}  {graph.attrs[graph.index[key]].get('title', '')}")
+    print(f"({(time.perf_counter() - t0) * 1000:.1f} ms)")
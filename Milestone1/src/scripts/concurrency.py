@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# stage: (initial, minimum, maximum) concurrent items; a stage runs `maximum` worker threads
+STAGE_LIMITS = {
+    "download": (3, 1, 16),     # arxiv.org/src
+    "reference": (2, 1, 4),     # Semantic Scholar (more workers only means smaller batches)
+}
+API_STAGES = {"src": "download", "s2": "reference"}
+
+INCREASE = 1.0                 # additive step: +1 concurrent item per `limit` healthy responses
+DECREASE = 0.5                 # multiplicative factor on 429/503 and errors
+LATENCY_TOLERANCE = 2.0        # healthy while smoothed latency <= tolerance x the best recent latency
+LATENCY_SMOOTHING = 0.2        # weight of a new response in the smoothed latency (EWMA)
+BASELINE_DECAY = 1.01          # the best latency slowly forgets, so a faster past does not pin it
+MAX_RETRY_AFTER = 120          # cap on an honored Retry-After (seconds)
+MAX_BACKOFF_SECONDS = 64       # cap of the exponential backoff when no Retry-After is given
+
+# ---------------------------
+# AIMD controller
+# ---------------------------
+
+class AIMDController:
+    """
+    Concurrency limit of one stage, adjusted like TCP congestion control: every healthy response
+    adds INCREASE / limit (about +1 per round of `limit` items) unless the smoothed latency has
+    grown past LATENCY_TOLERANCE x the best recent latency (then the limit holds), and a 429/503 or
+    error multiplies the limit by DECREASE, once per window: requests sent before the last
+    decrease (which tend to answer 429 together) do not cut it again. A Retry-After pauses new items of the stage until it
+    expires. Workers hold a slot() while processing one item.
+    """
+
+    def __init__(self, stage, initial, minimum=1, maximum=16):
+        self.stage = stage
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.baseline = None            # best recent latency
+        self.smoothed = None            # EWMA of the latency
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        metrics.CONCURRENCY_LIMIT.set(self.limit, stage=stage)
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(wait if wait > 0 else None)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _set_limit(self, value):
+        self.limit = min(self.maximum, max(self.minimum, value))
+        metrics.CONCURRENCY_LIMIT.set(round(self.limit, 2), stage=self.stage)
+        self._cond.notify_all()
+
+    def success(self, latency=None):
+        """A healthy-status response: grow the limit, unless latency has degraded."""
+        with self._cond:
+            if latency is not None:
+                if self.baseline is None:
+                    self.baseline = self.smoothed = latency
+                self.baseline = min(self.baseline * BASELINE_DECAY, latency)
+                self.smoothed += LATENCY_SMOOTHING * (latency - self.smoothed)
+                if self.smoothed > self.baseline * LATENCY_TOLERANCE:
+                    return
+            self._set_limit(self.limit + INCREASE / self.limit)
+
+    def backoff(self, retry_after=None, latency=None):
+        """A 429/503 or failed request: cut the limit, and pause the stage for retry_after seconds."""
+        now = time.monotonic()
+        with self._cond:
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + min(retry_after, MAX_RETRY_AFTER))
+            if now - (latency or 0) >= self._last_decrease:
+                self._last_decrease = now
+                self._set_limit(self.limit * DECREASE)
+                metrics.BACKOFFS.inc(stage=self.stage)
+
+
+CONTROLLERS = {stage: AIMDController(stage, *limits) for stage, limits in STAGE_LIMITS.items()}
+
+# ---------------------------
+# Feedback from the HTTP layer
+# ---------------------------
+
+def parse_retry_after(value):
+    """Seconds of a Retry-After header (delta-seconds form); None if absent or a date."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return float(value) if value.isdigit() else None
+
+
+def backoff_seconds(retry_after, attempt):
+    """Wait before retry `attempt`: the server's Retry-After if given, else capped 2^attempt + jitter."""
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER)
+    return min(2 ** attempt, MAX_BACKOFF_SECONDS) + random.uniform(0, 1)
+
+
+def report(api, status, latency=None, retry_after=None):
+    """
+    Feed one upstream response to the controller of the stage calling `api`.
+    status is the HTTP status code, or None for a connection error.
+    """
+    controller = CONTROLLERS.get(API_STAGES.get(api))
+    if controller is None:
+        return
+    if status in (429, 503) or status is None or status >= 500:
+        controller.backoff(retry_after, latency)
+    else:
+        controller.success(latency)
@@ -0,0 +1,377 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+
+import psutil
+import pyarrow as pa
+
+STORE_DIRNAME = "corpus"           # <base_data_dir>/corpus/<kind>/yymm=<YYMM>/part-*.arrow
+WRITE_LEGACY_JSON = True           # also write per-paper metadata.json / references.json (read by Milestone 2)
+SEGMENT_PAPERS = 500               # papers appended to an open segment before it is sealed
+SEGMENT_SECONDS = 60.0             # ... or seconds since it was opened, whichever comes first
+OPEN_PREFIX = ".open-"             # .open-<pid>-<id>.arrows: a segment being appended to (Arrow IPC stream)
+
+METADATA_SCHEMA = pa.schema([
+    ("arxiv_id", pa.string()),
+    ("paper_title", pa.string()),
+    ("authors", pa.list_(pa.string())),
+    ("submission_date", pa.string()),
+    ("revised_dates", pa.list_(pa.string())),
+    ("latest_version", pa.int32()),
+    ("categories", pa.list_(pa.string())),
+    ("abstract", pa.string()),
+    ("pdf_urls", pa.list_(pa.string())),
+    ("publication_venue", pa.string()),
+    ("doi", pa.string()),
+    ("written_at", pa.float64()),
+])
+
+# One row per reference edge. A paper with no references gets a single row with a null
+# ref_key, so "fetched, empty" stays distinguishable from "not fetched yet".
+REFERENCE_SCHEMA = pa.schema([
+    ("src_arxiv_id", pa.string()),
+    ("ref_key", pa.string()),
+    ("ref_arxiv_id", pa.string()),
+    ("title", pa.string()),
+    ("authors", pa.list_(pa.string())),
+    ("submission_date", pa.string()),
+    ("doi", pa.string()),
+    ("venue", pa.string()),
+    ("year", pa.int32()),
+    ("written_at", pa.float64()),
+])
+
+SCHEMAS = {"metadata": METADATA_SCHEMA, "references": REFERENCE_SCHEMA}
+ID_COLUMNS = {"metadata": "arxiv_id", "references": "src_arxiv_id"}
+
+# ---------------------------
+# Store
+# ---------------------------
+
+class CorpusStore:
+    """
+    Append-only Arrow IPC store partitioned by YYMM.
+    Appends go to one open segment per month, an Arrow IPC stream flushed after every write,
+    so a killed process loses nothing. A segment is sealed into an immutable part-*.arrow
+    file (the only files readers see) after SEGMENT_PAPERS papers or SEGMENT_SECONDS, and by
+    flush(); segments left open by a dead process are sealed when the store is next opened.
+    compact() merges a month's segments into a single file so a whole month loads with one
+    memory-mapped read. Rewriting a paper appends a newer version of its rows, and readers
+    keep only the latest one.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._open = {}        # (kind, yymm) -> [sink, writer, path, papers, opened_at]
+        self._recover()
+
+    def _partition(self, kind, yymm):
+        return os.path.join(self.root, kind, f"yymm={yymm}")
+
+    def _write_segment(self, kind, yymm, table):
+        folder = self._partition(kind, yymm)
+        os.makedirs(folder, exist_ok=True)
+        name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.arrow"
+        tmp_path = os.path.join(folder, f".{name}.tmp")
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, os.path.join(folder, name))
+
+    def _append(self, kind, rows):
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row[ID_COLUMNS[kind]].split('.')[0], []).append(row)
+        with self._lock:
+            for yymm, month_rows in by_month.items():
+                segment = self._open.get((kind, yymm))
+                if segment is None:
+                    folder = self._partition(kind, yymm)
+                    os.makedirs(folder, exist_ok=True)
+                    path = os.path.join(folder, f"{OPEN_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}.arrows")
+                    sink = pa.OSFile(path, "wb")
+                    segment = [sink, pa.ipc.new_stream(sink, SCHEMAS[kind]), path, 0, time.monotonic()]
+                    self._open[(kind, yymm)] = segment
+                segment[1].write_table(pa.Table.from_pylist(month_rows, schema=SCHEMAS[kind]))
+                segment[0].flush()
+                segment[3] += len({row[ID_COLUMNS[kind]] for row in month_rows})
+            now = time.monotonic()
+            for key, segment in list(self._open.items()):
+                if segment[3] >= SEGMENT_PAPERS or now - segment[4] >= SEGMENT_SECONDS:
+                    self._seal(key)
+
+    def _seal(self, key):
+        """Turn an open segment into a part-*.arrow file (caller holds the lock)."""
+        sink, writer, path, _, _ = self._open.pop(key)
+        writer.close()
+        sink.close()
+        self._seal_file(key[0], key[1], path)
+
+    def _seal_file(self, kind, yymm, path):
+        batches = []
+        try:
+            with pa.OSFile(path, "rb") as source:
+                for batch in pa.ipc.open_stream(source):
+                    batches.append(batch)
+        except (pa.ArrowInvalid, OSError):
+            pass        # a batch cut short by a crash: it was never acknowledged to the caller
+        if batches:
+            self._write_segment(kind, yymm, pa.Table.from_batches(batches, schema=SCHEMAS[kind]))
+        os.remove(path)
+
+    def _recover(self):
+        """Seal the segments that dead processes left open."""
+        for kind in SCHEMAS:
+            for yymm in self.months(kind):
+                folder = self._partition(kind, yymm)
+                for name in os.listdir(folder):
+                    if not name.startswith(OPEN_PREFIX):
+                        continue
+                    pid = name[len(OPEN_PREFIX):].split('-')[0]
+                    if pid.isdigit() and int(pid) != os.getpid() and psutil.pid_exists(int(pid)):
+                        continue
+                    self._seal_file(kind, yymm, os.path.join(folder, name))
+
+    def flush(self):
+        """Seal every open segment, so readers see all rows appended so far."""
+        with self._lock:
+            for key in list(self._open):
+                self._seal(key)
+
+    def append_metadata(self, metadata_list):
+        """Append metadata dicts as produced by metadata_collector.create_metadata."""
+        now = time.time()
+        self._append("metadata", [
+            {**{name: m.get(name) for name in METADATA_SCHEMA.names}, "written_at": now}
+            for m in metadata_list
+        ])
+
+    def append_references(self, references_by_paper):
+        """Append {arxiv_id: references_dict} as produced by convert_to_references_dict."""
+        now = time.time()
+        rows = []
+        for arxiv_id, references_dict in references_by_paper.items():
+            if not references_dict:
+                rows.append({"src_arxiv_id": arxiv_id, "written_at": now})
+            for key, ref in references_dict.items():
+                rows.append({
+                    "src_arxiv_id": arxiv_id,
+                    "ref_key": key,
+                    "ref_arxiv_id": ref.get("arxiv_id"),
+                    "title": ref.get("title"),
+                    "authors": ref.get("authors"),
+                    "submission_date": ref.get("submission_date"),
+                    "doi": ref.get("doi"),
+                    "venue": ref.get("venue"),
+                    "year": ref.get("year"),
+                    "written_at": now,
+                })
+        self._append("references", rows)
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+
+    def months(self, kind="metadata"):
+        folder = os.path.join(self.root, kind)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(name.split('=')[1] for name in os.listdir(folder) if name.startswith("yymm="))
+
+    def _segments(self, kind, yymm):
+        folder = self._partition(kind, yymm)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                      if name.startswith("part-") and name.endswith(".arrow"))
+
+    def read_table(self, kind, yymm):
+        """All live rows of one month as a pyarrow Table (memory-mapped, superseded rows dropped)."""
+        tables = []
+        for path in self._segments(kind, yymm):
+            with pa.memory_map(path, "r") as source:
+                tables.append(pa.ipc.open_file(source).read_all())
+        if not tables:
+            return SCHEMAS[kind].empty_table()
+        table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+        if len(tables) == 1:
+            return table
+
+        # Keep only the most recent write of every paper
+        ids = table.column(ID_COLUMNS[kind]).to_pylist()
+        written = table.column("written_at").to_pylist()
+        latest = {}
+        for arxiv_id, ts in zip(ids, written):
+            if ts > latest.get(arxiv_id, -1.0):
+                latest[arxiv_id] = ts
+        return table.filter(pa.array([ts == latest[arxiv_id] for arxiv_id, ts in zip(ids, written)]))
+
+    def load(self, kind, yymm=None):
+        """One month (or every month when yymm is None) as a pandas DataFrame."""
+        months = [yymm] if yymm else self.months(kind)
+        tables = [self.read_table(kind, m) for m in months]
+        table = pa.concat_tables(tables) if tables else SCHEMAS[kind].empty_table()
+        return table.to_pandas()
+
+    def load_metadata(self, yymm=None):
+        return self.load("metadata", yymm)
+
+    def load_references(self, yymm=None):
+        """Reference edges; the null-key markers of papers without references are dropped."""
+        df = self.load("references", yymm)
+        return df[df["ref_key"].notna()].reset_index(drop=True)
+
+    # ---------------------------
+    # Maintenance
+    # ---------------------------
+
+    def compact(self, kind=None, yymm=None):
+        """Merge the segments of each month into one file holding only live rows."""
+        self.flush()
+        for k in [kind] if kind else list(SCHEMAS):
+            for month in [yymm] if yymm else self.months(k):
+                with self._lock:
+                    segments = self._segments(k, month)
+                    if len(segments) <= 1:
+                        continue
+                    self._write_segment(k, month, self.read_table(k, month))
+                    for path in segments:
+                        os.remove(path)
+
+    def merge_from(self, other, arxiv_ids):
+        """
+        Append the live rows of arxiv_ids from another store (the output of another crawler node).
+        Rows keep their written_at, and papers whose rows here are as recent are skipped, so
+        merging the same papers twice copies nothing. Returns the number of rows copied.
+        """
+        wanted_by_month = {}
+        for arxiv_id in arxiv_ids:
+            wanted_by_month.setdefault(arxiv_id.split('.')[0], set()).add(arxiv_id)
+        copied = 0
+        for kind in SCHEMAS:
+            for month, wanted in wanted_by_month.items():
+                own = self.read_table(kind, month)
+                have = dict(zip(own.column(ID_COLUMNS[kind]).to_pylist(), own.column("written_at").to_pylist()))
+                table = other.read_table(kind, month)
+                ids = table.column(ID_COLUMNS[kind]).to_pylist()
+                written = table.column("written_at").to_pylist()
+                table = table.filter(pa.array([arxiv_id in wanted and ts > have.get(arxiv_id, -1.0)
+                                               for arxiv_id, ts in zip(ids, written)], pa.bool_()))
+                if table.num_rows:
+                    with self._lock:
+                        self._write_segment(kind, month, table)
+                    copied += table.num_rows
+        return copied
+
+    def export_legacy_json(self, out_dir, yymm=None):
+        """
+        Write the per-paper layout (<yymm-id>/metadata.json and references.json) from the store.
+        Returns the number of papers exported.
+        """
+        exported = 0
+        for month in [yymm] if yymm else self.months("metadata"):
+            refs_by_paper = {}
+            for ref in self.read_table("references", month).to_pylist():
+                refs_by_paper.setdefault(ref["src_arxiv_id"], []).append(ref)
+            for row in self.read_table("metadata", month).to_pylist():
+                arxiv_id = row["arxiv_id"]
+                folder = os.path.join(out_dir, arxiv_id.replace('.', '-'))
+                write_legacy_metadata(folder, row_to_metadata(row))
+                if arxiv_id in refs_by_paper:
+                    write_legacy_references(folder, {
+                        r["ref_key"]: row_to_reference(r)
+                        for r in refs_by_paper[arxiv_id] if r["ref_key"] is not None
+                    })
+                exported += 1
+        return exported
+
+# ---------------------------
+# Legacy JSON layout
+# ---------------------------
+
+def row_to_metadata(row):
+    """Inverse of append_metadata: rebuild the metadata.json dictionary."""
+    metadata = {name: row[name] for name in METADATA_SCHEMA.names
+                if name not in ("written_at", "doi")}
+    if row.get("doi"):
+        metadata["doi"] = row["doi"]
+    return metadata
+
+def row_to_reference(row):
+    """Inverse of append_references for one edge: rebuild a references.json entry."""
+    reference = {
+        "title": row["title"] or "",
+        "authors": list(row["authors"]) if row["authors"] is not None else [],
+        "submission_date": row["submission_date"] or "",
+        "revised_dates": [],
+    }
+    for name, key in (("doi", "doi"), ("arxiv_id", "ref_arxiv_id"), ("venue", "venue"), ("year", "year")):
+        value = row[key]
+        if value is not None:
+            reference[name] = value
+    return reference
+
+def write_legacy_metadata(folder, metadata):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=4, ensure_ascii=False)
+
+def write_legacy_references(folder, references_dict):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "references.json"), "w", encoding="utf-8") as f:
+        json.dump(references_dict, f, indent=2, ensure_ascii=False)
+
+# ---------------------------
+# Shared stores
+# ---------------------------
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(base_data_dir):
+    """The store of a data directory (one instance per directory, shared by all threads)."""
+    root = os.path.join(os.path.abspath(base_data_dir), STORE_DIRNAME)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = CorpusStore(root)
+        return _stores[root]
+
+@atexit.register
+def compact_all():
+    """
+    Flush and compact every store used by this process, so the next reader maps one file per
+    month. Called at the end of every pipeline run, and at exit.
+    """
+    for store in list(_stores.values()):
+        store.compact()
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the columnar corpus store of a data directory.")
+    parser.add_argument("command", choices=["compact", "export", "stats"])
+    parser.add_argument("base_data_dir")
+    parser.add_argument("--yymm", help="restrict to one month, e.g. 2303")
+    parser.add_argument("--out", help="export target directory (default: base_data_dir)")
+    args = parser.parse_args()
+
+    store = get_store(args.base_data_dir)
+    if args.command == "compact":
+        store.compact(yymm=args.yymm)
+        print(f"✅ Compacted {store.root}")
+    elif args.command == "export":
+        n = store.export_legacy_json(args.out or args.base_data_dir, args.yymm)
+        print(f"✅ Exported {n} papers to the legacy JSON layout")
+    else:
+        for month in store.months():
+            meta = store.read_table("metadata", month)
+            refs = store.read_table("references", month)
+            print(f"{month}: {meta.num_rows} papers, {refs.num_rows} reference rows, "
+                  f"{len(store._segments('metadata', month))} metadata segments")
@@ -1,11 +1,27 @@
+import gzip
+import http.client
 import os
 import re
+import shutil
 import tarfile
+import zlib
 import requests
 import string
+import time
+import urllib3
+import concurrency
+import metrics
+from blob_store import HashingReader, get_blob_store, version_complete, write_manifest
 from metadata_collector import save_metadata
 
 ARXIV_HOST = "https://arxiv.org"
+TEX_BIB_SUFFIXES = (".tex", ".bib")
+GZIP_MAGIC = b"\x1f\x8b"
+TEX_MARKERS = (b"\\documentclass", b"\\documentstyle", b"\\begin", b"\\input")   # a single-file body must look like TeX
+TEX_SNIFF_SIZE = 16 * 1024  # bytes of a single-file body searched for TEX_MARKERS
+CHUNK_SIZE = 64 * 1024
+MAX_RETRIES = 5             # attempts of one /src request on 429/503 and connection errors
+BLOB_STORE = True           # store each distinct .tex/.bib once (<base_dir>/blobs) and hard-link it into tex/
 
 def format_yymm_id(base_id: str) -> str:
     """'2303.07856' -> '2303-07856'"""
@@ -19,75 +35,231 @@ def sanitize_filename(name: str) -> str:
     safe_chars = f"-_.{string.ascii_letters}{string.digits}/"
     return ''.join(c if c in safe_chars else '_' for c in name)
 
-def safe_extract_tar(tar_path: str, extract_to: str) -> None:
-    """Safely extract a tar.gz file using 'filter=data', skipping broken entries."""
+class _PrefixedStream:
+    """File-like reader that replays already-consumed `head` bytes before the rest of `stream`."""
+
+    def __init__(self, head: bytes, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if self.head:
+            if size < 0:
+                data, self.head = self.head + self.stream.read(), b""
+                return data
+            data, self.head = self.head[:size], self.head[size:]
+            if len(data) < size:
+                data += self.stream.read(size - len(data))
+            return data
+        return self.stream.read(size)
+
+
+def _read_exact(stream, size: int) -> bytes:
+    """Read up to `size` bytes, looping over short reads of network streams."""
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _is_tar_header(block: bytes) -> bool:
     try:
-        with tarfile.open(tar_path, "r:gz") as tar:
-            for member in tar.getmembers():
-                try:
-                    # Skip symbolic links and absolute paths (security)
-                    if member.islnk() or member.issym() or member.name.startswith("/") or ".." in member.name:
-                        continue
-                    
-                    member.name = sanitize_filename(member.name)
-                    target_path = os.path.join(extract_to, member.name)
-                    target_dir = os.path.dirname(target_path)
-                    os.makedirs(target_dir, exist_ok=True)
-
-                    # Extract safely
-                    tar.extract(member, path=extract_to, filter="data")
-                except (FileNotFoundError, OSError, tarfile.ExtractError) as inner_e:
-                    print(f"⚠️ Skipped bad entry in {os.path.basename(tar_path)}: {member.name} ({inner_e})")
+        tarfile.TarInfo.frombuf(block, tarfile.ENCODING, "surrogateescape")
+        return True
+    except (tarfile.HeaderError, ValueError):
+        return False
+
+
+def _write_member(src, extract_to: str, name: str, store=None, files=None) -> None:
+    target_path = os.path.join(extract_to, name)
+    if store is not None:
+        digest = store.put(src)
+        store.link(digest, target_path)
+        files[name] = digest
+        return
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with open(target_path, "wb") as f:
+        shutil.copyfileobj(src, f, CHUNK_SIZE)
+
+
+def stream_extract(stream, extract_to: str, full_id: str, store=None, files=None) -> int:
+    """
+    Extract .tex/.bib files from an arXiv /src body while it is being read.
+    Handles gzipped tarballs, plain tarballs and single gzipped .tex files; the archive
+    itself and every other member (figures, PDFs, ...) never touch the disk.
+    With a BlobStore, files go through it and files receives {path: sha256}.
+    Returns the number of files written (0 when the body holds no LaTeX source).
+    """
+    if store is not None and files is None:
+        files = {}
+    magic = _read_exact(stream, len(GZIP_MAGIC))
+    stream = _PrefixedStream(magic, stream)
+    if magic == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+
+    head = _read_exact(stream, tarfile.BLOCKSIZE)
+    if head.startswith(b"%PDF"):
+        print(f"No LaTeX source for {full_id} (PDF only)")
+        return 0
+
+    if len(head) == tarfile.BLOCKSIZE and _is_tar_header(head):
+        written = 0
+        with tarfile.open(fileobj=_PrefixedStream(head, stream), mode="r|") as tar:
+            for member in tar:
+                # Skip links, directories, absolute paths and anything outside .tex/.bib
+                if not member.isfile() or member.name.startswith("/") or ".." in member.name:
                     continue
-    except Exception as e:
-        print(f"[Error] Extraction failed for {tar_path}: {e}")
+                if not member.name.endswith(TEX_BIB_SUFFIXES):
+                    continue
+                try:
+                    _write_member(tar.extractfile(member), extract_to, sanitize_filename(member.name), store, files)
+                    written += 1
+                except (OSError, tarfile.TarError) as inner_e:
+                    print(f"⚠️ Skipped bad entry in {full_id}: {member.name} ({inner_e})")
+        return written
+
+    # Single-file source: a gzipped .tex without a tar wrapper. Anything else, compressed or not
+    # (a .ps.gz, an HTML error page, a stray redirect body), is only taken for TeX if it looks like it.
+    head += _read_exact(stream, TEX_SNIFF_SIZE - len(head))
+    if not head.strip():
+        return 0
+    if not any(marker in head for marker in TEX_MARKERS):
+        print(f"No LaTeX source for {full_id} (unrecognized body: {head[:40]!r})")
+        return 0
+    _write_member(_PrefixedStream(head, stream), extract_to, f"{full_id}.tex", store, files)
+    return 1
+
+
+def extract_source(stream, extract_to: str, full_id: str, store=None, etag=None) -> int:
+    """
+    stream_extract through the blob store, when given: the archive is hashed on the way, and
+    its file list goes to the store's archive index and to the version's .sources.json.
+    Returns the number of files written.
+    """
+    if store is None:
+        return stream_extract(stream, extract_to, full_id)
+    reader = HashingReader(stream)
+    files = {}
+    written = stream_extract(reader, extract_to, full_id, store, files)
+    if written:
+        archive = reader.finish()
+        if store.has_archive(archive):
+            print(f"♻️ {full_id}: same archive as a version seen before")
+        store.remember_archive(archive, files, full_id, etag)
+        write_manifest(extract_to, archive, files, etag)
+    return written
+
 
+def reuse_known_archive(store, etag, extract_to: str, full_id: str) -> bool:
+    """
+    Rebuild a version from the blob store when this same version was served before with this
+    ETag (a 304 to our If-None-Match, or a server ignoring it), so no body is read. False if the
+    pair is unknown (or a blob of the archive is gone).
+    """
+    archive = store.archive_for_etag(full_id, etag)
+    files = store.archive_files(archive) if archive else None
+    if not files:
+        return False
+    store.materialize(files, extract_to)
+    write_manifest(extract_to, archive, files, etag)
+    metrics.ARCHIVES_REUSED.inc(reason="etag")
+    print(f"♻️ {full_id}: archive already seen (ETag), linked {len(files)} files")
+    return True
+
+
+def download_source(url: str, extract_to: str, full_id: str, max_retries: int = MAX_RETRIES, store=None) -> bool:
+    """
+    Stream a /src response straight into stream_extract (through the blob store, if given).
+    A 429/503 or connection error is reported to the download stage's AIMD controller (which
+    pauses the stage for Retry-After) and retried after Retry-After or a capped exponential backoff.
+    """
+    for attempt in range(max_retries):
+        extracted, retry_after = _download_once(url, extract_to, full_id, store)
+        if extracted is not None:
+            return extracted
+        wait = concurrency.backoff_seconds(retry_after, attempt)
+        print(f"Retrying {full_id} in {wait:.1f}s (attempt {attempt + 1}/{max_retries})")
+        time.sleep(wait)
+    return False
 
-def download_url(url: str, out_path: str) -> bool:
-    """Basic downloader (no retry, no backoff)."""
+
+def _download_once(url: str, extract_to: str, full_id: str, store=None):
+    """
+    One /src request. Returns (True if LaTeX files were extracted, False if there is nothing
+    to extract, or None if the request should be retried; Retry-After seconds).
+    A version whose archive the blob store already holds is requested with If-None-Match,
+    so a 304 rebuilds it from links without transferring the body.
+    """
     headers = {"User-Agent": "arxiv-downloader/1.0 (+https://github.com/your-handle)"}
+    known_etag = store.known_etag(full_id) if store is not None else None
+    if known_etag:
+        headers["If-None-Match"] = known_etag
+    t0 = time.perf_counter()
     try:
         with requests.get(url, headers=headers, stream=True, timeout=30) as r:
-            if r.status_code == 200:
-                os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                with open(out_path, "wb") as f:
-                    for chunk in r.iter_content(8192):
-                        if chunk:
-                            f.write(chunk)
-                return True
-            print(f"HTTP {r.status_code} for {url}")
-            return False
-    except requests.RequestException as e:
+            retry_after = concurrency.parse_retry_after(r.headers.get("Retry-After"))
+            # Time to the response headers: the body time depends on the archive size
+            concurrency.report("src", r.status_code, time.perf_counter() - t0, retry_after)
+            metrics.API_RESPONSES.inc(api="src", status=str(r.status_code))
+            if r.status_code in (429, 503):
+                metrics.RATE_LIMITED.inc(api="src")
+            if r.status_code == 304 and known_etag:
+                os.makedirs(extract_to, exist_ok=True)
+                # None (retry) if a blob went missing since: the next attempt asks unconditionally
+                return (True if reuse_known_archive(store, known_etag, extract_to, full_id) else None), None
+            if r.status_code != 200:
+                print(f"HTTP {r.status_code} for {url}")
+                return (None if r.status_code in (429, 503) or r.status_code >= 500 else False), retry_after
+            os.makedirs(extract_to, exist_ok=True)
+            etag = r.headers.get("ETag")
+            if store is not None and reuse_known_archive(store, etag, extract_to, full_id):
+                return True, None
+            r.raw.decode_content = True  # undo any Content-Encoding; stream_extract sniffs the rest
+            t_extract = time.perf_counter()
+            try:
+                written = extract_source(r.raw, extract_to, full_id, store, etag)
+            finally:
+                # Extraction overlaps the transfer: its time includes reading the body
+                metrics.EXTRACT_SECONDS.observe(time.perf_counter() - t_extract)
+                metrics.BYTES_DOWNLOADED.inc(r.raw.tell())
+            metrics.FILES_EXTRACTED.inc(written)
+            print(f"✅ Extracted {written} .tex/.bib files to {extract_to}")
+            return written > 0, None
+    except (requests.RequestException, urllib3.exceptions.HTTPError, http.client.HTTPException) as e:
+        # r.raw raises urllib3/http.client errors (ProtocolError, ReadTimeoutError, IncompleteRead)
+        # when the transfer breaks mid-body: retryable, like a failed connection
+        concurrency.report("src", None)
+        metrics.API_RESPONSES.inc(api="src", status="error")
         print(f"Download failed for {url}: {e}")
-        return False
-
-
-def cleanup_non_tex_bib_files(folder: str) -> None:
-    """Remove all non-.tex and non-.bib files."""
-    for root, _, files in os.walk(folder):
-        for file in files:
-            if not (file.endswith(".tex") or file.endswith(".bib")):
-                try:
-                    os.remove(os.path.join(root, file))
-                except OSError as e:
-                    print(f"Warning: could not remove {file}: {e}")
+        shutil.rmtree(extract_to, ignore_errors=True)
+        return None, None
+    except (OSError, EOFError, tarfile.TarError, zlib.error) as e:
+        metrics.API_RESPONSES.inc(api="src", status="error")
+        print(f"Download failed for {url}: {e}")
+        shutil.rmtree(extract_to, ignore_errors=True)
+        return False, None
+    finally:
+        metrics.API_SECONDS.observe(time.perf_counter() - t0, api="src")
 
 
-def download(list_download: list, base_dir: str) -> None:
+def download(paper, base_dir: str) -> None:
     """
     Downloads all versions of an arXiv paper using /src/{id} URL.
-    Extracts .tex/.bib files and saves metadata.
+    `paper` is the arxiv.Result of the latest version; older versions are derived
+    from its version number. Extracts .tex/.bib files and saves metadata.
+    Returns {version: True if its source was extracted}.
     """
-    if not list_download:
-        print("⚠️ list_download is empty — skipping.")
-        return
-
-    match = re.match(r"^(\d{4}\.\d{5})", list_download[0].get_short_id())
+    match = re.match(r"^(\d{4}\.\d{5})v(\d+)$", paper.get_short_id())
     if not match:
-        print(f"Invalid arXiv ID format: {list_download[0].get_short_id()}")
-        return
+        print(f"Invalid arXiv ID format: {paper.get_short_id()}")
+        return {}
 
     arxiv_id = match.group(1)
+    latest_version = int(match.group(2))
     folder_arxiv = os.path.join(base_dir, format_yymm_id(arxiv_id))
     print(f"Processing {arxiv_id} → {folder_arxiv}")
 
@@ -95,42 +267,29 @@ def download(list_download: list, base_dir: str) -> None:
     tex_root = os.path.join(folder_arxiv, "tex")
     os.makedirs(tex_root, exist_ok=True)
 
-    for result in list_download:
-        full_id = result.get_short_id()  # e.g. '2305.00633v4'
+    store = get_blob_store(base_dir) if BLOB_STORE else None
+    extracted = {}
+    for version in range(1, latest_version + 1):
+        full_id = f"{arxiv_id}v{version}"  # e.g. '2305.00633v4'
         folder_version = os.path.join(tex_root, full_id)  # put all versions under .../<paper>/tex/<version>
         os.makedirs(folder_version, exist_ok=True)
+        if store is not None and version_complete(folder_version):
+            # Extracted by an earlier run (e.g. before a later version failed)
+            print(f"Already extracted: {full_id}")
+            metrics.ARCHIVES_REUSED.inc(reason="extracted")
+            extracted[version] = True
+            continue
 
         src_url = f"{ARXIV_HOST}/src/{full_id}"
-        tar_path = os.path.join(folder_version, f"{full_id}.tar.gz")
         print(f"Attempting source: {src_url}")
 
-        if not download_url(src_url, tar_path):
+        extracted[version] = download_source(src_url, folder_version, full_id, store=store)
+        if not extracted[version]:
             print(f"Source unavailable for {full_id}")
-            continue
-
-        # Validate and extract
-        if not tarfile.is_tarfile(tar_path):
-            print(f"Invalid tar archive for {full_id}. Removing file.")
-            try:
-                os.remove(tar_path)
-            except OSError as e:
-                print(f"Could not remove invalid file {tar_path}: {e}")
-            continue
-
-        try:
-            safe_extract_tar(tar_path, folder_version)
-            cleanup_non_tex_bib_files(folder_version)
-            print(f"✅ Extracted to {folder_version}")
-        except Exception as e:
-            print(f"⚠️ Extraction failed for {full_id}: {e}")
-        finally:
-            try:
-                os.remove(tar_path)
-            except OSError:
-                pass
 
     # Save metadata after all versions
     try:
-        save_metadata(result, folder_arxiv)
+        save_metadata(paper, folder_arxiv)
     except Exception as e:
         print(f"⚠️ Metadata save failed for {arxiv_id}: {e}")
+    return extracted
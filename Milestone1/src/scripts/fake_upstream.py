@@ -0,0 +1,385 @@
+import argparse
+import functools
+import gzip
+import hashlib
+import http.server
+import io
+import json
+import os
+import random
+import tarfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape, quoteattr
+
+FAKE_PORT = 8765
+MONTHS = ("2303", "2304")          # the two months benchmark ID ranges span
+NESTED_REFERENCE_LIMIT = 50        # /paper/batch truncates nested references like S2 does
+PDF_ONLY_RATE = 0.01               # share of papers served as a PDF instead of LaTeX
+S2_UNKNOWN_RATE = 0.02             # share of papers Semantic Scholar does not know
+SOURCE_CACHE_SIZE = 512            # tarballs kept in memory (versions are fetched once)
+SAME_SOURCE_RATE = 0.2             # share of revisions whose archive is byte-identical to the previous version
+SHARED_MACROS_RATE = 0.5           # share of papers including the same macros.tex
+SHARED_MACROS = ("\\newcommand{\\R}{\\mathbb{R}}\n\\newcommand{\\E}{\\mathbb{E}}\n"
+                 "\\newcommand{\\norm}[1]{\\left\\lVert#1\\right\\rVert}\n")
+UNLIMITED_RATE = (1e6, 1000)       # token bucket of the async engine when delays are off
+
+WORDS = (
+    "learning deep neural network graph quantum spin transport optimal control robust sparse "
+    "attention transformer diffusion model inference bayesian stochastic gradient dynamics "
+    "lattice field theory topological phase entanglement scalable efficient adaptive"
+).split()
+NAMES = ("Smith Nguyen Tran Garcia Muller Wang Li Zhang Kim Rossi Dubois Ivanov "
+         "Sato Kumar Silva Cohen Novak Berg Costa Lopez").split()
+CATEGORIES = ("cs.LG", "cs.CL", "quant-ph", "cond-mat.str-el", "math.OC", "stat.ML")
+
+# ---------------------------
+# Synthetic corpus
+# ---------------------------
+
+def _rng(*key):
+    return random.Random(":".join(map(str, key)))
+
+
+def _title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))).title()
+
+
+def _authors(rng):
+    return [f"{rng.choice('ABCDEFGH')}. {rng.choice(NAMES)}" for _ in range(rng.randint(1, 5))]
+
+
+class FakeCorpus:
+    """
+    Deterministic papers of MONTHS: IDs 1..papers_per_month exist in every month, and each
+    paper's versions, sources and references are derived from (seed, arXiv ID) alone.
+    """
+
+    def __init__(self, papers_per_month, seed=0):
+        self.papers_per_month = papers_per_month
+        self.seed = seed
+
+    def exists(self, arxiv_id):
+        yymm, _, number = arxiv_id.partition(".")
+        return yymm in MONTHS and number.isdigit() and 1 <= int(number) <= self.papers_per_month
+
+    @functools.lru_cache(maxsize=4096)
+    def paper(self, arxiv_id):
+        rng = _rng(self.seed, arxiv_id)
+        yymm = arxiv_id.split(".")[0]
+        day = rng.randint(1, 28)
+        versions = rng.choice((1, 1, 1, 2, 2, 3))
+        references = sorted({f"{rng.randint(10, 22):02d}{rng.randint(1, 12):02d}.{rng.randint(1, 20000):05d}"
+                             for _ in range(rng.randint(5, 80))})
+        return {
+            "id": arxiv_id,
+            "title": _title(rng),
+            "authors": _authors(rng),
+            "abstract": " ".join(rng.choice(WORDS) for _ in range(60)),
+            "categories": rng.sample(CATEGORIES, rng.randint(1, 3)),
+            "published": f"20{yymm[:2]}-{yymm[2:]}-{day:02d}T12:00:00Z",
+            "updated": f"20{yymm[:2]}-{yymm[2:]}-{min(day + versions - 1, 28):02d}T12:00:00Z",
+            "versions": versions,
+            "references": references,
+            "pdf_only": rng.random() < PDF_ONLY_RATE,
+            "s2_known": rng.random() >= S2_UNKNOWN_RATE,
+        }
+
+    def cited_paper(self, ref_id):
+        """The Semantic Scholar record of a referenced paper (the same for every citing paper)."""
+        rng = _rng(self.seed, "ref", ref_id)
+        year = 2000 + int(ref_id[:2])
+        return {
+            "paperId": f"s2-{ref_id}",
+            "title": _title(rng),
+            "authors": [{"name": a} for a in _authors(rng)],
+            "year": year,
+            "venue": rng.choice(("NeurIPS", "ICML", "PRL", "PRB", "")),
+            "externalIds": {"ArXiv": ref_id, **({"DOI": f"10.1000/{ref_id}"} if rng.random() < 0.5 else {})},
+            "publicationDate": f"{year}-{ref_id[2:4]}-01" if rng.random() < 0.7 else None,
+        }
+
+    # ---------------------------
+    # LaTeX sources
+    # ---------------------------
+
+    def source_files(self, arxiv_id, version):
+        """{name: bytes} of one version: main.tex, sections, refs.bib and a figure."""
+        paper = self.paper(arxiv_id)
+        rng = _rng(self.seed, arxiv_id, "tex")
+        refs = paper["references"]
+        keys = [f"ref{i}" for i in range(len(refs))]
+        sections = []
+        for s in range(rng.randint(3, 6)):
+            paragraphs = []
+            for _ in range(rng.randint(2, 5)):
+                cited = ",".join(rng.sample(keys, min(len(keys), rng.randint(1, 3))))
+                sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 40)))
+                paragraphs.append(f"{sentence.capitalize()} \\cite{{{cited}}}.")
+            if s == 0 and version > 1:
+                paragraphs.append(f"This is revision {version} of the paper.")
+            sections.append(f"\\section{{{_title(rng)}}}\n" + "\n\n".join(paragraphs) + "\n")
+
+        files = {f"sections/sec{s}.tex": text for s, text in enumerate(sections)}
+        macros = _rng(self.seed, arxiv_id, "macros").random() < SHARED_MACROS_RATE
+        if macros:
+            files["macros.tex"] = SHARED_MACROS
+        files["main.tex"] = (
+            "\\documentclass{article}\n\\usepackage{amsmath}\n" + ("\\input{macros}\n" if macros else "") +
+            f"\\title{{{paper['title']}}}\n\\begin{{document}}\n\\maketitle\n"
+            f"\\begin{{abstract}}\n{paper['abstract']}\n\\end{{abstract}}\n"
+            + "".join(f"\\input{{sections/sec{s}}}\n" for s in range(len(sections)))
+            + "\\bibliographystyle{plain}\n\\bibliography{refs}\n\\end{document}\n")
+
+        entries = []
+        for key, ref_id in zip(keys, refs):
+            if rng.random() < 0.2:        # not every S2 reference is in the .bib
+                continue
+            cited = self.cited_paper(ref_id)
+            words = cited["title"].split()
+            if rng.random() < 0.4:
+                del words[rng.randrange(len(words))]
+            authors = " and ".join(f"{a['name'].split()[-1]}, {a['name'].split()[0]}" for a in cited["authors"])
+            entries.append(f"@article{{{key},\n  title = {{{' '.join(words)}}},\n  author = {{{authors}}},\n"
+                           f"  year = {{{cited['year']}}},\n  journal = {{{cited['venue'] or 'arXiv'}}}\n}}\n")
+        files["refs.bib"] = "\n".join(entries)
+        blob = {name: text.encode("utf-8") for name, text in files.items()}
+        blob["figures/plot.png"] = rng.randbytes(20000)     # skipped by the extractor
+        return blob
+
+    def source_version(self, arxiv_id, version):
+        """The version whose sources a version carries: a metadata-only revision repeats the previous one."""
+        while version > 1 and _rng(self.seed, arxiv_id, "same", version).random() < SAME_SOURCE_RATE:
+            version -= 1
+        return version
+
+    @functools.lru_cache(maxsize=SOURCE_CACHE_SIZE)
+    def source(self, arxiv_id, version):
+        """The /src body of a version: a gzipped tarball (or a PDF for PDF-only papers), byte-stable."""
+        if self.paper(arxiv_id)["pdf_only"]:
+            return b"%PDF-1.5\n" + b"0" * 4096
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            for name, data in self.source_files(arxiv_id, self.source_version(arxiv_id, version)).items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = 1680000000
+                tar.addfile(info, io.BytesIO(data))
+        return gzip.compress(buffer.getvalue(), mtime=0)
+
+# ---------------------------
+# Responses
+# ---------------------------
+
+ATOM_HEAD = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" '
+             'xmlns:arxiv="http://arxiv.org/schemas/atom">\n<title>arXiv Query</title>\n')
+
+
+def atom_entry(paper):
+    full_id = f"{paper['id']}v{paper['versions']}"
+    authors = "".join(f"<author><name>{escape(a)}</name></author>" for a in paper["authors"])
+    categories = "".join(f'<category term={quoteattr(c)} scheme="http://arxiv.org/schemas/atom"/>'
+                         for c in paper["categories"])
+    return (f"<entry><id>http://arxiv.org/abs/{full_id}</id>"
+            f"<updated>{paper['updated']}</updated><published>{paper['published']}</published>"
+            f"<title>{escape(paper['title'])}</title><summary>{escape(paper['abstract'])}</summary>{authors}"
+            f"<arxiv:comment>{len(paper['references'])} references</arxiv:comment>"
+            f'<link href="http://arxiv.org/abs/{full_id}" rel="alternate" type="text/html"/>'
+            f'<link title="pdf" href="http://arxiv.org/pdf/{full_id}" rel="related" type="application/pdf"/>'
+            f'<arxiv:primary_category term={quoteattr(paper["categories"][0])} '
+            f'scheme="http://arxiv.org/schemas/atom"/>{categories}</entry>\n')
+
+
+def atom_feed(corpus, query):
+    """Export-API answer to an id_list query: the existing IDs only, paged by start/max_results."""
+    ids = [i for i in query.get("id_list", [""])[0].split(",") if i]
+    found = [corpus.paper(i.split("v")[0]) for i in ids if corpus.exists(i.split("v")[0])]
+    start = int(query.get("start", ["0"])[0])
+    size = int(query.get("max_results", [str(len(found))])[0])
+    entries = "".join(atom_entry(p) for p in found[start:start + size])
+    return (ATOM_HEAD + f"<opensearch:totalResults>{len(found)}</opensearch:totalResults>\n"
+            f"<opensearch:startIndex>{start}</opensearch:startIndex>\n{entries}</feed>\n")
+
+
+def s2_batch_paper(corpus, s2_id):
+    arxiv_id = s2_id.split(":", 1)[-1]
+    if not corpus.exists(arxiv_id) or not corpus.paper(arxiv_id)["s2_known"]:
+        return None
+    refs = corpus.paper(arxiv_id)["references"]
+    return {"paperId": f"s2-{arxiv_id}", "referenceCount": len(refs),
+            "references": [corpus.cited_paper(r) for r in refs[:NESTED_REFERENCE_LIMIT]]}
+
+
+def s2_references_page(corpus, arxiv_id, offset, limit):
+    refs = corpus.paper(arxiv_id)["references"]
+    page = {"offset": offset, "data": [{"citedPaper": corpus.cited_paper(r)} for r in refs[offset:offset + limit]]}
+    if offset + limit < len(refs):
+        page["next"] = offset + limit
+    return page
+
+# ---------------------------
+# Server
+# ---------------------------
+
+class FakeUpstream:
+    """
+    Local stand-in for export.arxiv.org, arxiv.org/src and the Semantic Scholar Graph API.
+    Every request waits `latency` seconds (per api: "export", "src", "s2") and is answered
+    429 with Retry-After: retry_after with probability rate_limit_rate.
+    """
+
+    def __init__(self, corpus, latency=0.0, rate_limit_rate=0.0, retry_after=1, seed=0,
+                 host="127.0.0.1", port=0):
+        self.corpus = corpus
+        self.latency = latency if isinstance(latency, dict) else {api: latency for api in ("export", "src", "s2")}
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.served = {}                  # (api, status) -> requests
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-upstream")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {f"{api} {status}": n for (api, status), n in sorted(self.served.items())}
+
+    def _admit(self, api):
+        """Sleep the api's latency; False if this request is rate limited."""
+        delay = self.latency.get(api, 0)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            return self._rng.random() >= self.rate_limit_rate
+
+    def _count(self, api, status):
+        with self._lock:
+            self.served[(api, status)] = self.served.get((api, status), 0) + 1
+
+    def route(self, method, path, query, body):
+        """(api, status, content type, body bytes) of a request."""
+        corpus = self.corpus
+        if path == "/api/query":
+            return "export", 200, "application/atom+xml", atom_feed(corpus, query).encode("utf-8")
+        if path.startswith("/src/"):
+            full_id = path[len("/src/"):]
+            arxiv_id, _, version = full_id.partition("v")
+            if not corpus.exists(arxiv_id) or not version.isdigit() \
+                    or not 1 <= int(version) <= corpus.paper(arxiv_id)["versions"]:
+                return "src", 404, "text/plain", b"not found"
+            return "src", 200, "application/x-eprint-tar", corpus.source(arxiv_id, int(version))
+        if path == "/graph/v1/paper/batch" and method == "POST":
+            ids = json.loads(body or b"{}").get("ids", [])
+            return "s2", 200, "application/json", json.dumps([s2_batch_paper(corpus, i) for i in ids]).encode()
+        if path.startswith("/graph/v1/paper/arXiv:") and path.endswith("/references"):
+            arxiv_id = path[len("/graph/v1/paper/arXiv:"):-len("/references")]
+            if s2_batch_paper(corpus, arxiv_id) is None:
+                return "s2", 404, "application/json", b'{"error": "Paper not found"}'
+            page = s2_references_page(corpus, arxiv_id, int(query.get("offset", ["0"])[0]),
+                                      int(query.get("limit", ["100"])[0]))
+            return "s2", 200, "application/json", json.dumps(page).encode()
+        return "other", 404, "text/plain", b"not found"
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def _serve(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                api, status, content_type, payload = upstream.route(method, url.path, parse_qs(url.query), body)
+                if api != "other" and not upstream._admit(api):
+                    status, content_type, payload = 429, "text/plain", b"Too Many Requests"
+                etag = f'"{hashlib.sha1(payload).hexdigest()}"' if api == "src" and status == 200 else None
+                if etag and etag in self.headers.get("If-None-Match", ""):
+                    status, payload = 304, b""
+                upstream._count(api, status)
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", str(upstream.retry_after))
+                elif etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def redirect_pipeline(upstream_url, cache_dir, keep_delays=False):
+    """
+    Point the crawler modules of this process at a FakeUpstream, with the ID probe and
+    Semantic Scholar caches under cache_dir; politeness delays are zeroed unless keep_delays.
+    """
+    import arXiv_handler
+    import async_engine
+    import downloader
+    import metadata_collector
+    import reference_extractor
+
+    for client in (arXiv_handler._client, metadata_collector._client):
+        client.query_url_format = f"{upstream_url}/api/query?{{}}"
+        if not keep_delays:
+            client.delay_seconds = 0
+    async_engine.EXPORT_API_URL = f"{upstream_url}/api/query"
+    downloader.ARXIV_HOST = upstream_url
+    reference_extractor.S2_API_HOST = f"{upstream_url}/graph/v1"
+
+    arXiv_handler.ID_CACHE_PATH = os.path.join(cache_dir, "id_cache.json")
+    arXiv_handler._cache = None
+    reference_extractor.CACHE_DIR = os.path.join(cache_dir, "s2_cache")
+    if not keep_delays:
+        reference_extractor.S2_MIN_INTERVAL = 0
+        async_engine.HOST_RATES = {host: UNLIMITED_RATE for host in async_engine.HOST_RATES}
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic arXiv / Semantic Scholar on localhost.")
+    parser.add_argument("--port", type=int, default=FAKE_PORT)
+    parser.add_argument("--papers-per-month", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="probability of answering 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeUpstream(FakeCorpus(args.papers_per_month, args.seed), args.latency, args.rate_limit,
+                          args.retry_after, args.seed, port=args.port).start()
+    print(f"🧪 Fake upstream on {server.url} (months {', '.join(MONTHS)}, {args.papers_per_month} papers each)")
+    print(f"   export API: {server.url}/api/query   sources: {server.url}/src/<id>   "
+          f"S2: {server.url}/graph/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
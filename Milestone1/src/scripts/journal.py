@@ -0,0 +1,235 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Paper states, in pipeline order
+PENDING = "pending"          # queued, nothing done yet
+FETCHED = "fetched"          # metadata resolved from the export API
+EXTRACTED = "extracted"      # .tex/.bib of at least one version on disk
+REFS_DONE = "refs_done"      # references.json written — paper complete
+FAILED = "failed"            # last attempt failed (see reason / quarantined)
+
+STATES = (PENDING, FETCHED, EXTRACTED, REFS_DONE, FAILED)
+QUARANTINED = "quarantined"  # state_counts row of failed papers that are quarantined (not a state)
+MAX_ATTEMPTS = 3             # transient failures are quarantined after this many attempts
+
+FOLDER_PATTERN = re.compile(r"^(\d{4})-(\d{5})$")  # folder name pattern YYMM-NNNNN
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    arxiv_id    TEXT PRIMARY KEY,
+    yymm        TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    quarantined INTEGER NOT NULL DEFAULT 0,
+    reason      TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS papers_state ON papers (state, quarantined);
+
+CREATE TABLE IF NOT EXISTS versions (
+    arxiv_id   TEXT NOT NULL,
+    version    INTEGER NOT NULL,
+    state      TEXT NOT NULL,
+    reason     TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (arxiv_id, version)
+);
+
+-- Per-state counters kept in sync by triggers so progress queries never scan papers
+CREATE TABLE IF NOT EXISTS state_counts (
+    state TEXT PRIMARY KEY,
+    n     INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS papers_count_insert AFTER INSERT ON papers BEGIN
+    INSERT OR IGNORE INTO state_counts (state, n) VALUES (NEW.state, 0);
+    UPDATE state_counts SET n = n + 1 WHERE state = NEW.state;
+END;
+CREATE TRIGGER IF NOT EXISTS papers_count_update AFTER UPDATE OF state ON papers
+WHEN OLD.state != NEW.state BEGIN
+    UPDATE state_counts SET n = n - 1 WHERE state = OLD.state;
+    INSERT OR IGNORE INTO state_counts (state, n) VALUES (NEW.state, 0);
+    UPDATE state_counts SET n = n + 1 WHERE state = NEW.state;
+END;
+CREATE TRIGGER IF NOT EXISTS papers_count_delete AFTER DELETE ON papers BEGIN
+    UPDATE state_counts SET n = n - 1 WHERE state = OLD.state;
+END;
+
+-- ... and the 'quarantined' counter (failed papers with quarantined = 1)
+CREATE TRIGGER IF NOT EXISTS papers_quarantined_insert AFTER INSERT ON papers
+WHEN NEW.state = 'failed' AND NEW.quarantined = 1 BEGIN
+    UPDATE state_counts SET n = n + 1 WHERE state = 'quarantined';
+END;
+CREATE TRIGGER IF NOT EXISTS papers_quarantined_update AFTER UPDATE OF state, quarantined ON papers
+WHEN (OLD.state = 'failed' AND OLD.quarantined = 1) != (NEW.state = 'failed' AND NEW.quarantined = 1) BEGIN
+    UPDATE state_counts SET n = n + CASE WHEN NEW.quarantined = 1 AND NEW.state = 'failed' THEN 1 ELSE -1 END
+    WHERE state = 'quarantined';
+END;
+CREATE TRIGGER IF NOT EXISTS papers_quarantined_delete AFTER DELETE ON papers
+WHEN OLD.state = 'failed' AND OLD.quarantined = 1 BEGIN
+    UPDATE state_counts SET n = n - 1 WHERE state = 'quarantined';
+END;
+"""
+
+
+class JobJournal:
+    """
+    SQLite (WAL mode) record of per-paper and per-version crawl state.
+    Shared by every worker thread; restarts resume from it instead of scanning the data dir.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if not self._conn.execute("SELECT 1 FROM state_counts WHERE state = ?", (QUARANTINED,)).fetchall():
+            # Journals created before the counter existed: count once, the triggers take over
+            self._conn.execute(
+                "INSERT INTO state_counts (state, n) "
+                "SELECT ?, COUNT(*) FROM papers WHERE state = ? AND quarantined = 1", (QUARANTINED, FAILED))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ---------------------------
+    # Writes
+    # ---------------------------
+
+    def add_papers(self, arxiv_ids):
+        """Register IDs as pending; IDs already in the journal keep their state."""
+        now = time.time()
+        rows = [(aid, aid.split('.')[0], PENDING, now) for aid in arxiv_ids]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO papers (arxiv_id, yymm, state, updated_at) VALUES (?, ?, ?, ?)",
+                rows)
+            self._conn.execute("COMMIT")
+
+    def start_attempts(self, arxiv_ids):
+        """Count one more attempt for every paper about to be (re)processed."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE papers SET attempts = attempts + 1, updated_at = ? WHERE arxiv_id = ?",
+                [(now, aid) for aid in arxiv_ids])
+            self._conn.execute("COMMIT")
+
+    def mark(self, arxiv_id, state):
+        self._execute("UPDATE papers SET state = ?, reason = NULL, updated_at = ? WHERE arxiv_id = ?",
+                      (state, time.time(), arxiv_id))
+
+    def mark_version(self, arxiv_id, version, state, reason=None):
+        self._execute(
+            "INSERT OR REPLACE INTO versions (arxiv_id, version, state, reason, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (arxiv_id, version, state, reason, time.time()))
+
+    def fail(self, arxiv_id, reason, permanent=False):
+        """
+        Record a failure. Permanent failures (withdrawn, no source, unknown ID) and papers
+        that exhausted MAX_ATTEMPTS are quarantined and never handed out again.
+        """
+        self._execute(
+            "UPDATE papers SET state = ?, reason = ?, updated_at = ?, "
+            "quarantined = CASE WHEN ? OR attempts >= ? THEN 1 ELSE 0 END WHERE arxiv_id = ?",
+            (FAILED, reason, time.time(), int(permanent), MAX_ATTEMPTS, arxiv_id))
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+
+    def state_of(self, arxiv_id):
+        rows = self._execute("SELECT state FROM papers WHERE arxiv_id = ?", (arxiv_id,))
+        return rows[0][0] if rows else None
+
+    def pending_ids(self):
+        """IDs that still need work, grouped by the state they are resuming from."""
+        rows = self._execute(
+            "SELECT arxiv_id, state FROM papers WHERE state != ? AND quarantined = 0 ORDER BY arxiv_id",
+            (REFS_DONE,))
+        resume = {}
+        for arxiv_id, state in rows:
+            resume.setdefault(state, []).append(arxiv_id)
+        return resume
+
+    def counts(self):
+        """{state: n} plus the number of quarantined papers, without scanning the papers table."""
+        counts = {state: 0 for state in STATES + (QUARANTINED,)}
+        counts.update(dict(self._execute("SELECT state, n FROM state_counts")))
+        return counts
+
+    def quarantined(self):
+        return self._execute(
+            "SELECT arxiv_id, reason FROM papers WHERE quarantined = 1 ORDER BY arxiv_id")
+
+    def print_progress(self, prefix="[Journal]"):
+        c = self.counts()
+        print(f"{prefix} pending={c[PENDING]} fetched={c[FETCHED]} extracted={c[EXTRACTED]} "
+              f"refs_done={c[REFS_DONE]} failed={c[FAILED]} (quarantined {c[QUARANTINED]})")
+
+    def merge_from(self, path, arxiv_ids):
+        """
+        Copy the paper and version rows of arxiv_ids from another journal file (the journal
+        of another crawler node), replacing what this journal had for them.
+        """
+        arxiv_ids = list(arxiv_ids)
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                self._conn.execute("BEGIN")
+                for i in range(0, len(arxiv_ids), 500):
+                    chunk = arxiv_ids[i:i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    # DELETE + INSERT rather than INSERT OR REPLACE, so the count triggers fire
+                    for table in ("papers", "versions"):
+                        self._conn.execute(f"DELETE FROM main.{table} WHERE arxiv_id IN ({marks})", chunk)
+                        self._conn.execute(f"INSERT INTO main.{table} SELECT * FROM other.{table} "
+                                           f"WHERE arxiv_id IN ({marks})", chunk)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._conn.execute("DETACH DATABASE other")
+
+    # ---------------------------
+    # Migration
+    # ---------------------------
+
+    def seed_from_directory(self, base_dir):
+        """
+        One-off import of a data dir crawled before the journal existed: a paper folder with
+        references.json is complete, one with metadata.json only needs its references.
+        """
+        now = time.time()
+        rows = []
+        for entry in os.scandir(base_dir):
+            m = FOLDER_PATTERN.match(entry.name)
+            if not (entry.is_dir() and m):
+                continue
+            if os.path.exists(os.path.join(entry.path, "references.json")):
+                state = REFS_DONE
+            elif os.path.exists(os.path.join(entry.path, "metadata.json")):
+                state = EXTRACTED
+            else:
+                continue
+            rows.append((f"{m.group(1)}.{m.group(2)}", m.group(1), state, now))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO papers (arxiv_id, yymm, state, updated_at) VALUES (?, ?, ?, ?)",
+                rows)
+            self._conn.execute("COMMIT")
+        return len(rows)
@@ -1,14 +1,44 @@
+import asyncio
+import atexit
+import json
+import multiprocessing
+import sys
 import threading
-import queue
 import time
-import arxiv
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
 import psutil
 from arXiv_handler import get_IDs_All
-from downloader import download
-from reference_extractor import extract_references_for_paper
+from downloader import download, format_yymm_id
+from metadata_collector import fetch_metadata_batch, METADATA_BATCH_SIZE
+from reference_extractor import extract_references_for_papers, S2_BATCH_SIZE
+from journal import JobJournal, FETCHED, EXTRACTED, REFS_DONE
+from staged_pipeline import Pipeline, Stage
+import concurrency
+import corpus_store
+import metrics
 import os
-import random
-import re
+
+HIERARCHY_PROCESSES = os.cpu_count() or 1    # LaTeX expansion and parsing run in a process pool
+HIERARCHY_BATCH_SIZE = 8      # papers per pool task (at most; a batch never waits to fill up)
+MATCHING_WORKERS = 1          # vectorized scoring
+PREDICTIONS_FILE = "predictions.json"
+MILESTONE2_SCRIPTS = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..",
+                                                  "Milestone2", "src", "scripts"))
+
+# Bounded queue in front of each stage (items): a full queue blocks the stage feeding it
+QUEUE_CAPACITY = {
+    "metadata": 2 * METADATA_BATCH_SIZE,    # IDs
+    "download": 32,                         # (arxiv_id, arxiv.Result) pairs
+    "reference": S2_BATCH_SIZE,             # IDs, so a reference batch can fill up
+    "hierarchy": 2 * HIERARCHY_PROCESSES * HIERARCHY_BATCH_SIZE,
+    "matching": 16,
+}
+
+_hierarchy_pool = None
+_hierarchy_pool_lock = threading.Lock()
 
 # ---------------------------
 # Helpers
@@ -20,32 +50,6 @@ def now_memory_mb():
 def print_mem(prefix=""):
     print(f"{prefix} RAM = {now_memory_mb():.2f} MB")
 
-# ---------------------------
-# Missing papers detection
-# ---------------------------
-
-PATTERN = re.compile(r"^(\d{4})-(\d{5})$")  # folder name pattern YYMM-NNNNN
-
-def collect_existing_ids(base_dir: str, target_months: list):
-    """Return a dict of existing paper tails for each target month."""
-    existing = {ym: set() for ym in target_months}
-    for entry in os.scandir(base_dir):
-        if entry.is_dir():
-            m = PATTERN.match(entry.name)
-            if m:
-                yymm, tail = m.group(1), int(m.group(2))
-                if yymm in target_months:
-                    existing[yymm].add(tail)
-    return existing
-
-def find_missing_ids(yymm, existing_set, start_tail, end_tail):
-    """Return sorted list of missing tails in a given range."""
-    expected_range = set(range(start_tail, end_tail + 1))
-    return sorted(expected_range - existing_set)
-
-def format_arxiv_ids(yymm, tails):
-    return [f"{yymm}.{t:05d}" for t in tails]
-
 # ---------------------------
 # Core Workers
 # ---------------------------
@@ -86,140 +90,261 @@ def fetch_ids_worker(start_month, start_year, start_ID,
             yymm_ranges[yymm][1] = max(yymm_ranges[yymm][1], tail)
 
     print(f"[Step 1] Built yymm_ranges: {yymm_ranges}")
+    metrics.STAGE_SECONDS.observe(time.time() - t0, stage="ids")
     print(f"[Step 1] Done in {time.time() - t0:.2f} sec | RAM used = {now_memory_mb() - mem0:.2f} MB\n")
 
     return selected_ids, yymm_ranges
 
-def download_with_retries(client, arxiv_id, max_retries=5):
-    for attempt in range(max_retries):
-        try:
-            search = arxiv.Search(id_list=[arxiv_id])
-            return next(client.results(search))
-        except Exception as e:
-            if "HTTP 429" in str(e) or "HTTP 503" in str(e):
-                wait = min(60 * (2 ** attempt), 600) + random.uniform(0, 5)
-                print(f"[Download] Busy: {e}. Retry in {wait:.1f}s")
-                time.sleep(wait)
-            else:
-                raise
-    raise RuntimeError(f"[Download] Failed after retries: {arxiv_id}")
-
-def download_worker(id_queue, download_queue, base_data_dir, delay=2):
-    client = arxiv.Client()
-    processed = 0
-    while True:
-        arxiv_id = id_queue.get()
-        if arxiv_id is None:
-            id_queue.task_done()
-            print(f"[Download] Thread exit. Total downloaded: {processed}")
-            break
-        try:
-            print(f"[Download] Start {arxiv_id}")
-            result_latest = download_with_retries(client, arxiv_id)
-
-            version_latest = int(result_latest.get_short_id().split('v')[1])
-            list_download = [result_latest]
-
-            for v in range(1, version_latest):
-                res = download_with_retries(client, f"{arxiv_id}v{v}")
-                list_download.append(res)
-
-            download(list_download, base_data_dir)
-            processed += 1
-            print(f"[Download] Done {arxiv_id} (Total {processed})")
-            download_queue.put(arxiv_id)
-            time.sleep(delay)
-        except Exception as e:
-            print(f"[Download] Error {arxiv_id}: {e}")
-        finally:
-            id_queue.task_done()
-
-def reference_worker(download_queue, base_data_dir, delay=2):
-    processed = 0
-    while True:
-        arxiv_id = download_queue.get()
-        if arxiv_id is None:
-            download_queue.task_done()
-            print(f"[Reference] Thread exit. Total extracted: {processed}")
-            break
-        try:
-            print(f"[Reference] Start {arxiv_id}")
-            extract_references_for_paper(arxiv_id, base_data_dir)
-            processed += 1
-            print(f"[Reference] Done {arxiv_id} (Total {processed})")
-            time.sleep(delay)
-        except Exception as e:
-            print(f"[Reference] Error {arxiv_id}: {e}")
-        finally:
-            download_queue.task_done()
+def resolve_metadata(ids, journal):
+    """Metadata stage: resolve a batch of IDs with one export-API request; yields (arxiv_id, latest_result)."""
+    papers = fetch_metadata_batch(ids)
+    print(f"[Metadata] Resolved {len(papers)}/{len(ids)} IDs in one request")
+    metrics.STAGE_ITEMS.inc(len(papers), stage="metadata", outcome="ok")
+    metrics.STAGE_ITEMS.inc(len(ids) - len(papers), stage="metadata", outcome="not_found")
+    for aid in ids:
+        if aid in papers:
+            journal.mark(aid, FETCHED)
+            yield aid, papers[aid]
+        else:
+            print(f"[Metadata] Not found: {aid}")
+            journal.fail(aid, "not found in arXiv export API", permanent=True)
+
+def download_papers(items, base_data_dir, journal):
+    """Download stage: download and extract every version of one paper; yields its ID once extracted."""
+    for arxiv_id, result_latest in items:
+        print(f"[Download] Start {arxiv_id}")
+        extracted = download(result_latest, base_data_dir)
+        for version, ok in extracted.items():
+            journal.mark_version(arxiv_id, version, EXTRACTED if ok else "failed",
+                                 None if ok else "no source")
+        if not any(extracted.values()):
+            # Withdrawn or PDF-only papers will never have a source: quarantine them
+            journal.fail(arxiv_id, "no LaTeX source for any version", permanent=True)
+            metrics.STAGE_ITEMS.inc(stage="download", outcome="no_source")
+            continue
+        journal.mark(arxiv_id, EXTRACTED)
+        metrics.STAGE_ITEMS.inc(stage="download", outcome="ok")
+        print(f"[Download] Done {arxiv_id}")
+        yield arxiv_id
+
+def fetch_references(ids, base_data_dir, journal):
+    """Reference stage: batched Semantic Scholar calls for up to S2_BATCH_SIZE papers (cached papers cost none)."""
+    print(f"[Reference] Start {len(ids)} papers: {ids[:3]}...")
+    extract_references_for_papers(ids, base_data_dir)
+    for aid in ids:
+        journal.mark(aid, REFS_DONE)
+    metrics.STAGE_ITEMS.inc(len(ids), stage="reference", outcome="ok")
+    print(f"[Reference] Done {len(ids)} papers")
+    return ids
+
+def stage_failed(stage, journal):
+    """on_error of a crawl stage: count the batch as failed and record it in the journal."""
+    def on_error(batch, error):
+        ids = [item[0] if isinstance(item, tuple) else item for item in batch]
+        metrics.STAGE_ITEMS.inc(len(ids), stage=stage, outcome="failed")
+        for aid in ids:
+            journal.fail(aid, f"{stage}: {error}")
+    return on_error
 
 # ---------------------------
-# Missing papers auto-recovery
+# Milestone 2 stages
 # ---------------------------
 
-def recover_missing_papers(base_dir, yymm_ranges):
+def hierarchy_pool():
+    """Processes of the hierarchy stage (CPU-bound: threads would contend for the GIL), shut down at exit."""
+    global _hierarchy_pool
+    with _hierarchy_pool_lock:
+        if _hierarchy_pool is None:
+            _hierarchy_pool = ProcessPoolExecutor(HIERARCHY_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_hierarchy_pool.shutdown)
+        return _hierarchy_pool
+
+def reset_hierarchy_pool(broken):
+    """Drop a pool that lost a process (every later submit() would raise BrokenProcessPool)."""
+    global _hierarchy_pool
+    with _hierarchy_pool_lock:
+        if _hierarchy_pool is broken:
+            _hierarchy_pool = None
+    broken.shutdown(wait=False)
+
+def build_hierarchies(ids, base_data_dir, output_dir):
     """
-    Loop until all missing papers are downloaded.
-    Automatically detects missing papers in target months.
+    Hierarchy stage: incremental Milestone 2 build of a batch in a pool process; yields papers that have one.
+    If a pool process dies, the batch is resubmitted once on a fresh pool.
     """
-    target_months = list(yymm_ranges.keys())
-    while True:
-        existing = collect_existing_ids(base_dir, target_months)
-        missing_ids = []
-
-        for yymm in target_months:
-            start_tail, end_tail = yymm_ranges[yymm]
-            missing_tails = find_missing_ids(yymm, existing.get(yymm, set()), start_tail, end_tail)
-            missing_ids.extend(format_arxiv_ids(yymm, missing_tails))
-
-        if not missing_ids:
-            print(f"\n✅ No missing papers left for months: {target_months}")
-            break
-
-        print(f"\n⚠️ Missing papers detected ({len(missing_ids)}): {missing_ids[:20]}{'...' if len(missing_ids)>20 else ''}")
-
-        id_queue = queue.Queue(maxsize=len(missing_ids) + DOWNLOAD_THREAD_COUNT)
-        download_queue = queue.Queue(maxsize=len(missing_ids) + REFERENCE_THREAD_COUNT)
-
-        for aid in missing_ids:
-            id_queue.put(aid)
-        for _ in range(DOWNLOAD_THREAD_COUNT):
-            id_queue.put(None)
+    from build_hierarchy import process_chunk
+    paper_dirs = [str(Path(base_data_dir) / format_yymm_id(aid)) for aid in ids]
+    pool = hierarchy_pool()
+    try:
+        results = pool.submit(process_chunk, paper_dirs, str(output_dir)).result()
+    except BrokenProcessPool:
+        print(f"[Hierarchy] A pool process died: resubmitting {len(ids)} papers on a fresh pool")
+        reset_hierarchy_pool(pool)
+        results = hierarchy_pool().submit(process_chunk, paper_dirs, str(output_dir)).result()
+    for aid, result in zip(ids, results):
+        metrics.STAGE_ITEMS.inc(stage="hierarchy", outcome=result["status"])
+        if result["status"] == "error":
+            print(f"[Hierarchy] Error {aid}: {result['error']}")
+        elif result["status"] in ("ok", "unchanged"):
+            yield aid
+
+def match_references(ids, output_dir, model):
+    """Matching stage: rank the candidates of each BibTeX entry; top-5 go to predictions.json."""
+    from corpus_reader import PaperRecord, MATCHING_FIELDS
+    from scoring import generate_predictions_batched
+    for aid in ids:
+        record = PaperRecord(Path(output_dir) / format_yymm_id(aid))
+        if not all(record.has(field) and record[field] for field in MATCHING_FIELDS):
+            metrics.STAGE_ITEMS.inc(stage="matching", outcome="no_bibtex")
+            continue
+        predictions = generate_predictions_batched(record.paper_id, record, model)
+        record.release()
+        with open(record.paper_dir / PREDICTIONS_FILE, "w", encoding="utf-8") as f:
+            json.dump(predictions, f, indent=2, ensure_ascii=False)
+        metrics.STAGE_ITEMS.inc(stage="matching", outcome="ok")
+        yield aid
+
+def load_matching_model(path):
+    """A matching model saved from the Milestone 2 notebook with joblib.dump(model, path)."""
+    import joblib   # installed with scikit-learn, which the model needs anyway
+    model = joblib.load(path)
+    print(f"[Matching] Loaded model from {path}")
+    return model
+
+def paper_stages(base_data_dir, output_dir, model=None):
+    """
+    Milestone 2 stages to chain after the crawl: the hierarchy build of every paper whose
+    references are done, then, given a trained matching model, reference matching.
+    Predictions go to predictions.json rather than pred.json, which holds labeled ground truth.
+    """
+    if MILESTONE2_SCRIPTS not in sys.path:
+        sys.path.insert(0, MILESTONE2_SCRIPTS)
+    output_dir = Path(output_dir)
+    # One thread per pool process keeps every process busy
+    stages = [Stage("hierarchy", partial(build_hierarchies, base_data_dir=base_data_dir, output_dir=output_dir),
+                    workers=HIERARCHY_PROCESSES, batch_size=HIERARCHY_BATCH_SIZE, capacity=QUEUE_CAPACITY["hierarchy"])]
+    if model is not None:
+        stages.append(Stage("matching", partial(match_references, output_dir=output_dir, model=model),
+                            workers=MATCHING_WORKERS, capacity=QUEUE_CAPACITY["matching"]))
+    return stages
 
-        # Start download threads
-        download_threads = []
-        for _ in range(DOWNLOAD_THREAD_COUNT):
-            t = threading.Thread(target=download_worker, args=(id_queue, download_queue, base_dir))
-            t.start()
-            download_threads.append(t)
+# ---------------------------
+# Pipelines
+# ---------------------------
 
-        # Start reference threads
-        reference_threads = []
-        for _ in range(REFERENCE_THREAD_COUNT):
-            t = threading.Thread(target=reference_worker, args=(download_queue, base_dir))
-            t.start()
-            reference_threads.append(t)
+def crawl_stages(base_dir, journal):
+    """
+    Metadata → download → reference. The download and reference pools run their controller's
+    maximum of threads; the AIMD limit decides how many are active.
+    """
+    download_controller = concurrency.CONTROLLERS["download"]
+    reference_controller = concurrency.CONTROLLERS["reference"]
+    return [
+        Stage("metadata", partial(resolve_metadata, journal=journal),
+              batch_size=METADATA_BATCH_SIZE, capacity=QUEUE_CAPACITY["metadata"],
+              on_error=stage_failed("metadata", journal)),
+        Stage("download", partial(download_papers, base_data_dir=base_dir, journal=journal),
+              workers=download_controller.maximum, capacity=QUEUE_CAPACITY["download"],
+              controller=download_controller, on_error=stage_failed("download", journal)),
+        Stage("reference", partial(fetch_references, base_data_dir=base_dir, journal=journal),
+              workers=reference_controller.maximum, batch_size=S2_BATCH_SIZE,
+              capacity=QUEUE_CAPACITY["reference"], controller=reference_controller,
+              on_error=stage_failed("reference", journal)),
+    ]
+
+def run_thread_pipeline(arxiv_ids, base_dir, journal, refs_only_ids=(), extra_stages=(), stop=None):
+    """
+    Stream the papers through the staged pipeline (staged_pipeline.py): bounded queues between
+    the stages, so memory does not grow with the number of papers, and a paper goes through
+    extra_stages (e.g. paper_stages) as soon as its references are done.
+    refs_only_ids already have their sources on disk and enter at the reference stage.
+    stop: a callable that cancels the pipeline as soon as it returns True (see Pipeline.run).
+    Returns the finished Pipeline: its processed counts, and whether it was drained or cancelled.
+    """
+    pipeline = Pipeline(crawl_stages(base_dir, journal) + list(extra_stages))
+    pipeline.feed(arxiv_ids)
+    pipeline.feed(refs_only_ids, stage="reference")
+    pipeline.run(stop)
+    return pipeline
 
-        id_queue.join()
+def run_pipeline(arxiv_ids, base_dir, journal, engine="threads", refs_only_ids=(), extra_stages=(), stop=None):
+    """
+    Run the selected engine: "threads" (staged pipeline) or "async" (asyncio + token buckets, crawl only).
+    stop: a callable polled while it runs; the run is cancelled as soon as it returns True.
+    Returns the Pipeline (threads) or the stats dict of run_async_pipeline (async).
+    """
+    journal.start_attempts(list(arxiv_ids) + list(refs_only_ids))
+    try:
+        if engine == "async":
+            if extra_stages:
+                raise ValueError("the async engine only crawls; use engine='threads' for extra stages")
+            from async_engine import run_async_pipeline   # aiohttp/feedparser are only needed here
+            return asyncio.run(run_async_pipeline(list(arxiv_ids) + list(refs_only_ids), base_dir,
+                                                  journal=journal, stop=stop))
+        return run_thread_pipeline(arxiv_ids, base_dir, journal, refs_only_ids, extra_stages, stop)
+    finally:
+        # Seal the corpus store's open segments and merge each month into one file
+        corpus_store.compact_all()
 
-        for _ in range(REFERENCE_THREAD_COUNT):
-            download_queue.put(None)
-        download_queue.join()
+# ---------------------------
+# Resume from the job journal
+# ---------------------------
 
-        for t in download_threads:
-            t.join()
-        for t in reference_threads:
-            t.join()
+def resume_pending_papers(journal, base_dir, engine="threads", only=None, extra_stages=(), stop=None):
+    """
+    Re-run the pipeline on every journal entry that is neither done nor quarantined.
+    Papers whose sources are already extracted only redo the reference stage. Each round
+    costs one attempt per paper, so transient failures end up quarantined and the loop ends.
+    It also ends after a round that was drained or cancelled (Ctrl-C), or that handled no
+    paper at all; the papers left stay pending for the next run.
+    only: restrict the rounds to these IDs (the papers of one shard, see shards.py).
+    extra_stages: stages run on each paper after its references (see paper_stages).
+    stop: a callable that, once it returns True, cancels the current round and ends the loop
+    (e.g. a lost shard lease, see shards.py).
+    """
+    while True:
+        if stop is not None and stop():
+            print("\n⏹️ Stop requested: the remaining papers stay pending in the journal")
+            break
+        resume = journal.pending_ids()
+        if only is not None:
+            resume = {state: [aid for aid in ids if aid in only] for state, ids in resume.items()}
+            resume = {state: ids for state, ids in resume.items() if ids}
+        if not resume:
+            print("\n✅ No pending papers left in the journal")
+            break
 
-        print("✅ Batch complete. Rechecking for missing papers...\n")
+        refs_only = resume.pop(EXTRACTED, [])
+        full = [aid for ids in resume.values() for aid in ids]
+        print(f"\n⚠️ Resuming {len(full)} papers (+{len(refs_only)} reference-only): "
+              f"{(full + refs_only)[:20]}{'...' if len(full) + len(refs_only) > 20 else ''}")
+
+        outcome = run_pipeline(full, base_dir, journal, engine, refs_only, extra_stages, stop)
+        journal.print_progress()
+        if engine == "async":
+            if outcome.get("cancelled"):
+                print("\n⏹️ Stop requested: the remaining papers stay pending in the journal")
+                break
+            handled = outcome["processed"] + outcome["failed"]
+        else:
+            if outcome.draining or outcome.cancelled:
+                print("\n⏹️ Pipeline interrupted: the remaining papers stay pending in the journal")
+                break
+            handled = sum(outcome.processed.values())
+        if not handled:
+            print("\n⚠️ No paper was handled in this round: stopping (the rest stay pending)")
+            break
 
 # ---------------------------
 # Main
 # ---------------------------
 
 if __name__ == "__main__":
-    DOWNLOAD_THREAD_COUNT = 3
-    REFERENCE_THREAD_COUNT = 2
+    # Download / reference concurrency adapts at runtime: see concurrency.STAGE_LIMITS
+    ENGINE = "threads"  # "threads" or "async"
+    METRICS_PORT = metrics.METRICS_PORT  # /metrics and /summary endpoint (None to disable)
+    HIERARCHY_OUTPUT_DIR = None  # Milestone 2 output folder: build hierarchies while crawling (None: crawl only)
+    MATCHING_MODEL_PATH = None   # joblib file of a trained matching model: also match references (needs HIERARCHY_OUTPUT_DIR)
 
     base_data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "23127130_Test"))
     os.makedirs(base_data_dir, exist_ok=True)
@@ -237,52 +362,44 @@ if __name__ == "__main__":
 
     print("Starting pipeline...\n")
     print_mem("[START]")
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
     pipeline_start = time.time()
 
-    # Step 1: fetch IDs and build yymm_ranges
-    selected_ids, yymm_ranges = fetch_ids_worker(
+    journal_path = os.path.join(base_data_dir, "journal.sqlite3")
+    new_journal = not os.path.exists(journal_path)
+    journal = JobJournal(journal_path)
+    if new_journal:
+        print(f"[Journal] Imported {journal.seed_from_directory(base_data_dir)} existing papers")
+
+    # Step 1: fetch IDs and register them in the journal
+    selected_ids, _ = fetch_ids_worker(
         start_month, start_year, start_ID,
         end_month, end_year, end_ID,
         start_index, num_papers,
         download_all
     )
-    print(yymm_ranges)
-
-    # Initial download batch
-    id_queue = queue.Queue(maxsize=len(selected_ids) + DOWNLOAD_THREAD_COUNT)
-    download_queue = queue.Queue(maxsize=len(selected_ids) + REFERENCE_THREAD_COUNT)
-
-    for aid in selected_ids:
-        id_queue.put(aid)
-    for _ in range(DOWNLOAD_THREAD_COUNT):
-        id_queue.put(None)
-
-    download_threads = []
-    for _ in range(DOWNLOAD_THREAD_COUNT):
-        t = threading.Thread(target=download_worker, args=(id_queue, download_queue, base_data_dir))
-        t.start()
-        download_threads.append(t)
-
-    reference_threads = []
-    for _ in range(REFERENCE_THREAD_COUNT):
-        t = threading.Thread(target=reference_worker, args=(download_queue, base_data_dir))
-        t.start()
-        reference_threads.append(t)
-
-    id_queue.join()
-    for _ in range(REFERENCE_THREAD_COUNT):
-        download_queue.put(None)
-    download_queue.join()
-    for t in download_threads:
-        t.join()
-    for t in reference_threads:
-        t.join()
-
-    # Step 2: recover missing papers
-    recover_missing_papers(base_data_dir, yymm_ranges)
+    journal.add_papers(selected_ids)
+    journal.print_progress()
+
+    # Step 2: process everything that is not done yet (first run and restarts alike)
+    extra_stages = ()
+    if HIERARCHY_OUTPUT_DIR:
+        model = load_matching_model(MATCHING_MODEL_PATH) if MATCHING_MODEL_PATH else None
+        extra_stages = paper_stages(base_data_dir, HIERARCHY_OUTPUT_DIR, model)
+    elif MATCHING_MODEL_PATH:
+        print("⚠️ MATCHING_MODEL_PATH is ignored without HIERARCHY_OUTPUT_DIR")
+    resume_pending_papers(journal, base_data_dir, ENGINE, extra_stages=extra_stages)
+
+    for arxiv_id, reason in journal.quarantined():
+        print(f"[Journal] Quarantined {arxiv_id}: {reason}")
+    journal.close()
 
     total_time = time.time() - pipeline_start
     total_ram_used = now_memory_mb()
+    summary_path = os.path.join(base_data_dir, "metrics_summary.json")
+    metrics.print_summary(metrics.dump_summary(summary_path))
+    print(f"[Metrics] Summary written to {summary_path}")
 
     print("\n===============================")
     print(f"Pipeline complete in {total_time:.2f} sec")
@@ -1,5 +1,46 @@
 import os
-import json
+import time
+import arxiv
+import concurrency
+import corpus_store
+import metrics
+
+METADATA_BATCH_SIZE = 100   # papers resolved per export-API request
+
+_client = arxiv.Client(page_size=METADATA_BATCH_SIZE)
+
+
+def fetch_metadata_batch(arxiv_ids, max_retries=5):
+    """
+    Resolve up to METADATA_BATCH_SIZE papers with a single id_list query.
+    Unversioned IDs resolve to their latest version, so the version count of every
+    paper is read from its short ID and no per-version lookups are needed.
+
+    Returns:
+        dict: {base_id: arxiv.Result of the latest version}; IDs not found are absent
+    """
+    search = arxiv.Search(id_list=list(arxiv_ids), max_results=len(arxiv_ids))
+    wanted = set(arxiv_ids)
+    for attempt in range(max_retries):
+        try:
+            papers = {}
+            with metrics.API_SECONDS.time(api="export"):
+                for result in _client.results(search):
+                    base_id = result.get_short_id().split('v')[0]
+                    if base_id in wanted:
+                        papers[base_id] = result
+            metrics.API_RESPONSES.inc(api="export", status="200")
+            return papers
+        except Exception as e:
+            if "HTTP 429" in str(e) or "HTTP 503" in str(e):
+                metrics.RATE_LIMITED.inc(api="export")
+                # The arxiv client drops the response headers: no Retry-After to honor here
+                wait = concurrency.backoff_seconds(None, attempt)
+                print(f"[Metadata] Busy: {e}. Retry in {wait:.1f}s")
+                time.sleep(wait)
+            else:
+                raise
+    raise RuntimeError(f"[Metadata] Failed after retries: {len(arxiv_ids)} IDs")
 
 
 def create_metadata(paper):
@@ -44,16 +85,15 @@ def create_metadata(paper):
 
 def save_metadata(paper, folder):
     """
-    Save metadata.json for a single paper into the given folder.
+    Append a single paper's metadata to the corpus store of the data directory holding folder
+    (plus folder/metadata.json when corpus_store.WRITE_LEGACY_JSON is set).
     """
     metadata = create_metadata(paper)
 
     folder_path = os.path.abspath(folder)
-    os.makedirs(folder_path, exist_ok=True)
-    save_path = os.path.join(folder_path, "metadata.json")
-
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=4, ensure_ascii=False)
+    corpus_store.get_store(os.path.dirname(folder_path)).append_metadata([metadata])
+    if corpus_store.WRITE_LEGACY_JSON:
+        corpus_store.write_legacy_metadata(folder_path, metadata)
 
-    print(f"💾 Saved metadata to {save_path}")
+    print(f"💾 Saved metadata of {metadata['arxiv_id']}")
     return metadata
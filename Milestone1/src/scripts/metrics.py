@@ -0,0 +1,465 @@
+import http.server
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+METRICS_PORT = 9108            # default port of the /metrics endpoint
+SAMPLE_INTERVAL = 1.0          # seconds between queue-depth samples
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# ---------------------------
+# Metric types
+# ---------------------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _round(value, digits=6):
+    return round(value, digits) if value is not None else None
+
+
+class _Metric:
+    """A named metric family; one series per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def series(self):
+        with self._lock:
+            return dict(self._series)
+
+    def label_string(self, key):
+        return ",".join(f"{n}={v}" for n, v in zip(self.labelnames, key)) or "total"
+
+
+class Counter(_Metric):
+    """Monotonic count (requests, bytes, 429 responses, ...)."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def expose(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(self.series().items())]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; set_function() reads it at collection time (queue depths)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = fn
+
+    def series(self):
+        with self._lock:
+            values = dict(self._series)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return values
+
+    def value(self, **labels):
+        return self.series().get(self._key(labels), 0)
+
+    def expose(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(self.series().items())]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with sum and count (latencies, sizes)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def series(self):
+        with self._lock:
+            return {k: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                    for k, s in self._series.items()}
+
+    def quantile(self, q, series):
+        """Estimate of the q-quantile from bucket counts (linear inside a bucket, as histogram_quantile)."""
+        if not series["count"]:
+            return None
+        rank = q * series["count"]
+        seen, lower = 0, 0.0
+        for bound, count in zip(self.buckets, series["counts"]):
+            if seen + count >= rank and count:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound if bound != math.inf else lower
+        return lower
+
+    def stats(self, series):
+        return {
+            "count": series["count"],
+            "sum": round(series["sum"], 6),
+            "mean": round(series["sum"] / series["count"], 6) if series["count"] else None,
+            **{f"p{round(q * 100)}": _round(self.quantile(q, series)) for q in (0.50, 0.95, 0.99)},
+        }
+
+    def expose(self):
+        lines = []
+        for key, series in sorted(self.series().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+# ---------------------------
+# Registry
+# ---------------------------
+
+class Registry:
+    """Every metric of the process, rendered as Prometheus text or as a JSON summary."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self.metrics[metric.name] = metric
+
+    def exposition(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """{"counters": ..., "gauges": ..., "histograms": ...} keyed by metric name then label string."""
+        out = {"counters": {}, "gauges": {}, "histograms": {}}
+        for metric in self.metrics.values():
+            if isinstance(metric, Histogram):
+                values = {metric.label_string(k): metric.stats(s) for k, s in metric.series().items()}
+            else:
+                values = {metric.label_string(k): v for k, v in metric.series().items()}
+            if values:
+                out[metric.kind + "s"][metric.name] = values
+        return out
+
+
+REGISTRY = Registry()
+
+# ---------------------------
+# Pipeline metrics
+# ---------------------------
+
+# ID discovery (arXiv_handler)
+ID_PROBES = Counter("arxiv_id_probes_total", "IDs probed for existence, by result", ["result"])
+
+# Upstream APIs: export = export.arxiv.org, src = arxiv.org/src, s2 = Semantic Scholar
+API_SECONDS = Histogram("arxiv_api_request_seconds", "Latency of one upstream request", ["api"])
+API_RESPONSES = Counter("arxiv_api_responses_total", "Upstream responses by status", ["api", "status"])
+RATE_LIMITED = Counter("arxiv_rate_limited_total", "429/503 responses (requests that had to back off)", ["api"])
+
+# Sources and references
+BYTES_DOWNLOADED = Counter("arxiv_downloaded_bytes_total", "Bytes of /src bodies read from the network")
+FILES_EXTRACTED = Counter("arxiv_extracted_files_total", ".tex/.bib files written")
+EXTRACT_SECONDS = Histogram("arxiv_extract_seconds", "Streaming extraction time of one version")
+REFERENCE_FETCH_SECONDS = Histogram("arxiv_reference_fetch_seconds",
+                                    "Semantic Scholar fetch of one batch of papers (cache hits included)")
+S2_CACHE = Counter("arxiv_s2_cache_total", "Reference cache lookups, by result", ["result"])
+BLOBS = Counter("arxiv_blobs_total", "Extracted files by blob store outcome (new, duplicate)", ["outcome"])
+BLOB_BYTES = Counter("arxiv_blob_bytes_total", "Bytes of extracted files by blob store outcome", ["outcome"])
+ARCHIVES_REUSED = Counter("arxiv_archives_reused_total",
+                          "Versions linked from an archive seen before instead of downloaded", ["reason"])
+
+# Stages, queues and threads
+STAGE_SECONDS = Histogram("arxiv_stage_seconds", "Time a worker spent on one item of a stage", ["stage"])
+STAGE_ITEMS = Counter("arxiv_stage_items_total", "Items finished per stage, by outcome", ["stage", "outcome"])
+QUEUE_DEPTH = Gauge("arxiv_queue_depth", "Items waiting in a pipeline queue", ["queue"])
+QUEUE_DEPTH_SAMPLES = Histogram("arxiv_queue_depth_samples", "Queue depth sampled every SAMPLE_INTERVAL",
+                                ["queue"], buckets=DEPTH_BUCKETS)
+WORKER_THREADS = Gauge("arxiv_worker_threads", "Live worker threads per stage", ["stage"])
+WORKER_BUSY = Gauge("arxiv_worker_busy", "Worker threads currently processing an item", ["stage"])
+WORKER_BUSY_SECONDS = Counter("arxiv_worker_busy_seconds_total", "Thread time spent processing items", ["stage"])
+WORKER_ALIVE_SECONDS = Counter("arxiv_worker_alive_seconds_total", "Thread time of exited workers", ["stage"])
+CONCURRENCY_LIMIT = Gauge("arxiv_concurrency_limit", "Adaptive (AIMD) limit of items in flight per stage", ["stage"])
+BACKOFFS = Counter("arxiv_concurrency_backoffs_total", "Multiplicative decreases of a stage's limit", ["stage"])
+PROCESS_RSS = Gauge("arxiv_process_rss_bytes", "Resident memory of the crawler process")
+PROCESS_RSS.set_function(lambda: psutil.Process(os.getpid()).memory_info().rss)
+
+_live_workers = {}             # stage -> {thread id: start time}
+_live_lock = threading.Lock()
+_watched_queues = {}
+_peak_rss = [0]
+
+# ---------------------------
+# Instrumentation helpers
+# ---------------------------
+
+@contextmanager
+def worker_thread(stage):
+    """Wrap a worker thread's whole loop: counts it as a live thread of `stage`."""
+    ident, t0 = threading.get_ident(), time.perf_counter()
+    with _live_lock:
+        _live_workers.setdefault(stage, {})[ident] = t0
+    WORKER_THREADS.inc(stage=stage)
+    try:
+        yield
+    finally:
+        WORKER_THREADS.dec(stage=stage)
+        with _live_lock:
+            _live_workers[stage].pop(ident, None)
+        WORKER_ALIVE_SECONDS.inc(time.perf_counter() - t0, stage=stage)
+
+
+@contextmanager
+def busy(stage):
+    """Wrap the processing of one item (not the queue wait nor the politeness sleep)."""
+    WORKER_BUSY.inc(stage=stage)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        WORKER_BUSY.dec(stage=stage)
+        WORKER_BUSY_SECONDS.inc(elapsed, stage=stage)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+
+
+def utilization(stage):
+    """Share of its threads' lifetime a stage spent processing items (0..1); None without threads."""
+    now = time.perf_counter()
+    with _live_lock:
+        alive = sum(now - t0 for t0 in _live_workers.get(stage, {}).values())
+    alive += WORKER_ALIVE_SECONDS.value(stage=stage)
+    return WORKER_BUSY_SECONDS.value(stage=stage) / alive if alive > 0 else None
+
+
+def watch_queue(name, q):
+    """Expose q.qsize() as arxiv_queue_depth{queue=name} and sample it in the background."""
+    QUEUE_DEPTH.set_function(q.qsize, queue=name)
+    _watched_queues[name] = q
+    _start_sampler()
+
+
+_sampler = None
+
+def _start_sampler():
+    global _sampler
+    if _sampler is not None:
+        return
+
+    def sample():
+        while True:
+            for name, q in list(_watched_queues.items()):
+                QUEUE_DEPTH_SAMPLES.observe(q.qsize(), queue=name)
+            _peak_rss[0] = max(_peak_rss[0], PROCESS_RSS.value())
+            time.sleep(SAMPLE_INTERVAL)
+
+    _sampler = threading.Thread(target=sample, daemon=True, name="metrics-sampler")
+    _sampler.start()
+
+# ---------------------------
+# Summary
+# ---------------------------
+
+def summary():
+    """JSON-ready summary of the run: every metric plus per-stage and per-queue rollups."""
+    snapshot = REGISTRY.snapshot()
+    _peak_rss[0] = max(_peak_rss[0], PROCESS_RSS.value())
+
+    stages = {}
+    stage_names = {k[0] for k in WORKER_BUSY_SECONDS.series()} | {k[0] for k in STAGE_SECONDS.series()}
+    stage_latency = STAGE_SECONDS.series()
+    items = STAGE_ITEMS.series()
+    limits = CONCURRENCY_LIMIT.series()
+    for stage in sorted(stage_names):
+        latency = STAGE_SECONDS.stats(stage_latency[(stage,)]) if (stage,) in stage_latency else {}
+        share = utilization(stage)
+        stages[stage] = {
+            "items": {outcome: n for (s, outcome), n in items.items() if s == stage},
+            "busy_seconds": round(WORKER_BUSY_SECONDS.value(stage=stage), 3),
+            "utilization": round(share, 3) if share is not None else None,
+            "p50_seconds": latency.get("p50"),
+            "p99_seconds": latency.get("p99"),
+            "concurrency_limit": limits.get((stage,)),
+        }
+
+    queues = {}
+    for (name,), series in QUEUE_DEPTH_SAMPLES.series().items():
+        nonzero = [b for b, c in zip(QUEUE_DEPTH_SAMPLES.buckets, series["counts"]) if c]
+        queues[name] = {"samples": series["count"],
+                        "mean_depth": round(series["sum"] / series["count"], 2) if series["count"] else 0,
+                        "max_depth_bucket": nonzero[-1] if nonzero else 0,
+                        "p99_depth": _round(QUEUE_DEPTH_SAMPLES.quantile(0.99, series), 2)}
+
+    # The busiest thread pool is the one the others wait on
+    pools = [s for s in stages if stages[s]["utilization"] is not None]
+    bottleneck = max(pools, key=lambda s: stages[s]["utilization"]) if pools else None
+    return {
+        "elapsed_seconds": round(time.time() - REGISTRY.started, 3),
+        "peak_rss_mb": round(_peak_rss[0] / 1024 ** 2, 2),
+        "bottleneck": bottleneck,
+        "stages": stages,
+        "queues": queues,
+        **snapshot,
+    }
+
+
+def dump_summary(path):
+    """Write summary() to path atomically; returns the summary."""
+    data = summary()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    return data
+
+
+def print_summary(data=None):
+    data = data or summary()
+    print("\n[Metrics] stage        items   busy(s)  util   p50(s)   p99(s)")
+    for stage, s in data["stages"].items():
+        p50 = f"{s['p50_seconds']:.3f}" if s["p50_seconds"] is not None else "-"
+        p99 = f"{s['p99_seconds']:.3f}" if s["p99_seconds"] is not None else "-"
+        util = f"{s['utilization']:.0%}" if s["utilization"] is not None else "-"
+        print(f"[Metrics] {stage:<12}{sum(s['items'].values()):6}{s['busy_seconds']:10.1f}"
+              f"{util:>6}{p50:>9}{p99:>9}")
+    for name, q in data["queues"].items():
+        print(f"[Metrics] queue {name}: mean depth {q['mean_depth']}, p99 {q['p99_depth']}")
+    limits = {stage: s["concurrency_limit"] for stage, s in data["stages"].items() if s["concurrency_limit"]}
+    if limits:
+        print(f"[Metrics] Concurrency limits at the end: {limits}")
+    limited = data["counters"].get(RATE_LIMITED.name, {})
+    if limited:
+        print(f"[Metrics] 429/503 responses: {limited}")
+    if data["bottleneck"]:
+        print(f"[Metrics] 🐢 Bottleneck: {data['bottleneck']} "
+              f"({data['stages'][data['bottleneck']]['utilization']:.0%} busy)")
+
+# ---------------------------
+# HTTP endpoint
+# ---------------------------
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = REGISTRY.exposition().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/summary":
+            body = json.dumps(summary(), indent=2, default=str).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=METRICS_PORT, host="127.0.0.1"):
+    """Serve /metrics (Prometheus) and /summary (JSON) from a daemon thread; returns the server."""
+    server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    _start_sampler()
+    print(f"📈 Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,74 +1,209 @@
 import requests
+import hashlib
 import json
 import os
+import random
 import time
 import re
 import threading
+import citation_graph
+import concurrency
+import corpus_store
+import metrics
 from downloader import format_yymm_id
 
 # Semantic Scholar API Key
 API_KEY = ""
+S2_API_HOST = os.environ.get("S2_API_HOST", "https://api.semanticscholar.org/graph/v1")
+REFERENCE_FIELDS = "title,authors,year,venue,externalIds,publicationDate"
+
+S2_BATCH_SIZE = 500             # max IDs accepted by POST /paper/batch
+REFERENCE_PAGE_SIZE = 1000      # max limit of GET /paper/{id}/references
+MAX_RETRIES = 6
+MAX_BACKOFF_SECONDS = 64
+
+# Raw API responses, content-addressed by request, reused until they expire
+CACHE_DIR = os.environ.get(
+    "S2_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "s2_cache"))
+CACHE_TTL_SECONDS = 30 * 24 * 3600
 
 # Rate limiter: 1 request per second across all threads
+S2_MIN_INTERVAL = 1.0
 _rate_limit_lock = threading.Lock()
 _last_request_time = 0
 
 def wait_for_rate_limit():
-    """Ensure at least 1 second has passed since last API call"""
+    """Ensure at least S2_MIN_INTERVAL seconds have passed since last API call"""
     global _last_request_time
     with _rate_limit_lock:
         current_time = time.time()
         time_since_last = current_time - _last_request_time
-        if time_since_last < 1.0:
-            sleep_time = 1.0 - time_since_last
+        if time_since_last < S2_MIN_INTERVAL:
+            sleep_time = S2_MIN_INTERVAL - time_since_last
             time.sleep(sleep_time)
         _last_request_time = time.time()
 
-def get_paper_references(arxiv_id, delay=1):
+# ---------------------------
+# Response cache
+# ---------------------------
+
+def _cache_path(key):
+    """Content address of a request: sha256 of its canonical JSON description."""
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, digest[:2], f"{digest}.json")
+
+def cache_get(key, ttl=CACHE_TTL_SECONDS):
+    """Return the cached response body for key, or None if missing or older than ttl."""
+    path = _cache_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("fetched_at", 0) > ttl:
+        return None
+    return entry["body"]
+
+def cache_put(key, body):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "fetched_at": time.time(), "body": body}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def references_cache_key(clean_id):
+    return {"endpoint": "references", "paper": f"arXiv:{clean_id}", "fields": REFERENCE_FIELDS}
+
+# ---------------------------
+# HTTP with bounded backoff
+# ---------------------------
+
+def _backoff(response, attempt):
+    """Seconds to wait before retry `attempt`: Retry-After if given, else capped 2^attempt + jitter."""
+    header = response.headers.get("Retry-After") if response is not None else None
+    if header and header.isdigit():
+        return min(float(header), MAX_BACKOFF_SECONDS)
+    return min(2 ** attempt, MAX_BACKOFF_SECONDS) + random.uniform(0, 1)
+
+def _api_request(method, url, **kwargs):
     """
-    Fetch references for a paper from Semantic Scholar API.
-    
-    Args:
-        arxiv_id: arXiv ID (format: YYMM.NNNNN or YYMM.NNNNNvN)
-        retry: number of retry attempts
-        delay: delay between retries in seconds
-    
+    Rate-limited request to the Graph API. Retries 429/5xx and connection errors with
+    exponential backoff, at most MAX_RETRIES times.
+
     Returns:
-        list: List of references with detailed information
+        parsed JSON body, or None on 404
     """
-    # Clean arxiv_id (remove version suffix if present)
-    clean_id = re.sub(r'v\d+$', '', arxiv_id)
-    url = f"https://api.semanticscholar.org/graph/v1/paper/arXiv:{clean_id}/references"
-    params = {
-        "fields": "title,authors,year,venue,externalIds,publicationDate"
-    }
     headers = {
         "x-api-key": API_KEY,
         "Accept": "application/json"
     }
-
-    while True:
+    for attempt in range(MAX_RETRIES):
+        response = None
         try:
-            # Wait to respect rate limit before making request
             wait_for_rate_limit()
-            
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            t0 = time.perf_counter()
+            with metrics.API_SECONDS.time(api="s2"):
+                response = requests.request(method, url, headers=headers, timeout=30, **kwargs)
+            concurrency.report("s2", response.status_code, time.perf_counter() - t0,
+                               concurrency.parse_retry_after(response.headers.get("Retry-After")))
+            metrics.API_RESPONSES.inc(api="s2", status=str(response.status_code))
+            if response.status_code in (429, 503):
+                metrics.RATE_LIMITED.inc(api="s2")
             if response.status_code == 200:
-                data = response.json()
-                # API trả về {"data": [list of references]}
-                return data.get("data", [])
-            elif response.status_code == 429:
-                print(f"  Rate limit hit. Waiting {delay}s before retry...")
-                time.sleep(delay)
-            elif response.status_code == 404:
-                print(f"  Paper {arxiv_id} not found in Semantic Scholar")
-                return []
-            else:
-                print(f"  API returned status {response.status_code}, retrying in {delay}s...")
-                time.sleep(delay)
+                return response.json()
+            if response.status_code == 404:
+                return None
+            if response.status_code != 429 and response.status_code < 500:
+                raise RuntimeError(f"Semantic Scholar returned {response.status_code}: {response.text[:200]}")
+            reason = f"status {response.status_code}"
         except requests.exceptions.RequestException as e:
-            print(f"  Request error: {e}, retrying in {delay}s...")
-            time.sleep(delay)
+            concurrency.report("s2", None)
+            metrics.API_RESPONSES.inc(api="s2", status="error")
+            reason = f"request error: {e}"
+        wait = _backoff(response, attempt)
+        print(f"  Semantic Scholar {reason}, retrying in {wait:.1f}s...")
+        time.sleep(wait)
+    raise RuntimeError(f"Semantic Scholar request failed after {MAX_RETRIES} attempts: {url}")
+
+# ---------------------------
+# Fetching references
+# ---------------------------
+
+def _fetch_all_reference_pages(clean_id):
+    """Page through GET /paper/arXiv:{id}/references for papers with long reference lists."""
+    url = f"{S2_API_HOST}/paper/arXiv:{clean_id}/references"
+    references = []
+    offset = 0
+    while True:
+        data = _api_request("GET", url, params={
+            "fields": REFERENCE_FIELDS, "offset": offset, "limit": REFERENCE_PAGE_SIZE})
+        if data is None:
+            return references
+        references.extend(data.get("data") or [])
+        if "next" not in data:
+            return references
+        offset = data["next"]
+
+def fetch_references_batch(arxiv_ids):
+    """
+    Fetch the references of many papers with POST /paper/batch, S2_BATCH_SIZE IDs per call.
+    Papers whose nested reference list is shorter than their referenceCount are completed
+    through the paginated references endpoint. Every paper's result is cached on disk, so
+    papers fetched before (by any batch) cost no API call until CACHE_TTL_SECONDS expires.
+
+    Returns:
+        dict: {clean arXiv ID: [{"citedPaper": {...}}, ...]} ([] for papers unknown to S2)
+    """
+    with metrics.REFERENCE_FETCH_SECONDS.time():
+        return _fetch_references_batch(arxiv_ids)
+
+def _fetch_references_batch(arxiv_ids):
+    result = {}
+    missing = []
+    for arxiv_id in arxiv_ids:
+        clean_id = re.sub(r'v\d+$', '', arxiv_id)
+        cached = cache_get(references_cache_key(clean_id))
+        if cached is not None:
+            result[clean_id] = cached
+        elif clean_id not in missing:
+            missing.append(clean_id)
+    metrics.S2_CACHE.inc(len(result), result="hit")
+    metrics.S2_CACHE.inc(len(missing), result="miss")
+
+    nested_fields = ",".join(f"references.{f}" for f in REFERENCE_FIELDS.split(","))
+    for i in range(0, len(missing), S2_BATCH_SIZE):
+        chunk = missing[i:i + S2_BATCH_SIZE]
+        papers = _api_request("POST", f"{S2_API_HOST}/paper/batch",
+                              params={"fields": f"referenceCount,{nested_fields}"},
+                              json={"ids": [f"arXiv:{aid}" for aid in chunk]}) or []
+        for clean_id, paper in zip(chunk, papers):
+            if paper is None:
+                print(f"  Paper {clean_id} not found in Semantic Scholar")
+                references = []
+            else:
+                cited = paper.get("references") or []
+                if len(cited) < (paper.get("referenceCount") or 0):
+                    references = _fetch_all_reference_pages(clean_id)
+                else:
+                    # Same shape as the references endpoint, for convert_to_references_dict
+                    references = [{"citedPaper": p} for p in cited]
+            cache_put(references_cache_key(clean_id), references)
+            result[clean_id] = references
+    return result
+
+def get_paper_references(arxiv_id):
+    """
+    Fetch references for a paper from Semantic Scholar API.
+    
+    Args:
+        arxiv_id: arXiv ID (format: YYMM.NNNNN or YYMM.NNNNNvN)
+    
+    Returns:
+        list: List of references with detailed information
+    """
+    clean_id = re.sub(r'v\d+$', '', arxiv_id)
+    return fetch_references_batch([clean_id]).get(clean_id, [])
  
 
 def convert_to_references_dict(references):
@@ -158,17 +293,33 @@ def convert_to_references_dict(references):
     return result
 
 
-def save_references(arxiv_id, paper_folder, verbose=True):
+def write_references(paper_folder, references_dict):
     """
-    Fetch and save references for a paper version to both JSON and BibTeX formats.
+    Append a converted references dictionary to the corpus store of the data directory
+    (plus <paper_folder>/references.json when corpus_store.WRITE_LEGACY_JSON is set).
+    """
+    paper_folder = os.path.abspath(paper_folder)
+    arxiv_id = os.path.basename(paper_folder).replace('-', '.', 1)
+    corpus_store.get_store(os.path.dirname(paper_folder)).append_references({arxiv_id: references_dict})
+    citation_graph.get_graph(os.path.dirname(paper_folder)).add_papers({arxiv_id: references_dict})
+    if corpus_store.WRITE_LEGACY_JSON:
+        corpus_store.write_legacy_references(paper_folder, references_dict)
+
+
+def save_references(arxiv_id, paper_folder, verbose=True, references=None):
+    """
+    Fetch a paper's references from Semantic Scholar and save them with write_references:
+    the corpus store and citation graph, plus references.json when
+    corpus_store.WRITE_LEGACY_JSON is set. A paper without references is saved as empty.
     
     Args:
-        arxiv_id: arXiv ID (e.g., "2304.07856v1")
-        version_folder: Path to version folder (e.g., "data/2304.07856/v1/")
+        arxiv_id: arXiv ID (e.g., "2304.07856")
+        paper_folder: Path to the paper folder (e.g., "data/2304-07856/")
         verbose: Whether to print progress messages
+        references: Already fetched references (skips the API call)
     
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if references were saved, False if none were found or saving failed
     """
     # Check if the folder exists, if not, create it
     if not os.path.exists(paper_folder):
@@ -177,26 +328,24 @@ def save_references(arxiv_id, paper_folder, verbose=True):
     if verbose:
         print(f"Fetching references for {arxiv_id}...")
 
-    references = get_paper_references(arxiv_id)
+    if references is None:
+        references = get_paper_references(arxiv_id)
 
     if not references:
         if verbose:
             print(f"  No references found for {arxiv_id}")
-        json_path = os.path.join(paper_folder, "references.json")
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump({}, f, indent=2, ensure_ascii=False)
+        write_references(paper_folder, {})
         return False
 
-    json_path = os.path.join(paper_folder, "references.json")
     references_dict = convert_to_references_dict(references)
     try:
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(references_dict, f, indent=2, ensure_ascii=False)
+        write_references(paper_folder, references_dict)
         if verbose:
-            print(f"  Saved {len(references_dict)} references to references.json")
+            print(f"  Saved {len(references_dict)} references")
     except Exception as e:
         print(f"  Error saving JSON: {e}")
         return False
+    return True
     
 
 
@@ -216,4 +365,26 @@ def extract_references_for_paper(paper_id, base_data_dir="../data"):
     
     save_references(paper_id, os.path.join(paper_folder))
     
-    
\ No newline at end of file
+    
+
+def extract_references_for_papers(paper_ids, base_data_dir="../data"):
+    """
+    Extract references for many papers, fetching them with batched Semantic Scholar calls
+    and appending the whole batch to the corpus store at once.
+    
+    Args:
+        paper_ids: arXiv paper IDs without version
+        base_data_dir: Base directory containing data folders
+    """
+    references = fetch_references_batch(paper_ids)
+    references_by_paper = {
+        paper_id: convert_to_references_dict(references.get(paper_id, [])) for paper_id in paper_ids
+    }
+    corpus_store.get_store(base_data_dir).append_references(references_by_paper)
+    citation_graph.get_graph(base_data_dir).add_papers(references_by_paper)
+    if corpus_store.WRITE_LEGACY_JSON:
+        for paper_id, references_dict in references_by_paper.items():
+            corpus_store.write_legacy_references(
+                os.path.join(base_data_dir, format_yymm_id(paper_id)), references_dict)
+    print(f"  Saved references of {len(paper_ids)} papers "
+          f"({sum(len(r) for r in references_by_paper.values())} in total)")
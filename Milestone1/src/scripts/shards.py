@@ -0,0 +1,422 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+
+import citation_graph
+import corpus_store
+from arXiv_handler import get_IDs_month
+from downloader import format_yymm_id
+from journal import JobJournal, REFS_DONE
+
+SHARD_SIZE = 500             # consecutive IDs of one month per shard
+LEASE_SECONDS = 120          # a shard not renewed for this long is handed to another node
+POLL_SECONDS = 10            # wait of an idle node before looking for expired leases again
+MAX_SHARD_ATTEMPTS = 3       # claims of one shard before it is marked failed
+
+# Shard states
+PENDING = "pending"          # never claimed, released after an error, or reclaimed
+LEASED = "leased"            # held by a node while its lease is renewed
+DONE = "done"                # every paper processed by the node holding the lease
+FAILED = "failed"            # errored MAX_SHARD_ATTEMPTS times
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    shard_id    INTEGER PRIMARY KEY,
+    yymm        TEXT NOT NULL,
+    first_id    INTEGER NOT NULL,            -- tail numbers, inclusive
+    last_id     INTEGER NOT NULL,
+    state       TEXT NOT NULL,
+    owner       TEXT,
+    token       INTEGER NOT NULL DEFAULT 0,  -- fencing token, bumped by every claim
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    output_dir  TEXT,
+    result      TEXT,
+    updated_at  REAL NOT NULL,
+    UNIQUE (yymm, first_id, last_id)
+);
+CREATE INDEX IF NOT EXISTS shards_state ON shards (state, lease_until);
+"""
+
+# ---------------------------
+# Lease table
+# ---------------------------
+
+class Lease:
+    """A claimed shard. `token` fences it: once the shard is re-claimed, this lease is dead."""
+
+    __slots__ = ("shard_id", "yymm", "first_id", "last_id", "token", "lease_seconds")
+
+    def __init__(self, shard_id, yymm, first_id, last_id, token, lease_seconds=LEASE_SECONDS):
+        self.shard_id = shard_id
+        self.yymm = yymm
+        self.first_id = first_id
+        self.last_id = last_id
+        self.token = token
+        self.lease_seconds = lease_seconds
+
+    def arxiv_ids(self):
+        return shard_ids(self.yymm, self.first_id, self.last_id)
+
+    def __repr__(self):
+        return f"shard {self.shard_id} ({self.yymm}.{self.first_id:05d}-{self.last_id:05d})"
+
+
+def shard_ids(yymm, first_id, last_id):
+    return get_IDs_month(int(yymm[2:]), 2000 + int(yymm[:2]), first_id, last_id)
+
+
+class ShardTable:
+    """
+    Shards of a crawl in one SQLite file every node can open (a local disk for processes of
+    one box, a shared volume for several hosts). It uses the rollback journal instead of WAL,
+    which needs shared memory between the processes, and every claim is one BEGIN IMMEDIATE
+    transaction, so two nodes never get the same shard. A node renews its lease while it
+    works; a lease not renewed within its lease_seconds expires and the shard is claimed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    # ---------------------------
+    # Coordinator
+    # ---------------------------
+
+    def plan(self, arxiv_ids, shard_size=SHARD_SIZE):
+        """
+        Split IDs into shards of up to shard_size consecutive numbers of one month.
+        Planning the same range again adds nothing. Returns the number of new shards.
+        """
+        runs = []                       # [yymm, first, last] of consecutive numbers
+        for arxiv_id in sorted(arxiv_ids):
+            yymm, number = arxiv_id.split('.')
+            number = int(number)
+            if runs and runs[-1][0] == yymm and runs[-1][2] + 1 == number and \
+                    number - runs[-1][1] < shard_size:
+                runs[-1][2] = number
+            else:
+                runs.append([yymm, number, number])
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO shards (yymm, first_id, last_id, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(yymm, first, last, PENDING, now) for yymm, first, last in runs])
+            added = self._conn.total_changes - before
+            self._conn.execute("COMMIT")
+        return added
+
+    def reclaim_expired(self):
+        """Put shards whose lease expired back to pending. Returns how many were reclaimed."""
+        _, n = self._execute(
+            "UPDATE shards SET state = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE state = ? AND lease_until < ?",
+            (PENDING, time.time(), LEASED, time.time()))
+        return n
+
+    # ---------------------------
+    # Nodes
+    # ---------------------------
+
+    def claim(self, owner, output_dir, lease_seconds=LEASE_SECONDS):
+        """Lease the first pending (or expired) shard to owner; None when nothing is claimable."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT shard_id, yymm, first_id, last_id, token FROM shards "
+                    "WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY shard_id LIMIT 1",
+                    (PENDING, LEASED, now)).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                shard_id, yymm, first_id, last_id, token = row
+                self._conn.execute(
+                    "UPDATE shards SET state = ?, owner = ?, output_dir = ?, token = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE shard_id = ?",
+                    (LEASED, owner, output_dir, token + 1, now + lease_seconds, now, shard_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return Lease(shard_id, yymm, first_id, last_id, token + 1, lease_seconds)
+
+    def heartbeat(self, lease):
+        """Extend a lease; False if it was lost (expired and claimed by another node)."""
+        now = time.time()
+        _, n = self._execute(
+            "UPDATE shards SET lease_until = ?, updated_at = ? WHERE shard_id = ? AND token = ? AND state = ?",
+            (now + lease.lease_seconds, now, lease.shard_id, lease.token, LEASED))
+        return n == 1
+
+    def complete(self, lease, result):
+        """Mark a shard done if the lease still holds it; False if its work must not be merged."""
+        _, n = self._execute(
+            "UPDATE shards SET state = ?, lease_until = NULL, result = ?, updated_at = ? "
+            "WHERE shard_id = ? AND token = ? AND state = ?",
+            (DONE, json.dumps(result), time.time(), lease.shard_id, lease.token, LEASED))
+        return n == 1
+
+    def release(self, lease, reason):
+        """Give a shard back after an error: pending again, or failed after MAX_SHARD_ATTEMPTS claims."""
+        self._execute(
+            "UPDATE shards SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, owner = NULL, "
+            "lease_until = NULL, result = ?, updated_at = ? WHERE shard_id = ? AND token = ?",
+            (MAX_SHARD_ATTEMPTS, FAILED, PENDING, json.dumps({"error": reason}), time.time(),
+             lease.shard_id, lease.token))
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+
+    def counts(self):
+        counts = {state: 0 for state in (PENDING, LEASED, DONE, FAILED)}
+        rows, _ = self._execute("SELECT state, COUNT(*) FROM shards GROUP BY state")
+        counts.update(dict(rows))
+        rows, _ = self._execute("SELECT COUNT(*) FROM shards WHERE state = ? AND lease_until < ?",
+                                (LEASED, time.time()))
+        counts["expired"] = rows[0][0]
+        return counts
+
+    def unfinished(self):
+        rows, _ = self._execute("SELECT COUNT(*) FROM shards WHERE state IN (?, ?)", (PENDING, LEASED))
+        return rows[0][0]
+
+    def done_shards(self):
+        """(shard_id, yymm, first_id, last_id, output_dir) of every finished shard."""
+        rows, _ = self._execute(
+            "SELECT shard_id, yymm, first_id, last_id, output_dir FROM shards WHERE state = ? ORDER BY shard_id",
+            (DONE,))
+        return rows
+
+    def leases(self):
+        """(shard_id, owner, seconds left) of every held lease."""
+        rows, _ = self._execute(
+            "SELECT shard_id, owner, lease_until FROM shards WHERE state = ? ORDER BY shard_id", (LEASED,))
+        return [(shard_id, owner, round(until - time.time(), 1)) for shard_id, owner, until in rows]
+
+    def print_progress(self, prefix="[Shards]"):
+        c = self.counts()
+        print(f"{prefix} pending={c[PENDING]} leased={c[LEASED]} (expired {c['expired']}) "
+              f"done={c[DONE]} failed={c[FAILED]}")
+
+
+class Heartbeat:
+    """Background renewal of a lease every lease_seconds / 4; `lost` is set once it fails."""
+
+    def __init__(self, table, lease):
+        self.table = table
+        self.lease = lease
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"heartbeat-{lease.shard_id}")
+
+    def _run(self):
+        while not self._stop.wait(self.lease.lease_seconds / 4):
+            try:
+                alive = self.table.heartbeat(self.lease)
+            except sqlite3.Error as e:
+                print(f"[Shards] Heartbeat of {self.lease} failed: {e}")
+                continue             # the lease survives a few missed beats
+            if not alive:
+                print(f"[Shards] ⚠️ Lost the lease of {self.lease}")
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+# ---------------------------
+# Node
+# ---------------------------
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_node(table, out_root, node_id=None, engine="threads", lease_seconds=LEASE_SECONDS,
+             max_shards=None, poll_seconds=POLL_SECONDS):
+    """
+    Claim shards until none is left and crawl each one into out_root/<node_id>, a data
+    directory of its own (journal, corpus store, paper folders). A shard whose lease is
+    lost stops being crawled at once (the heartbeat's stop check cancels the pipeline) and is
+    not marked done: its papers stay in this node's folder but are not merged. Returns the
+    number of shards completed.
+    """
+    import main
+
+    node_id = node_id or default_node_id()
+    data_dir = os.path.abspath(os.path.join(out_root, node_id))
+    os.makedirs(data_dir, exist_ok=True)
+    journal = JobJournal(os.path.join(data_dir, "journal.sqlite3"))
+    completed = 0
+    try:
+        while max_shards is None or completed < max_shards:
+            lease = table.claim(node_id, data_dir, lease_seconds)
+            if lease is None:
+                if table.unfinished() == 0:
+                    break
+                # Other nodes hold the remaining shards; their leases may still expire
+                time.sleep(poll_seconds)
+                continue
+
+            ids = lease.arxiv_ids()
+            print(f"\n[Shards] {node_id} claimed {lease}: {len(ids)} IDs")
+            with Heartbeat(table, lease) as heartbeat:
+                try:
+                    journal.add_papers(ids)
+                    main.resume_pending_papers(journal, data_dir, engine, only=set(ids), stop=heartbeat.lost.is_set)
+                except Exception as e:
+                    print(f"[Shards] Error in {lease}: {e}")
+                    table.release(lease, str(e))
+                    continue
+            states = [journal.state_of(aid) for aid in ids]
+            result = {"node": node_id, "papers": len(ids), "refs_done": states.count(REFS_DONE)}
+            if heartbeat.lost.is_set() or not table.complete(lease, result):
+                print(f"[Shards] {lease} was reclaimed by another node; its output will not be merged")
+                continue
+            completed += 1
+            print(f"[Shards] ✅ {lease} done: {result['refs_done']}/{len(ids)} papers")
+            table.print_progress()
+    finally:
+        journal.close()
+    return completed
+
+# ---------------------------
+# Merge
+# ---------------------------
+
+def _link_or_copy(src, dst):
+    """Hard-link a file (same filesystem), else copy it; an existing target is replaced."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def merge_outputs(table, merged_dir):
+    """
+    Merge the data directories of every node into merged_dir: for each done shard, the paper
+    folders, corpus store rows and journal rows of its papers are taken from the node that
+    completed it, so partial work of nodes that lost a lease is left out. The citation graph
+    is rebuilt from the merged store. Merging again after more shards finish is safe.
+    Returns {"shards": n, "papers": n, "rows": n}.
+    """
+    merged_dir = os.path.abspath(merged_dir)
+    os.makedirs(merged_dir, exist_ok=True)
+    store = corpus_store.get_store(merged_dir)
+    journal = JobJournal(os.path.join(merged_dir, "journal.sqlite3"))
+    stats = {"shards": 0, "papers": 0, "rows": 0}
+    try:
+        for shard_id, yymm, first_id, last_id, output_dir in table.done_shards():
+            if os.path.abspath(output_dir) == merged_dir:
+                continue
+            ids = shard_ids(yymm, first_id, last_id)
+            stats["rows"] += store.merge_from(corpus_store.get_store(output_dir), ids)
+            journal.merge_from(os.path.join(output_dir, "journal.sqlite3"), ids)
+            for arxiv_id in ids:
+                folder = os.path.join(output_dir, format_yymm_id(arxiv_id))
+                if os.path.isdir(folder):
+                    shutil.copytree(folder, os.path.join(merged_dir, format_yymm_id(arxiv_id)),
+                                    copy_function=_link_or_copy, dirs_exist_ok=True)
+                    stats["papers"] += 1
+            stats["shards"] += 1
+        journal.print_progress("[Merge]")
+    finally:
+        journal.close()
+    store.compact()
+    graph = citation_graph.get_graph(merged_dir)
+    graph.rebuild_from_store(store)
+    graph.compact()
+    return stats
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded crawl over several nodes sharing one lease table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    plan = sub.add_parser("plan", help="discover IDs (as fetch_ids_worker) and split them into shards")
+    for name, default in (("start-month", 3), ("start-year", 2023), ("start-id", 7856),
+                          ("end-month", 4), ("end-year", 2023), ("end-id", 4606),
+                          ("start-index", 0), ("num-papers", 100)):
+        plan.add_argument(f"--{name}", type=int, default=default)
+    plan.add_argument("--all", action="store_true", help="every ID of the range (download_all)")
+    plan.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+
+    work = sub.add_parser("work", help="claim and crawl shards until none is left")
+    work.add_argument("--out", required=True, help="root folder; this node writes to <out>/<node>")
+    work.add_argument("--node", default=None, help="node id (default: <hostname>-<pid>)")
+    work.add_argument("--engine", choices=("threads", "async"), default="threads")
+    work.add_argument("--lease", type=float, default=LEASE_SECONDS, help="lease length in seconds")
+    work.add_argument("--max-shards", type=int)
+
+    sub.add_parser("status", help="shard counts and live leases")
+    sub.add_parser("reclaim", help="return expired leases to pending")
+    merge = sub.add_parser("merge", help="merge the node folders of every done shard")
+    merge.add_argument("--out", required=True, help="merged data directory")
+
+    for p in (plan, work, merge):
+        p.add_argument("--upstream", help="fake_upstream.py URL to crawl instead of arXiv / S2 (local tests)")
+    parser.add_argument("--db", default="shards.sqlite3", help="shared lease table")
+    args = parser.parse_args()
+
+    table = ShardTable(args.db)
+    if getattr(args, "upstream", None):
+        from fake_upstream import redirect_pipeline
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(args.db)), "upstream_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        redirect_pipeline(args.upstream, cache_dir)
+
+    if args.command == "plan":
+        from main import fetch_ids_worker
+        selected_ids, _ = fetch_ids_worker(args.start_month, args.start_year, args.start_id,
+                                           args.end_month, args.end_year, args.end_id,
+                                           args.start_index, args.num_papers, args.all)
+        print(f"[Shards] Planned {table.plan(selected_ids, args.shard_size)} new shards "
+              f"for {len(selected_ids)} IDs")
+        table.print_progress()
+    elif args.command == "work":
+        done = run_node(table, args.out, args.node, args.engine, args.lease, args.max_shards)
+        print(f"[Shards] Node finished: {done} shards completed")
+        table.print_progress()
+    elif args.command == "status":
+        table.print_progress()
+        for shard_id, owner, left in table.leases():
+            print(f"  shard {shard_id}: {owner} ({left:+.0f}s)")
+    elif args.command == "reclaim":
+        print(f"[Shards] Reclaimed {table.reclaim_expired()} expired leases")
+    else:
+        stats = merge_outputs(table, args.out)
+        print(f"[Merge] ✅ {stats['shards']} shards, {stats['papers']} papers, "
+              f"{stats['rows']} store rows → {args.out}")
+    table.close()
@@ -0,0 +1,234 @@
+import threading
+from collections import deque
+from contextlib import nullcontext
+
+import metrics
+
+CHANNEL_CAPACITY = 64          # default bound of the queue in front of a stage (items)
+JOIN_POLL_SECONDS = 0.5        # run() wakes this often, so Ctrl-C reaches the main thread
+
+# ---------------------------
+# Bounded channel
+# ---------------------------
+
+class Channel:
+    """
+    Bounded FIFO in front of a stage. put() blocks while it is full, which is the backpressure
+    on whatever feeds it. The channel closes by itself once all its registered producers are
+    done, and get_batch() then returns [] as soon as it is empty, so no sentinel values travel
+    through the queues. cancel() drops the queued items and wakes every waiting thread.
+    """
+
+    def __init__(self, name, capacity=CHANNEL_CAPACITY):
+        self.name = name
+        self.capacity = capacity
+        self.producers = 0
+        self._items = deque()
+        self._closed = False
+        self._cancelled = False
+        self._cond = threading.Condition()
+        metrics.watch_queue(name, self)
+
+    def qsize(self):
+        return len(self._items)
+
+    def add_producer(self):
+        with self._cond:
+            self.producers += 1
+
+    def producer_done(self):
+        with self._cond:
+            self.producers -= 1
+            if self.producers <= 0:
+                self.close()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def cancel(self):
+        with self._cond:
+            self._cancelled = True
+            self._items.clear()
+            self._cond.notify_all()
+
+    def put(self, item):
+        """Queue one item, waiting for room; False if the channel was cancelled meanwhile."""
+        with self._cond:
+            while len(self._items) >= self.capacity and not self._cancelled:
+                self._cond.wait()
+            if self._cancelled:
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get_batch(self, max_items=1):
+        """
+        Wait for an item, then take up to max_items of the queued ones (no waiting for a full
+        batch). [] once the channel is closed and empty, or cancelled.
+        """
+        with self._cond:
+            while not self._items and not self._closed and not self._cancelled:
+                self._cond.wait()
+            if self._cancelled:
+                return []
+            batch = [self._items.popleft() for _ in range(min(max_items, len(self._items)))]
+            self._cond.notify_all()
+            return batch
+
+# ---------------------------
+# Stages
+# ---------------------------
+
+class Stage:
+    """
+    One step of a Pipeline. `workers` threads take batches of up to batch_size items from the
+    stage's channel and call fn(batch), which returns the items for the next stage (any
+    iterable, possibly empty). With an AIMD controller (concurrency.py), a worker holds one of
+    its slots while taking and processing a batch, so at most `limit` batches run at once and
+    items arriving meanwhile join the next batch. If fn raises, on_error(batch, exc) is called
+    and the batch goes no further.
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=1, capacity=CHANNEL_CAPACITY,
+                 controller=None, on_error=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.controller = controller
+        self.on_error = on_error
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, workers={self.workers}, batch_size={self.batch_size})"
+
+
+class Pipeline:
+    """
+    Stages chained by bounded channels, each with its own worker pool. An item moves on as
+    soon as its stage is done with it. A full channel blocks the stage feeding it, so a slow
+    stage throttles everything upstream instead of letting items pile up in memory. Each stage
+    holds about capacity + workers x batch_size items, whatever the number of items fed.
+
+    Sources are read lazily by feed(). Shutdown uses no poison pills:
+      * drain() stops reading the sources; items already inside are finished, and run() returns.
+      * cancel() drops every queued item; workers stop after their current batch.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.channels = {stage.name: Channel(f"{stage.name}_queue", stage.capacity) for stage in self.stages}
+        self.processed = {stage.name: 0 for stage in self.stages}
+        self._sources = []
+        self._lock = threading.Lock()
+        self._draining = threading.Event()
+        self._cancelled = threading.Event()
+
+    def feed(self, items, stage=None):
+        """Add a source: items are read one by one into `stage` (default: the first stage)."""
+        self._sources.append((stage or self.stages[0].name, items))
+        return self
+
+    def drain(self):
+        self._draining.set()
+
+    def cancel(self):
+        self._draining.set()
+        self._cancelled.set()
+        for channel in self.channels.values():
+            channel.cancel()
+
+    @property
+    def draining(self):
+        """Whether the sources were cut short (drain() or cancel()): some items were never read."""
+        return self._draining.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _read_source(self, items, channel):
+        try:
+            for item in items:
+                if self._draining.is_set() or not channel.put(item):
+                    break
+        finally:
+            channel.producer_done()
+
+    def _work(self, stage, channel, downstream):
+        try:
+            while not self._cancelled.is_set():
+                with stage.controller.slot() if stage.controller else nullcontext():
+                    batch = channel.get_batch(stage.batch_size)
+                    if not batch:
+                        break
+                    try:
+                        with metrics.busy(stage.name):
+                            out = list(stage.fn(batch) or ())
+                    except Exception as e:
+                        print(f"[{stage.name}] Error for batch {batch[:3]}...: {e}")
+                        out = []
+                        if stage.on_error:
+                            stage.on_error(batch, e)
+                with self._lock:
+                    self.processed[stage.name] += len(batch)
+                if downstream is not None:
+                    for item in out:
+                        if not downstream.put(item):
+                            break
+        finally:
+            if downstream is not None:
+                downstream.producer_done()
+
+    def _start(self, stage, downstream):
+        """One worker thread of stage, counted in its metrics (live threads, utilization)."""
+        def run():
+            with metrics.worker_thread(stage.name):
+                self._work(stage, self.channels[stage.name], downstream)
+        t = threading.Thread(target=run, name=f"{stage.name}-worker", daemon=True)
+        t.start()
+        return t
+
+    def run(self, stop=None):
+        """
+        Run until every item has left the last stage (or the pipeline is cancelled).
+        A first Ctrl-C drains the pipeline, a second one cancels it. `stop`, a callable polled
+        every JOIN_POLL_SECONDS, cancels it as soon as it returns True.
+        Returns {stage name: items taken by that stage}.
+        """
+        for name, _ in self._sources:
+            self.channels[name].add_producer()
+        for upstream, stage in zip(self.stages, self.stages[1:]):
+            for _ in range(upstream.workers):
+                self.channels[stage.name].add_producer()
+        for channel in self.channels.values():
+            if channel.producers == 0:
+                channel.close()
+
+        threads = [threading.Thread(target=self._read_source, args=(items, self.channels[name]),
+                                    name=f"{name}-source", daemon=True)
+                   for name, items in self._sources]
+        for t in threads:
+            t.start()
+        for i, stage in enumerate(self.stages):
+            downstream = self.channels[self.stages[i + 1].name] if i + 1 < len(self.stages) else None
+            threads += [self._start(stage, downstream) for _ in range(stage.workers)]
+
+        for t in threads:
+            while t.is_alive():
+                if stop is not None and not self._cancelled.is_set() and stop():
+                    print("[Pipeline] Stop requested: cancelling, queued items are dropped")
+                    self.cancel()
+                try:
+                    t.join(JOIN_POLL_SECONDS)
+                except KeyboardInterrupt:
+                    if self._draining.is_set():
+                        print("[Pipeline] Cancelling: queued items are dropped")
+                        self.cancel()
+                    else:
+                        print("[Pipeline] Draining: no new items are read (Ctrl-C again to cancel)")
+                        self.drain()
+        return dict(self.processed)
@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The scripts are run from src/scripts and import each other as top-level modules
+SCRIPTS = Path(__file__).resolve().parents[1] / "src" / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+
+PAPERS_PER_MONTH = 12
+
+
+@pytest.fixture(scope="session")
+def scripts_dir():
+    """The src/scripts folder, for tests that run a script in a subprocess."""
+    return SCRIPTS
+
+
+@pytest.fixture(scope="session")
+def papers_per_month():
+    """How many papers the fake arXiv lists in every month."""
+    return PAPERS_PER_MONTH
+
+
+@pytest.fixture(scope="session")
+def upstream(tmp_path_factory):
+    """A fake_upstream.py server every crawler module of this process is pointed at."""
+    from fake_upstream import FakeCorpus, FakeUpstream, redirect_pipeline
+
+    server = FakeUpstream(FakeCorpus(PAPERS_PER_MONTH)).start()
+    redirect_pipeline(server.url, str(tmp_path_factory.mktemp("caches")))
+    yield server
+    server.stop()
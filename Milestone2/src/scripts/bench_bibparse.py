@@ -0,0 +1,193 @@
+"""
+Parity check and throughput benchmark of bibparse.py against the notebook's bibliography path.
+
+    1. .bib files: parse_bibtex must return exactly bibtexparser's entries (hierarchy settings
+       and load_paper_data settings); entries/s of both and the share of files that needed the
+       bibtexparser fallback.
+    2. thebibliography blocks: every key found by BIBITEM_RE must be found by iter_bibitems, in
+       the same order and with the same body; entries/s and how often parse_bibitem_body
+       recovered a title, authors and a year.
+
+The corpus is every .bib file and thebibliography block of every version in a data directory;
+without one a synthetic corpus of typical arXiv bibliographies is generated.
+
+Usage:
+    python bench_bibparse.py [data_dir] [--repeat 3] [--limit 2000]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import bibtexparser
+from bibtexparser.bparser import BibTexParser
+
+from bibparse import BibSyntaxError, iter_bibitems, parse_bibitem_body, parse_bibtex, scan_bibtex
+from hierarchy import BIBITEM_BLOCK_RE, BIBITEM_RE, expand_tex, find_main_tex, get_all_papers, list_papers
+
+SURNAMES = "Smith Nguyen Tran Garcia M{\\\"u}ller Wang Li Zhang Kim Rossi Dubois Ivanov Sato Kumar".split()
+WORDS = ("learning deep neural network graph quantum spin transport optimal control robust sparse "
+         "attention transformer diffusion model inference bayesian stochastic gradient").split()
+VENUES = ["Phys. Rev. Lett.", "Nature", "Advances in Neural Information Processing Systems",
+          "J. Amer. Math. Soc.", "Proceedings of {ICML}"]
+
+
+def legacy_bibtex(text, **kwargs):
+    return bibtexparser.loads(text, parser=BibTexParser(**kwargs)).entries
+
+# ---------------------------
+# Corpus
+# ---------------------------
+
+def _title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9))).capitalize()
+
+
+def _authors(rng, sep=" and "):
+    return sep.join(f"{rng.choice(SURNAMES)}, {rng.choice('ABCDEFGH')}." for _ in range(rng.randint(1, 5)))
+
+
+def synthetic_bib(rng, n_entries=40):
+    """A .bib text mixing the constructs seen in arXiv sources (and a few that need the fallback)."""
+    parts = ["% Encoding: UTF-8\n"]
+    if rng.random() < 0.1:
+        parts.append('@String{prl = "Phys. Rev. Lett."}\n')
+    for i in range(n_entries):
+        kind = rng.choice(["article", "inproceedings", "misc", "book", "Article", "online"])
+        title = _title(rng)
+        title = rng.choice([f"{{{title}}}", f"{{{{{title}}}}}", f'"{title}"', f"{{{title[:10]}\n      {title[10:]}}}"])
+        fields = [f"  title = {title}", f"  author = {{{_authors(rng)}}}",
+                  f"  year = {rng.choice([rng.randint(1990, 2024), '{%d}' % rng.randint(1990, 2024)])}"]
+        if rng.random() < 0.5:
+            fields.append(f"  journal = {{{rng.choice(VENUES)}}}")
+        if rng.random() < 0.3:
+            fields.append(f"  doi = {{10.{rng.randint(1000, 9999)}/abc.{i}}}")
+        if rng.random() < 0.2:
+            fields.append(f"  month = {rng.choice(['jan', 'feb', '{March}'])}")
+        if rng.random() < 0.1:
+            fields.append('  note = "See " # {\\url{x}}')
+        rng.shuffle(fields)
+        sep = rng.choice([",\n", ",\n\t", ", "])
+        trailing = rng.choice(["", ",", ",\n"])
+        parts.append(f"@{kind}{{key{i},\n{sep.join(fields)}{trailing}\n}}\n")
+        if rng.random() < 0.05:
+            parts.append("@comment{jabref-meta: databaseType:bibtex;}\n")
+    return "".join(parts)
+
+
+def synthetic_bibitem_block(rng, n_items=40):
+    """A thebibliography block in plain/natbib, IEEE, APS and amsplain styles."""
+    items = []
+    for i in range(n_items):
+        authors = ", ".join(f"{rng.choice('ABCDEFGH')}.~{rng.choice(SURNAMES)}" for _ in range(rng.randint(1, 4)))
+        title, venue, year = _title(rng), rng.choice(VENUES), rng.randint(1990, 2024)
+        style = rng.randrange(4)
+        label = f"[{{{rng.choice(SURNAMES)} et~al.({year})}}]" if rng.random() < 0.3 else ""
+        if style == 0:
+            body = f"{authors}.\n\\newblock {title}.\n\\newblock {{\\em {venue}}}, {year}."
+        elif style == 1:
+            body = f"{authors}, ``{title},'' \\emph{{{venue}}}, vol.~{rng.randint(1, 99)}, {year}."
+        elif style == 2:
+            body = f"{authors}, \\textit{{{venue}}} \\textbf{{{rng.randint(1, 99)}}}, {rng.randint(1, 999)} ({year})."
+        else:
+            body = f"{authors}, \\emph{{{title}}}, {venue} {rng.randint(1, 99)} ({year}), 1--20."
+        items.append(f"\\bibitem{label}{{ref{i}}}\n{body}\n")
+    return "\\begin{thebibliography}{99}\n" + "\n".join(items) + "\\end{thebibliography}\n"
+
+
+def load_corpus(data_dir=None, limit=None, seed=42):
+    """(list of .bib texts, list of TeX texts holding a thebibliography block)."""
+    if data_dir is None:
+        rng = random.Random(seed)
+        return [synthetic_bib(rng) for _ in range(100)], [synthetic_bibitem_block(rng) for _ in range(100)]
+    bibs, blocks = [], []
+    for paper in list_papers(Path(data_dir)):
+        for version in get_all_papers(paper) or []:
+            bibs.extend(p.read_text(encoding="utf-8", errors="ignore") for p in version.rglob("*.bib"))
+            main_tex = find_main_tex(version)
+            tex = expand_tex(main_tex) if main_tex else ""
+            if tex and BIBITEM_BLOCK_RE.search(tex):
+                blocks.append(tex)
+    return bibs[:limit], blocks[:limit]
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+# ---------------------------
+# Checks
+# ---------------------------
+
+def check_bib(bibs, repeat):
+    failed = False
+    fallbacks = 0
+    for text in bibs:
+        try:
+            scan_bibtex(text)
+        except BibSyntaxError:
+            fallbacks += 1
+    for label, kwargs in (("hierarchy", {"common_strings": False, "interpolate_strings": False}),
+                          ("matching", {"common_strings": True, "interpolate_strings": True})):
+        bad = [i for i, text in enumerate(bibs) if parse_bibtex(text, **kwargs) != legacy_bibtex(text, **kwargs)]
+        failed |= bool(bad)
+        print(f".bib parity ({label} settings): {len(bibs) - len(bad)}/{len(bibs)} files identical")
+        for i in bad[:3]:
+            print(f"  ❌ file #{i}: {bibs[i][:80]!r}")
+
+    n_entries = sum(len(legacy_bibtex(t)) for t in bibs)
+    legacy_sec = best_time(lambda: [legacy_bibtex(t) for t in bibs], 1)
+    fast_sec = best_time(lambda: [parse_bibtex(t) for t in bibs], repeat)
+    print(f"{n_entries} entries in {len(bibs)} files, {fallbacks} needed the bibtexparser fallback")
+    print(f"  bibtexparser : {n_entries / legacy_sec:12,.0f} entries/s")
+    print(f"  parse_bibtex : {n_entries / fast_sec:12,.0f} entries/s ({legacy_sec / fast_sec:.1f}x)")
+    return failed
+
+
+def legacy_bibitems(tex):
+    block = BIBITEM_BLOCK_RE.search(tex)
+    return BIBITEM_RE.findall(block.group(0)) if block else []
+
+
+def check_bibitems(blocks, repeat):
+    missing, extra, n_items = 0, 0, 0
+    for tex in blocks:
+        legacy = legacy_bibitems(tex)
+        fast = dict(iter_bibitems(tex))
+        n_items += len(fast)
+        extra += len(fast) - len(legacy)
+        fast_keys = [k for k in fast if k in dict(legacy)]
+        if fast_keys != [k for k, _ in legacy] or any(fast[k] != body for k, body in legacy):
+            missing += 1
+    print(f"\n\\bibitem parity: {len(blocks) - missing}/{len(blocks)} blocks with every legacy key and body, "
+          f"{extra} more items found ([label] forms)")
+
+    parsed = [parse_bibitem_body(body) for tex in blocks for _, body in iter_bibitems(tex)]
+    if parsed:
+        fill = {f: sum(bool(p[f]) for p in parsed) / len(parsed) for f in ("title", "authors", "year", "journal")}
+        print("  fields recovered: " + ", ".join(f"{f} {share:.0%}" for f, share in fill.items()))
+    legacy_sec = best_time(lambda: [legacy_bibitems(t) for t in blocks], repeat)
+    split_sec = best_time(lambda: [list(iter_bibitems(t)) for t in blocks], repeat)
+    fields_sec = best_time(lambda: [parse_bibitem_body(b) for t in blocks for _, b in iter_bibitems(t)], repeat)
+    print(f"  BIBITEM_RE split   : {n_items / legacy_sec:12,.0f} items/s")
+    print(f"  iter_bibitems      : {n_items / split_sec:12,.0f} items/s")
+    print(f"  + field extraction : {n_items / fields_sec:12,.0f} items/s")
+    return missing > 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity and speed of the bibliography parsers.")
+    parser.add_argument("data_dir", nargs="?", help="Milestone 1 data directory (default: synthetic corpus)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=None, help="at most this many .bib files / blocks")
+    args = parser.parse_args()
+
+    bibs, blocks = load_corpus(args.data_dir, args.limit)
+    failed = check_bib(bibs, args.repeat)
+    failed |= check_bibitems(blocks, args.repeat)
+    sys.exit(1 if failed else 0)
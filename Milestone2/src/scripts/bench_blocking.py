@@ -0,0 +1,91 @@
+"""
+Speed/recall tradeoff of the blocking stage (blocking.py).
+
+For each shortlist size K, reports recall@K against the manual labels (the fraction of labeled
+BibTeX entries whose true arXiv candidate survives blocking), the share of pairs left to
+score, and throughput and MRR of blocked vs full batched scoring. Without an output directory
+the synthetic labeled corpus of bench_scoring.py is used. With --title-index, every K is also
+run with a corpus-wide TitleIndex (title_index.py) filling part of each shortlist.
+
+Usage:
+    python bench_blocking.py [output_dir] [--k 5 10 20 50] [--title-index [index_dir]]
+"""
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from sklearn.linear_model import LogisticRegression
+
+from bench_scoring import overall_mrr, synthetic_corpus, timed
+from blocking import generate_predictions_blocked, recall_at_k
+from matching import load_all_data, load_pred_labels, manual_labels
+from scoring import create_dataset_batched, generate_predictions_batched
+from title_index import TitleIndex, build_index
+
+
+def temporary_title_index(all_data, output_dir, workdir):
+    """Build a TitleIndex of the corpus' candidates in workdir (synthetic papers are written out first)."""
+    if output_dir is None:
+        output_dir = Path(workdir) / "output"
+        for paper_id, paper in all_data.items():
+            (output_dir / paper_id).mkdir(parents=True)
+            with open(output_dir / paper_id / "references.json", "w", encoding="utf-8") as f:
+                json.dump(paper["candidates"], f)
+    build_index(Path(output_dir), Path(workdir) / "title_index")
+    return TitleIndex(Path(workdir) / "title_index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@K and speed of candidate blocking.")
+    parser.add_argument("output_dir", nargs="?", help="output directory with refs.bib/references.json "
+                                                     "(default: synthetic corpus)")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20, 50], help="shortlist sizes")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--title-index", nargs="?", const="",
+                        help="also block with this TitleIndex directory (no value: build one from the corpus)")
+    args = parser.parse_args()
+
+    if args.output_dir:
+        all_data = load_all_data(Path(args.output_dir))
+        labels = {p: g for p, g in manual_labels.items() if p in all_data}
+        pred_labels, partitions = load_pred_labels(Path(args.output_dir))
+        train_labels = {p: g for p, g in pred_labels.items()
+                        if partitions[p] == "train" and p in all_data} or labels
+    else:
+        all_data, synthetic_labels, partitions = synthetic_corpus()
+        labels = {p: g for p, g in synthetic_labels.items() if partitions[p] != "train"}
+        train_labels = {p: g for p, g in synthetic_labels.items() if partitions[p] == "train"}
+    if not labels:
+        sys.exit("None of the manually labeled papers is in this output directory")
+
+    X, y, _ = create_dataset_batched(list(train_labels), all_data, train_labels)
+    model = LogisticRegression(class_weight='balanced', max_iter=1000, random_state=42, solver='lbfgs')
+    model.fit(X, y)
+
+    paper_ids = list(labels)
+    full_sec, full_preds = timed(lambda: {p: generate_predictions_batched(p, all_data[p], model, args.top_k)
+                                          for p in paper_ids}, 1)
+    n_entries = sum(len(all_data[p]["bibtex"]) for p in paper_ids)
+    print(f"Labeled set: {len(paper_ids)} papers, {sum(len(g) for g in labels.values())} labeled entries")
+    print(f"{'K':>6} {'recall@K':>9} {'pairs kept':>11} {'entries/s':>10} {'speedup':>8} {'MRR':>7}")
+    print(f"{'all':>6} {1.0:9.3f} {1.0:11.1%} {n_entries / full_sec:10,.0f} {1.0:7.1f}x "
+          f"{overall_mrr(labels, full_preds):7.4f}")
+
+    indexes = [("", None)]
+    workdir = tempfile.TemporaryDirectory()
+    if args.title_index is not None:
+        title_index = TitleIndex(Path(args.title_index)) if args.title_index else \
+            temporary_title_index(all_data, args.output_dir, workdir.name)
+        indexes.append(("+idx", title_index))
+
+    for k in sorted(args.k):
+        for suffix, title_index in indexes:
+            recall, hits, total, kept, all_pairs = recall_at_k(all_data, labels, k, title_index)
+            sec, preds = timed(lambda: {p: generate_predictions_blocked(p, all_data[p], model, args.top_k, k,
+                                                                        title_index)
+                                        for p in paper_ids}, 1)
+            print(f"{f'{k}{suffix}':>6} {recall:9.3f} {kept / all_pairs:11.1%} {n_entries / sec:10,.0f} "
+                  f"{full_sec / sec:7.1f}x {overall_mrr(labels, preds):7.4f}")
+    workdir.cleanup()
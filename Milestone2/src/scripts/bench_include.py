@@ -0,0 +1,196 @@
+"""
+Parity check and benchmark of include_graph.py against the notebook's find_main_tex/expand_tex.
+
+    1. Parity: on sources that only use what the legacy code understands (\\input / \\include
+       next to the including file, missing files, cycles, repeated includes), the main file and
+       the expanded text must be identical.
+    2. Extensions: on sources using \\subfile, \\import, root-relative paths and "\\input f",
+       how many included files the legacy expansion dropped.
+    3. Speed: main-file detection + expansion of every version, then the second expansion the
+       incremental builder does on a cache miss; files read by each.
+
+Without a data directory a synthetic corpus of multi-file projects is written to a temporary
+folder. With one, parity is reported per version (differences there come from the extensions).
+
+Usage:
+    python bench_include.py [data_dir] [--repeat 3] [--papers 30]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from bench_preprocess import SYNTHETIC_PARAGRAPHS
+from hierarchy import expand_tex_legacy, find_main_tex_legacy, get_all_papers, list_papers
+from include_graph import IncludeGraph, SourceCache
+
+PREAMBLE = "\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n"
+
+# ---------------------------
+# Corpus
+# ---------------------------
+
+def _paragraphs(rng, n):
+    return "\n\n".join(rng.choice(SYNTHETIC_PARAGRAPHS) for _ in range(n))
+
+
+def _write(root, files):
+    for name, text in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+
+def legacy_project(rng, n_sections=8):
+    """Files of a project in the forms expand_tex_legacy handles."""
+    files = {"macros.tex": "\\newcommand{\\R}{\\mathbb{R}}\n"}
+    body = ["\\input{macros}"]
+    for s in range(n_sections):
+        name = f"sections/sec{s}"
+        files[f"{name}.tex"] = (f"\\section{{Section {s}}}\n{_paragraphs(rng, 6)}\n"
+                                + ("\\input{figures/fig}\n" if s % 3 == 0 else "")
+                                + ("\\input{figures/fig}\n" if s == 1 else "")     # repeated file
+                                + ("\\input{missing}\n" if s == 2 else ""))
+        body.append(rng.choice([f"\\input{{{name}}}", f"\\include{{{name}}}", f"\\input{{{name}.tex}}"]))
+    files["sections/figures/fig.tex"] = "\\begin{figure}\\caption{A figure.}\\end{figure}\n\\input{fig}\n"   # cycle
+    files["main.tex"] = PREAMBLE + "\n".join(body) + "\n\\end{document}\n"
+    files["appendix_old.tex"] = f"% unused draft\n{_paragraphs(rng, 3)}\n"
+    return files
+
+
+def extended_project(rng, n_sections=8):
+    """Files of a project using \\subfile, \\import, root-relative paths and \\input without braces."""
+    files = {"aa_chapter.tex": ("\\documentclass[main.tex]{subfiles}\n\\begin{document}\n"
+                                f"\\chapter{{Subfile}}\n{_paragraphs(rng, 4)}\n\\end{{document}}\n")}
+    body = ["\\subfile{aa_chapter}"]
+    for s in range(n_sections):
+        files[f"parts/p{s}/text.tex"] = f"\\section{{Part {s}}}\n{_paragraphs(rng, 6)}\n\\input{{parts/shared}}\n"
+        body.append(rng.choice([f"\\import{{parts/p{s}/}}{{text}}", f"\\subimport{{parts/p{s}/}}{{text}}",
+                                f"\\input parts/p{s}/text.tex"]))
+    files["parts/shared.tex"] = "Shared remark.\n"
+    files["main.tex"] = PREAMBLE + "\n".join(body) + "\n\\end{document}\n"
+    return files
+
+
+def synthetic_versions(root, n_papers=30, seed=42):
+    """(legacy-form version folders, extended-form version folders), two versions per paper."""
+    rng = random.Random(seed)
+    legacy, extended = [], []
+    for p in range(n_papers):
+        for v in (1, 2):
+            for kind, make, folders in (("legacy", legacy_project, legacy), ("extended", extended_project, extended)):
+                version = root / kind / f"2303.{p:05d}" / "tex" / f"2303.{p:05d}v{v}"
+                _write(version, make(rng))
+                folders.append(version)
+    return legacy, extended
+
+
+def versions_from_data_dir(data_dir, limit=None):
+    return [v for paper in list_papers(Path(data_dir))[:limit] for v in get_all_papers(paper) or []]
+
+# ---------------------------
+# Checks
+# ---------------------------
+
+def legacy_expand(version):
+    main = find_main_tex_legacy(version)
+    try:
+        return main, expand_tex_legacy(main) if main else ""
+    except RecursionError:              # a cycle through "..": the paths never repeat
+        return main, None
+
+
+def new_expand(version, cache):
+    graph = IncludeGraph(version, cache)
+    main = graph.main_file()
+    return main, graph.expand(main) if main else ""
+
+
+def compare(versions, cache):
+    differing = [v for v in versions if legacy_expand(v) != new_expand(v, cache)]
+    return len(versions) - len(differing), differing
+
+
+def dropped_by_legacy(versions, cache):
+    """Included files reached by the resolver but not by the legacy expansion."""
+    dropped = 0
+    for version in versions:
+        graph = IncludeGraph(version, cache)
+        legacy_text = legacy_expand(version)[1]
+        for path, children in graph.edges().items():
+            for child in children:
+                source = cache.get(child)
+                dropped += bool(source and source.text.strip() and source.text.strip() not in legacy_text)
+    return dropped
+
+
+def count_reads(fn):
+    """(result, number of files read) of fn()."""
+    original = Path.read_text
+    reads = [0]
+
+    def counting(self, *args, **kwargs):
+        reads[0] += 1
+        return original(self, *args, **kwargs)
+
+    with mock.patch.object(Path, "read_text", counting):
+        result = fn()
+    return result, reads[0]
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def incremental_pattern(expand):
+    """What build_paper does per version on a cache miss: expand for the hash, then again to parse."""
+    return lambda versions: [(expand(v), expand(v)) for v in versions]
+
+
+def check_speed(versions, repeat):
+    legacy = incremental_pattern(legacy_expand)
+    fresh = lambda: SourceCache()
+    new = lambda vs: (lambda cache: incremental_pattern(lambda v: new_expand(v, cache))(vs))(fresh())
+    _, legacy_reads = count_reads(lambda: legacy(versions))
+    _, new_reads = count_reads(lambda: new(versions))
+    legacy_sec = best_time(lambda: legacy(versions), repeat)
+    new_sec = best_time(lambda: new(versions), repeat)
+    print(f"\n{'':22}{'versions/s':>12}{'files read':>12}")
+    print(f"{'legacy':22}{len(versions) / legacy_sec:12,.0f}{legacy_reads:12,}")
+    print(f"{'include graph':22}{len(versions) / new_sec:12,.0f}{new_reads:12,}   ({legacy_sec / new_sec:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity and speed of the include-graph resolver.")
+    parser.add_argument("data_dir", nargs="?", help="Milestone 1 data directory (default: synthetic corpus)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--papers", type=int, default=30, help="papers to generate / read")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.data_dir:
+            versions = versions_from_data_dir(args.data_dir, args.papers)
+            same, differing = compare(versions, SourceCache())
+            print(f"Parity: {same}/{len(versions)} versions with the same main file and expanded text")
+            for version in differing[:5]:
+                print(f"  differs (extension forms?): {version}")
+        else:
+            versions, extended = synthetic_versions(Path(tmp), args.papers)
+            same, differing = compare(versions, SourceCache())
+            failed = bool(differing)
+            print(f"Parity (legacy forms): {same}/{len(versions)} versions identical")
+            for version in differing[:5]:
+                print(f"  ❌ {version}")
+            print(f"Extensions: {dropped_by_legacy(extended, SourceCache())} included files dropped by the "
+                  f"legacy expansion over {len(extended)} versions, none by the resolver")
+        check_speed(versions, args.repeat)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,110 @@
+"""
+Parity check and throughput benchmark: preprocess_latex vs preprocess_latex_legacy.
+
+The golden corpus is every version of every paper in a data directory (main .tex expanded
+exactly as the hierarchy pipeline does); without a data directory a synthetic corpus of
+typical arXiv constructs is generated.
+
+Usage:
+    python bench_preprocess.py [data_dir] [--repeat 5] [--limit 500]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from hierarchy import expand_tex, find_main_tex, get_all_papers, list_papers
+from latex_preprocess import preprocess_latex, preprocess_latex_legacy
+
+SYNTHETIC_PARAGRAPHS = [
+    r"We build on prior work~\cite{smith2020,doe2019} and extend the analysis of Section~\ref{sec:method}.",
+    r"As shown in Eq.~\eqref{eq:loss}, the \textbf{loss} is \emph{convex} when $\lambda > 0$. % TODO check",
+    r"The cost is 5\% lower than \textit{baseline} \cite{lee2021}; see \textbf{Table \ref{tab:main}}.",
+    r"\begin{figure}[t]\centering\includegraphics[width=\linewidth]{fig.pdf}\caption{Overview.}\label{fig:overview}\end{figure}",
+    r"\begin{equation}\label{eq:loss} \mathcal{L} = \sum_i \ell(x_i, y_i) \end{equation}",
+    r"\begin{align} a &= b + c \\ d &= e \end{align}",
+    "Inline math \\( x^2 \\) and display math $$ \\int_0^1 f(x)\\,dx $$ and \\[ y = mx + b \\].",
+    r"\vspace{2mm}\small Results are averaged over 5 seeds.\normalsize\smallskip",
+    r"\begin{table}[htbp]\centering\footnotesize\begin{tabular}{cc}\toprule A & B \\ \midrule 1 & 2 \\ \bottomrule\end{tabular}\end{table}",
+    r"\underline{Note}: \texttt{code} and \emph{\textbf{nested}} emphasis \textbf{with \cite{x} inside}.",
+    r"\paragraph{Setup} We use $ \alpha = 0.1 $ and \hspace{1em} train for 10 epochs.",
+]
+
+
+def synthetic_corpus(n_docs=200, paragraphs_per_doc=400, seed=42):
+    rng = random.Random(seed)
+    docs = []
+    for d in range(n_docs):
+        body = []
+        for s in range(paragraphs_per_doc // 20):
+            body.append(f"\\section{{Section {s}}}\\label{{sec:{s}}}")
+            body.extend(rng.choice(SYNTHETIC_PARAGRAPHS) for _ in range(20))
+        docs.append(
+            "\\documentclass{article}\r\n\\usepackage{amsmath} % preamble\n\\begin{document}\n"
+            f"\\title{{Paper {d}}}\\author{{A. Author}}\\maketitle\n"
+            "\\begin{abstract}An abstract.\\end{abstract}\n"
+            + "\n\n".join(body)
+            + "\n\\bibliographystyle{plain}\\bibliography{refs}\n\\end{document}\n"
+        )
+    return docs
+
+
+def corpus_from_data_dir(data_dir, limit=None):
+    docs = []
+    for paper in list_papers(Path(data_dir))[:limit]:
+        for version in get_all_papers(paper) or []:
+            main_tex = find_main_tex(version)
+            if main_tex is not None:
+                text = expand_tex(main_tex)
+                if text:
+                    docs.append(text)
+    return docs
+
+
+def check_parity(docs):
+    """Return [(doc index, first differing offset)] for every document whose outputs differ."""
+    mismatches = []
+    for i, doc in enumerate(docs):
+        expected, actual = preprocess_latex_legacy(doc), preprocess_latex(doc)
+        if expected != actual:
+            offset = next((k for k, (a, b) in enumerate(zip(expected, actual)) if a != b),
+                          min(len(expected), len(actual)))
+            mismatches.append((i, offset))
+    return mismatches
+
+
+def throughput(fn, docs, repeat):
+    """Best-of-`repeat` MB/s of fn over the whole corpus."""
+    size_mb = sum(len(d.encode("utf-8")) for d in docs) / 1e6
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for doc in docs:
+            fn(doc)
+        best = min(best, time.perf_counter() - t0)
+    return size_mb / best, best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the single-scan LaTeX preprocessor with the legacy chain.")
+    parser.add_argument("data_dir", nargs="?", help="Milestone 1 data directory (default: synthetic corpus)")
+    parser.add_argument("--limit", type=int, default=None, help="max papers to load from data_dir")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    docs = corpus_from_data_dir(args.data_dir, args.limit) if args.data_dir else synthetic_corpus()
+    size_mb = sum(len(d.encode("utf-8")) for d in docs) / 1e6
+    print(f"Corpus: {len(docs)} documents, {size_mb:.1f} MB")
+
+    mismatches = check_parity(docs)
+    print(f"Parity: {len(docs) - len(mismatches)}/{len(docs)} identical")
+    for i, offset in mismatches[:10]:
+        print(f"  ❌ document {i} differs at offset {offset}")
+
+    legacy_mbps, legacy_sec = throughput(preprocess_latex_legacy, docs, args.repeat)
+    fast_mbps, fast_sec = throughput(preprocess_latex, docs, args.repeat)
+    print(f"Legacy : {legacy_mbps:8.2f} MB/s ({legacy_sec:.3f} sec)")
+    print(f"Single : {fast_mbps:8.2f} MB/s ({fast_sec:.3f} sec)")
+    print(f"Speedup: {fast_mbps / legacy_mbps:.2f}x")
+    sys.exit(1 if mismatches else 0)
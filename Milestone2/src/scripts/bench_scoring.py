@@ -0,0 +1,144 @@
+"""
+Parity check and throughput benchmark: batched scoring (scoring.py) vs the per-pair notebook
+path (matching.py) on the labeled set.
+
+Labels come from the pred.json files of an output directory (ground truth + partition); a
+Logistic Regression is trained on the train partition exactly as in the notebook, then every
+labeled paper is ranked both ways. Without an output directory a synthetic labeled corpus is
+generated. Title similarity runs on the "difflib" backend, the only one with the notebook's
+exact values (bench_similarity.py covers the C backends).
+
+Usage:
+    python bench_scoring.py [output_dir] [--repeat 3] [--top-k 5]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from matching import (calculate_mrr, create_dataset_for_papers, generate_predictions_for_paper,
+                      load_all_data, load_pred_labels)
+from scoring import create_dataset_batched, generate_predictions_batched
+import similarity
+
+SYNTHETIC_WORDS = (
+    "learning deep neural network graph quantum spin transport optimal control robust sparse "
+    "attention transformer diffusion model inference bayesian stochastic gradient dynamics "
+    "lattice field theory topological phase entanglement scalable efficient adaptive"
+).split()
+SYNTHETIC_NAMES = ("Smith Nguyen Tran Garcia Müller Wang Li Zhang Kim Rossi Dubois Ivanov "
+                   "Sato Kumar Silva Cohen Novak Berg Costa Lopez").split()
+
+
+def synthetic_corpus(n_papers=12, n_refs=30, n_candidates=50, seed=42):
+    """Papers whose refs.bib entries are noisy copies of some of their candidates."""
+    rng = random.Random(seed)
+    all_data, all_labels, partitions = {}, {}, {}
+    for p in range(n_papers):
+        paper_id = f"2303-{p:05d}"
+        candidates = {}
+        for c in range(n_candidates):
+            candidates[f"{rng.randint(1000, 2299)}-{rng.randint(0, 99999):05d}"] = {
+                "title": " ".join(rng.choice(SYNTHETIC_WORDS) for _ in range(rng.randint(4, 10))).title(),
+                "authors": [f"{rng.choice('ABCDEFGH')}. {rng.choice(SYNTHETIC_NAMES)}"
+                            for _ in range(rng.randint(1, 6))],
+                "year": str(rng.randint(1995, 2023)),
+            }
+        # Near-duplicates (follow-up papers of the same group) make the ranking non-trivial
+        ids = list(candidates)
+        for prev_id, arxiv_id in zip(ids[::5], ids[1::5]):
+            words = candidates[prev_id]["title"].split()
+            words[rng.randrange(len(words))] = rng.choice(SYNTHETIC_WORDS).title()
+            candidates[arxiv_id].update(title=" ".join(words), authors=candidates[prev_id]["authors"])
+        bibtex, labels = {}, {}
+        for r, arxiv_id in enumerate(rng.sample(list(candidates), n_refs)):
+            cand = candidates[arxiv_id]
+            words = cand["title"].split()
+            if rng.random() < 0.4:
+                del words[rng.randrange(len(words))]
+            title = " ".join(words) if rng.random() < 0.6 else f"{{\\textit{{{' '.join(words).lower()}}}}}: a study"
+            authors = [f"{a.split()[-1]}, {a.split()[0]}" for a in cand["authors"]]
+            bibtex[f"ref_{p}_{r}"] = {
+                "ID": f"ref_{p}_{r}",
+                "title": title,
+                "author": " and ".join(authors if rng.random() < 0.8 else authors[:1]),
+                "year": cand["year"] if rng.random() < 0.8 else "",
+            }
+            labels[f"ref_{p}_{r}"] = arxiv_id
+        all_data[paper_id] = {"bibtex": bibtex, "candidates": candidates}
+        all_labels[paper_id] = labels
+        partitions[paper_id] = "test" if p < 2 else "valid" if p < 4 else "train"
+    return all_data, all_labels, partitions
+
+
+def overall_mrr(labels, predictions):
+    rr = []
+    for paper_id, groundtruth in labels.items():
+        rr.extend(calculate_mrr(groundtruth, predictions[paper_id])[1])
+    return float(np.mean(rr)) if rr else 0.0
+
+
+def timed(fn, repeat):
+    """(best-of-`repeat` seconds, last result) of fn()."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare batched candidate scoring with the per-pair path.")
+    parser.add_argument("output_dir", nargs="?", help="output directory with refs.bib/references.json/pred.json "
+                                                     "(default: synthetic corpus)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+    similarity.set_backend("difflib")
+
+    if args.output_dir:
+        all_data = load_all_data(Path(args.output_dir))
+        all_labels, partitions = load_pred_labels(Path(args.output_dir))
+        all_labels = {k: v for k, v in all_labels.items() if k in all_data}
+    else:
+        all_data, all_labels, partitions = synthetic_corpus()
+    if not all_labels:
+        sys.exit("No labeled papers found (run the matching notebook first to write pred.json files)")
+
+    paper_ids = list(all_labels)
+    train_papers = [p for p in paper_ids if partitions.get(p) == "train"] or paper_ids
+    n_pairs = sum(len(all_data[p]["bibtex"]) * len(all_data[p]["candidates"]) for p in paper_ids)
+    print(f"Labeled set: {len(paper_ids)} papers, {n_pairs} (entry, candidate) pairs to rank")
+
+    # Feature parity on the training set
+    legacy_sec, (X_legacy, y_legacy, meta_legacy) = timed(
+        lambda: create_dataset_for_papers(train_papers, all_data, all_labels), 1)
+    batched_sec, (X_batched, y_batched, meta_batched) = timed(
+        lambda: create_dataset_batched(train_papers, all_data, all_labels), args.repeat)
+    features_equal = (np.array_equal(X_legacy, X_batched) and np.array_equal(y_legacy, y_batched)
+                      and meta_legacy == meta_batched)
+    print(f"Training features: {'identical' if features_equal else 'DIFFERENT'} "
+          f"({len(X_legacy)} pairs, legacy {len(X_legacy) / legacy_sec:,.0f} pairs/s, "
+          f"batched {len(X_batched) / batched_sec:,.0f} pairs/s)")
+
+    model = LogisticRegression(class_weight='balanced', max_iter=1000, random_state=42, solver='lbfgs')
+    model.fit(X_legacy, y_legacy)
+
+    def rank_all(generate):
+        return {p: generate(p, all_data[p], model, top_k=args.top_k) for p in paper_ids}
+
+    legacy_sec, legacy_preds = timed(lambda: rank_all(generate_predictions_for_paper), 1)
+    batched_sec, batched_preds = timed(lambda: rank_all(generate_predictions_batched), args.repeat)
+    legacy_mrr, batched_mrr = overall_mrr(all_labels, legacy_preds), overall_mrr(all_labels, batched_preds)
+    same_rankings = legacy_preds == batched_preds
+
+    print(f"Per-pair : {n_pairs / legacy_sec:12,.0f} pairs/s ({legacy_sec:.3f} sec)  MRR {legacy_mrr:.4f}")
+    print(f"Batched  : {n_pairs / batched_sec:12,.0f} pairs/s ({batched_sec:.3f} sec)  MRR {batched_mrr:.4f}")
+    print(f"Speedup  : {legacy_sec / batched_sec:.1f}x")
+    print(f"Rankings : {'identical' if same_rankings else 'DIFFERENT'}")
+    sys.exit(0 if features_equal and same_rankings and legacy_mrr == batched_mrr else 1)
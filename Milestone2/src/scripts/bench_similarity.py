@@ -0,0 +1,140 @@
+"""
+Parity check and microbenchmark of similarity.py against the notebook's TextCleaner and
+feature functions (matching.py).
+
+    1. Cleaner parity: normalize_text / extract_author_lastname outputs must be identical.
+    2. Feature parity per backend: the five non-title features must be identical; title
+       similarity is identical on "difflib" and its largest gap is reported for the C backends.
+    3. Microbenchmarks: normalization (uncached and warm cache), title ratio kernels, per-pair
+       extract_all_features, and MRR of batched scoring trained with each backend.
+
+Usage:
+    python bench_similarity.py [output_dir] [--repeat 3]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+import matching
+import similarity
+from bench_scoring import overall_mrr, synthetic_corpus
+from matching import load_all_data, load_pred_labels
+from scoring import create_dataset_batched, generate_predictions_batched
+
+TRICKY_STRINGS = [
+    r"\textit{Deep} \textbf{Residual} Learning for Image Recognition",
+    r"On the $\alpha$-stability of {N}eural {ODE}s \emph{revisited}",
+    "Müller, Jürgen and Ñúñez, José", "Café — naïve résumé… “quoted” ‘single’",
+    'A weird key: "\'", here', "  spaces\tand\nnewlines  ", "", "Schrödinger's cat in a box",
+    r"\\ \mathcal{L} = \sum_i {x_i}", "Hyphen-ated-words & punctuation!?",
+]
+
+
+def collect_pairs(all_data, limit=None):
+    pairs = [(bib, cand) for paper in all_data.values()
+             for bib in paper['bibtex'].values() for cand in paper['candidates'].values()]
+    return pairs[:limit]
+
+
+def collect_strings(all_data):
+    titles, names = list(TRICKY_STRINGS), list(TRICKY_STRINGS)
+    for paper in all_data.values():
+        for bib in paper['bibtex'].values():
+            titles.append(bib.get('title', ''))
+            names.extend(a.strip() for a in bib.get('author', '').split(' and '))
+        for cand in paper['candidates'].values():
+            titles.append(cand.get('title', ''))
+            names.extend(cand.get('authors', []))
+    return titles, names
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_cleaner(titles, names):
+    legacy = matching.TextCleaner(remove_stopwords=False, lowercase=True)
+    fast = similarity.FastTextCleaner(remove_stopwords=False, lowercase=True)
+    bad = [t for t in titles if legacy.normalize_text(t) != fast.normalize_text(t)]
+    bad += [n for n in names if legacy.extract_author_lastname(n) != fast.extract_author_lastname(n)]
+    return bad
+
+
+def feature_gaps(pairs):
+    """(max |gap| per feature, number of pairs with any non-title feature different)."""
+    legacy = np.array([matching.extract_all_features(b, c) for b, c in pairs])
+    fast = np.array([similarity.extract_all_features(b, c) for b, c in pairs])
+    gaps = np.abs(legacy - fast).max(axis=0) if len(pairs) else np.zeros(len(matching.FEATURE_NAMES))
+    mismatched = int(np.any(legacy[:, 1:] != fast[:, 1:], axis=1).sum()) if len(pairs) else 0
+    return gaps, mismatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity and speed of the similarity kernels.")
+    parser.add_argument("output_dir", nargs="?", help="output directory with refs.bib/references.json "
+                                                     "(default: synthetic corpus)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pairs", type=int, default=5000, help="pairs used for per-pair parity and timing")
+    args = parser.parse_args()
+
+    if args.output_dir:
+        all_data = load_all_data(Path(args.output_dir))
+        labels, partitions = load_pred_labels(Path(args.output_dir))
+        labels = {p: g for p, g in labels.items() if p in all_data}
+    else:
+        all_data, labels, partitions = synthetic_corpus()
+    backends = [b for b in similarity.BACKENDS if similarity._available(b)]
+    titles, names = collect_strings(all_data)
+    pairs = collect_pairs(all_data, args.pairs)
+    failed = False
+
+    # 1. Cleaner parity and normalization speed
+    bad = check_cleaner(titles, names)
+    failed |= bool(bad)
+    print(f"Cleaner parity: {len(titles) + len(names) - len(bad)}/{len(titles) + len(names)} identical")
+    for s in bad[:5]:
+        print(f"  ❌ {s!r}")
+    legacy_cleaner = matching.TextCleaner()
+    legacy_sec = best_time(lambda: [legacy_cleaner.normalize_text(t) for t in titles], args.repeat)
+    uncached = similarity.FastTextCleaner(cache_size=0)
+    compiled_sec = best_time(lambda: [uncached.normalize_text(t) for t in titles], args.repeat)
+    warm = similarity.FastTextCleaner()
+    [warm.normalize_text(t) for t in titles]
+    warm_sec = best_time(lambda: [warm.normalize_text(t) for t in titles], args.repeat)
+    print(f"normalize_text: legacy {len(titles) / legacy_sec:,.0f}/s, precompiled {len(titles) / compiled_sec:,.0f}/s, "
+          f"cached {len(titles) / warm_sec:,.0f}/s ({len(set(titles))} distinct of {len(titles)})")
+
+    # 2-3. Per-backend feature parity and kernel speed
+    normalized = [(similarity.cleaner.normalize_text(b.get('title', '')),
+                   similarity.cleaner.normalize_text(c.get('title', ''))) for b, c in pairs]
+    legacy_sec = best_time(lambda: [matching.extract_all_features(b, c) for b, c in pairs], 1)
+    print(f"\n{len(pairs)} pairs; legacy extract_all_features {len(pairs) / legacy_sec:,.0f} pairs/s")
+    print(f"{'backend':>12} {'title gap':>10} {'other diffs':>12} {'ratio/s':>12} {'features/s':>12} {'MRR':>7}")
+
+    train = [p for p in labels if partitions.get(p) == "train"] or list(labels)
+    for backend in backends:
+        similarity.set_backend(backend)
+        gaps, mismatched = feature_gaps(pairs)
+        failed |= mismatched > 0 or (backend == "difflib" and gaps[0] != 0)
+        ratio_sec = best_time(lambda: [similarity.title_ratio(a, b) for a, b in normalized], args.repeat)
+        feat_sec = best_time(lambda: [similarity.extract_all_features(b, c) for b, c in pairs], args.repeat)
+
+        mrr = float("nan")
+        if labels:
+            X, y, _ = create_dataset_batched(train, all_data, labels)
+            model = LogisticRegression(class_weight='balanced', max_iter=1000, random_state=42, solver='lbfgs')
+            model.fit(X, y)
+            mrr = overall_mrr(labels, {p: generate_predictions_batched(p, all_data[p], model) for p in labels})
+        print(f"{backend:>12} {gaps[0]:10.4f} {mismatched:12d} {len(pairs) / ratio_sec:12,.0f} "
+              f"{len(pairs) / feat_sec:12,.0f} {mrr:7.4f}")
+
+    sys.exit(1 if failed else 0)
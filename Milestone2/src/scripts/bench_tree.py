@@ -0,0 +1,142 @@
+"""
+Parity check and benchmark of compact_tree.py against the notebook's dict trees.
+
+    1. Tree parity: build_compact_tree must give build_tree's structure (types, contents,
+       children order) for every version.
+    2. Output parity: finalize_compact must serialize to exactly the hierarchy.json of
+       finalize_hierarchy_json for every paper.
+    3. Speed and memory: tree building, cross-version merge (and the share of nodes replayed
+       from unchanged subtrees), and the memory held by one paper's trees.
+
+Without a data directory a synthetic corpus is generated: each paper has three versions where
+v2 rewrites one section and adds another, and v3 edits a few sentences of v2.
+
+Usage:
+    python bench_tree.py [data_dir] [--repeat 3] [--limit 50]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from bench_preprocess import SYNTHETIC_PARAGRAPHS, synthetic_corpus
+from compact_tree import CompactTree, build_compact_tree, finalize_compact
+from hierarchy import (build_tree, expand_tex, finalize_hierarchy_json, find_main_tex, get_all_papers,
+                       list_papers, process_references, remove_references_from_tex)
+from latex_preprocess import preprocess_latex
+
+
+def _cleaned(text):
+    return remove_references_from_tex(preprocess_latex(text))
+
+
+def synthetic_papers(n_papers=20, seed=42):
+    rng = random.Random(seed)
+    papers = []
+    for p, doc in enumerate(synthetic_corpus(n_docs=n_papers, paragraphs_per_doc=200, seed=seed)):
+        sections = doc.split("\\section{")
+        v2 = list(sections)
+        k = rng.randrange(1, len(v2) - 1)
+        v2[k] = v2[k].split("}", 1)[0] + "} " + " ".join(rng.choice(SYNTHETIC_PARAGRAPHS) for _ in range(15))
+        v2.insert(-1, "Appendix} " + " ".join(rng.choice(SYNTHETIC_PARAGRAPHS) for _ in range(10)))
+        v2 = "\\section{".join(v2)
+        v3 = v2.replace("5 seeds", "10 seeds", 1).replace("convex", "strictly convex", 2)
+        papers.append({f"2303.{p:05d}v{i}": _cleaned(t) for i, t in enumerate((doc, v2, v3), 1)})
+    return papers
+
+
+def papers_from_data_dir(data_dir, limit=None):
+    papers = []
+    for paper in list_papers(Path(data_dir))[:limit]:
+        versions = {}
+        for version in get_all_papers(paper) or []:
+            main_tex = find_main_tex(version)
+            text = expand_tex(main_tex) if main_tex else ""
+            if text:
+                versions[version.name] = process_references(preprocess_latex(text), version, version.name)[0]
+        if versions:
+            papers.append(versions)
+    return papers
+
+
+def strip_ids(node):
+    return (node["type"], node["content"], [strip_ids(c) for c in node["children"]])
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def held_bytes(build):
+    """Bytes still allocated after build() returns, i.e. the size of what it returned."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact trees vs dict trees: parity, speed, memory.")
+    parser.add_argument("data_dir", nargs="?", help="Milestone 1 data directory (default: synthetic corpus)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=None, help="at most this many papers")
+    args = parser.parse_args()
+
+    papers = papers_from_data_dir(args.data_dir, args.limit) if args.data_dir else synthetic_papers()
+    n_versions = sum(len(p) for p in papers)
+    failed = False
+
+    # 1-2. Parity
+    bad_trees = bad_outputs = 0
+    stats = {"fingerprinted": 0, "replayed": 0}
+    for versions in papers:
+        dict_trees = {v: build_tree(t) for v, t in versions.items()}
+        compact_trees = {v: build_compact_tree(t) for v, t in versions.items()}
+        bad_trees += sum(strip_ids(dict_trees[v]) != strip_ids(compact_trees[v].to_dict()) for v in versions)
+        bad_trees += sum(strip_ids(CompactTree.from_dict(dict_trees[v]).to_dict()) != strip_ids(dict_trees[v])
+                         for v in versions)
+        paper_stats = {}
+        legacy = json.dumps(finalize_hierarchy_json(dict_trees), indent=2, ensure_ascii=False)
+        compact = json.dumps(finalize_compact(compact_trees, paper_stats), indent=2, ensure_ascii=False)
+        bad_outputs += legacy != compact
+        for name in stats:
+            stats[name] += paper_stats[name]
+    failed = bad_trees > 0 or bad_outputs > 0
+    n_nodes = stats["fingerprinted"] + stats["replayed"]
+    print(f"{len(papers)} papers, {n_versions} versions, {n_nodes} nodes")
+    print(f"Tree parity   : {2 * n_versions - bad_trees}/{2 * n_versions} identical")
+    print(f"Output parity : {len(papers) - bad_outputs}/{len(papers)} hierarchy.json identical")
+    print(f"Merge         : {stats['replayed'] / max(n_nodes, 1):.0%} of nodes replayed from unchanged subtrees")
+
+    # 3. Speed
+    texts = [t for versions in papers for t in versions.values()]
+    dict_corpus = [{v: build_tree(t) for v, t in versions.items()} for versions in papers]
+    compact_corpus = [{v: build_compact_tree(t) for v, t in versions.items()} for versions in papers]
+    build_legacy = best_time(lambda: [build_tree(t) for t in texts], args.repeat)
+    build_compact = best_time(lambda: [build_compact_tree(t) for t in texts], args.repeat)
+    merge_legacy = best_time(lambda: [finalize_hierarchy_json(p) for p in dict_corpus], args.repeat)
+    merge_compact = best_time(lambda: [finalize_compact(p) for p in compact_corpus], args.repeat)
+    print(f"\n{'':14}{'dict trees':>14}{'compact':>14}{'speedup':>10}")
+    print(f"{'build (v/s)':14}{n_versions / build_legacy:14,.0f}{n_versions / build_compact:14,.0f}"
+          f"{build_legacy / build_compact:9.1f}x")
+    print(f"{'merge (p/s)':14}{len(papers) / merge_legacy:14,.0f}{len(papers) / merge_compact:14,.0f}"
+          f"{merge_legacy / merge_compact:9.1f}x")
+
+    # Memory of one paper's trees (largest paper)
+    largest = max(papers, key=lambda p: sum(len(t) for t in p.values()))
+    dict_bytes = held_bytes(lambda: {v: build_tree(t) for v, t in largest.items()})
+    compact_bytes = held_bytes(lambda: {v: build_compact_tree(t) for v, t in largest.items()})
+    print(f"{'memory (KiB)':14}{dict_bytes / 1024:14,.0f}{compact_bytes / 1024:14,.0f}"
+          f"{dict_bytes / compact_bytes:9.1f}x   (largest paper, all versions)")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,379 @@
+"""
+Fast bibliography parsing for the hierarchy pipeline.
+
+parse_bibtex is a hand-written scanner for the BibTeX subset found in nearly every arXiv .bib
+file (braced, quoted and numeric values, @comment, comments between entries). Its entries are
+exactly those of bibtexparser 1.x (pyparsing quirks included: tab expansion, whitespace after
+line breaks dropped, macros kept as BibDataStringExpression). Anything outside that subset
+(@string, @preamble, duplicate fields, malformed entries, ...) makes it re-parse the whole
+file with bibtexparser, so the result never differs, only the speed.
+
+iter_bibitems splits a thebibliography block with plain string scans (and, unlike BIBITEM_RE,
+also reads \\bibitem[label]{key}); parse_bibitem_body pulls authors, title, year, journal and
+DOI out of a formatted \\bibitem body.
+
+Usage (parity and entries/s on a data directory or a synthetic corpus):
+    python bench_bibparse.py [data_dir]
+"""
+import re
+import warnings
+from typing import Dict, Iterator, List, Tuple
+
+import bibtexparser
+from bibtexparser.bibdatabase import STANDARD_TYPES, BibDataString, BibDataStringExpression
+from bibtexparser.bparser import BibTexParser
+
+# ---------------------------
+# BibTeX scanner
+# ---------------------------
+
+FIELD_NAME_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-().+")
+STRING_NAME_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-:")
+KEYWORD_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_$")
+DIGITS = frozenset("0123456789")
+CLOSERS = {"{": "}", "(": ")"}
+
+NEXT_ENTRY_RE = re.compile(r'[ \t\r]*\n[ \n\t\r]*@')   # where a comment stops: "@" opening a line
+ENTRY_TYPE_RE = re.compile(r'[A-Za-z]+')
+BRACE_RE = re.compile(r'[{}]')
+QUOTE_OR_BRACE_RE = re.compile(r'["{}]')
+NON_WS_RE = re.compile(r'[^ \n\t\r]')
+
+
+class BibSyntaxError(ValueError):
+    """Input outside the subset handled by the scanner (parse_bibtex then uses bibtexparser)."""
+
+
+def _skip_ws(text, pos):
+    match = NON_WS_RE.search(text, pos)
+    return match.start() if match else len(text)
+
+
+def _strip_after_new_lines(s):
+    # bibtexparser.bibtexexpression._strip_after_new_lines
+    lines = s.splitlines()
+    if len(lines) > 1:
+        lines = [lines[0]] + [line.lstrip() for line in lines[1:]]
+    return '\n'.join(lines)
+
+
+def _braced_end(text, pos):
+    """Index just past the balanced {...} group starting at text[pos] == '{'."""
+    depth = 0
+    while True:
+        match = BRACE_RE.search(text, pos)
+        if match is None:
+            raise BibSyntaxError("unbalanced braces")
+        pos = match.end()
+        depth += 1 if match.group() == '{' else -1
+        if depth == 0:
+            return pos
+
+
+def _quoted_end(text, pos):
+    """Index just past the "..." value starting at text[pos] == '"' (braces may hide quotes)."""
+    depth = 0
+    pos += 1
+    while True:
+        match = QUOTE_OR_BRACE_RE.search(text, pos)
+        if match is None:
+            raise BibSyntaxError("unterminated quoted value")
+        char, pos = match.group(), match.end()
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth < 0:
+                raise BibSyntaxError("unbalanced braces in quoted value")
+        elif depth == 0:
+            return pos
+
+
+def _value(text, pos):
+    """(value, end) of a field value: integer, or '#'-joined braced/quoted strings and macros."""
+    if text[pos] in DIGITS:
+        end = pos
+        while end < len(text) and text[end] in DIGITS:
+            end += 1
+        return text[pos:end], end
+
+    items = []
+    while True:
+        char = text[pos] if pos < len(text) else ''
+        if char == '{':
+            end = _braced_end(text, pos)
+            items.append(text[pos + 1:end - 1])
+        elif char == '"':
+            end = _quoted_end(text, pos)
+            items.append(text[pos + 1:end - 1])
+        elif char in STRING_NAME_CHARS:
+            end = pos
+            while end < len(text) and text[end] in STRING_NAME_CHARS:
+                end += 1
+            items.append(BibDataString(None, text[pos:end]))
+        else:
+            raise BibSyntaxError(f"unexpected {char!r} in value")
+        pos = _skip_ws(text, end)
+        if pos < len(text) and text[pos] == '#':
+            pos = _skip_ws(text, pos + 1)
+            continue
+        if len(items) == 1 and isinstance(items[0], str):
+            return _strip_after_new_lines(items[0]), end
+        expression = BibDataStringExpression(items)
+        expression.apply_on_strings(_strip_after_new_lines)
+        return expression, end
+
+
+def _entry(text, pos, interpolate_strings):
+    """(entry dict or None for non-standard types, end) of the entry starting at text[pos] == '@'."""
+    type_match = ENTRY_TYPE_RE.match(text, pos + 1)
+    if type_match is None:
+        raise BibSyntaxError("missing entry type")
+    entry_type = type_match.group().lower()
+    pos = _skip_ws(text, type_match.end())
+    if pos >= len(text) or text[pos] not in CLOSERS:
+        raise BibSyntaxError("missing opening brace")
+    closer = CLOSERS[text[pos]]
+
+    comma = text.find(',', pos + 1)
+    if comma < 0:
+        raise BibSyntaxError("missing citation key")
+    key = text[pos + 1:comma].strip()
+    if not key or any(c.isspace() for c in key):
+        raise BibSyntaxError("empty citation key or whitespace in it")
+
+    fields = []
+    pos = _skip_ws(text, comma + 1)
+    while True:
+        start = pos
+        while pos < len(text) and text[pos] in FIELD_NAME_CHARS:
+            pos += 1
+        if pos == start:
+            if not fields:
+                raise BibSyntaxError("entry without fields")
+            break
+        name = text[start:pos]
+        pos = _skip_ws(text, pos)
+        if pos >= len(text) or text[pos] != '=':
+            raise BibSyntaxError(f"missing '=' after {name}")
+        pos = _skip_ws(text, pos + 1)
+        if pos >= len(text):
+            raise BibSyntaxError("missing value")
+        value, pos = _value(text, pos)
+        fields.append((name, value))
+        pos = _skip_ws(text, pos)
+        if pos < len(text) and text[pos] == ',':
+            pos = _skip_ws(text, pos + 1)
+            continue
+        break
+    if pos >= len(text) or text[pos] != closer:
+        raise BibSyntaxError("missing closing brace")
+
+    if entry_type not in STANDARD_TYPES:
+        return None, pos + 1
+    names = [name.lower() for name, _ in fields]
+    if len(set(names)) != len(names):
+        raise BibSyntaxError("duplicate field")           # bibtexparser's merge order is intricate
+    entry = {}
+    for name, value in reversed(fields):
+        if interpolate_strings and not isinstance(value, str):
+            raise BibSyntaxError("string interpolation")
+        entry[name.lower()] = '' if (not value or value == "{}") else value
+    entry['ENTRYTYPE'] = entry_type
+    entry['ID'] = key
+    return entry, pos + 1
+
+
+def scan_bibtex(text: str, interpolate_strings: bool = False) -> List[Dict]:
+    """Entries of a .bib text; raises BibSyntaxError outside the supported subset."""
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    text = text.expandtabs()          # pyparsing parses the tab-expanded string
+    entries = []
+    pos = _skip_ws(text, 0)
+    while pos < len(text):
+        if text[pos] == '@':
+            word = ENTRY_TYPE_RE.match(text, pos + 1)
+            after = word.end() if word else pos + 1
+            if word is None or (after < len(text) and text[after] in KEYWORD_CHARS):
+                raise BibSyntaxError("unusual '@' construct")
+            keyword = word.group().lower()
+            if keyword in ("string", "preamble"):
+                raise BibSyntaxError(f"@{keyword} is not supported")
+            if keyword == "comment":
+                stop = NEXT_ENTRY_RE.search(text, after)
+                pos = _skip_ws(text, stop.start() if stop else len(text))
+                continue
+            entry, pos = _entry(text, pos, interpolate_strings)
+            if entry is not None:
+                entries.append(entry)
+        else:
+            # Implicit comment: everything up to the next line starting with '@'
+            stop = NEXT_ENTRY_RE.search(text, pos)
+            pos = stop.start() if stop else len(text)
+        pos = _skip_ws(text, pos)
+    return entries
+
+
+def parse_bibtex(text: str, common_strings: bool = False, interpolate_strings: bool = False) -> List[Dict]:
+    """
+    Same entries as bibtexparser.loads(text, BibTexParser(common_strings=..., interpolate_strings=...)),
+    from the fast scanner when possible.
+    """
+    try:
+        return scan_bibtex(text, interpolate_strings)
+    except BibSyntaxError:
+        parser = BibTexParser(common_strings=common_strings, interpolate_strings=interpolate_strings)
+        # bibtexparser warns about every odd entry; keep that out of the caller's warning filters
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return bibtexparser.loads(text, parser=parser).entries
+
+# ---------------------------
+# \bibitem blocks
+# ---------------------------
+
+BIB_BEGIN = r'\begin{thebibliography}'
+BIB_END = r'\end{thebibliography}'
+BIBITEM_TOKEN_RE = re.compile(r'\\bibitem')
+# Optional [label] (braces nested up to two levels, as in natbib's "[{Smith et~al.(2001)}]")
+# and {key} right after a '\\bibitem' token
+BIBITEM_HEADER_RE = re.compile(
+    r'[ \t\n\r]*(?:\[(?:[^\]{}]|\{(?:[^{}]|\{[^{}]*\})*\})*\][ \t\n\r]*)?\{([^}]+)\}')
+
+
+def _bibitem_key(block, pos):
+    """(key, end) of the optional [label] and {key} following '\\bibitem' at pos; None if absent."""
+    pos = _skip_ws(block, pos)
+    if pos < len(block) and block[pos] == '[':
+        depth, pos = 0, pos + 1
+        while pos < len(block) and not (block[pos] == ']' and depth == 0):
+            depth += {'{': 1, '}': -1}.get(block[pos], 0)
+            pos += 1
+        pos = _skip_ws(block, pos + 1)
+    if pos >= len(block) or block[pos] != '{':
+        return None
+    end = block.find('}', pos + 1)
+    if end <= pos + 1:
+        return None
+    return block[pos + 1:end], end + 1
+
+
+def iter_bibitems(tex: str) -> Iterator[Tuple[str, str]]:
+    """(key, body) of every \\bibitem of the first thebibliography block."""
+    start = tex.find(BIB_BEGIN)
+    if start < 0:
+        return
+    stop = tex.find(BIB_END, start)
+    if stop < 0:
+        return
+    block = tex[start:stop]
+    starts = [m.end() for m in BIBITEM_TOKEN_RE.finditer(block)]
+    ends = [pos - len(r'\bibitem') for pos in starts[1:]] + [len(block)]
+    for pos, next_pos in zip(starts, ends):
+        # A header never runs into the next item; deeper [label] nesting takes the slow scan
+        header = BIBITEM_HEADER_RE.match(block, pos, next_pos)
+        if header is not None:
+            key, end = header.group(1), header.end()
+        else:
+            parsed = _bibitem_key(block, pos)
+            if parsed is None or parsed[1] > next_pos:
+                continue
+            key, end = parsed
+        yield key, block[end:next_pos].lstrip()
+
+# ---------------------------
+# \bibitem field extraction
+# ---------------------------
+
+COMMENT_RE = re.compile(r'(?<!\\)%[^\n]*')
+ESCAPED_RE = re.compile(r'\\([&%$#_])')
+ACCENT_RE = re.compile(r"\\[`'^\"~=.]|\\[uvHtcdbk](?=\{|\s+[a-zA-Z])")
+COMMAND_RE = re.compile(r'\\[a-zA-Z]+\*?')
+SPACES_RE = re.compile(r'\s+')
+YEAR_RE = re.compile(r'(?<![\d./])((?:19|20)\d{2})[a-z]?(?![\d]|\.\d)')
+PAREN_YEAR_RE = re.compile(r'\([^()]*?((?:19|20)\d{2})[a-z]?\)')
+DOI_RE = re.compile(r'10\.\d{4,9}/[^\s,;{}]+')
+QUOTED_RE = re.compile(r"``(.+?)''|“(.+?)”|\"(.+?)\"", re.S)
+EMPH_RE = re.compile(r'\\(?:emph|textit|textsl)\s*\{([^{}]*(?:\{[^{}]*\}[^{}]*)*)\}|\{\\(?:em|it|sl)\s+([^{}]*)\}')
+NEWBLOCK_RE = re.compile(r'\\newblock\b')
+VOLUME_RE = re.compile(r'\s*(?:\\textbf\s*\{\s*\d|\d+\s*[,(:])')   # "\textbf{12}, 345" / "12 (2001)"
+AUTHOR_SPLIT_RE = re.compile(r'\s*(?:,\s*and\s+|\band\b|&|;|,)\s*')
+INITIALS_RE = re.compile(r'(?:[A-Z][a-z]?\.?[\s-]*)+')
+ET_AL_RE = re.compile(r'\bet\.?\s*al\.?', re.I)
+MAX_NAME_WORDS = 5
+
+
+def clean_latex_text(text: str) -> str:
+    """Plain text of a short LaTeX snippet (commands dropped, arguments kept)."""
+    text = ACCENT_RE.sub('', ESCAPED_RE.sub(r'\1', text)).replace('~', ' ')
+    text = COMMAND_RE.sub(' ', text)
+    text = text.replace('{', '').replace('}', '').replace('\\', ' ')
+    return SPACES_RE.sub(' ', text).strip(' ,.;:')
+
+
+def split_authors(text: str) -> List[str]:
+    """Author names of "A. Smith, B. Jones and C. Lee" / "Smith, A., Jones, B." lists."""
+    names = []
+    for piece in AUTHOR_SPLIT_RE.split(ET_AL_RE.sub('', text)):
+        piece = piece.strip(' .')
+        if not piece:
+            continue
+        if INITIALS_RE.fullmatch(piece + '.') and names and ',' not in names[-1] and ' ' not in names[-1]:
+            names[-1] = f"{names[-1]}, {piece}."          # "Smith, A." split at its comma
+            continue
+        if len(piece.split()) > MAX_NAME_WORDS or any(c.isdigit() for c in piece):
+            break                                         # ran into the title or the venue
+        names.append(piece)
+    return names
+
+
+def _looks_like_title(text: str) -> bool:
+    words = text.split()
+    return len(words) >= 4 and sum(w.endswith('.') for w in words) < len(words) / 2
+
+
+def parse_bibitem_body(body: str) -> Dict:
+    """
+    Best-effort {title, authors, year, journal, doi} of a formatted \\bibitem body. Handles
+    \\newblock-separated styles (plain, abbrv, natbib), quoted titles (IEEE, APS with titles)
+    and emphasized titles or venues (amsplain, apsrev); missing parts are empty.
+    """
+    body = COMMENT_RE.sub('', body)
+    doi_match = DOI_RE.search(body)
+    year_match = PAREN_YEAR_RE.search(body) or (list(YEAR_RE.finditer(body)) or [None])[-1]
+    fields = {
+        "title": "",
+        "authors": [],
+        "year": year_match.group(1) if year_match else "",
+        "journal": "",
+        "doi": doi_match.group(0).rstrip('.') if doi_match else "",
+    }
+
+    blocks = NEWBLOCK_RE.split(body)
+    if len(blocks) > 1:
+        authors_part = blocks[0]
+        fields["title"] = clean_latex_text(blocks[1])
+        if len(blocks) > 2:
+            emph = EMPH_RE.search(blocks[2])
+            fields["journal"] = clean_latex_text(emph.group(1) or emph.group(2) if emph else blocks[2].split(',')[0])
+    else:
+        quoted = QUOTED_RE.search(body)
+        emph = EMPH_RE.search(body)
+        if quoted:
+            authors_part = body[:quoted.start()]
+            fields["title"] = clean_latex_text(next(g for g in quoted.groups() if g is not None))
+            emph = EMPH_RE.search(body, quoted.end())
+            if emph:
+                fields["journal"] = clean_latex_text(emph.group(1) or emph.group(2))
+        elif emph:
+            authors_part = body[:emph.start()]
+            emphasized = clean_latex_text(emph.group(1) or emph.group(2))
+            is_venue = VOLUME_RE.match(body, emph.end()) or not _looks_like_title(emphasized)
+            fields["journal" if is_venue else "title"] = emphasized
+        else:
+            authors_part = body.split('. ', 1)[0] if year_match is None else body[:year_match.start()]
+
+    authors_part = PAREN_YEAR_RE.sub('', authors_part)
+    fields["authors"] = split_authors(clean_latex_text(authors_part))
+    return fields
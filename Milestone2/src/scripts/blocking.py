@@ -0,0 +1,221 @@
+"""
+Blocking stage of the reference matcher: propose a small candidate shortlist per BibTeX entry
+so that features (and SequenceMatcher in particular) only run on plausible pairs instead of
+every (entry x candidate) pair of a paper.
+
+A CandidateIndex is built once per paper over its references.json candidates:
+    - exact lookups on DOI and arXiv ID (from the entry's doi/eprint/journal/url fields);
+    - an inverted index on normalized title words (IDF-weighted);
+    - an inverted index on character trigrams of the normalized title (robust to typos,
+      hyphenation and LaTeX leftovers).
+Exact hits are ranked first, then candidates by the sum of their word and trigram overlap.
+
+Given a corpus-wide TitleIndex (title_index.py), the TF-IDF top hits of every entry among the
+paper's candidates join the shortlist right after the exact hits; all entries of a paper are
+answered by one sparse product.
+"""
+import heapq
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from scoring import feature_tensor, prepare_bibtex, prepare_candidate
+
+DEFAULT_SHORTLIST_K = 20   # candidates kept per entry before feature extraction
+TITLE_INDEX_K = 10         # shortlist slots a TitleIndex may fill (the rest go to word/trigram overlap)
+NGRAM = 3
+
+ARXIV_ID_PATTERN = r'(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?'
+ARXIV_IN_TEXT_RE = re.compile(r'arxiv(?:\s+preprint)?(?:\.org/(?:abs|pdf)/|\s*:\s*|\s+)' + ARXIV_ID_PATTERN, re.I)
+EPRINT_RE = re.compile(r'^\s*(?:arxiv:)?' + ARXIV_ID_PATTERN + r'\s*$', re.I)
+DOI_PREFIX_RE = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:)', re.I)
+ARXIV_FIELDS = ('eprint', 'arxiv', 'journal', 'url', 'note', 'howpublished', 'volume')
+
+
+def normalize_arxiv_id(arxiv_id: str) -> str:
+    """'2303.07857v2' / '2303-07857' -> '2303-07857', 'cond-mat/0009376' unchanged (references.json key format)."""
+    return re.sub(r'v\d+$', '', arxiv_id.strip()).replace('.', '-').lower()
+
+
+def normalize_doi(doi) -> str:
+    if not isinstance(doi, str):
+        return ""
+    return DOI_PREFIX_RE.sub('', doi.strip()).lower()
+
+
+def bibtex_arxiv_ids(bibtex_entry: Dict) -> set:
+    """arXiv IDs mentioned in an entry's eprint/journal/url/... fields."""
+    ids = set()
+    for field in ARXIV_FIELDS:
+        value = bibtex_entry.get(field)
+        if not isinstance(value, str) or not value:
+            continue
+        match = EPRINT_RE.match(value) if field in ('eprint', 'arxiv') else None
+        if match:
+            ids.add(normalize_arxiv_id(match.group(1)))
+        ids.update(normalize_arxiv_id(m.group(1)) for m in ARXIV_IN_TEXT_RE.finditer(value))
+    return ids
+
+
+def title_ngrams(title: str, n: int = NGRAM) -> set:
+    padded = f" {title} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+# ---------------------------
+# Candidate index
+# ---------------------------
+
+class CandidateIndex:
+    """Inverted indexes over one paper's candidates (positions follow references.json order)."""
+
+    def __init__(self, candidates: Dict[str, Dict]):
+        self.arxiv_ids = list(candidates)
+        self.prepared = [prepare_candidate(candidates[a]) for a in self.arxiv_ids]
+
+        self.by_arxiv = defaultdict(list)
+        self.by_doi = defaultdict(list)
+        for pos, arxiv_id in enumerate(self.arxiv_ids):
+            cand = candidates[arxiv_id]
+            self.by_arxiv[normalize_arxiv_id(arxiv_id)].append(pos)
+            if isinstance(cand.get('arxiv_id'), str) and cand['arxiv_id']:
+                self.by_arxiv[normalize_arxiv_id(cand['arxiv_id'])].append(pos)
+            doi = normalize_doi(cand.get('doi'))
+            if doi:
+                self.by_doi[doi].append(pos)
+
+        self.words = defaultdict(list)
+        self.ngrams = defaultdict(list)
+        for pos, prep in enumerate(self.prepared):
+            for word in prep.words:
+                self.words[word].append(pos)
+            if prep.title:
+                for gram in title_ngrams(prep.title):
+                    self.ngrams[gram].append(pos)
+        n = max(len(self.arxiv_ids), 1)
+        self.idf = {w: math.log(1 + n / len(p)) for w, p in self.words.items()}
+
+    def __len__(self):
+        return len(self.arxiv_ids)
+
+    def exact_matches(self, bibtex_entry: Dict) -> List[int]:
+        hits = list(self.by_doi.get(normalize_doi(bibtex_entry.get('doi')), ()))
+        for arxiv_id in bibtex_arxiv_ids(bibtex_entry):
+            hits.extend(self.by_arxiv.get(arxiv_id, ()))
+        return list(dict.fromkeys(hits))
+
+    def title_index_hits(self, bibtex_entries: List[Dict], title_index, k: int = TITLE_INDEX_K) -> List[List[int]]:
+        """Positions of each entry's TF-IDF top-k among this paper's candidates (one product for all)."""
+        position = {arxiv_id: pos for pos, arxiv_id in enumerate(self.arxiv_ids)}
+        hits = title_index.top_k([e.get('title', '') or '' for e in bibtex_entries], k, among=self.arxiv_ids)
+        return [[position[arxiv_id] for arxiv_id, _ in entry_hits] for entry_hits in hits]
+
+    def shortlist(self, bibtex_entry: Dict, k: int = DEFAULT_SHORTLIST_K, prepared=None, proposed=()) -> List[int]:
+        """
+        Up to k candidate positions worth scoring for one entry: exact DOI/arXiv hits first,
+        then `proposed` ones (TitleIndex hits), then the best by title word + trigram overlap.
+        Entries without a usable title cannot be blocked and get every candidate.
+        """
+        prep = prepared or prepare_bibtex(bibtex_entry)
+        exact = list(dict.fromkeys(self.exact_matches(bibtex_entry) + list(proposed)))
+        if not prep.title:
+            return exact + [pos for pos in range(len(self)) if pos not in exact]
+
+        scores = defaultdict(float)
+        words = [w for w in prep.words if w in self.idf]
+        total_idf = sum(self.idf[w] for w in words)
+        for word in words:
+            weight = self.idf[word] / total_idf
+            for pos in self.words[word]:
+                scores[pos] += weight
+        grams = title_ngrams(prep.title)
+        weight = 1.0 / len(grams)
+        for gram in grams:
+            for pos in self.ngrams.get(gram, ()):
+                scores[pos] += weight
+
+        for pos in exact:
+            scores.pop(pos, None)
+        best = heapq.nlargest(max(k - len(exact), 0), scores.items(), key=lambda kv: (kv[1], -kv[0]))
+        return exact + [pos for pos, _ in best]
+
+# ---------------------------
+# Blocked scoring
+# ---------------------------
+
+def _proposals(index: CandidateIndex, bibtex: Dict, k: int, title_index=None) -> List[List[int]]:
+    if title_index is None or not bibtex:
+        return [()] * len(bibtex)
+    return index.title_index_hits(list(bibtex.values()), title_index, min(k, TITLE_INDEX_K))
+
+
+def score_paper_blocked(paper_data: Dict, model, k: int = DEFAULT_SHORTLIST_K, index: CandidateIndex = None,
+                        title_index=None):
+    """
+    Match probabilities of the shortlisted pairs only, with one predict_proba call per paper.
+    Features come from one tensor per paper over the union of the shortlists, masked down to
+    each entry's own shortlist (a per-pair title backend only compares the shortlisted pairs).
+    title_index: a TitleIndex whose hits join every shortlist (see CandidateIndex.shortlist).
+    Returns:
+        {bib_key: (candidate positions in references.json order, probabilities)}, index
+    """
+    index = index or CandidateIndex(paper_data['candidates'])
+    proposals = _proposals(index, paper_data['bibtex'], k, title_index)
+    blocks, preps = [], []
+    for (bib_key, bib_entry), proposed in zip(paper_data['bibtex'].items(), proposals):
+        prep = prepare_bibtex(bib_entry)
+        # Candidate order (not shortlist order) keeps tie-breaking identical to full scoring
+        blocks.append((bib_key, sorted(index.shortlist(bib_entry, k, prep, proposed))))
+        preps.append(prep)
+
+    union = sorted({pos for _, positions in blocks for pos in positions})
+    column = {pos: j for j, pos in enumerate(union)}
+    mask = np.zeros((len(blocks), len(union)), dtype=bool)
+    for i, (_, positions) in enumerate(blocks):
+        mask[i, [column[pos] for pos in positions]] = True
+    # Boolean indexing is row-major: entry by entry, candidates in ascending position
+    X = feature_tensor(preps, [index.prepared[pos] for pos in union], mask)[mask]
+    proba = model.predict_proba(X)[:, 1] if len(X) else np.zeros(0)
+    scored, offset = {}, 0
+    for bib_key, positions in blocks:
+        scored[bib_key] = (positions, proba[offset:offset + len(positions)])
+        offset += len(positions)
+    return scored, index
+
+
+def generate_predictions_blocked(paper_id, paper_data, model, top_k=5, shortlist_k=DEFAULT_SHORTLIST_K,
+                                 title_index=None):
+    """generate_predictions_for_paper restricted to each entry's shortlist."""
+    scored, index = score_paper_blocked(paper_data, model, shortlist_k, title_index=title_index)
+    predictions = {}
+    for bib_key, (positions, proba) in scored.items():
+        order = np.argsort(-proba, kind="stable")[:top_k]
+        predictions[bib_key] = [index.arxiv_ids[positions[i]] for i in order]
+    return predictions
+
+
+def recall_at_k(all_data: Dict, labels: Dict[str, Dict], k: int, title_index=None):
+    """
+    Fraction of labeled entries whose true candidate survives blocking, and the number of
+    pairs left to score (over the labeled entries), with or without a TitleIndex.
+    Returns:
+        (recall, hits, total, shortlisted_pairs, all_pairs)
+    """
+    hits = total = shortlisted = all_pairs = 0
+    for paper_id, groundtruth in labels.items():
+        if paper_id not in all_data:
+            continue
+        paper_data = all_data[paper_id]
+        index = CandidateIndex(paper_data['candidates'])
+        keys = [key for key in groundtruth if key in paper_data['bibtex']]
+        entries = {key: paper_data['bibtex'][key] for key in keys}
+        for bib_key, proposed in zip(keys, _proposals(index, entries, k, title_index)):
+            arxiv_id = groundtruth[bib_key]
+            positions = index.shortlist(paper_data['bibtex'][bib_key], k, proposed=proposed)
+            total += 1
+            hits += arxiv_id in {index.arxiv_ids[p] for p in positions}
+            shortlisted += len(positions)
+            all_pairs += len(index)
+    return (hits / total if total else 0.0), hits, total, shortlisted, all_pairs
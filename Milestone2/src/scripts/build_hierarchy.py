@@ -0,0 +1,204 @@
+"""
+Build hierarchy.json / refs.bib for a whole corpus on every core.
+
+Papers are sharded into chunks and scheduled on a ProcessPoolExecutor; a failing paper is
+caught inside its worker and reported, never aborting the rest of its chunk or the run. A worker
+process that dies breaks the whole pool (every pending chunk fails with BrokenProcessPool), so
+the unfinished chunks are rerun on single-process executors, where a crash only takes down the
+chunk that caused it; that chunk is then retried paper by paper to find the paper at fault.
+
+Usage:
+    python build_hierarchy.py <data_dir> [--out output] [--workers N] [--chunksize K] [--full]
+"""
+import argparse
+import json
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from tqdm.auto import tqdm
+
+from hierarchy import DATA_DIR, OUTPUT_DIR, list_papers
+from incremental import build_paper
+
+DEFAULT_CHUNKSIZE = 8   # papers per task: amortizes IPC without starving idle workers at the tail
+
+# ---------------------------
+# Worker side
+# ---------------------------
+
+def process_chunk(paper_dirs, output_dir, force=False):
+    """
+    Process a chunk of papers in one worker process (incrementally unless force).
+    Returns one result dict per paper: {paper_id, status, seconds[, error]}.
+    """
+    results = []
+    for paper_dir in paper_dirs:
+        paper_dir = Path(paper_dir)
+        t0 = time.perf_counter()
+        try:
+            status = build_paper(paper_dir, Path(output_dir), verbose=False, force=force)
+            result = {"paper_id": paper_dir.name, "status": status}
+        except Exception as e:
+            result = {
+                "paper_id": paper_dir.name,
+                "status": "error",
+                "error": f"{type(e).__name__}: {e}",
+                "traceback": traceback.format_exc(limit=5),
+            }
+        result["seconds"] = time.perf_counter() - t0
+        result["pid"] = os.getpid()
+        results.append(result)
+    return results
+
+# ---------------------------
+# Driver side
+# ---------------------------
+
+def run_pool(chunks, output_dir, workers, force, bar):
+    """
+    Run chunks on one process pool.
+    Returns (results, chunks left unfinished because a worker process died and broke the pool).
+    """
+    results, unfinished = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_chunk, chunk, str(output_dir), force): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                chunk_results = future.result()
+            except BrokenProcessPool:
+                unfinished.append(futures[future])
+                continue
+            except Exception as e:
+                chunk_results = [{"paper_id": Path(p).name, "status": "error", "seconds": 0.0,
+                                  "error": f"{type(e).__name__}: {e}"} for p in futures[future]]
+            results.extend(chunk_results)
+            bar.update(len(chunk_results))
+    return results, unfinished
+
+
+def run_isolated(chunks, output_dir, workers, force, bar):
+    """
+    Run chunks on `workers` single-process executors, one chunk per executor at a time, so a
+    process that dies only fails its own chunk. A crashed chunk is retried one paper per task;
+    a paper that crashes its process on its own is reported as an error.
+    """
+    todo = deque(chunks)
+    results, idle, running = [], [], {}
+    try:
+        while todo or running:
+            while todo and len(running) < workers:
+                executor = idle.pop() if idle else ProcessPoolExecutor(max_workers=1)
+                chunk = todo.popleft()
+                running[executor.submit(process_chunk, chunk, str(output_dir), force)] = (executor, chunk)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                executor, chunk = running.pop(future)
+                try:
+                    chunk_results = future.result()
+                    idle.append(executor)
+                except BrokenProcessPool:
+                    executor.shutdown(wait=False)
+                    if len(chunk) > 1:
+                        todo.extend([p] for p in chunk)
+                        continue
+                    chunk_results = [{"paper_id": Path(chunk[0]).name, "status": "error", "seconds": 0.0,
+                                      "error": "worker process died on this paper"}]
+                except Exception as e:
+                    idle.append(executor)
+                    chunk_results = [{"paper_id": Path(p).name, "status": "error", "seconds": 0.0,
+                                      "error": f"{type(e).__name__}: {e}"} for p in chunk]
+                results.extend(chunk_results)
+                bar.update(len(chunk_results))
+    finally:
+        for executor in idle + [executor for executor, _ in running.values()]:
+            executor.shutdown()
+    return results
+
+
+def build_corpus(paper_dirs, output_dir=OUTPUT_DIR, workers=None, chunksize=DEFAULT_CHUNKSIZE, force=False):
+    """
+    Process every paper folder with a pool of `workers` processes (default: all cores).
+    Papers whose sources and parser are unchanged since the last build are skipped unless force.
+    Returns a report dict with per-status counts, timings and failures.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    chunks = [[str(p) for p in paper_dirs[i:i + chunksize]]
+              for i in range(0, len(paper_dirs), chunksize)]
+
+    t0 = time.perf_counter()
+    with tqdm(total=len(paper_dirs), desc="Processing papers", unit="paper") as bar:
+        results, unfinished = run_pool(chunks, output_dir, workers, force, bar)
+        if unfinished:
+            # A worker process died (e.g. killed for memory) and took the pool's pending chunks with it
+            bar.write(f"⚠️ A worker process died: rerunning {len(unfinished)} chunks in isolated processes")
+            results.extend(run_isolated(unfinished, output_dir, workers, force, bar))
+    wall = time.perf_counter() - t0
+
+    return make_report(results, wall, workers, chunksize)
+
+
+def make_report(results, wall_seconds, workers, chunksize):
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    busy = sum(r["seconds"] for r in results)
+    return {
+        "papers": len(results),
+        "counts": counts,
+        "workers": workers,
+        "chunksize": chunksize,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": busy,
+        "papers_per_second": len(results) / wall_seconds if wall_seconds > 0 else 0.0,
+        "parallel_efficiency": busy / (wall_seconds * workers) if wall_seconds > 0 else 0.0,
+        "slowest": sorted(({"paper_id": r["paper_id"], "seconds": r["seconds"]} for r in results),
+                          key=lambda r: r["seconds"], reverse=True)[:10],
+        "failures": [{k: r[k] for k in ("paper_id", "error", "traceback") if k in r}
+                     for r in results if r["status"] == "error"],
+    }
+
+
+def print_report(report):
+    print("\n===============================")
+    print(f"Processed {report['papers']} papers in {report['wall_seconds']:.2f} sec "
+          f"with {report['workers']} workers (chunks of {report['chunksize']})")
+    print(f"Throughput: {report['papers_per_second']:.2f} papers/sec, "
+          f"parallel efficiency {report['parallel_efficiency'] * 100:.0f}%")
+    print("Status: " + ", ".join(f"{k}={v}" for k, v in sorted(report["counts"].items())))
+    for slow in report["slowest"][:5]:
+        print(f"  slow: {slow['paper_id']} {slow['seconds']:.2f}s")
+    for failure in report["failures"]:
+        print(f"  ❌ {failure['paper_id']}: {failure['error']}")
+    print("===============================")
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build hierarchy.json and refs.bib for every paper in parallel.")
+    parser.add_argument("data_dir", nargs="?", default=str(DATA_DIR))
+    parser.add_argument("--out", default=str(OUTPUT_DIR), help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="papers per scheduled task")
+    parser.add_argument("--start", type=int, default=0, help="index of the first paper to process")
+    parser.add_argument("--end", type=int, default=None, help="index where processing stops (exclusive)")
+    parser.add_argument("--report", help="also write the report as JSON to this path")
+    parser.add_argument("--full", action="store_true", help="rebuild every paper, ignoring manifests and caches")
+    args = parser.parse_args()
+
+    papers = list_papers(Path(args.data_dir))[args.start:args.end]
+    print(f"Total papers to process: {len(papers)}")
+
+    report = build_corpus(papers, args.out, args.workers, args.chunksize, force=args.full)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
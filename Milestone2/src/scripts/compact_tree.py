@@ -0,0 +1,217 @@
+"""
+Compact hierarchy trees and linear cross-version deduplication.
+
+build_tree makes one dict per node (with a uuid4 string ID) and collect_elements_and_hierarchy
+normalizes and SHA1-hashes every node of every version. Here a tree is a few parallel arrays in
+pre-order (node i's parent is parents[i] < i and its subtree is the index range [i, ends[i])),
+and every subtree gets a Merkle hash (BLAKE2b of its type, raw content and children's hashes).
+When merging versions, a subtree whose Merkle hash was already seen (a section unchanged
+between v1 and v2) reuses the canonical IDs of its first occurrence: none of its sentences is
+normalized or fingerprinted again.
+
+The output of finalize_compact is identical to hierarchy.finalize_hierarchy_json on the
+equivalent dict trees; bench_tree.py checks it.
+"""
+import hashlib
+import re
+from array import array
+from typing import Dict, List
+
+from hierarchy import (HIERARCHY_LEVELS, clean_whitespace, node_fingerprint, normalize_node_content,
+                       scan_tokens, strip_document_env)
+
+NODE_TYPES = list(HIERARCHY_LEVELS)                   # type code -> type name
+TYPE_CODES = {name: code for code, name in enumerate(NODE_TYPES)}
+TYPE_LEVELS = [HIERARCHY_LEVELS[name]["level"] for name in NODE_TYPES]
+DOCUMENT, SENTENCE = TYPE_CODES["document"], TYPE_CODES["sentence"]
+SENTENCE_RE = re.compile(HIERARCHY_LEVELS["sentence"]["signals"][0])
+BEGIN_ENV_RE = re.compile(r"\\begin\{")
+DIGEST_SIZE = 16
+
+
+class CompactTree:
+    """One version's hierarchy as parallel arrays in pre-order; node 0 is the document root."""
+
+    __slots__ = ("types", "contents", "parents", "ends")
+
+    def __init__(self, types=None, contents=None, parents=None):
+        self.types = array("B", types or [DOCUMENT])
+        self.contents = list(contents or [""])
+        self.parents = array("i", parents or [-1])
+        self.ends = None
+
+    def __len__(self):
+        return len(self.types)
+
+    def add(self, parent: int, type_code: int, content: str) -> int:
+        self.types.append(type_code)
+        self.contents.append(content)
+        self.parents.append(parent)
+        return len(self.types) - 1
+
+    def finish(self) -> "CompactTree":
+        """Compute subtree ranges once all nodes are added."""
+        ends = array("i", range(1, len(self) + 1))
+        parents = self.parents
+        for i in range(len(self) - 1, 0, -1):
+            if ends[i] > ends[parents[i]]:
+                ends[parents[i]] = ends[i]
+        self.ends = ends
+        return self
+
+    def children(self, i: int):
+        child, end, ends = i + 1, self.ends[i], self.ends
+        while child < end:
+            yield child
+            child = ends[child]
+
+    def subtree_hashes(self) -> List[bytes]:
+        """Merkle hash of every subtree (bottom-up, no recursion)."""
+        n = len(self)
+        child_digests = [[] for _ in range(n)]
+        digests = [b""] * n
+        for i in range(n - 1, -1, -1):
+            h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+            content = self.contents[i].encode("utf-8", "surrogatepass")
+            h.update(bytes((self.types[i],)) + len(content).to_bytes(8, "little") + content)
+            for digest in reversed(child_digests[i]):   # collected last child first
+                h.update(digest)
+            digests[i] = h.digest()
+            if i:
+                child_digests[self.parents[i]].append(digests[i])
+            child_digests[i] = None
+        return digests
+
+    # ---------------------------
+    # Conversions
+    # ---------------------------
+
+    def to_json(self) -> Dict:
+        return {"types": [NODE_TYPES[t] for t in self.types], "contents": self.contents,
+                "parents": list(self.parents)}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "CompactTree":
+        return cls([TYPE_CODES[t] for t in data["types"]], data["contents"], data["parents"]).finish()
+
+    def to_dict(self) -> Dict:
+        """The nested {"id", "type", "content", "children"} form of build_tree (IDs are node indices)."""
+        nodes = [{"id": i, "type": NODE_TYPES[t], "content": c, "children": []}
+                 for i, (t, c) in enumerate(zip(self.types, self.contents))]
+        for i in range(1, len(nodes)):
+            nodes[self.parents[i]]["children"].append(nodes[i])
+        return nodes[0]
+
+    @classmethod
+    def from_dict(cls, root: Dict) -> "CompactTree":
+        tree = cls()
+        stack = [(child, 0) for child in reversed(root.get("children", []))]
+        while stack:
+            node, parent = stack.pop()
+            i = tree.add(parent, TYPE_CODES[node["type"]], node.get("content", ""))
+            stack.extend((child, i) for child in reversed(node.get("children", [])))
+        return tree.finish()
+
+# ---------------------------
+# Construction
+# ---------------------------
+
+def _emit_sentences(tree, parent, text):
+    for s in SENTENCE_RE.finditer(text):
+        tree.add(parent, SENTENCE, clean_whitespace(s.group(0)))
+
+
+def build_compact_tree(full_text: str) -> CompactTree:
+    """hierarchy.build_tree, producing a CompactTree (nodes are created in pre-order)."""
+    text = clean_whitespace(strip_document_env(full_text))
+    tree = CompactTree()
+    stack = [0]
+    cursor = 0
+
+    for start, end, name, level, atomic, content in scan_tokens(text):
+        if start > cursor:
+            gap = text[cursor:start]
+            if not BEGIN_ENV_RE.search(gap):
+                _emit_sentences(tree, stack[-1], gap)
+        cursor = end
+
+        while len(stack) > 1 and TYPE_LEVELS[tree.types[stack[-1]]] >= level:
+            stack.pop()
+        node = tree.add(stack[-1], TYPE_CODES[name], content)
+        if not atomic:
+            stack.append(node)
+
+    tail = text[cursor:]
+    if tail.strip() and not BEGIN_ENV_RE.search(tail):
+        _emit_sentences(tree, stack[-1], tail)
+    return tree.finish()
+
+# ---------------------------
+# Cross-version deduplication
+# ---------------------------
+
+def collect_compact(trees: Dict[str, CompactTree], stats: Dict = None):
+    """
+    (elements, hierarchy) of collect_elements_and_hierarchy for {version_id: CompactTree}.
+    Each distinct subtree is walked once; repeats are replayed from the canonical IDs of their
+    first occurrence. stats (optional dict) receives node counts: fingerprinted vs replayed.
+    """
+    first_version = next(iter(trees))
+    paper_id = first_version.split('v')[0].replace('.', '-')
+
+    canonical_id_by_key = {}       # (type, raw content) -> canonical_id
+    fingerprints = set()
+    elements = {}
+    hierarchy = {}
+    first_seen = {}                # subtree hash -> (tree, node index, canonical IDs of that tree)
+    fingerprinted = replayed = 0
+
+    for version_id, tree in trees.items():
+        edges = hierarchy[version_id] = {}
+        digests = tree.subtree_hashes()
+        cids = [None] * len(tree)
+        parents, ends = tree.parents, tree.ends
+
+        i = 1                      # the document root is not an element
+        while i < len(tree):
+            parent = parents[i]
+            seen = first_seen.get(digests[i])
+            if seen is not None:
+                src_tree, j, src_cids = seen
+                offset = i - j
+                src_parents = src_tree.parents
+                cids[i] = src_cids[j]
+                if parent != 0:
+                    edges[cids[i]] = cids[parent]
+                for k in range(j + 1, src_tree.ends[j]):
+                    cid = src_cids[k]
+                    cids[k + offset] = cid
+                    edges[cid] = src_cids[src_parents[k]]
+                replayed += ends[i] - i
+                i = ends[i]
+                continue
+
+            key = (tree.types[i], tree.contents[i])
+            cid = canonical_id_by_key.get(key)
+            if cid is None:
+                fp = node_fingerprint({"type": NODE_TYPES[key[0]], "content": key[1]})
+                cid = canonical_id_by_key[key] = f"{paper_id}_{fp[:12]}"
+                if fp not in fingerprints:
+                    fingerprints.add(fp)
+                    elements[cid] = normalize_node_content(key[1])
+                fingerprinted += 1
+            cids[i] = cid
+            if parent != 0:
+                edges[cid] = cids[parent]
+            first_seen[digests[i]] = (tree, i, cids)
+            i += 1
+
+    if stats is not None:
+        stats.update(fingerprinted=fingerprinted, replayed=replayed)
+    return elements, hierarchy
+
+
+def finalize_compact(trees: Dict[str, CompactTree], stats: Dict = None) -> Dict:
+    """hierarchy.finalize_hierarchy_json for compact trees."""
+    elements, hierarchy = collect_compact(trees, stats)
+    return {"elements": elements, "hierarchy": hierarchy}
@@ -0,0 +1,288 @@
+"""
+Streaming reader over the hierarchy outputs (output/<paper_id>/).
+
+load_all_data parses every refs.bib and references.json of the corpus before anything runs.
+Here a paper is a PaperRecord whose fields are read from disk on first access, papers are
+yielded one at a time, and an optional background thread prefetches the next few into a
+bounded queue, so memory stays proportional to the prefetch depth instead of the corpus size.
+
+    for paper in iter_papers(output_dir, fields=("bibtex", "candidates"), prefetch=4):
+        predictions = generate_predictions_batched(paper.paper_id, paper, model)
+
+LazyCorpus is the same data behind the {paper_id: {'bibtex', 'candidates'}} mapping that the
+matching functions take, with at most `cache_size` papers held in memory.
+"""
+import json
+import queue
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from bibparse import parse_bibtex
+from matching import OUTPUT_DIR
+
+# field -> file of the paper folder
+FIELD_FILES = {
+    "bibtex": "refs.bib",
+    "candidates": "references.json",
+    "metadata": "metadata.json",
+    "hierarchy": "hierarchy.json",
+    "pred": "pred.json",
+}
+MATCHING_FIELDS = ("bibtex", "candidates")
+DEFAULT_PREFETCH = 4
+DEFAULT_CACHE_SIZE = 64
+
+
+def read_bibtex(path: Path) -> Dict[str, Dict]:
+    """{entry ID: entry} of a .bib file; {} if missing or unparsable (as load_paper_data)."""
+    if not path.exists():
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = parse_bibtex(f.read(), common_strings=True, interpolate_strings=True)
+        return {entry['ID']: entry for entry in entries}
+    except Exception:
+        return {}
+
+
+def read_json(path: Path) -> Dict:
+    """Parsed JSON file; {} if missing or unparsable."""
+    if not path.exists():
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+# ---------------------------
+# One paper
+# ---------------------------
+
+class PaperRecord(Mapping):
+    """
+    One output folder with lazily loaded fields: record.bibtex / record['bibtex'] parses refs.bib
+    on first access and keeps it until release(). Being a Mapping of its fields, a record can be
+    passed wherever the matching code expects all_data[paper_id].
+    """
+
+    def __init__(self, paper_dir: Path):
+        self.paper_dir = Path(paper_dir)
+        self.paper_id = self.paper_dir.name
+        self._fields = {}
+
+    def __getitem__(self, field):
+        if field not in FIELD_FILES:
+            raise KeyError(field)
+        if field not in self._fields:
+            path = self.paper_dir / FIELD_FILES[field]
+            self._fields[field] = read_bibtex(path) if field == "bibtex" else read_json(path)
+        return self._fields[field]
+
+    def __getattr__(self, field):
+        if field.startswith('_') or field not in FIELD_FILES:
+            raise AttributeError(field)
+        return self[field]
+
+    def __iter__(self):
+        return iter(FIELD_FILES)
+
+    def __len__(self):
+        return len(FIELD_FILES)
+
+    def has(self, field) -> bool:
+        """Whether the field's file exists and is not empty, without parsing it."""
+        path = self.paper_dir / FIELD_FILES[field]
+        return path.exists() and path.stat().st_size > 0
+
+    def load(self, fields: Iterable[str] = MATCHING_FIELDS) -> "PaperRecord":
+        """Read the given fields now (used by the prefetch thread); returns self."""
+        for field in fields:
+            self[field]
+        return self
+
+    def release(self, fields: Optional[Iterable[str]] = None):
+        """Drop loaded fields (all by default); they are re-read on next access."""
+        for field in list(fields or self._fields):
+            self._fields.pop(field, None)
+
+    def __repr__(self):
+        return f"PaperRecord({self.paper_id!r}, loaded={sorted(self._fields)})"
+
+# ---------------------------
+# Whole corpus
+# ---------------------------
+
+def list_paper_dirs(output_dir: Path = OUTPUT_DIR, require: Iterable[str] = MATCHING_FIELDS):
+    """Paper folders (sorted) whose required field files exist and are not empty."""
+    return [d for d in sorted(p for p in Path(output_dir).iterdir() if p.is_dir())
+            if all(PaperRecord(d).has(field) for field in require)]
+
+
+def _usable(record: PaperRecord, require) -> bool:
+    # Same rule as load_all_data: a required field that parses to nothing drops the paper
+    return all(record[field] for field in require)
+
+
+def iter_papers(output_dir: Path = OUTPUT_DIR, require: Iterable[str] = MATCHING_FIELDS,
+                fields: Iterable[str] = (), prefetch: int = 0,
+                paper_ids: Optional[Iterable[str]] = None) -> Iterator[PaperRecord]:
+    """
+    Yield one PaperRecord per usable paper, in folder order.
+
+    require:   fields that must be present and non-empty (papers lacking one are skipped)
+    fields:    fields to read eagerly before yielding; anything else stays lazy
+    prefetch:  > 0 reads up to that many papers ahead in a background thread
+    paper_ids: restrict to these papers (default: every folder of output_dir)
+    """
+    require, fields = tuple(require), tuple(dict.fromkeys((*require, *fields)))
+    if paper_ids is None:
+        paper_dirs = list_paper_dirs(output_dir, require)
+    else:
+        paper_dirs = [Path(output_dir) / p for p in paper_ids]
+
+    def records():
+        for paper_dir in paper_dirs:
+            record = PaperRecord(paper_dir)
+            if all(record.has(f) for f in require) and _usable(record.load(fields), require):
+                yield record
+
+    if prefetch <= 0:
+        yield from records()
+        return
+    yield from _prefetched(records(), prefetch)
+
+
+_DONE = object()
+
+def _prefetched(items: Iterator, depth: int) -> Iterator:
+    """Run `items` in a daemon thread, at most `depth` results ahead of the consumer."""
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        """Block until the consumer takes room for item; False once it has stopped."""
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:          # re-raised in the consumer
+            put(e)
+
+    thread = threading.Thread(target=produce, daemon=True, name="corpus-prefetch")
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()           # consumer stopped early: let the producer exit
+
+
+class LazyCorpus:
+    """
+    Read-only {paper_id: PaperRecord} over an output directory, with the keys of load_all_data
+    (papers with a non-empty refs.bib and references.json). At most cache_size records keep
+    their fields loaded; older ones are released (LRU).
+
+    Whether a paper's files parse to something is only known once it is read, so iteration
+    checks each paper as it is yielded, and each paper is parsed once. The number of papers is
+    therefore not known up front, and this is not a collections.abc.Mapping: it supports
+    lookup, `in`, iteration, keys(), values(), items() and get(), but not len(). Size lists with
+    len(list(corpus)), or use estimated_len().
+    """
+
+    def __init__(self, output_dir: Path = OUTPUT_DIR, require: Iterable[str] = MATCHING_FIELDS,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        self.output_dir = Path(output_dir)
+        self.require = tuple(require)
+        self.cache_size = cache_size
+        self._dirs = {d.name: d for d in list_paper_dirs(self.output_dir, self.require)}
+        self._cache = OrderedDict()
+        self._unusable = set()
+        self._usable = set()
+        self._scanned = False          # every paper checked once: len() is exact
+        self._lock = threading.Lock()
+
+    def __getitem__(self, paper_id) -> PaperRecord:
+        with self._lock:
+            if paper_id in self._cache:
+                self._cache.move_to_end(paper_id)
+                return self._cache[paper_id]
+        if paper_id not in self._dirs or paper_id in self._unusable:
+            raise KeyError(paper_id)
+        record = PaperRecord(self._dirs[paper_id]).load(self.require)
+        if not _usable(record, self.require):
+            self._unusable.add(paper_id)
+            raise KeyError(paper_id)
+        with self._lock:
+            self._usable.add(paper_id)
+            self._cache[paper_id] = record
+            while len(self._cache) > self.cache_size:
+                _, evicted = self._cache.popitem(last=False)
+                evicted.release()
+        return record
+
+    def __contains__(self, paper_id):
+        try:
+            self[paper_id]
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        # Files that exist but parse to nothing are only found (and skipped) when read; the
+        # record read for the check stays in the cache for the caller's own lookup
+        for paper_id in list(self._dirs):
+            if paper_id in self._usable or (paper_id not in self._unusable and paper_id in self):
+                yield paper_id
+        self._scanned = True
+
+    def estimated_len(self) -> int:
+        """
+        Number of papers without reading them: the papers whose files exist, minus those already
+        found unusable (an upper bound). Exact once a full iteration has run.
+        """
+        if self._scanned:
+            return len(self._usable)
+        return len(self._dirs) - len(self._unusable)
+
+    def get(self, paper_id, default=None):
+        try:
+            return self[paper_id]
+        except KeyError:
+            return default
+
+    def keys(self) -> Iterator[str]:
+        return iter(self)
+
+    def values(self) -> Iterator[PaperRecord]:
+        for paper_id in self:
+            yield self[paper_id]
+
+    def items(self) -> Iterator[Tuple[str, PaperRecord]]:
+        for paper_id in self:
+            yield paper_id, self[paper_id]
+
+    def items_streaming(self, prefetch: int = DEFAULT_PREFETCH) -> Iterator[Tuple[str, PaperRecord]]:
+        """(paper_id, record) pairs read ahead in a background thread, bypassing the LRU cache."""
+        for record in iter_papers(self.output_dir, self.require, prefetch=prefetch,
+                                  paper_ids=[p for p in self._dirs if p not in self._unusable]):
+            yield record.paper_id, record
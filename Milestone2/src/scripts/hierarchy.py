@@ -0,0 +1,670 @@
+"""
+LaTeX → hierarchy pipeline of Milestone 2.1, lifted from Milestone2_Hierarchy.ipynb so it can be
+imported by the parallel builder (build_hierarchy.py) and by other scripts.
+"""
+import re
+from pathlib import Path
+import hashlib
+import json
+
+import uuid
+from copy import deepcopy
+
+# Step 3 (shallow cleaning before parsing) and bibliography parsing live in their own modules
+from latex_preprocess import preprocess_latex
+from bibparse import iter_bibitems, parse_bibitem_body, parse_bibtex
+# Step 2 is done by the include-graph resolver; the notebook's version is kept below as reference
+from include_graph import expand_tex, find_main_tex
+
+import logging
+
+# Suppress bibtexparser logging messages (its warnings are silenced around the call, in bibparse)
+logging.getLogger('bibtexparser').setLevel(logging.ERROR)
+
+DATA_DIR = Path("23127130")
+OUTPUT_DIR = Path("output")
+
+
+def list_papers(data_dir: Path = DATA_DIR) -> list:
+    """All paper folders of the data directory, in a stable order."""
+    if not data_dir.exists():
+        print("Data directory does not exist.")
+        return []
+    return sorted(folder for folder in data_dir.iterdir() if folder.is_dir())
+
+# ---------------------------
+# Step 1: version discovery
+# ---------------------------
+
+# Function to get all papers version and their main .tex files
+def get_all_papers(arXiv_folder: Path) -> dict:
+    # Go the tex folder to get all the version folder
+    arXiv_folder = arXiv_folder / "tex"
+    
+    if arXiv_folder:
+        if arXiv_folder.is_dir():
+            papers = []
+            for paper_dir in arXiv_folder.iterdir():
+                if paper_dir.is_dir():
+                    papers.append(paper_dir)
+            # v1, v2, ..., v10 order (names only differ in the version suffix)
+            return sorted(papers, key=lambda p: (len(p.name), p.name))
+
+# ---------------------------
+# Step 2: main .tex and expansion
+# ---------------------------
+
+INPUT_RE = re.compile(r'\\(input|include)\{([^}]+)\}')
+
+def find_main_tex_legacy(tex_dir: Path) -> Path:
+    tex_files = sorted(
+        p for p in tex_dir.rglob("*")
+        if p.is_file() and p.suffix.lower() == ".tex"
+    )
+
+    if not tex_files:
+        return None
+
+    # Priority 1: \documentclass
+    for f in tex_files:
+        try:
+            if "\\documentclass" in f.read_text(encoding="utf-8", errors="ignore"):
+                return f
+        except Exception:
+            continue
+
+    # Priority 2: filename contains main
+    for f in tex_files:
+        if "main" in f.name.lower():
+            return f
+
+    return tex_files[0]
+
+def expand_tex_legacy(file: Path, visited=None) -> str:
+    """
+    Recursively inline all \\input / \\include
+    """
+    if visited is None:
+        visited = set()
+
+    if file in visited:
+        return ""
+
+    visited.add(file)
+
+    try:
+        text = file.read_text(encoding="utf-8", errors="ignore")
+    except Exception:
+        return ""
+
+    def replacer(match):
+        name = match.group(2).strip()
+        child = (file.parent / name).with_suffix(".tex")
+
+        if child.exists():
+            return expand_tex_legacy(child, visited)
+        else:
+            return ""  
+
+    while INPUT_RE.search(text):
+        text = INPUT_RE.sub(replacer, text)
+
+    return text
+
+# ---------------------------
+# Step 4: references
+# ---------------------------
+
+# regex patterns
+BIBITEM_BLOCK_RE = re.compile(
+    r'\\begin\{thebibliography\}.*?\\end\{thebibliography\}',
+    re.S
+)
+
+BIBITEM_RE = re.compile(
+    r'\\bibitem\{([^}]+)\}\s*(.*?)(?=\\bibitem|\\end\{thebibliography\})',
+    re.S
+)
+
+BIBLIOGRAPHY_RE = re.compile(
+    r'\\bibliography\{([^}]+)\}'
+)
+
+BIBSTYLE_RE = re.compile(
+    r'\\bibliographystyle\{[^}]+\}'
+)
+
+# Normalization & Fingerprint
+def normalize_text(s):
+    if not s:
+        return ""
+    s = s.lower()
+    s = re.sub(r'\{|\}', '', s)
+    s = re.sub(r'\s+', ' ', s)
+    s = re.sub(r'[^\w\s]', '', s)
+    return s.strip()
+
+
+def reference_fingerprint(ref):
+    title = normalize_text(ref.get("title", ""))
+    year = normalize_text(ref.get("year", ""))
+    authors = normalize_text(" ".join(ref.get("authors", [])))
+    raw = f"{title}|{authors}|{year}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+# Parse the bibitem
+def parse_bibitem_block(tex, version_id):
+    refs = []
+
+    for key, body in iter_bibitems(tex):
+        fields = parse_bibitem_body(body)
+        refs.append({
+            "type": "misc",
+            "title": fields["title"],
+            "authors": fields["authors"],
+            "year": fields["year"],
+            "journal": fields["journal"],
+            "doi": fields["doi"],
+            "source_keys": [key.strip()],
+            "sources": ["bibitem"],
+            "versions": [version_id]
+        })
+
+    return refs
+# Parse the .bib file
+
+def safe_str(val):
+    if val is None:
+        return ""
+    if isinstance(val, str):
+        return val
+    # BibDataStringExpression or others
+    return str(val)
+
+MONTH_MAP = {
+    "jan": "January", "january": "January",
+    "feb": "February", "february": "February",
+    "mar": "March", "march": "March",
+    "apr": "April", "april": "April",
+    "may": "May",
+    "jun": "June", "june": "June",
+    "jul": "July", "july": "July",
+    "aug": "August", "august": "August",
+    "sep": "September", "september": "September",
+    "oct": "October", "october": "October",
+    "nov": "November", "november": "November",
+    "dec": "December", "december": "December",
+}
+
+def parse_bib_file(bib_path, version_id):
+    if not bib_path.exists():
+        return []
+
+    text = bib_path.read_text(encoding="utf-8", errors="ignore")
+    return bib_entries_to_refs(parse_bibtex(text), version_id)
+
+
+def bib_entries_to_refs(entries, version_id):
+    refs = []
+    for entry in entries:
+        month_raw = safe_str(entry.get("month")).strip().lower()
+        month = MONTH_MAP.get(month_raw, month_raw)
+
+        refs.append({
+            "type": safe_str(entry.get("ENTRYTYPE", "misc")),
+            "title": safe_str(entry.get("title")),
+            "authors": safe_str(entry.get("author"))
+                        .replace("\n", " ")
+                        .split(" and ")
+                        if entry.get("author") else [],
+            "year": safe_str(entry.get("year")),
+            "journal": safe_str(entry.get("journal") or entry.get("booktitle")),
+            "month": month,
+            "doi": safe_str(entry.get("doi")),
+            "source_keys": [safe_str(entry.get("ID"))],
+            "sources": ["bib"],
+            "versions": [version_id]
+        })
+
+    return refs
+
+
+
+# Deduplicate references (global)
+def deduplicate_references(refs):
+    merged = {}
+
+    for ref in refs:
+        fp = reference_fingerprint(ref)
+
+        if fp not in merged:
+            ref["id"] = f"ref_{fp[:10]}"
+            merged[fp] = ref
+        else:
+            base = merged[fp]
+
+            for field in ["title", "year", "journal", "doi"]:
+                if not base.get(field) and ref.get(field):
+                    base[field] = ref[field]
+
+            base["authors"] = sorted(set(base["authors"]) | set(ref["authors"]))
+            base["source_keys"] = sorted(set(base["source_keys"]) | set(ref["source_keys"]))
+            base["sources"] = sorted(set(base["sources"]) | set(ref["sources"]))
+            base["versions"] = sorted(set(base["versions"]) | set(ref["versions"]))
+
+    return list(merged.values())
+
+# Remove references from LaTeX
+def remove_references_from_tex(tex):
+    tex = BIBITEM_BLOCK_RE.sub("", tex)
+    tex = BIBLIOGRAPHY_RE.sub("", tex)
+    tex = BIBSTYLE_RE.sub("", tex)
+
+    tex = re.sub(r'[ \t]+$', '', tex, flags=re.M)
+    tex = re.sub(r'\n\s*\n+', '\n\n', tex)
+    return tex.strip()
+
+# Process one LaTeX version
+def process_references(tex, tex_dir, version_id):
+    refs = []
+
+    refs.extend(parse_bibitem_block(tex, version_id))
+
+    for bibname in BIBLIOGRAPHY_RE.findall(tex):
+        bib_path = (tex_dir / bibname).with_suffix(".bib")
+        refs.extend(parse_bib_file(bib_path, version_id))
+
+    cleaned_tex = remove_references_from_tex(tex)
+    return cleaned_tex, refs
+
+# Convert references → BIBTEX
+def refs_to_bibtex(refs):
+    entries = []
+
+    for ref in refs:
+        key = ref["id"]
+        entry_type = ref.get("type", "misc")
+
+        fields = []
+        if ref.get("title"):
+            fields.append(f"  title = {{{ref['title']}}}")
+        if ref.get("authors"):
+            fields.append(f"  author = {{{' and '.join(ref['authors'])}}}")
+        if ref.get("year"):
+            fields.append(f"  year = {{{ref['year']}}}")
+        if ref.get("journal"):
+            fields.append(f"  journal = {{{ref['journal']}}}")
+        if ref.get("doi"):
+            fields.append(f"  doi = {{{ref['doi']}}}")
+
+        entry = f"@{entry_type}{{{key},\n" + ",\n".join(fields) + "\n}"
+        entries.append(entry)
+
+    return "\n\n".join(entries)
+
+
+
+# Main pipeline: multi-version processing
+def process_latex(versions: dict, out_dir: Path):
+    """
+    versions: {paper_folder: latex_text}
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    all_refs = []
+    cleaned_tex_map = {}
+
+    # ---- extract per version ----
+    for paper_folder, tex in versions.items():
+        cleaned_tex, refs = process_references(tex, Path(paper_folder), paper_folder.name)
+        cleaned_tex_map[paper_folder] = cleaned_tex
+        all_refs.extend(refs)
+
+    canonical_refs = deduplicate_references(all_refs)
+
+    # --- output ---
+    # Save references to refs.bib
+    with open(out_dir / "refs.bib", "w", encoding="utf-8") as f:
+        f.write(refs_to_bibtex(canonical_refs))
+    return cleaned_tex_map
+
+# ---------------------------
+# Step 5: hierarchy construction
+# ---------------------------
+
+HIERARCHY_LEVELS = {
+    "document": {"level": 0, "atomic": False, "include": True, "signals": [], "unwrap": False},
+
+    "section": {
+        "level": 1, "atomic": False, "include": True,
+        "signals": [r"\\section\*?\{[^}]*\}"],
+        "unwrap": False  # Keep full \section{...}
+    },
+    "subsection": {
+        "level": 2, "atomic": False, "include": True,
+        "signals": [r"\\subsection\*?\{[^}]*\}"],
+        "unwrap": False  # Keep full \subsection{...}
+    },
+    "subsubsection": {
+        "level": 3, "atomic": False, "include": True,
+        "signals": [r"\\subsubsection\*?\{[^}]*\}"],
+        "unwrap": False  # Keep full \subsubsection{...}
+    },
+    "paragraph_explicit": {
+        "level": 4, "atomic": False, "include": True,
+        "signals": [r"\\paragraph\*?\{[^}]*\}"],
+        "unwrap": False  # Keep full \paragraph{...}
+    },
+
+    "figure": {
+        "level": 5, "atomic": True, "include": True,
+        "signals": [r"\\begin\{figure\*?\}(.*?)\\end\{figure\*?\}"],
+        "unwrap": True  # Extract content inside figure
+    },
+    "block_formula": {
+        "level": 5, "atomic": True, "include": True,
+        "signals": [
+            r"\\begin\{equation\}(.*?)\\end\{equation\}",
+            r"\\begin\{align\*?\}(.*?)\\end\{align\*?\}",
+            r"\\begin\{dcases\}(.*?)\\end\{dcases\}",
+            r"\$\$(.*?)\$\$",
+            r"\\\[(.*?)\\\]"
+        ],
+        "unwrap": True  # Extract content inside math
+    },
+
+    "sentence": {
+        "level": 6,
+        "atomic": True,
+        "include": True,
+        "signals": [r"[^.!?]+(?:[.!?]|$)"],
+        "unwrap": False
+    }
+}
+
+
+def uid():
+    return str(uuid.uuid4())
+
+def clean_whitespace(text):
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    return text.strip()
+
+def strip_document_env(text):
+    return re.sub(r"\\begin\{document\}|\\end\{document\}", "", text)
+
+
+def scan_tokens(text):
+    """
+    Structural tokens of the text as (start, end, type, level, atomic, content) tuples sorted
+    by position; higher levels claim their spans first and overlapping matches are dropped.
+    """
+    tokens = []
+    occupied = bytearray(len(text))
+
+    levels = sorted(
+        HIERARCHY_LEVELS.items(),
+        key=lambda x: x[1]["level"]
+    )
+
+    for name, cfg in levels:
+        if not cfg["signals"]:
+            continue
+
+        for sig in cfg["signals"]:
+            for m in re.finditer(sig, text, re.S):
+                start, end = m.start(), m.end()
+                if occupied.find(1, start, end) != -1:
+                    continue
+                occupied[start:end] = b"\x01" * (end - start)
+
+                # Decide whether to unwrap based on configuration
+                if cfg.get("unwrap", False) and m.lastindex:
+                    # Extract content from capture group
+                    content = m.group(1)
+                else:
+                    # Keep full match
+                    content = m.group(0)
+
+                tokens.append((start, end, name, cfg["level"], cfg["atomic"], clean_whitespace(content)))
+
+    tokens.sort(key=lambda x: x[0])
+    return tokens
+
+def extract_tokens(text):
+    return [
+        {"id": uid(), "type": name, "level": level, "atomic": atomic, "start": start, "end": end,
+         "content": content}
+        for start, end, name, level, atomic, content in scan_tokens(text)
+    ]
+
+def emit_sentences(parent, text):
+    # Extracts sentence nodes from plain text.
+    for s in re.finditer(HIERARCHY_LEVELS["sentence"]["signals"][0], text):
+        parent["children"].append({
+            "id": uid(),
+            "type": "sentence",
+            "content": clean_whitespace(s.group(0)),
+            "children": []
+        })
+
+def build_tree(full_text):
+    text = clean_whitespace(strip_document_env(full_text))
+
+    root = {
+        "id": uid(),
+        "type": "document",
+        "content": "",
+        "children": []
+    }
+
+    stack = [root]
+    tokens = extract_tokens(text)
+    cursor = 0
+
+    for tok in tokens:
+        if tok["start"] > cursor:
+            gap = text[cursor:tok["start"]]
+            if not re.search(r"\\begin\{", gap):
+                emit_sentences(stack[-1], gap)
+
+        cursor = tok["end"]
+
+        node = {
+            "id": tok["id"],
+            "type": tok["type"],
+            "content": tok["content"],
+            "children": []
+        }
+
+        while (
+            len(stack) > 1 and
+            HIERARCHY_LEVELS[stack[-1]["type"]]["level"] >= tok["level"]
+        ):
+            stack.pop()
+
+        stack[-1]["children"].append(node)
+
+        if not tok["atomic"]:
+            stack.append(node)
+
+    tail = text[cursor:]
+    if tail.strip() and not re.search(r"\\begin\{", tail):
+        emit_sentences(stack[-1], tail)
+
+    return root
+
+def build_hierarchy(paper_dict: dict):
+    hierarchies = {}
+    for paper_folder, text in paper_dict.items():
+        hierarchies[paper_folder.name] = build_tree(text)
+    return hierarchies
+
+# ---------------------------
+# Step 6: normalization and deduplication
+# ---------------------------
+
+def normalize_node_content(text: str) -> str:
+# Standardizes text content for comparison.
+    text = text.lower()
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    return text.strip()
+
+def traverse_tree(node, fn):
+# Runs a function on every node while traversing the tree (pre-order, explicit stack).
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        fn(node)
+        stack.extend(reversed(node.get("children", [])))
+
+def node_fingerprint(node):
+# Creates a unique ID for a node using its type and content.
+    key = f"{node['type']}|{normalize_node_content(node.get('content', ''))}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def collect_elements_and_hierarchy(hierarchies: dict):
+# Extracts unique elements and parent-child links for each version.
+
+    # Get paper ID from first version
+    first_version = list(hierarchies.keys())[0]
+    paper_id = first_version.split('v')[0].replace('.', '-')
+    
+    # Maps for deduplication
+    canonical_id_by_fp = {}  # fingerprint -> canonical_id
+    elements = {}  # canonical_id -> content
+    hierarchy = {}  # version_id -> {child_id: parent_id}
+    
+    for version_id, tree in hierarchies.items():
+        # Initialize hierarchy for this version
+        hierarchy[version_id] = {}
+        
+        def collect(node, parent_id=None, is_root=False):
+            # Skip adding root document node to elements
+            if is_root and node.get('type') == 'document':
+                # Process children of root without adding root itself
+                for child in node.get("children", []):
+                    collect(child, parent_id=None, is_root=False)
+                return
+            
+            # Generate fingerprint and canonical ID
+            fp = node_fingerprint(node)
+            
+            if fp not in canonical_id_by_fp:
+                # First time seeing this content
+                canonical_id = f"{paper_id}_{fp[:12]}"
+                canonical_id_by_fp[fp] = canonical_id
+                elements[canonical_id] = normalize_node_content(node.get('content', ''))
+            else:
+                canonical_id = canonical_id_by_fp[fp]
+            
+            # Record parent-child relationship for this version
+            if parent_id is not None:
+                hierarchy[version_id][canonical_id] = parent_id
+            
+            # Process children
+            for child in node.get("children", []):
+                collect(child, canonical_id, is_root=False)
+        
+        collect(tree, is_root=True)
+    
+    return elements, hierarchy
+
+def finalize_hierarchy_json(hierarchies: dict):
+   # Formats hierarchy trees into a final elements and relationships JSON.
+
+    hierarchies = deepcopy(hierarchies)
+    
+    elements, hierarchy = collect_elements_and_hierarchy(hierarchies)
+    
+    return {
+        "elements": elements,
+        "hierarchy": hierarchy
+    }
+
+def save_hierarchy_json(final_structure: dict, path: Path, paper_id: str):
+# Saves the hierarchy structure to a JSON file.
+
+    # Ensure the output directory exists
+    path.mkdir(parents=True, exist_ok=True)
+    
+    # Save the hierarchy to hierarchy.json
+    output_file = path / f"hierarchy.json"
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(final_structure, f, indent=2, ensure_ascii=False)
+
+# ---------------------------
+# Step 7: single paper pipeline
+# ---------------------------
+
+def process_paper(target_paper: Path, output_dir: Path = OUTPUT_DIR, verbose=True):
+    """
+    Run the whole pipeline for one paper folder and write output_dir/<paper_id>/.
+    Returns:
+        str: "ok", "no_versions" or "no_latex"
+    """
+    paper_id = target_paper.name
+
+    if verbose:
+        print(f"Processing paper: {paper_id}...")
+    all_papers = get_all_papers(target_paper)
+    # Ensure paper output directory exists
+    paper_out_dir = output_dir / paper_id
+    paper_out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Copy metadata.json
+    meta_path = target_paper / "metadata.json"
+    if meta_path.exists():
+        metadata = json.loads(meta_path.read_text(encoding="utf-8", errors="ignore"))
+        output_meta_path = paper_out_dir / "metadata.json"
+        with open(output_meta_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+    # Copy references.json
+    ref_path = target_paper / "references.json"
+    if ref_path.exists():
+        ref = json.loads(ref_path.read_text(encoding="utf-8", errors="ignore"))
+        output_ref_path = paper_out_dir / "references.json"
+        with open(output_ref_path, "w", encoding="utf-8") as f:
+            json.dump(ref, f, indent=2, ensure_ascii=False)
+
+    if not all_papers:
+        if verbose:
+            print(f"No versions found for paper {paper_id}")
+        return "no_versions"
+
+    paper_dict = {}
+    for paper_folder in all_papers:
+        main_tex = find_main_tex(paper_folder)
+        if main_tex is None:
+            continue
+
+        full_text = expand_tex(main_tex)
+        if full_text:
+            paper_dict[paper_folder] = full_text
+
+    if not paper_dict:
+        if verbose:
+            print(f"No valid LaTeX found for paper {paper_id}")
+        return "no_latex"
+
+    # Preprocess LaTeX
+    for paper_folder, text in paper_dict.items():
+        paper_dict[paper_folder] = preprocess_latex(text)
+
+    # Process references and clean LaTeX
+    paper_dict = process_latex(paper_dict, paper_out_dir)
+
+    # Build hierarchies
+    hierarchies = build_hierarchy(paper_dict)
+
+    # Create final merged JSON structure and save
+    final_structure = finalize_hierarchy_json(hierarchies)
+    save_hierarchy_json(final_structure, paper_out_dir, paper_id)
+
+    if verbose:
+        print(f"Paper {paper_id} processed successfully")
+    return "ok"
@@ -0,0 +1,252 @@
+"""
+Include-graph resolution of a version's LaTeX sources (Step 2 of the hierarchy pipeline).
+
+find_main_tex_legacy reads every .tex file of a version looking for \\documentclass, then
+expand_tex_legacy reads the included files again and re-runs INPUT_RE.sub over the whole growing
+document until no \\input is left. Here every file is read once: its text and the positions of
+its include directives go into a SourceCache keyed by (path, mtime, size), shared by main-file
+detection, expansion and the re-expansion of a version on a cache miss. A version's files form
+an IncludeGraph, and a document is expanded in one pass by copying the text between directives
+and recursing into the resolved children.
+
+Compared with the legacy expansion:
+    - \\subfile{f} (the body of f's document environment), \\import{dir}{f} / \\subimport{dir}{f}
+      (and the *from variants of the import package) and "\\input f" without braces are inlined;
+    - "sec.1" resolves to sec.1.tex before sec.tex, and a path not found next to the including
+      file is looked up from the main file's folder, where LaTeX resolves it;
+    - a subfiles/standalone document included by another file is not picked as the main file
+      when another \\documentclass file exists.
+A cycle or a repeated file expands to "" as before, and paths are normalized so that "a/../b.tex"
+and "b.tex" are one file.
+"""
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+TEX_SUFFIX = ".tex"
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+INCLUDE_RE = re.compile(
+    r'\\(?P<cmd>input|include|subfile)\s*\{(?P<name>[^}]+)\}'
+    r'|\\(?P<icmd>(?:sub)?(?:import|inputfrom|includefrom))\*?\s*\{(?P<dir>[^}]*)\}\s*\{(?P<iname>[^}]+)\}'
+    r'|\\input[ \t]+(?P<bare>[^\s{}\\%]+)'
+)
+SUBFILE_CLASS_RE = re.compile(r'\\documentclass\s*(?:\[[^\]]*\])?\s*\{(?:subfiles|standalone)\}')
+DOCUMENT_BODY_RE = re.compile(r'\\begin\{document\}(.*?)(?:\\end\{document\}|\Z)', re.S)
+
+# ---------------------------
+# File cache
+# ---------------------------
+
+class SourceFile:
+    """One .tex file: its text and its include directives as (start, end, kind, dir, name)."""
+
+    __slots__ = ("path", "text", "includes")
+
+    def __init__(self, path: str, text: str):
+        self.path = path
+        self.text = text
+        self.includes = []
+        for m in INCLUDE_RE.finditer(text):
+            if m.group("cmd"):
+                kind, directory, name = m.group("cmd"), None, m.group("name")
+            elif m.group("icmd"):
+                kind, directory, name = m.group("icmd"), m.group("dir"), m.group("iname")
+            else:
+                kind, directory, name = "input", None, m.group("bare")
+            self.includes.append((m.start(), m.end(), kind, directory, name.strip()))
+
+
+class SourceCache:
+    """SourceFiles keyed by absolute path, valid while (mtime, size) match; LRU over max_bytes."""
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = self.misses = 0
+        self._files = OrderedDict()     # path -> ((mtime_ns, size), SourceFile)
+
+    def get(self, path: str) -> Optional[SourceFile]:
+        """The SourceFile of an absolute, normalized path, or None if it cannot be read."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = path
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry = self._files.get(key)
+        if entry is not None and entry[0] == stamp:
+            self._files.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        try:
+            source = SourceFile(path, Path(path).read_text(encoding="utf-8", errors="ignore"))
+        except Exception:
+            return None
+        if entry is not None:
+            self.size -= len(entry[1].text)
+        self._files[key] = (stamp, source)
+        self.size += len(source.text)
+        while self.size > self.max_bytes and len(self._files) > 1:
+            _, (_, evicted) = self._files.popitem(last=False)
+            self.size -= len(evicted.text)
+        return source
+
+    def clear(self):
+        self._files.clear()
+        self.size = 0
+
+
+SOURCE_CACHE = SourceCache()
+
+# ---------------------------
+# Include graph
+# ---------------------------
+
+def _candidates(base: str, name: str) -> List[str]:
+    path = os.path.normpath(os.path.join(base, name))
+    stem, suffix = os.path.splitext(path)
+    if suffix.lower() == TEX_SUFFIX:
+        return [path, stem + TEX_SUFFIX]
+    return [path + TEX_SUFFIX, stem + TEX_SUFFIX]     # the legacy rule: "sec.1" -> sec.tex
+
+
+class IncludeGraph:
+    """
+    The .tex files of one version folder and the include edges between them. Files are keyed by
+    absolute, normalized path; edges come from the cached directives, so each file is read once,
+    and existence checks inside the folder use its listing instead of a stat per candidate.
+    """
+
+    def __init__(self, tex_dir: Path, cache: SourceCache = None):
+        self.tex_dir = Path(tex_dir)
+        self.cache = cache or SOURCE_CACHE
+        self._files = None
+        self._listed = None
+        self._prefix = os.path.join(os.path.abspath(tex_dir), "")
+
+    def tex_files(self) -> List[str]:
+        """Absolute paths of every .tex file under the folder, in find_main_tex_legacy's order."""
+        if self._files is None:
+            found = []
+            for dirpath, _, filenames in os.walk(self._prefix):
+                found.extend(os.path.join(dirpath, name) for name in filenames
+                             if os.path.splitext(name)[1].lower() == TEX_SUFFIX)
+            # sorted like Path objects (component by component), not like strings
+            self._files = sorted((f for f in found if os.path.isfile(f)), key=lambda f: f.split(os.sep))
+            self._listed = set(self._files)
+        return self._files
+
+    def _is_file(self, path: str) -> bool:
+        if self._listed is not None and path.startswith(self._prefix) and path.endswith(TEX_SUFFIX):
+            return path in self._listed
+        return os.path.isfile(path)
+
+    def resolve(self, including: str, kind: str, directory: Optional[str], name: str,
+                root: str) -> Optional[str]:
+        """File a directive of `including` points to (None if missing); root is the main file's folder."""
+        here = os.path.dirname(including)
+        if directory is None:
+            bases = (here, root) if here != root else (here,)
+        elif kind.startswith("sub"):
+            bases = (os.path.join(here, directory),)
+        else:
+            bases = (os.path.join(root, directory),)
+        for base in bases:
+            for path in _candidates(base, name):
+                if self._is_file(path):
+                    return path
+        return None
+
+    def children(self, path: str, root: str = None) -> List[str]:
+        """Files included by `path`, in directive order."""
+        source = self.cache.get(path)
+        if source is None:
+            return []
+        root = root or os.path.abspath(self.tex_dir)
+        resolved = (self.resolve(path, kind, d, name, root) for _, _, kind, d, name in source.includes)
+        return [child for child in resolved if child is not None]
+
+    def edges(self, root: str = None) -> Dict[str, List[str]]:
+        """{file: included files} over every .tex file of the folder."""
+        return {path: self.children(path, root) for path in self.tex_files()}
+
+    def main_file(self) -> Optional[Path]:
+        """
+        find_main_tex_legacy's choice (first file with \\documentclass, else a "main" file, else
+        the first file). Files are read in order until the first \\documentclass, unless it is
+        a subfiles/standalone document: then the first candidate no other file includes wins.
+        """
+        files = self.tex_files()
+        if not files:
+            return None
+        candidates = []
+        for f in files:
+            source = self.cache.get(f)
+            if source is None or "\\documentclass" not in source.text:
+                continue
+            if not candidates and not SUBFILE_CLASS_RE.search(source.text):
+                return self._as_given(f)
+            candidates.append(f)
+        if len(candidates) > 1:
+            included = {child for children in self.edges().values() for child in children}
+            roots = [f for f in candidates if f not in included]
+            return self._as_given((roots or candidates)[0])
+        if candidates:
+            return self._as_given(candidates[0])
+        for f in files:
+            if "main" in os.path.basename(f).lower():
+                return self._as_given(f)
+        return self._as_given(files[0])
+
+    def _as_given(self, path: str) -> Path:
+        """A listed file as a Path under tex_dir as it was given (what rglob would return)."""
+        return self.tex_dir / path[len(self._prefix):]
+
+    def expand(self, main: Path) -> str:
+        """The main file with every include inlined, in one pass over each file's text."""
+        main = os.path.abspath(main)
+        out = []
+        self._expand(main, os.path.dirname(main), out, set(), 0, None)
+        return "".join(out)
+
+    def _expand(self, path: str, root: str, out: list, visited: set, lo: int, hi: Optional[int]):
+        visited.add(path)
+        source = self.cache.get(path)
+        if source is None:
+            return
+        text = source.text
+        hi = len(text) if hi is None else hi
+        cursor = lo
+        for start, end, kind, directory, name in source.includes:
+            if start < lo or end > hi:
+                continue
+            out.append(text[cursor:start])
+            cursor = end
+            child = self.resolve(path, kind, directory, name, root)
+            if child is None or child in visited:
+                continue
+            if kind == "subfile":
+                child_source = self.cache.get(child)
+                body = DOCUMENT_BODY_RE.search(child_source.text) if child_source else None
+                if body:
+                    self._expand(child, root, out, visited, body.start(1), body.end(1))
+                    continue
+            self._expand(child, root, out, visited, 0, None)
+        out.append(text[cursor:hi])
+
+# ---------------------------
+# Pipeline entry points
+# ---------------------------
+
+def find_main_tex(tex_dir: Path, cache: SourceCache = None) -> Optional[Path]:
+    return IncludeGraph(tex_dir, cache).main_file()
+
+
+def expand_tex(file: Path, cache: SourceCache = None) -> str:
+    """Recursively inline all \\input / \\include / \\subfile / \\import of a main file."""
+    return IncludeGraph(Path(file).parent, cache).expand(file)
@@ -0,0 +1,241 @@
+"""
+Incremental build of one paper's hierarchy outputs.
+
+Each output folder keeps a manifest.json with the hash of every version's expanded TeX (plus
+the .bib files it cites), the hashes of the copied metadata/references files and the code
+version of the pipeline. A version downloaded through the blob store also carries the sha256 of
+each of its files (.sources.json): when they are unchanged, its hash is reused without
+expanding the TeX. A paper whose manifest still matches is skipped entirely; otherwise only
+versions missing from the per-version cache (.cache/) are parsed again, and the
+paper-level merge (reference dedup, refs.bib, hierarchy.json) is redone from cached parts.
+"""
+import hashlib
+import json
+import os
+from copy import deepcopy
+from pathlib import Path
+
+import bibparse
+import compact_tree
+import hierarchy
+import include_graph
+from compact_tree import CompactTree, build_compact_tree, finalize_compact
+from hierarchy import (BIBLIOGRAPHY_RE, OUTPUT_DIR, deduplicate_references, expand_tex, find_main_tex,
+                       get_all_papers, process_references, refs_to_bibtex, save_hierarchy_json)
+import latex_preprocess
+from latex_preprocess import preprocess_latex
+
+MANIFEST_NAME = "manifest.json"
+SOURCES_MANIFEST = ".sources.json"   # {path: sha256} of a version folder, written by the Milestone 1 downloader
+CACHE_DIRNAME = ".cache"
+COPIED_FILES = ("metadata.json", "references.json")
+OUTPUT_FILES = ("hierarchy.json", "refs.bib")
+
+
+def _sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _code_version():
+    """Hash of the parser sources: any change to them invalidates manifests and caches."""
+    h = hashlib.sha1()
+    for module in (hierarchy, latex_preprocess, bibparse, compact_tree, include_graph):
+        h.update(Path(module.__file__).read_bytes())
+    h.update(Path(__file__).read_bytes())
+    return h.hexdigest()
+
+
+CODE_VERSION = _code_version()
+
+# ---------------------------
+# Hashing inputs
+# ---------------------------
+
+def version_hash(version_dir: Path, full_text: str) -> str:
+    """Hash of a version's expanded TeX and of every .bib file it cites."""
+    h = hashlib.sha1(full_text.encode("utf-8", errors="ignore"))
+    for bibname in sorted(set(BIBLIOGRAPHY_RE.findall(full_text))):
+        bib_path = (version_dir / bibname).with_suffix(".bib")
+        if bib_path.exists():
+            h.update(bibname.encode("utf-8"))
+            h.update(bib_path.read_bytes())
+    return h.hexdigest()
+
+
+def sources_hash(version_dir: Path):
+    """
+    Hash of the .tex/.bib file hashes the downloader recorded for a version (no file is read);
+    None when the folder has no such manifest.
+    """
+    try:
+        files = json.loads((version_dir / SOURCES_MANIFEST).read_text(encoding="utf-8"))["files"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return _sha1(json.dumps(files, sort_keys=True).encode("utf-8"))
+
+
+def load_manifest(paper_out_dir: Path):
+    try:
+        return json.loads((paper_out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: Path, obj, indent=None):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# ---------------------------
+# Per-version cache
+# ---------------------------
+
+def _cache_path(paper_out_dir: Path, version_name: str, tex_hash: str) -> Path:
+    key = _sha1(f"{CODE_VERSION}|{version_name}|{tex_hash}".encode("utf-8"))
+    return paper_out_dir / CACHE_DIRNAME / f"{version_name}-{key[:16]}.json"
+
+
+def expand_version(version_dir: Path):
+    """Expanded main .tex of a version folder, or None when it has no usable LaTeX."""
+    main_tex = find_main_tex(version_dir)
+    if main_tex is None:
+        return None
+    return expand_tex(main_tex) or None
+
+
+def parse_version(version_dir: Path, full_text: str):
+    """Per-version work of the pipeline: preprocessing, reference extraction, tree building."""
+    tex = preprocess_latex(full_text)
+    cleaned_tex, refs = process_references(tex, version_dir, version_dir.name)
+    return refs, build_compact_tree(cleaned_tex)
+
+
+def cached_parse_version(paper_out_dir: Path, version_dir: Path, tex_hash: str, use_cache=True,
+                         full_text=None):
+    """
+    parse_version, memoized on disk by (code version, version name, tex hash).
+    The TeX is only expanded (again) on a cache miss when full_text is not given.
+    """
+    path = _cache_path(paper_out_dir, version_dir.name, tex_hash)
+    if use_cache:
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            return entry["refs"], CompactTree.from_json(entry["tree"]), True
+        except (OSError, ValueError, KeyError):
+            pass
+    refs, tree = parse_version(version_dir, full_text if full_text is not None else expand_version(version_dir))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write_json(path, {"refs": refs, "tree": tree.to_json()})
+    return refs, tree, False
+
+
+def _prune_cache(paper_out_dir: Path, keep):
+    cache_dir = paper_out_dir / CACHE_DIRNAME
+    if not cache_dir.is_dir():
+        return
+    for entry in cache_dir.iterdir():
+        if entry not in keep:
+            entry.unlink()
+
+# ---------------------------
+# Paper build
+# ---------------------------
+
+def _copy_if_changed(src: Path, dst: Path, old_hash):
+    """Copy metadata.json/references.json (re-indented as before) only if its bytes changed."""
+    if not src.exists():
+        return None
+    raw = src.read_bytes()
+    digest = _sha1(raw)
+    if digest != old_hash or not dst.exists():
+        data = json.loads(raw.decode("utf-8", errors="ignore"))
+        with open(dst, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+    return digest
+
+
+def build_paper(target_paper: Path, output_dir: Path = OUTPUT_DIR, verbose=True, force=False):
+    """
+    Incremental counterpart of hierarchy.process_paper (same output files).
+    force=True ignores the manifest and the per-version cache and rebuilds everything.
+    Returns:
+        str: "unchanged", "ok", "no_versions" or "no_latex"
+    """
+    paper_id = target_paper.name
+    paper_out_dir = output_dir / paper_id
+    paper_out_dir.mkdir(parents=True, exist_ok=True)
+    old = (load_manifest(paper_out_dir) or {}) if not force else {}
+
+    inputs = {name: _copy_if_changed(target_paper / name, paper_out_dir / name,
+                                     old.get("inputs", {}).get(name))
+              for name in COPIED_FILES}
+
+    version_dirs = get_all_papers(target_paper) or []
+    if not version_dirs:
+        if verbose:
+            print(f"No versions found for paper {paper_id}")
+        return "no_versions"
+
+    # One version's TeX in memory at a time: hash now, re-expand later only on a cache miss.
+    # A version whose downloaded files are those of an already hashed version (the last build,
+    # or an identical earlier revision) takes its hash without being expanded.
+    known = {}
+    if old.get("code_version") == CODE_VERSION:
+        known = {source: old["versions"][name] for name, source in old.get("sources", {}).items()
+                 if name in old.get("versions", {})}
+    versions = {}
+    sources = {}
+    for version_dir in version_dirs:
+        source = sources_hash(version_dir)
+        if source is not None:
+            sources[version_dir.name] = source
+        if source in known:
+            versions[version_dir] = known[source]
+            continue
+        full_text = expand_version(version_dir)
+        if full_text:
+            versions[version_dir] = version_hash(version_dir, full_text)
+            if source is not None:
+                known[source] = versions[version_dir]
+
+    if not versions:
+        if verbose:
+            print(f"No valid LaTeX found for paper {paper_id}")
+        return "no_latex"
+
+    version_hashes = {v.name: h for v, h in versions.items()}
+    if (old.get("code_version") == CODE_VERSION
+            and old.get("versions") == version_hashes
+            and all((paper_out_dir / name).exists() for name in OUTPUT_FILES)):
+        if verbose:
+            print(f"Paper {paper_id} unchanged")
+        _write_json(paper_out_dir / MANIFEST_NAME, {**old, "inputs": inputs, "sources": sources}, indent=2)
+        return "unchanged"
+
+    all_refs = []
+    hierarchies = {}
+    kept_cache = set()
+    reused = 0
+    for version_dir, tex_hash in versions.items():
+        refs, tree, hit = cached_parse_version(paper_out_dir, version_dir, tex_hash, use_cache=not force)
+        kept_cache.add(_cache_path(paper_out_dir, version_dir.name, tex_hash))
+        reused += hit
+        all_refs.extend(refs)
+        hierarchies[version_dir.name] = tree
+
+    with open(paper_out_dir / "refs.bib", "w", encoding="utf-8") as f:
+        f.write(refs_to_bibtex(deduplicate_references(deepcopy(all_refs))))
+    save_hierarchy_json(finalize_compact(hierarchies), paper_out_dir, paper_id)
+
+    _prune_cache(paper_out_dir, kept_cache)
+    _write_json(paper_out_dir / MANIFEST_NAME, {
+        "code_version": CODE_VERSION,
+        "versions": version_hashes,
+        "sources": sources,
+        "inputs": inputs,
+    }, indent=2)
+    if verbose:
+        print(f"Paper {paper_id} rebuilt ({len(versions) - reused} parsed, {reused} from cache)")
+    return "ok"
+
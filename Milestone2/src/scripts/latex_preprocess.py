@@ -0,0 +1,245 @@
+"""
+Shallow LaTeX cleaning before hierarchy parsing (Step 3 of the hierarchy pipeline).
+
+preprocess_latex_legacy is the original chain of ~30 full-document re.sub passes from the
+notebook, kept as the reference implementation. preprocess_latex produces the same output
+with one tokenizer scan for every command/environment rewrite whose result does not depend
+on pass order, and skips the remaining order-sensitive passes when their trigger is absent.
+"""
+import re
+
+# ---------------------------
+# Reference implementation
+# ---------------------------
+
+def preprocess_latex_legacy(tex):
+   # Cleans and normalizes LaTeX text for hierarchy parsing.
+   
+    # Step 1: Remove comments (lines starting with %)
+    lines = []
+    for line in tex.splitlines():
+        if "%" in line:
+            # ignore escaped \%
+            line = re.sub(r'(?<!\\)%.*', '', line)
+        lines.append(line)
+    tex = "\n".join(lines)
+    
+    # Step 2: Remove preamble but keep \begin{document}
+    if "\\begin{document}" in tex:
+        before, after = tex.split("\\begin{document}", 1)
+        tex = "\\begin{document}\n" + after
+    
+    # Step 3: Remove abstract environment
+    tex = re.sub(
+        r'\\begin\{abstract\}.*?\\end\{abstract\}',
+        '',
+        tex,
+        flags=re.S
+    )
+    
+    # Step 4: Normalize line endings
+    tex = tex.replace('\r\n', '\n')
+    
+    # Step 5: Remove title/author blocks
+    # Delete everything from \title{ up to the first section or abstract
+    tex = re.sub(
+        r'\\title\s*\{[\s\S]*?(?=\\section\*?\{|\n\\section\*?\{|\n\\begin\{abstract\})',
+        '',
+        tex,
+        flags=re.MULTILINE
+    )
+    
+    # Step 6: Remove boilerplate commands
+    boilerplate_patterns = [
+        r'\\maketitle',
+        r'\\IEEEpeerreviewmaketitle',
+        r'\\IEEEtitleabstractindextext',
+        r'\\IEEEdisplaynontitleabstractindextext',
+        r'\\ACMmaketitle',
+    ]
+    for p in boilerplate_patterns:
+        tex = re.sub(p, '', tex)
+    
+    # Step 7: Remove include/input commands (already expanded)
+    tex = re.sub(r'\\(input|include)\{[^}]+\}', '', tex)
+    
+    # Step 8: Remove labels
+    tex = re.sub(r'\\label\{[^}]+\}', '', tex)
+    
+    # Step 9: Normalize references to [REF] and [EQ]
+    tex = re.sub(r'\\eqref\{[^}]+\}', '[EQ]', tex)
+    tex = re.sub(r'\\ref\{[^}]+\}', '[REF]', tex)
+    
+    # Step 10: Normalize citations to [CITE:key]
+    tex = re.sub(r'\\cite\{([^}]+)\}', r'[CITE:\1]', tex)
+    
+    # Step 11: Remove formatting commands without semantic meaning
+    formatting_patterns = [
+        r'\\centering',
+        r'\\raggedright',
+        r'\\raggedleft',
+        r'\\vspace\{[^}]+\}',
+        r'\\hspace\{[^}]+\}',
+        r'\\small',
+        r'\\footnotesize',
+        r'\\scriptsize',
+        r'\\normalsize',
+        r'\\midrule',
+        r'\\toprule',
+        r'\\bottomrule'
+    ]
+    for p in formatting_patterns:
+        tex = re.sub(p, '', tex)
+    
+    # Step 12: Remove float options like [h], [t], [b], [p]
+    tex = re.sub(r'\[(h|t|b|p|!)+\]', '', tex)
+    
+    # Step 13: Unwrap text formatting commands (keep content, remove command)
+    text_commands = ['textbf', 'textit', 'emph', 'underline', 'texttt']
+    for cmd in text_commands:
+        tex = re.sub(r'\\' + cmd + r'\{([^}]*)\}', r'\1', tex)
+        
+    # Step 14: Normalize inline math to $ ... $
+    tex = re.sub(r'\\\((.*?)\\\)', r'$\1$', tex)
+    tex = re.sub(r'\$\s*(.*?)\s*\$', r'$\1$', tex)
+    
+    # Step 15: Normalize block math to \begin{equation} ... \end{equation}
+    # Convert $$ ... $$ to equation
+    tex = re.sub(
+        r'\$\$(.*?)\$\$',
+        r'\\begin{equation}\1\\end{equation}',
+        tex,
+        flags=re.S
+    )
+    # Convert \[ ... \] to equation
+    tex = re.sub(
+        r'\\\[(.*?)\\\]',
+        r'\\begin{equation}\1\\end{equation}',
+        tex,
+        flags=re.S
+    )
+    # Convert align/gather/multline to equation
+    tex = re.sub(
+        r'\\begin\{(align|gather|multline)\}(.*?)\\end\{\1\}',
+        r'\\begin{equation}\2\\end{equation}',
+        tex,
+        flags=re.S
+    )
+    
+    # Step 16: Normalize whitespace
+    tex = re.sub(r'[ \t]+', ' ', tex)
+    tex = re.sub(r'\n\s*\n+', '\n\n', tex)
+    
+    return tex.strip()
+
+# ---------------------------
+# Single-scan implementation
+# ---------------------------
+
+# Same as (?<!\\)%.* per line, but starting with a literal so the engine can skip ahead
+COMMENT_RE = re.compile(r'%(?<!\\%)[^\n]*')
+ABSTRACT_RE = re.compile(r'\\begin\{abstract\}.*?\\end\{abstract\}', re.S)
+
+# Steps 5-11 of the legacy chain as one alternation behind a single literal "\\" prefix
+# (which keeps the regex engine's fast literal scan), dispatched on the matched command.
+# Spellings (no word boundaries) are kept exactly as in the legacy patterns.
+TOKEN_RE = re.compile(
+    r'\\(?:'
+    r'title\s*\{[\s\S]*?(?=\\section\*?\{|\n\\section\*?\{|\n\\begin\{abstract\})'
+    r'|maketitle|IEEEpeerreviewmaketitle|IEEEtitleabstractindextext'      # boilerplate
+    r'|IEEEdisplaynontitleabstractindextext|ACMmaketitle'
+    r'|(?:input|include)\{[^}]+\}'                                      # already expanded
+    r'|label\{[^}]+\}'
+    r'|centering|raggedright|raggedleft|vspace\{[^}]+\}|hspace\{[^}]+\}'  # formatting
+    r'|small|footnotesize|scriptsize|normalsize|midrule|toprule|bottomrule'
+    r'|(eq)ref\{[^}]+\}'
+    r'|(r)ef\{[^}]+\}'
+    r'|cite\{([^}]+)\}'
+    r')'
+)
+FLOAT_OPTIONS_RE = re.compile(r'\[[htbp!]+\]')
+
+TEXT_COMMANDS = ['textbf', 'textit', 'emph', 'underline', 'texttt']
+TEXT_COMMAND_RES = [(f'\\{cmd}{{', re.compile(r'\\' + cmd + r'\{([^}]*)\}')) for cmd in TEXT_COMMANDS]
+
+PAREN_MATH_RE = re.compile(r'\\\((.*?)\\\)')
+DOLLAR_MATH_RE = re.compile(r'\$\s*(.*?)\s*\$')
+DISPLAY_DOLLAR_RE = re.compile(r'\$\$(.*?)\$\$', re.S)
+DISPLAY_BRACKET_RE = re.compile(r'\\\[(.*?)\\\]', re.S)
+ALIGN_RE = re.compile(r'\\begin\{(align|gather|multline)\}(.*?)\\end\{\1\}', re.S)
+
+# Runs of blanks other than a lone space: lone spaces are already normalized, skipping them
+# avoids one match (and one replacement) per word
+SPACES_RE = re.compile(r'(?: [ \t]|\t)[ \t]*')
+BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+
+def _rewrite_token(m):
+    group = m.lastindex  # 1: \eqref, 2: \ref, 3: \cite keys, None: removed command
+    if group is None:
+        return ""  # title block, boilerplate, \input, \label, formatting
+    if group == 3:
+        keys = m.group(3)
+        # The legacy chain kept running the later removals over the citation keys
+        if "\\" in keys:
+            keys = TOKEN_RE.sub(_rewrite_token, keys)
+        return f"[CITE:{keys}]"
+    return "[EQ]" if group == 1 else "[REF]"
+
+
+# Callables instead of r'\1'-style templates, which are expanded in Python for every match
+def _inner(m):
+    return m.group(1)
+
+def _inline_math(m):
+    return f"${m.group(1)}$"
+
+def _equation(m):
+    return f"\\begin{{equation}}{m.group(1)}\\end{{equation}}"
+
+def _aligned_equation(m):
+    return f"\\begin{{equation}}{m.group(2)}\\end{{equation}}"
+
+
+def preprocess_latex(tex):
+    """
+    Clean and normalize LaTeX text for hierarchy parsing.
+    Same output as preprocess_latex_legacy, but every command removal/normalization is done
+    in a single TOKEN_RE scan, and passes whose trigger does not occur are skipped.
+    """
+    # Comments: splitlines() also normalizes \r\n, so the legacy step 4 has nothing left to do
+    tex = "\n".join(tex.splitlines())
+    if "%" in tex:
+        tex = COMMENT_RE.sub('', tex)
+
+    # Preamble (keep \begin{document})
+    if "\\begin{document}" in tex:
+        tex = "\\begin{document}\n" + tex.split("\\begin{document}", 1)[1]
+
+    if "\\begin{abstract}" in tex:
+        tex = ABSTRACT_RE.sub('', tex)
+
+    # Title block, boilerplate, \input/\include, \label, \ref/\eqref, \cite, formatting
+    tex = TOKEN_RE.sub(_rewrite_token, tex)
+    if "[" in tex:
+        tex = FLOAT_OPTIONS_RE.sub('', tex)
+
+    # Unwrapping is order-sensitive (nested commands), so it keeps one pass per command
+    for trigger, pattern in TEXT_COMMAND_RES:
+        if trigger in tex:
+            tex = pattern.sub(_inner, tex)
+
+    # Math normalization
+    if "\\(" in tex:
+        tex = PAREN_MATH_RE.sub(_inline_math, tex)
+    if "$" in tex:
+        tex = DOLLAR_MATH_RE.sub(_inline_math, tex)
+        tex = DISPLAY_DOLLAR_RE.sub(_equation, tex)
+    if "\\[" in tex:
+        tex = DISPLAY_BRACKET_RE.sub(_equation, tex)
+    if "\\begin{" in tex:
+        tex = ALIGN_RE.sub(_aligned_equation, tex)
+
+    tex = SPACES_RE.sub(' ', tex)
+    tex = BLANK_LINES_RE.sub('\n\n', tex)
+    return tex.strip()
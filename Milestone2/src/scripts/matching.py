@@ -0,0 +1,914 @@
+"""
+Reference matching pipeline of Milestone 2.2, lifted from Milestone2_ReferencesMatching.ipynb so
+it can be imported by the batched scorer (scoring.py) and by benchmark scripts.
+
+The per-pair functions below are the reference implementation: scoring.py must reproduce
+their feature values and rankings exactly.
+"""
+import json
+import re
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import bibtexparser
+import numpy as np
+
+OUTPUT_DIR = Path("output")
+
+# ---------------------------
+# Step 1: Text normalization
+# ---------------------------
+
+class TextCleaner:
+    # Common stop words in papers
+    STOP_WORDS = {
+        'a', 'an', 'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+        'of', 'with', 'by', 'from', 'as', 'is', 'was', 'are', 'were', 'been',
+        'be', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+        'could', 'should', 'may', 'might', 'must', 'shall', 'can', 'need',
+        'into', 'through', 'during', 'before', 'after', 'above', 'below',
+        'between', 'under', 'again', 'further', 'then', 'once', 'here',
+        'there', 'when', 'where', 'why', 'how', 'all', 'each', 'few', 'more',
+        'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own',
+        'same', 'so', 'than', 'too', 'very', 'just', 'also', 'now', 'using',
+        'via', 'based', 'approach', 'method', 'methods', 'towards', 'toward'
+    }
+    
+    # LaTeX commands that need to be remove
+    LATEX_PATTERNS = [
+        r'\\textit\{([^}]*)\}',
+        r'\\textbf\{([^}]*)\}',
+        r'\\emph\{([^}]*)\}',
+        r'\\text\{([^}]*)\}',
+        r'\\[a-zA-Z]+\{([^}]*)\}',
+        r'\\[a-zA-Z]+',
+        r'[{}]',
+        r'\$[^$]*\$', 
+    ]
+    
+    def __init__(self, remove_stopwords: bool = False, lowercase: bool = True):
+        self.remove_stopwords = remove_stopwords
+        self.lowercase = lowercase
+    
+    def clean_latex(self, text: str) -> str:
+        # Remove latex commands just keep the content
+        if not text:
+            return ""
+        
+        for pattern in self.LATEX_PATTERNS:
+            if '(' in pattern:  # Pattern that capture groups
+                text = re.sub(pattern, r'\1', text)
+            else:
+                text = re.sub(pattern, ' ', text)
+        
+        return text
+    
+    def normalize_unicode(self, text: str) -> str:
+        if not text:
+            return ""
+        
+        replacements = {
+            ''': "'", ''': "'", '"': '"', '"': '"',
+            '–': '-', '—': '-', '…': '...',
+            'á': 'a', 'à': 'a', 'ä': 'a', 'â': 'a', 'ã': 'a',
+            'é': 'e', 'è': 'e', 'ë': 'e', 'ê': 'e',
+            'í': 'i', 'ì': 'i', 'ï': 'i', 'î': 'i',
+            'ó': 'o', 'ò': 'o', 'ö': 'o', 'ô': 'o', 'õ': 'o',
+            'ú': 'u', 'ù': 'u', 'ü': 'u', 'û': 'u',
+            'ñ': 'n', 'ç': 'c', 'Á': 'A', 'À': 'A', 'É': 'E'
+        }
+        
+        for old, new in replacements.items():
+            text = text.replace(old, new)
+        
+        return text
+    
+    def remove_punctuation(self, text: str, keep_hyphens: bool = True) -> str:
+        if not text:
+            return ""
+        
+        if keep_hyphens:
+            text = re.sub(r'[^\w\s-]', ' ', text)
+        else:
+            text = re.sub(r'[^\w\s]', ' ', text)
+        
+        return text
+    
+    def tokenize(self, text: str) -> List[str]:
+        # Turn texts into tokens
+        if not text:
+            return []
+        
+        tokens = text.split()
+        tokens = [t.strip() for t in tokens if t.strip()]
+        
+        return tokens
+    
+    def remove_stop_words(self, tokens: List[str]) -> List[str]:
+        # Remove stop words from token
+        return [t for t in tokens if t.lower() not in self.STOP_WORDS]
+    
+    def normalize_text(self, title: str) -> str:
+        # Clean and normalize texts such as title
+        if not title:
+            return ""
+        
+        title = self.clean_latex(title)
+        title = self.normalize_unicode(title)
+        
+        if self.lowercase:
+            title = title.lower()
+        
+        title = self.remove_punctuation(title)
+        tokens = self.tokenize(title)
+        
+        if self.remove_stopwords:
+            tokens = self.remove_stop_words(tokens)
+        
+        return ' '.join(tokens)
+    
+    def clean_author_name(self, name: str) -> str:
+        # Clean and normalize author names
+        if not name:
+            return ""
+        
+        name = self.clean_latex(name)
+        name = self.normalize_unicode(name)
+        
+        if self.lowercase:
+            name = name.lower()
+        
+        name = self.remove_punctuation(name, keep_hyphens=True)
+        name = ' '.join(name.split())
+        
+        return name.strip()
+    
+    def extract_author_lastname(self, name: str) -> str:
+        # Get author last name
+        if not name:
+            return ""
+        
+        name = self.clean_author_name(name)
+        
+        # Check for "Last, First" format
+        if ',' in name:
+            parts = name.split(',')
+            return parts[0].strip()
+        
+        # Otherwise assume "First Last" format
+        parts = name.split()
+        if parts:
+            return parts[-1].strip()
+        
+        return name
+    
+    def normalize_year(self, year: Any) -> Optional[str]:
+        # Normalizing years into 4 digits
+        if not year:
+            return None
+        
+        year_str = str(year).strip()
+        match = re.search(r'(19|20)\d{2}', year_str)
+        if match:
+            return match.group(0)
+        
+        return None
+    
+    def normalize_author_list(self, authors: List[str]) -> Set[str]:
+      # Normalize a list of authors
+        if not authors:
+            return set()
+        
+        lastnames = set()
+        for author in authors:
+            if author:
+                lastname = self.extract_author_lastname(author)
+                if lastname:
+                    lastnames.add(lastname)
+        
+        return lastnames
+
+# Initialize global cleaner instance
+cleaner = TextCleaner(remove_stopwords=False, lowercase=True)
+
+# ---------------------------
+# Data loading
+# ---------------------------
+
+def load_paper_data(paper_dir: Path) -> Tuple[str, Dict, Dict]:
+# Loads BibTeX entries and candidate metadata for a specific paper.
+    paper_id = paper_dir.name
+    
+    # Load refs.bib (BibTeX entries to match)
+    bib_file = paper_dir / "refs.bib"
+    bibtex_entries = {}
+    if bib_file.exists():
+        try:
+            with open(bib_file, 'r', encoding='utf-8') as f:
+                bib_database = bibtexparser.load(f)
+                for entry in bib_database.entries:
+                    bibtex_entries[entry['ID']] = entry
+        except Exception as e:
+            pass
+    
+    # Load references.json (candidate arXiv papers)
+    refs_file = paper_dir / "references.json"
+    candidates = {}
+    if refs_file.exists():
+        try:
+            with open(refs_file, 'r', encoding='utf-8') as f:
+                candidates = json.load(f)  
+        except Exception as e:
+            pass
+    
+    return paper_id, bibtex_entries, candidates
+
+
+def load_all_data(output_dir: Path = OUTPUT_DIR) -> Dict[str, Dict]:
+    """{paper_id: {'bibtex': ..., 'candidates': ...}} for every paper with both files."""
+    all_data = {}
+    for paper_dir in sorted(d for d in output_dir.iterdir() if d.is_dir()):
+        paper_id, bibtex_entries, candidates = load_paper_data(paper_dir)
+        if bibtex_entries and candidates:  # Only include papers with both bibtex and candidate entry
+            all_data[paper_id] = {
+                'bibtex': bibtex_entries,
+                'candidates': candidates
+            }
+    return all_data
+
+
+def load_pred_labels(output_dir: Path = OUTPUT_DIR) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    """Ground truth and partition of every paper that already has a pred.json."""
+    labels, partitions = {}, {}
+    for pred_file in sorted(output_dir.glob("*/pred.json")):
+        with open(pred_file, 'r', encoding='utf-8') as f:
+            pred_data = json.load(f)
+        labels[pred_file.parent.name] = pred_data['groundtruth']
+        partitions[pred_file.parent.name] = pred_data['partition']
+    return labels, partitions
+
+# ---------------------------
+# Step 2: Manual labels {paper_id: {bibtex_key: arxiv_id}}
+# ---------------------------
+
+manual_labels = {
+    "2303-07857": {
+        "ref_19cb4e1f3f": "1707-09187",
+        "ref_be4b543cb8": "1911-09749",
+        "ref_2582626033": "1907-06802",
+        "ref_8b82058ffd": "1602-00464",
+        "ref_12872aae94": "nlin/0109004",
+        "ref_64a1435c17": "1905-06110",
+        "ref_09430b3dba": "physics/0608227",
+        "ref_a43a0d6ccb": "astro-ph/0610759",
+        "ref_cded4eaa15": "1005-5422",
+        "ref_158d0e9a47": "1307-7465",
+        "ref_6a9782497d": "1708-06120",
+        "ref_df4379284b": "1607-05087",
+        "ref_2a26528e73": "astro-ph/0410274",
+        "ref_dc40b83c5b": "physics/0510053",
+        "ref_4158867359": "1602-03638",
+        "ref_7c49f4df40": "1810-02210",
+        "ref_33d481a866": "2004-10107",
+        "ref_e30dd83f1b": "1903-07829",
+        "ref_a7a71b622c": "nlin/0404043",
+        "ref_4e81ef7316": "1203-5301"
+    },
+        "2303-07859": {
+        "ref_bf67b0ad12": "cond-mat/0009376",
+        "ref_40fa37b08a": "1804-08459",
+        "ref_fd7783b9d0": "1805-09664",
+        "ref_3f3bd47dde": "cond-mat/0401118",
+        "ref_9cde417a61": "0912-5460",
+        "ref_b68ad720e4": "1210-5843",
+        "ref_6f7f252de3": "1405-5830",
+        "ref_af290d4b3e": "cond-mat/9803258",
+        "ref_18f54910ee": "1010-3490",
+        "ref_a666eff582": "1307-5130",
+        "ref_d76c92ebb7": "1902-03963",
+        "ref_a122083917": "0909-0628",
+        "ref_0661b25897": "1702-04853",
+        "ref_6beb33c773": "cond-mat/9902085",
+        "ref_2f1802b9ac": "1210-5843",
+        "ref_33c03f1f27": "1208-6095",
+        "ref_311b9ceb49": "1907-04732",
+        "ref_3ac609466f": "1802-02777",
+        "ref_5ce0b44224": "cond-mat/0501498",
+        "ref_893babc627": "0901-2254",
+        "ref_22d9c1bf05": "1911-09924",
+        "ref_066d5bfccd": "1012-4946",
+        "ref_0fb0e7f0c8": "2301-00610",
+        "ref_ac237bc612": "2105-08389",
+        "ref_04c59a22a4": "1907-06894",
+        "ref_0bf6cc4b6d": "2203-10524",
+        "ref_5ec06c5041": "1711-02746",
+        "ref_b9a2809671": "2301-12871",
+        "ref_7d2575c36c": "2204-02252"
+    },
+        "2303-07863": {
+        "ref_4bf9404da4": "1906-10057",
+        "ref_afe5a49e3c": "1812-03982",
+        "ref_63d6e86e57": "1906-02549",
+        "ref_d079b6668e": "2103-11555",
+        "ref_fca2fcf34d": "2109-04872",
+        "ref_faf0c4a98f": "2203-16434",
+        "ref_5687f4d1aa": "1911-08199",
+        "ref_3cfc6dc703": "2109-06398",
+        "ref_2660b70f99": "1512-03385",
+        "ref_6bb6308f93": "2009-10434",
+        "ref_48e9ee7cec": "2106-16136",
+        "ref_3520f21896": "1412-3555",
+        "ref_881794d1fe": "1906-02497",
+        "ref_12effe1f0d": "2008-08257",
+        "ref_da085b33da": "2011-10331",
+        "ref_80c6878c4c": "2011-10254",
+        "ref_7ab480c470": "1705-02101",
+        "ref_53c931df9b": "1708-01641",
+        "ref_aba4aa5dcb": "1904-03282",
+        "ref_5f39cadc6a": "1604-01753",
+        "ref_054f0fb075": "1705-07750",
+        "ref_408032c1d4": "1912-03590",
+        "ref_b49206d289": "2004-03545",
+        "ref_0b8d520c94": "2209-11572",
+        "ref_82b8672aff": "1904-08141",
+        "ref_245536a148": "2012-05499",
+        "ref_5e85bfa46f": "2301-01871",
+        "ref_5cde88962a": "2008-01403",
+        "ref_ee5e22e5fc": "2001-09099",
+        "ref_93335a0747": "2004-13931",
+        "ref_100d6500ff": "2201-05307",
+        "ref_975a0c11e7": "2011-10396",
+        "ref_ba8114ab94": "2208-14882",
+        "ref_a79dd870b6": "2102-13558",
+        "ref_179ddbd202": "1706-03762",
+        "ref_5212af9947": "2110-11334",
+        "ref_85d504e63f": "1611-10252",
+        "ref_946af4a1e7": "2303-01046",
+        "ref_db298314c8": "2204-05306",
+        "ref_1c5b48dc85": "2207-11247",
+        "ref_19e4de3c69": "2010-05864",
+        "ref_dcafda21bc": "2210-07242",
+        "ref_08998daaf8": "1810-00661",
+        "ref_370aef7781": "2108-11941",
+        "ref_5528725fa2": "2004-07514",
+        "ref_d14db865b4": "2203-02966",
+        "ref_9dabfe502a": "2109-06400",
+        "ref_9e8459fe07": "1910-14303",
+        "ref_c4a41cadd3": "2201-00454",
+        "ref_4a1809759b": "1705-02101",
+        "ref_ccf77068bf": "1604-01753",
+        "ref_951ab5d910": "2003-07048",
+        "ref_d4c58e0dc5": "2004-13931",
+        "ref_03f75d4ad5": "1904-03282",
+        "ref_f434593201": "1906-02497",
+        "ref_3e0cae01d3": "2008-01403",
+        "ref_9e179f8897": "1812-03849",
+        "ref_89fad23da7": "1911-08199",
+        "ref_627dcab578": "1912-03590",
+        "ref_3c094a7508": "1906-02549",
+        "ref_f36f7990fb": "2110-05717",
+        "ref_dd0dcb6689": "2008-08257",
+        "ref_0a734cb3b0": "1909-13784",
+        "ref_cc9ca6c837": "2008-10238",
+        "ref_4e5ceffc1a": "1706-03762",
+        "ref_3b1a042d00": "2001-09691",
+        "ref_6dc5f3a0ee": "1804-07014",
+        "ref_5359fdca0d": "1811-11057",
+        "ref_14a8ac81c3": "1712-00636",
+        "ref_a745ccb433": "2207-13457",
+        "ref_d19de04576": "1901-03460",
+        "ref_7bc2732da9": "1612-01925",
+        "ref_45725534d1": "2107-12192",
+        "ref_8dd4215560": "2203-15336",
+        "ref_09e038d10e": "2207-13450",
+        "ref_067241fa3a": "2203-02966"
+    },
+        "2303-07864": {
+        "ref_9521cc9934": "1904-07734",
+        "ref_94ef1d4510": "1706-08840",
+        "ref_4d4cc768cd": "1705-08690",
+        "ref_7fdcca8b92": "2101-10423",
+        "ref_92f4246340": "2003-13191",
+        "ref_8d64d25ec4": "2010-15277",
+        "ref_b2ca1ddcad": "2010-05595",
+        "ref_079404a4f9": "2103-13885",
+        "ref_5d954ca36a": "1812-00420",
+        "ref_a5205103f2": "1903-08671",
+        "ref_2162fde3a5": "1911-05722",
+        "ref_7ac49d4159": "1609-08764",
+        "ref_294d68dca8": "1712-04621",
+        "ref_fa4ebb8b42": "2209-13917",
+        "ref_593f03fc1e": "1710-09412",
+        "ref_123da2b30f": "2012-02909",
+        "ref_2660b70f99": "1512-03385",
+        "ref_4255dd5595": "2009-03632",
+        "ref_e54b7c2510": "2106-14413",
+        "ref_faed00b0bc": "1606-04080",
+        "ref_0860715aab": "1612-00796",
+        "ref_7dfad688a8": "2103-03230",
+        "ref_7f0e6dc14b": "1805-00385",
+        "ref_a203f60e54": "2108-09020"
+    },
+        "2303-07880": {
+        "ref_70a6855706": "2211-16377",
+        "ref_12bd785efc": "1604-01072",
+        "ref_2282d5416d": "0708-3096",
+        "ref_525f94edcc": "1503-06454",
+        "ref_c78a85454b": "1507-06379",
+        "ref_04881c760a": "1904-00599",
+        "ref_d71b3b7393": "1811-03808",
+        "ref_baf0ea14dd": "1711-08474",
+        "ref_28cdf8fefa": "1611-01834",
+        "ref_30918b197b": "2206-03123",
+        "ref_10f44e1597": "1503-03123",
+        "ref_28f5273de7": "0903-3247",
+        "ref_6698ce3df2": "cond-mat/9803302",
+        "ref_451468dc77": "1604-00953",
+        "ref_90066cb8b9": "2008-12972",
+        "ref_e9d016cc2d": "cond-mat/0504403",
+        "ref_70dd63c90d": "0812-2375",
+        "ref_fbdd23cbd9": "0910-2899",
+        "ref_b53f9fd593": "2012-02900",
+        "ref_a73987a293": "cond-mat/0503686",
+        "ref_1cf6b87f39": "2202-02630",
+        "ref_d03fc5b038": "2010-04231",
+        "ref_ce62e6660a": "1905-00373",
+        "ref_d968d5edd8": "2202-03766",
+        "ref_66ae6df8c5": "2204-04070",
+        "ref_170d31be93": "1811-03808",
+        "ref_3129f1b7c2": "1506-08046",
+        "ref_2a2fe2fd5b": "1910-10083",
+        "ref_b5cc191ec8": "2207-08695",
+        "ref_efedcab958": "2206-00992",
+        "ref_198a5b6ca8": "1504-00192",
+        "ref_86d58e023b": "1512-04227",
+        "ref_59b8d81e99": "1507-03443",
+        "ref_27c47a0d94": "2206-06105",
+        "ref_9eca7f8bfe": "1902-06176",
+        "ref_fbb365508f": "1601-04845",
+        "ref_6e27904868": "2209-07293",
+        "ref_24b8aca6a7": "2112-12437",
+        "ref_d7e663f9da": "1912-06710",
+        "ref_e4d17e8eb4": "1412-2692",
+        "ref_5559d39223": "2210-04205",
+        "ref_a2bf9df9ea": "1703-09976",
+        "ref_65993dfc0e": "2010-16286",
+        "ref_e07799567d": "2212-01216",
+        "ref_356a4e399b": "2301-04073",
+        "ref_976c34bcc3": "0803-1069",
+        "ref_7a1a833e5d": "1801-01894",
+        "ref_1c0a08a401": "1404-3037",
+        "ref_fdfaf8015a": "2303-02035"
+    }
+}
+
+# ---------------------------
+# Step 2: Automatic labeling
+# ---------------------------
+
+def create_automatic_labels(all_data: Dict, percentage: float = 0.1) -> Dict[str, Dict]:
+   #Auto-labels a percentage of papers using DOI or title similarity.
+
+    # Select papers for automatic labeling
+    paper_ids = list(all_data.keys())
+    np.random.seed(42)
+    num_papers = max(int(len(paper_ids) * percentage), 10)
+    selected_papers = np.random.choice(paper_ids, min(num_papers, len(paper_ids)), replace=False)
+    
+    labeled_data = {}
+    
+    for paper_id in selected_papers:
+        data = all_data[paper_id]
+        bibtex_entries = data['bibtex']
+        candidates = data['candidates']
+        
+        paper_labels = {}
+        
+        for bib_key, bib_entry in bibtex_entries.items():
+            # Get and clean BibTeX fields using TextCleaner methods
+            bib_doi = bib_entry.get('doi', '').strip().lower()
+            bib_title_raw = bib_entry.get('title', '')
+            bib_title = cleaner.normalize_text(bib_title_raw)  
+            
+            matches = []
+            
+            # Strategy 1: DOI matching (highest confidence)
+            if bib_doi:
+                for arxiv_id, cand in candidates.items():
+                    cand_doi = cand.get('doi', '').strip().lower()
+                    if cand_doi and cand_doi == bib_doi:
+                        matches.append(arxiv_id)
+            
+            # Strategy 2: Exact title matching (high confidence)
+            if not matches and bib_title:
+                for arxiv_id, cand in candidates.items():
+                    cand_title_raw = cand.get('title', '')
+                    cand_title = cleaner.normalize_text(cand_title_raw)  # Using cleaner method
+                    if cand_title and cand_title == bib_title:
+                        matches.append(arxiv_id)
+            
+            # Strategy 3: High similarity title matching (>0.9)
+            if not matches and bib_title and len(bib_title) > 10:
+                for arxiv_id, cand in candidates.items():
+                    cand_title_raw = cand.get('title', '')
+                    cand_title = cleaner.normalize_text(cand_title_raw)  # Using cleaner method
+                    if cand_title:
+                        similarity = SequenceMatcher(None, bib_title, cand_title).ratio()
+                        if similarity > 0.9:
+                            matches.append(arxiv_id)
+            
+            # Store label (take first match if multiple)
+            if matches:
+                paper_labels[bib_key] = matches[0]
+        
+        if paper_labels:
+            labeled_data[paper_id] = paper_labels
+    
+    return labeled_data
+
+# ---------------------------
+# Step 3: Feature engineering
+# ---------------------------
+
+# Helper functions for feature extraction
+# Each function takes a BibTeX entry and a candidate paper and returns a numeric feature value
+def calculate_title_similarity(bibtex_entry, candidate_paper):
+    # Calculates title similarity score between 0 and 1.
+
+    # Get titles
+    bib_title = bibtex_entry.get('title', '')
+    arxiv_title = candidate_paper.get('title', '')
+    
+    # Normalize and clean titles/texts
+    bib_title_clean = cleaner.normalize_text(bib_title)
+    arxiv_title_clean = cleaner.normalize_text(arxiv_title)
+    
+    # Handle empty titles
+    if not bib_title_clean or not arxiv_title_clean:
+        return 0.0
+    
+    # Calculate similarity
+    similarity = SequenceMatcher(None, bib_title_clean, arxiv_title_clean).ratio()
+    
+    return similarity
+
+
+def calculate_title_length_ratio(bibtex_entry, candidate_paper):
+    # Measures how similar title lengths are from 0 to 1.
+
+    # Get titles
+    bib_title = bibtex_entry.get('title', '')
+    arxiv_title = candidate_paper.get('title', '')
+    
+    # Clean titles
+    bib_title_clean = cleaner.normalize_text(bib_title)
+    arxiv_title_clean = cleaner.normalize_text(arxiv_title)
+    
+    # Get lengths
+    bib_len = len(bib_title_clean)
+    arxiv_len = len(arxiv_title_clean)
+    
+    # Handle empty
+    if bib_len == 0 or arxiv_len == 0:
+        return 0.0
+    
+    # Ratio of shorter to longer (always <= 1)
+    ratio = min(bib_len, arxiv_len) / max(bib_len, arxiv_len)
+    
+    return ratio
+
+
+def calculate_author_overlap(bibtex_entry, candidate_paper):
+    # Calculates Jaccard similarity of shared authors from 0 to 1.
+
+    # Get author strings/lists
+    bib_authors_raw = bibtex_entry.get('author', '')
+    arxiv_authors_raw = candidate_paper.get('authors', [])
+    
+    # Parse BibTeX authors (format: "Last1, First1 and Last2, First2")
+    if isinstance(bib_authors_raw, str):
+        # Split by "and"
+        bib_author_list = [a.strip() for a in bib_authors_raw.split(' and ')]
+    else:
+        bib_author_list = []
+    
+    # Parse arXiv authors (already a list)
+    if isinstance(arxiv_authors_raw, list):
+        arxiv_author_list = arxiv_authors_raw
+    else:
+        arxiv_author_list = []
+    
+    # Extract last names
+    bib_lastnames = set()
+    for author in bib_author_list:
+        lastname = cleaner.extract_author_lastname(author)
+        if lastname:
+            bib_lastnames.add(lastname.lower())
+    
+    arxiv_lastnames = set()
+    for author in arxiv_author_list:
+        lastname = cleaner.extract_author_lastname(author)
+        if lastname:
+            arxiv_lastnames.add(lastname.lower())
+    
+    # Handle empty sets
+    if not bib_lastnames or not arxiv_lastnames:
+        return 0.0
+    
+    # Jaccard similarity
+    intersection = len(bib_lastnames & arxiv_lastnames)
+    union = len(bib_lastnames | arxiv_lastnames)
+    
+    if union == 0:
+        return 0.0
+    
+    jaccard = intersection / union
+    
+    return jaccard
+
+
+def calculate_year_difference(bibtex_entry, candidate_paper):
+    # Calculates and normalizes publication year difference.
+
+    # Get years
+    bib_year = bibtex_entry.get('year', None)
+    arxiv_year = candidate_paper.get('year', None)
+    
+    # Normalize years
+    bib_year_clean = cleaner.normalize_year(bib_year)
+    arxiv_year_clean = cleaner.normalize_year(arxiv_year)
+    
+    # Handle missing years
+    if not bib_year_clean or not arxiv_year_clean:
+        return 5.0  # Large penalty for missing year
+    
+    # Calculate difference
+    try:
+        year_diff = abs(int(bib_year_clean) - int(arxiv_year_clean))
+        # Normalize: 0 years = 0.0, 10 years = 1.0
+        normalized_diff = year_diff / 10.0
+        return normalized_diff
+    except:
+        return 5.0
+
+
+def check_first_author_match(bibtex_entry, candidate_paper):
+    # Returns 1 if first authors' last names match, else 0.
+
+    # Get first author from BibTeX
+    bib_authors_raw = bibtex_entry.get('author', '')
+    if isinstance(bib_authors_raw, str) and bib_authors_raw:
+        first_bib_author = bib_authors_raw.split(' and ')[0].strip()
+    else:
+        return 0
+    
+    # Get first author from arXiv
+    arxiv_authors_raw = candidate_paper.get('authors', [])
+    if isinstance(arxiv_authors_raw, list) and arxiv_authors_raw:
+        first_arxiv_author = arxiv_authors_raw[0]
+    else:
+        return 0
+    
+    # Extract lastnames
+    bib_lastname = cleaner.extract_author_lastname(first_bib_author).lower()
+    arxiv_lastname = cleaner.extract_author_lastname(first_arxiv_author).lower()
+    
+    # Check match
+    if bib_lastname and arxiv_lastname and bib_lastname == arxiv_lastname:
+        return 1
+    else:
+        return 0
+
+
+def calculate_title_word_overlap(bibtex_entry, candidate_paper):
+    # Measures Jaccard similarity of shared title words from 0 to 1.
+
+    # Get titles
+    bib_title = bibtex_entry.get('title', '')
+    arxiv_title = candidate_paper.get('title', '')
+    
+    # Clean titles
+    bib_title_clean = cleaner.normalize_text(bib_title)
+    arxiv_title_clean = cleaner.normalize_text(arxiv_title)
+    
+    # Split into words
+    bib_words = set(bib_title_clean.split())
+    arxiv_words = set(arxiv_title_clean.split())
+    
+    # Remove very short words (likely noise)
+    bib_words = {w for w in bib_words if len(w) > 2}
+    arxiv_words = {w for w in arxiv_words if len(w) > 2}
+    
+    # Handle empty
+    if not bib_words or not arxiv_words:
+        return 0.0
+    
+    # Jaccard similarity
+    intersection = len(bib_words & arxiv_words)
+    union = len(bib_words | arxiv_words)
+    
+    if union == 0:
+        return 0.0
+    
+    jaccard = intersection / union
+    
+    return jaccard
+
+
+def extract_all_features(bibtex_entry, candidate_paper):
+    # Extracts all six features into a single list in order.
+    features = [
+        calculate_title_similarity(bibtex_entry, candidate_paper),
+        calculate_title_length_ratio(bibtex_entry, candidate_paper),
+        calculate_author_overlap(bibtex_entry, candidate_paper),
+        calculate_year_difference(bibtex_entry, candidate_paper),
+        check_first_author_match(bibtex_entry, candidate_paper),
+        calculate_title_word_overlap(bibtex_entry, candidate_paper)
+    ]
+    
+    return features
+
+
+# Feature names for later reference
+FEATURE_NAMES = [
+    'title_similarity',
+    'title_length_ratio', 
+    'author_overlap',
+    'year_difference',
+    'first_author_match',
+    'title_word_overlap'
+]
+
+
+def create_dataset_for_papers(paper_ids, all_data, all_labels):
+    # Build feature matrix and labels for training/testing
+    # Creates pairs of (bibtex, candidate) with features and label (1=match, 0=no match)
+    
+    X_list = []  # Features
+    y_list = []  # Labels
+    metadata_list = []  # To track which pair is which
+    
+    for paper_id in paper_ids:
+        if paper_id not in all_data or paper_id not in all_labels:
+            continue
+            
+        paper_data = all_data[paper_id]
+        paper_labels = all_labels[paper_id]
+        
+        bibtex_entries = paper_data['bibtex']
+        candidates = paper_data['candidates']
+        
+        # For each BibTeX entry
+        for bib_key, bib_entry in bibtex_entries.items():
+            # Only process if there're a label for this entry
+            if bib_key not in paper_labels:
+                continue
+                
+            correct_arxiv_id = paper_labels[bib_key]
+            
+            # Create pairs with ALL candidates
+            for arxiv_id, candidate in candidates.items():
+                # Extract features
+                features = extract_all_features(bib_entry, candidate)
+                
+                # Determine label
+                label = 1 if arxiv_id == correct_arxiv_id else 0
+                
+                # Store it
+                X_list.append(features)
+                y_list.append(label)
+                metadata_list.append((paper_id, bib_key, arxiv_id))
+    
+    # Convert to numpy arrays
+    X = np.array(X_list)
+    y = np.array(y_list)
+    
+    return X, y, metadata_list
+
+# ---------------------------
+# Step 5: Top-k predictions
+# ---------------------------
+
+def generate_predictions_for_paper(paper_id, paper_data, model, top_k=5):
+   #Predicts top-k candidates for BibTeX entries using a trained model.
+
+    predictions = {}
+    
+    bibtex_entries = paper_data['bibtex']
+    candidates = paper_data['candidates']
+    
+    # For each BibTeX entry
+    for bib_key, bib_entry in bibtex_entries.items():
+        candidate_scores = []
+        
+        # Score all candidates
+        for arxiv_id, candidate in candidates.items():
+            # Extract features for this pair
+            features = extract_all_features(bib_entry, candidate)
+            features_array = np.array(features).reshape(1, -1)
+            
+            # Predict probability
+            probability = model.predict_proba(features_array)[0, 1]
+            
+            candidate_scores.append((arxiv_id, probability))
+        
+        # Sort by probability (descending) and take top-k
+        candidate_scores.sort(key=lambda x: x[1], reverse=True)
+        top_candidates = [arxiv_id for arxiv_id, prob in candidate_scores[:top_k]]
+        
+        predictions[bib_key] = top_candidates
+    
+    return predictions
+
+
+def create_pred_json(paper_id, partition, groundtruth, predictions):
+    # Formats ground truth and top-k predictions into pred.json structure.
+    return {
+        "partition": partition,
+        "groundtruth": groundtruth,
+        "prediction": predictions
+    }
+
+
+def save_pred_json(paper_id, pred_data, output_dir):
+    # Saves pred.json to the paper's output directory.
+    
+    paper_dir = output_dir / paper_id
+    paper_dir.mkdir(parents=True, exist_ok=True)
+    
+    pred_file = paper_dir / "pred.json"
+    with open(pred_file, 'w', encoding='utf-8') as f:
+        json.dump(pred_data, f, indent=2, ensure_ascii=False)
+    
+    return pred_file
+
+# ---------------------------
+# Step 6: Mean Reciprocal Rank
+# ---------------------------
+
+def calculate_mrr(groundtruth, predictions):
+    # Calculate Mean Reciprocal Rank score (higher = better predictions)
+    
+    reciprocal_ranks = []
+    
+    for bib_key, correct_arxiv in groundtruth.items():
+        if bib_key not in predictions:
+            reciprocal_ranks.append(0)
+            continue
+        
+        predicted_list = predictions[bib_key]
+        
+        # Find rank of correct answer (1-indexed)
+        if correct_arxiv in predicted_list:
+            rank = predicted_list.index(correct_arxiv) + 1
+            reciprocal_ranks.append(1.0 / rank)
+        else:
+            reciprocal_ranks.append(0)
+    
+    mrr = np.mean(reciprocal_ranks) if reciprocal_ranks else 0
+    return mrr, reciprocal_ranks
+
+
+def evaluate_all_papers(paper_ids, output_dir):
+    """
+    Calculate MRR for multiple papers.
+    
+    Args:
+        paper_ids: List of paper IDs
+        output_dir: Directory containing pred.json files
+    
+    Returns:
+        Dictionary with MRR statistics
+    """
+    all_rr = []
+    results = []
+    
+    for paper_id in paper_ids:
+        pred_file = output_dir / paper_id / "pred.json"
+        
+        if not pred_file.exists():
+            continue
+        
+        with open(pred_file, 'r', encoding='utf-8') as f:
+            pred_data = json.load(f)
+        
+        mrr, rr_list = calculate_mrr(
+            pred_data['groundtruth'],
+            pred_data['prediction']
+        )
+        
+        all_rr.extend(rr_list)
+        results.append({
+            'paper_id': paper_id,
+            'mrr': mrr,
+            'num_entries': len(rr_list)
+        })
+    
+    overall_mrr = np.mean(all_rr) if all_rr else 0
+    
+    return {
+        'overall_mrr': overall_mrr,
+        'per_paper': results,
+        'all_rr': all_rr
+    }
@@ -0,0 +1,213 @@
+"""
+Batched candidate scoring for the reference matcher.
+
+The per-pair path (matching.extract_all_features + one predict_proba call per pair) normalizes
+both titles again inside every feature function. Here each BibTeX entry and each candidate is
+normalized exactly once, the (entries x candidates x features) matrix of a paper is built in one
+pass (NumPy broadcasting for the numeric features, precomputed sets for the Jaccard ones and
+similarity.title_ratio_matrix for title similarity) and the model is called once per paper.
+
+With the "difflib" similarity backend, feature values, probabilities and rankings are
+identical to the per-pair path.
+"""
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+from matching import FEATURE_NAMES
+from similarity import cleaner, title_ratio_matrix
+
+MISSING_YEAR_PENALTY = 5.0   # calculate_year_difference value when a year is missing
+
+# ---------------------------
+# One-time normalization
+# ---------------------------
+
+class Prepared(NamedTuple):
+    """Everything the features need from one side of a pair, computed once."""
+    title: str                    # cleaner.normalize_text(title)
+    words: Set[str]               # title words longer than 2 chars
+    lastnames: Set[str]           # lowercased author last names
+    first_lastname: Optional[str] # lowercased first-author last name (None: feature is 0)
+    year: Optional[int]
+
+
+def _lastname(author) -> str:
+    return cleaner.extract_author_lastname(author).lower()
+
+
+def _prepare(title, author_list, first_author, year) -> Prepared:
+    title_clean = cleaner.normalize_text(title)
+    lastnames = {_lastname(a) for a in author_list}
+    lastnames.discard("")
+    year_clean = cleaner.normalize_year(year)
+    return Prepared(
+        title=title_clean,
+        words={w for w in title_clean.split() if len(w) > 2},
+        lastnames=lastnames,
+        first_lastname=_lastname(first_author) if first_author is not None else None,
+        year=int(year_clean) if year_clean else None,
+    )
+
+
+def prepare_bibtex(bibtex_entry: Dict) -> Prepared:
+    """Normalize a refs.bib entry (authors as a "A and B" string)."""
+    authors = bibtex_entry.get('author', '')
+    if isinstance(authors, str):
+        author_list = [a.strip() for a in authors.split(' and ')]
+        first_author = author_list[0] if authors else None
+    else:
+        author_list, first_author = [], None
+    return _prepare(bibtex_entry.get('title', ''), author_list, first_author,
+                    bibtex_entry.get('year', None))
+
+
+def prepare_candidate(candidate_paper: Dict) -> Prepared:
+    """Normalize a references.json candidate (authors as a list)."""
+    authors = candidate_paper.get('authors', [])
+    if isinstance(authors, list):
+        author_list, first_author = authors, (authors[0] if authors else None)
+    else:
+        author_list, first_author = [], None
+    return _prepare(candidate_paper.get('title', ''), author_list, first_author,
+                    candidate_paper.get('year', None))
+
+# ---------------------------
+# Feature matrix
+# ---------------------------
+
+def _jaccard_matrix(left: List[Set[str]], right: List[Set[str]]) -> np.ndarray:
+    """Pairwise Jaccard similarity of two lists of sets (0 when either set is empty)."""
+    vocab = {}
+    for s in left:
+        for token in s:
+            vocab.setdefault(token, len(vocab))
+    out = np.zeros((len(left), len(right)))
+    if not vocab:
+        return out
+    # Token-incidence matrices: intersections are one matrix product
+    L = np.zeros((len(left), len(vocab)), dtype=np.int32)
+    for i, s in enumerate(left):
+        L[i, [vocab[t] for t in s]] = 1
+    R = np.zeros((len(right), len(vocab)), dtype=np.int32)
+    for j, s in enumerate(right):
+        R[j, [vocab[t] for t in s if t in vocab]] = 1
+    inter = L @ R.T
+    left_sizes = np.array([len(s) for s in left])[:, None]
+    right_sizes = np.array([len(s) for s in right])[None, :]
+    union = left_sizes + right_sizes - inter
+    valid = (left_sizes > 0) & (right_sizes > 0)
+    np.divide(inter, union, out=out, where=valid)
+    return out
+
+
+def feature_tensor(bibs: List[Prepared], cands: List[Prepared], mask: np.ndarray = None) -> np.ndarray:
+    """
+    Array of shape (len(bibs), len(cands), len(FEATURE_NAMES)), columns in FEATURE_NAMES order.
+    mask (len(bibs) x len(cands), bool): the pairs that will be read; a per-pair title backend
+    skips the others (the vectorized features are computed for every pair anyway).
+    """
+    features = np.zeros((len(bibs), len(cands), len(FEATURE_NAMES)))
+    if not bibs or not cands:
+        return features
+
+    features[:, :, 0] = title_ratio_matrix([b.title for b in bibs], [c.title for c in cands], mask)
+
+    bib_len = np.array([len(b.title) for b in bibs])[:, None]
+    cand_len = np.array([len(c.title) for c in cands])[None, :]
+    valid = (bib_len > 0) & (cand_len > 0)
+    np.divide(np.minimum(bib_len, cand_len), np.maximum(bib_len, cand_len),
+              out=features[:, :, 1], where=valid)
+
+    features[:, :, 2] = _jaccard_matrix([b.lastnames for b in bibs], [c.lastnames for c in cands])
+
+    bib_year = np.array([b.year if b.year is not None else -1 for b in bibs])[:, None]
+    cand_year = np.array([c.year if c.year is not None else -1 for c in cands])[None, :]
+    features[:, :, 3] = np.where((bib_year >= 0) & (cand_year >= 0),
+                                 np.abs(bib_year - cand_year) / 10.0, MISSING_YEAR_PENALTY)
+
+    # First-author match: compare integer codes of the last names ("" and None never match)
+    codes = {}
+    bib_first = np.array([codes.setdefault(b.first_lastname, len(codes)) if b.first_lastname else -1
+                          for b in bibs])[:, None]
+    cand_first = np.array([codes.get(c.first_lastname, -2) if c.first_lastname else -2
+                           for c in cands])[None, :]
+    features[:, :, 4] = bib_first == cand_first
+
+    features[:, :, 5] = _jaccard_matrix([b.words for b in bibs], [c.words for c in cands])
+    return features
+
+
+def paper_feature_matrix(paper_data: Dict, bib_keys=None):
+    """
+    Feature matrix of every (BibTeX entry x candidate) pair of one paper, rows in the same
+    order as the per-pair loops (entry-major, candidates in references.json order).
+    Returns:
+        (X, bib_keys, arxiv_ids) with X of shape (len(bib_keys) * len(arxiv_ids), n_features)
+    """
+    bibtex_entries = paper_data['bibtex']
+    candidates = paper_data['candidates']
+    bib_keys = list(bibtex_entries) if bib_keys is None else list(bib_keys)
+    arxiv_ids = list(candidates)
+    bibs = [prepare_bibtex(bibtex_entries[k]) for k in bib_keys]
+    cands = [prepare_candidate(candidates[a]) for a in arxiv_ids]
+    X = feature_tensor(bibs, cands).reshape(-1, len(FEATURE_NAMES))
+    return X, bib_keys, arxiv_ids
+
+# ---------------------------
+# Batched counterparts of the notebook functions
+# ---------------------------
+
+def create_dataset_batched(paper_ids, all_data, all_labels):
+    """Same (X, y, metadata) as matching.create_dataset_for_papers, one matrix per paper."""
+    X_parts, y_parts, metadata_list = [], [], []
+
+    for paper_id in paper_ids:
+        if paper_id not in all_data or paper_id not in all_labels:
+            continue
+        paper_labels = all_labels[paper_id]
+        bib_keys = [k for k in all_data[paper_id]['bibtex'] if k in paper_labels]
+        X, bib_keys, arxiv_ids = paper_feature_matrix(all_data[paper_id], bib_keys)
+        if X.size == 0:
+            continue
+
+        correct = np.array([paper_labels[k] for k in bib_keys], dtype=object)[:, None]
+        y = (np.array(arxiv_ids, dtype=object)[None, :] == correct).astype(int).ravel()
+        X_parts.append(X)
+        y_parts.append(y)
+        metadata_list.extend((paper_id, k, a) for k in bib_keys for a in arxiv_ids)
+
+    if not X_parts:
+        return np.array([]), np.array([]), metadata_list
+    return np.vstack(X_parts), np.concatenate(y_parts), metadata_list
+
+
+def score_paper(paper_data: Dict, model):
+    """
+    Match probability of every (BibTeX entry, candidate) pair with a single predict_proba call.
+    Returns:
+        (probabilities of shape (entries, candidates), bib_keys, arxiv_ids)
+    """
+    X, bib_keys, arxiv_ids = paper_feature_matrix(paper_data)
+    if X.size == 0:
+        return np.zeros((len(bib_keys), len(arxiv_ids))), bib_keys, arxiv_ids
+    proba = model.predict_proba(X)[:, 1]
+    return proba.reshape(len(bib_keys), len(arxiv_ids)), bib_keys, arxiv_ids
+
+
+def generate_predictions_batched(paper_id, paper_data, model, top_k=5):
+    """Drop-in replacement for matching.generate_predictions_for_paper."""
+    proba, bib_keys, arxiv_ids = score_paper(paper_data, model)
+    # Stable sort on -p keeps ties in candidate order, like list.sort(reverse=True)
+    order = np.argsort(-proba, axis=1, kind="stable")[:, :top_k]
+    return {bib_key: [arxiv_ids[j] for j in row] for bib_key, row in zip(bib_keys, order)}
+
+
+def generate_predictions_streaming(papers, model, top_k=5):
+    """
+    (paper_id, predictions) for every record of corpus_reader.iter_papers, one paper in memory
+    at a time: each record's fields are released once it is ranked.
+    """
+    for record in papers:
+        yield record.paper_id, generate_predictions_batched(record.paper_id, record, model, top_k)
+        record.release()
@@ -0,0 +1,250 @@
+"""
+Fast string-similarity kernels for the reference matcher features.
+
+    - FastTextCleaner: TextCleaner with precompiled LaTeX/punctuation regexes, a translate
+      table for the Unicode replacements and LRU caches on normalize_text and
+      extract_author_lastname keyed by the raw string (identical outputs).
+    - Title similarity backends, selected by the MATCH_SIMILARITY environment variable or
+      set_backend():
+        "rapidfuzz"    C++ Indel ratio, whole entry x candidate matrices via process.cdist
+        "levenshtein"  python-Levenshtein ratio (same values as rapidfuzz)
+        "difflib"      SequenceMatcher, exactly the notebook's values
+      Default: difflib, the feature the notebook's model was trained on. The two C backends
+      compute the normalized LCS-based ratio, which can differ from SequenceMatcher's
+      Ratcliff-Obershelp ratio (bench_similarity.py reports the gap), so opting into one of
+      them means retraining the matching model with it selected.
+    - Per-pair feature functions with the notebook's names, built on the above.
+"""
+import os
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+from matching import FEATURE_NAMES, TextCleaner
+
+try:
+    from rapidfuzz.distance import Indel
+    from rapidfuzz.process import cdist
+except ImportError:
+    Indel = cdist = None
+
+try:
+    import Levenshtein
+except ImportError:
+    Levenshtein = None
+
+CACHE_SIZE = 1 << 16   # normalized strings kept per cache (titles and author names)
+
+# ---------------------------
+# Cleaner
+# ---------------------------
+
+class FastTextCleaner(TextCleaner):
+    """Drop-in TextCleaner: same outputs, regexes compiled once, normalizations memoized."""
+
+    LATEX_SUBS = [(re.compile(p), r'\1' if '(' in p else ' ') for p in TextCleaner.LATEX_PATTERNS]
+    # The notebook's replacement dict: its first two "curly quote" keys were parsed as the
+    # triple-quoted string ': "\'", ' (one multi-character key), kept as-is for parity.
+    UNICODE_MULTI = [(': "\'", ', "'")]
+    UNICODE_TABLE = str.maketrans({
+        '–': '-', '—': '-', '…': '...',
+        'á': 'a', 'à': 'a', 'ä': 'a', 'â': 'a', 'ã': 'a',
+        'é': 'e', 'è': 'e', 'ë': 'e', 'ê': 'e',
+        'í': 'i', 'ì': 'i', 'ï': 'i', 'î': 'i',
+        'ó': 'o', 'ò': 'o', 'ö': 'o', 'ô': 'o', 'õ': 'o',
+        'ú': 'u', 'ù': 'u', 'ü': 'u', 'û': 'u',
+        'ñ': 'n', 'ç': 'c', 'Á': 'A', 'À': 'A', 'É': 'E'
+    })
+    PUNCT_KEEP_HYPHENS_RE = re.compile(r'[^\w\s-]')
+    PUNCT_RE = re.compile(r'[^\w\s]')
+
+    def __init__(self, remove_stopwords: bool = False, lowercase: bool = True, cache_size: int = CACHE_SIZE):
+        super().__init__(remove_stopwords=remove_stopwords, lowercase=lowercase)
+        self._normalize_cached = lru_cache(maxsize=cache_size)(super().normalize_text)
+        self._lastname_cached = lru_cache(maxsize=cache_size)(super().extract_author_lastname)
+
+    def clean_latex(self, text: str) -> str:
+        if not text:
+            return ""
+        for pattern, repl in self.LATEX_SUBS:
+            text = pattern.sub(repl, text)
+        return text
+
+    def normalize_unicode(self, text: str) -> str:
+        if not text:
+            return ""
+        for old, new in self.UNICODE_MULTI:
+            text = text.replace(old, new)
+        return text.translate(self.UNICODE_TABLE)
+
+    def remove_punctuation(self, text: str, keep_hyphens: bool = True) -> str:
+        if not text:
+            return ""
+        return (self.PUNCT_KEEP_HYPHENS_RE if keep_hyphens else self.PUNCT_RE).sub(' ', text)
+
+    def normalize_text(self, title: str) -> str:
+        if isinstance(title, str):
+            return self._normalize_cached(title)
+        return super().normalize_text(title)
+
+    def extract_author_lastname(self, name: str) -> str:
+        if isinstance(name, str):
+            return self._lastname_cached(name)
+        return super().extract_author_lastname(name)
+
+    def cache_info(self):
+        return {"normalize_text": self._normalize_cached.cache_info(),
+                "extract_author_lastname": self._lastname_cached.cache_info()}
+
+
+cleaner = FastTextCleaner(remove_stopwords=False, lowercase=True)
+
+# ---------------------------
+# Title similarity kernels
+# ---------------------------
+
+BACKENDS = ("rapidfuzz", "levenshtein", "difflib")
+DEFAULT_BACKEND = "difflib"   # parity with the trained model; the C backends are opt-in
+
+
+def _available(backend: str) -> bool:
+    return {"rapidfuzz": Indel is not None, "levenshtein": Levenshtein is not None,
+            "difflib": True}.get(backend, False)
+
+
+def set_backend(backend: str):
+    """Select the title similarity implementation used by every feature builder."""
+    global BACKEND
+    if not _available(backend):
+        raise ValueError(f"similarity backend {backend!r} is unknown or not installed "
+                         f"(available: {[b for b in BACKENDS if _available(b)]})")
+    BACKEND = backend
+
+
+BACKEND = None
+set_backend(os.environ.get("MATCH_SIMILARITY") or DEFAULT_BACKEND)
+
+
+def title_ratio(a: str, b: str) -> float:
+    """Similarity of two normalized titles in [0, 1] (0 when either is empty)."""
+    if not a or not b:
+        return 0.0
+    if BACKEND == "rapidfuzz":
+        return Indel.normalized_similarity(a, b)
+    if BACKEND == "levenshtein":
+        return Levenshtein.ratio(a, b)
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def title_ratio_matrix(left: List[str], right: List[str], mask: np.ndarray = None) -> np.ndarray:
+    """
+    title_ratio for every (left, right) pair, as a len(left) x len(right) array.
+    mask (same shape, bool) restricts the per-pair backends to the pairs set in it (the others
+    stay 0); rapidfuzz computes the whole matrix in one cdist call regardless.
+    """
+    out = np.zeros((len(left), len(right)))
+    if not left or not right:
+        return out
+    if BACKEND == "rapidfuzz":
+        out[:] = cdist(left, right, scorer=Indel.normalized_similarity, dtype=np.float64)
+        out[[not s for s in left], :] = 0.0
+        out[:, [not s for s in right]] = 0.0
+        return out
+    if BACKEND == "levenshtein":
+        for i, a in enumerate(left):
+            if a:
+                for j, b in enumerate(right):
+                    if b and (mask is None or mask[i, j]):
+                        out[i, j] = Levenshtein.ratio(a, b)
+        return out
+    matcher = SequenceMatcher(None)
+    for j, b in enumerate(right):
+        if not b or (mask is not None and not mask[:, j].any()):
+            continue
+        matcher.set_seq2(b)   # the right-side index (b2j) is built once per column
+        for i, a in enumerate(left):
+            if a and (mask is None or mask[i, j]):
+                matcher.set_seq1(a)
+                out[i, j] = matcher.ratio()
+    return out
+
+# ---------------------------
+# Per-pair features (same names and order as matching.py)
+# ---------------------------
+
+def _titles(bibtex_entry, candidate_paper):
+    return (cleaner.normalize_text(bibtex_entry.get('title', '')),
+            cleaner.normalize_text(candidate_paper.get('title', '')))
+
+
+def _lastnames(authors):
+    names = {cleaner.extract_author_lastname(a).lower() for a in authors}
+    names.discard("")
+    return names
+
+
+def calculate_title_similarity(bibtex_entry, candidate_paper):
+    return title_ratio(*_titles(bibtex_entry, candidate_paper))
+
+
+def calculate_title_length_ratio(bibtex_entry, candidate_paper):
+    bib_len, arxiv_len = map(len, _titles(bibtex_entry, candidate_paper))
+    if bib_len == 0 or arxiv_len == 0:
+        return 0.0
+    return min(bib_len, arxiv_len) / max(bib_len, arxiv_len)
+
+
+def calculate_author_overlap(bibtex_entry, candidate_paper):
+    bib_authors = bibtex_entry.get('author', '')
+    arxiv_authors = candidate_paper.get('authors', [])
+    bib_lastnames = _lastnames(a.strip() for a in bib_authors.split(' and ')) if isinstance(bib_authors, str) else set()
+    arxiv_lastnames = _lastnames(arxiv_authors) if isinstance(arxiv_authors, list) else set()
+    if not bib_lastnames or not arxiv_lastnames:
+        return 0.0
+    return len(bib_lastnames & arxiv_lastnames) / len(bib_lastnames | arxiv_lastnames)
+
+
+def calculate_year_difference(bibtex_entry, candidate_paper):
+    bib_year = cleaner.normalize_year(bibtex_entry.get('year', None))
+    arxiv_year = cleaner.normalize_year(candidate_paper.get('year', None))
+    if not bib_year or not arxiv_year:
+        return 5.0  # Large penalty for missing year
+    return abs(int(bib_year) - int(arxiv_year)) / 10.0
+
+
+def check_first_author_match(bibtex_entry, candidate_paper):
+    bib_authors = bibtex_entry.get('author', '')
+    arxiv_authors = candidate_paper.get('authors', [])
+    if not (isinstance(bib_authors, str) and bib_authors) or not (isinstance(arxiv_authors, list) and arxiv_authors):
+        return 0
+    bib_lastname = cleaner.extract_author_lastname(bib_authors.split(' and ')[0].strip()).lower()
+    arxiv_lastname = cleaner.extract_author_lastname(arxiv_authors[0]).lower()
+    return int(bool(bib_lastname) and bib_lastname == arxiv_lastname)
+
+
+def calculate_title_word_overlap(bibtex_entry, candidate_paper):
+    bib_title, arxiv_title = _titles(bibtex_entry, candidate_paper)
+    bib_words = {w for w in bib_title.split() if len(w) > 2}
+    arxiv_words = {w for w in arxiv_title.split() if len(w) > 2}
+    if not bib_words or not arxiv_words:
+        return 0.0
+    return len(bib_words & arxiv_words) / len(bib_words | arxiv_words)
+
+
+FEATURE_FUNCTIONS = {
+    'title_similarity': calculate_title_similarity,
+    'title_length_ratio': calculate_title_length_ratio,
+    'author_overlap': calculate_author_overlap,
+    'year_difference': calculate_year_difference,
+    'first_author_match': check_first_author_match,
+    'title_word_overlap': calculate_title_word_overlap,
+}
+assert list(FEATURE_FUNCTIONS) == FEATURE_NAMES
+
+
+def extract_all_features(bibtex_entry, candidate_paper):
+    """matching.extract_all_features on cached normalizations and the selected kernel."""
+    return [fn(bibtex_entry, candidate_paper) for fn in FEATURE_FUNCTIONS.values()]
@@ -0,0 +1,224 @@
+"""
+Corpus-wide TF-IDF title index.
+
+The vectorizer is fitted once over every distinct candidate of every references.json in the
+output directory (titles normalized with the matcher's cleaner). The index is stored term-major
+(the transposed document matrix, i.e. a weighted inverted index) as raw .npy arrays, so it is
+memory-mapped on load and "top-k candidates for these BibTeX titles" is one sparse
+(queries x terms) @ (terms x documents) product per batch. blocking.py uses it as a shortlist
+source: one product per paper for all of its BibTeX titles, restricted to its own candidates.
+
+Layout of <index_dir>/:
+    meta.json        vectorizer parameters, sizes, build time
+    ids.json         arXiv ID of every document column
+    vocabulary.json  term -> row
+    idf.npy          IDF weight of every term
+    data.npy, indices.npy, indptr.npy   CSR arrays of the terms x documents matrix
+
+Usage:
+    python title_index.py build [output_dir] [--index title_index]
+    python title_index.py query "Deep residual learning" [--index title_index] [--k 10]
+    python title_index.py eval [output_dir] [--index title_index] [--k 1 5 10 50]
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from matching import OUTPUT_DIR, load_all_data, load_pred_labels, manual_labels
+from similarity import cleaner
+
+INDEX_DIR = Path("title_index")
+QUERY_BATCH_SIZE = 1024
+VECTORIZER_PARAMS = {
+    "analyzer": "word",
+    "ngram_range": [1, 2],     # bigrams reward word order ("graph neural" vs "neural graph")
+    "sublinear_tf": True,
+    "min_df": 1,
+    "max_df": 0.5,             # terms in most titles carry no signal but densify every product
+}
+CSR_ARRAYS = ("data", "indices", "indptr")
+
+
+def _vectorizer(params, vocabulary=None):
+    params = dict(params, ngram_range=tuple(params["ngram_range"]))
+    return TfidfVectorizer(dtype=np.float32, vocabulary=vocabulary, **params)
+
+
+def iter_candidates(output_dir: Path = OUTPUT_DIR) -> Iterable[Tuple[str, Dict]]:
+    """(arxiv_id, candidate) of every references.json, first occurrence of each ID only."""
+    seen = set()
+    for refs_file in sorted(output_dir.glob("*/references.json")):
+        try:
+            with open(refs_file, 'r', encoding='utf-8') as f:
+                candidates = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for arxiv_id, candidate in candidates.items():
+            if arxiv_id not in seen:
+                seen.add(arxiv_id)
+                yield arxiv_id, candidate
+
+# ---------------------------
+# Build
+# ---------------------------
+
+def build_index(output_dir: Path = OUTPUT_DIR, index_dir: Path = INDEX_DIR):
+    """Fit the vectorizer on every candidate title of the corpus and write the index."""
+    t0 = time.perf_counter()
+    ids, titles = [], []
+    for arxiv_id, candidate in iter_candidates(output_dir):
+        title = cleaner.normalize_text(candidate.get('title', ''))
+        if title:
+            ids.append(arxiv_id)
+            titles.append(title)
+    if not titles:
+        raise ValueError(f"No candidate titles found under {output_dir}")
+
+    params = dict(VECTORIZER_PARAMS)
+    if len(titles) < 2 / params["max_df"]:
+        params["max_df"] = 1.0                       # tiny corpus: every term would be pruned
+    vectorizer = _vectorizer(params)
+    docs = vectorizer.fit_transform(titles)          # documents x terms, rows L2-normalized
+    postings = docs.T.tocsr()                        # terms x documents
+    postings.sort_indices()
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    for name in CSR_ARRAYS:
+        np.save(index_dir / f"{name}.npy", getattr(postings, name))
+    np.save(index_dir / "idf.npy", vectorizer.idf_.astype(np.float32))
+    vocabulary = {term: int(col) for term, col in vectorizer.vocabulary_.items()}
+    for name, obj in (("vocabulary.json", vocabulary), ("ids.json", ids)):
+        with open(index_dir / name, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+    meta = {
+        "vectorizer": params,
+        "documents": len(ids),
+        "terms": len(vocabulary),
+        "nnz": int(postings.nnz),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "build_seconds": time.perf_counter() - t0,
+    }
+    # meta.json last: its presence marks a complete index
+    tmp = index_dir / "meta.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, index_dir / "meta.json")
+    return meta
+
+# ---------------------------
+# Query
+# ---------------------------
+
+class TitleIndex:
+    """Read-only, memory-mapped view of an index directory."""
+
+    def __init__(self, index_dir: Path = INDEX_DIR):
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(index_dir / "ids.json", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.column = {arxiv_id: col for col, arxiv_id in enumerate(self.ids)}
+        with open(index_dir / "vocabulary.json", encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        data, indices, indptr = (np.load(index_dir / f"{name}.npy", mmap_mode="r") for name in CSR_ARRAYS)
+        self.postings = sp.csr_matrix((data, indices, indptr), shape=(len(vocabulary), len(self.ids)),
+                                      copy=False)
+        self.vectorizer = _vectorizer(self.meta["vectorizer"], vocabulary)
+        self.vectorizer.idf_ = np.load(index_dir / "idf.npy")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def top_k(self, titles: List[str], k: int = 10, batch_size: int = QUERY_BATCH_SIZE,
+              min_score: float = 0.0, among: Optional[Iterable[str]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Best k (arxiv_id, cosine) per raw title, highest first; one sparse product per batch.
+        Titles that normalize to nothing get an empty list.
+        among: only rank these documents (e.g. one paper's candidates); IDs not indexed are ignored.
+        """
+        allowed = None
+        if among is not None:
+            allowed = np.zeros(len(self.ids), dtype=bool)
+            allowed[[self.column[a] for a in among if a in self.column]] = True
+        results = []
+        for start in range(0, len(titles), batch_size):
+            batch = [cleaner.normalize_text(t) for t in titles[start:start + batch_size]]
+            scores = (self.vectorizer.transform(batch) @ self.postings).tocsr()
+            for row in range(scores.shape[0]):
+                lo, hi = scores.indptr[row], scores.indptr[row + 1]
+                values, cols = scores.data[lo:hi], scores.indices[lo:hi]
+                if allowed is not None:
+                    keep = allowed[cols]
+                    values, cols = values[keep], cols[keep]
+                if len(values) > k:
+                    keep = np.argpartition(-values, k)[:k]
+                    values, cols = values[keep], cols[keep]
+                order = np.lexsort((cols, -values))   # score desc, then column for stable ties
+                results.append([(self.ids[cols[i]], float(values[i])) for i in order
+                                if values[i] > min_score])
+        return results
+
+
+def recall_at_k(index: TitleIndex, all_data: Dict, labels: Dict[str, Dict], ks: List[int]):
+    """Fraction of labeled BibTeX titles whose true arXiv ID is in the corpus-wide top-k."""
+    titles, truth = [], []
+    for paper_id, groundtruth in labels.items():
+        bibtex = all_data.get(paper_id, {}).get('bibtex', {})
+        for bib_key, arxiv_id in groundtruth.items():
+            if bib_key in bibtex:
+                titles.append(bibtex[bib_key].get('title', ''))
+                truth.append(arxiv_id)
+    hits = index.top_k(titles, k=max(ks))
+    return {k: (sum(t in [a for a, _ in h[:k]] for t, h in zip(truth, hits)) / len(truth) if truth else 0.0)
+            for k in ks}, len(truth)
+
+# ---------------------------
+# Main
+# ---------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corpus-wide TF-IDF index of candidate titles.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_p = sub.add_parser("build", help="fit the vectorizer on every references.json and write the index")
+    build_p.add_argument("output_dir", nargs="?", default=str(OUTPUT_DIR))
+    query_p = sub.add_parser("query", help="top-k candidates for one or more titles")
+    query_p.add_argument("titles", nargs="+")
+    query_p.add_argument("--k", type=int, default=10)
+    eval_p = sub.add_parser("eval", help="recall@k of the labeled entries and query throughput")
+    eval_p.add_argument("output_dir", nargs="?", default=str(OUTPUT_DIR))
+    eval_p.add_argument("--k", type=int, nargs="+", default=[1, 5, 10, 50])
+    for p in (build_p, query_p, eval_p):
+        p.add_argument("--index", default=str(INDEX_DIR), help="index directory")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        meta = build_index(Path(args.output_dir), Path(args.index))
+        print(f"✅ Indexed {meta['documents']} candidate titles, {meta['terms']} terms, "
+              f"{meta['nnz']} postings in {meta['build_seconds']:.2f} sec -> {args.index}")
+    elif args.command == "query":
+        index = TitleIndex(Path(args.index))
+        for title, hits in zip(args.titles, index.top_k(args.titles, args.k)):
+            print(f"\n{title}")
+            for arxiv_id, score in hits:
+                print(f"  {score:.3f}  {arxiv_id}")
+    else:
+        index = TitleIndex(Path(args.index))
+        all_data = load_all_data(Path(args.output_dir))
+        t0 = time.perf_counter()
+        labels = {**load_pred_labels(Path(args.output_dir))[0], **manual_labels}
+        recalls, n = recall_at_k(index, all_data, labels, args.k)
+        elapsed = time.perf_counter() - t0
+        if not n:
+            raise SystemExit("No labeled BibTeX entry (manual_labels or pred.json) found in this output directory")
+        print(f"Index: {len(index)} documents; {n} labeled titles queried in {elapsed:.3f} sec "
+              f"({n / elapsed if elapsed else 0:,.0f} titles/s)")
+        for k, recall in recalls.items():
+            print(f"  recall@{k}: {recall:.3f}")
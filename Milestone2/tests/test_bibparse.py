@@ -0,0 +1,66 @@
+"""Parity of bibparse.py with the notebook's bibliography path (bibtexparser and BIBITEM_RE)."""
+import random
+
+import bibtexparser
+import pytest
+from bibtexparser.bparser import BibTexParser
+
+from bench_bibparse import legacy_bibitems, synthetic_bib, synthetic_bibitem_block
+from bibparse import iter_bibitems, parse_bibitem_body, parse_bibtex
+
+SETTINGS = [
+    {"common_strings": False, "interpolate_strings": False},   # hierarchy.parse_bib_file
+    {"common_strings": True, "interpolate_strings": True},     # matching.load_paper_data
+]
+
+EDGE_BIBS = [
+    "",
+    "@article{a, title={Nested {Braces} here}, year=2001}",
+    '@misc{b, title="Quoted, with comma", note = "See " # {\\url{x}},}',
+    "@String{prl = {Phys. Rev. Lett.}}\n@article{c, journal = prl, year = {1999}}",
+    "@comment{jabref-meta: databaseType:bibtex;}\n@Book{d,\n  author = {M{\\\"u}ller, A.},\n}",
+    "stray text before\n@inproceedings{e, title = {T}, title = {Duplicate}}",
+    "@article{f, title = {Unclosed",
+]
+
+
+def legacy_bibtex(text, **kwargs):
+    return bibtexparser.loads(text, parser=BibTexParser(**kwargs)).entries
+
+
+@pytest.mark.parametrize("settings", SETTINGS)
+def test_parse_bibtex_matches_bibtexparser(settings):
+    rng = random.Random(7)
+    for text in EDGE_BIBS + [synthetic_bib(rng, 15) for _ in range(30)]:
+        assert parse_bibtex(text, **settings) == legacy_bibtex(text, **settings), text[:80]
+
+
+def test_iter_bibitems_keeps_every_legacy_item():
+    rng = random.Random(7)
+    for tex in [synthetic_bibitem_block(rng, 20) for _ in range(30)]:
+        fast = list(iter_bibitems(tex))
+        legacy = legacy_bibitems(tex)
+        legacy_keys = {key for key, _ in legacy}
+        assert [(k, b) for k, b in fast if k in legacy_keys] == legacy
+
+
+def test_iter_bibitems_headers():
+    tex = ("\\begin{thebibliography}{9}\n"
+           "\\bibitem{a} First.\n"
+           "\\bibitem[{Smith et~al.(2001)}]{b} Second.\n"
+           "\\bibitem {c}Third.\n"
+           "\\bibitem{} dropped, ends Third\n"
+           "\\bibitem[{a{b{c}}}]{d} Deep label.\n"
+           "\\end{thebibliography}")
+    assert list(iter_bibitems(tex)) == [
+        ("a", "First.\n"), ("b", "Second.\n"), ("c", "Third.\n"), ("d", "Deep label.\n")]
+    assert list(iter_bibitems("no bibliography here")) == []
+
+
+def test_parse_bibitem_body_fields():
+    fields = parse_bibitem_body("A.~Smith and B.~Jones.\n\\newblock Deep learning for graphs.\n"
+                                "\\newblock {\\em Nature}, 2019. doi:10.1038/abc123")
+    assert fields["authors"] == ["A. Smith", "B. Jones"]
+    assert fields["title"] == "Deep learning for graphs"
+    assert fields["year"] == "2019"
+    assert fields["doi"] == "10.1038/abc123"